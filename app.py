@@ -1,16 +1,38 @@
 """
 Aplicação Flask para API GenDoc - Gestão de Demandas Redmine.
 """
-from flask import Flask, jsonify, request, send_file, send_from_directory
+from flask import Flask, Response, g, jsonify, request, send_file, send_from_directory
 from flask_cors import CORS
 import os
 import sys
 import json
-import tempfile
-import re
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from dotenv import load_dotenv
-from services.redmine import buscar_demanda, formatar_dados
-from services.documento import preencher_plano_trabalho
+
+# Carrega variáveis de ambiente do arquivo .env
+# IMPORTANTE: antes de importar os serviços, que leem configurações na importação
+# (DOCX_NIVEL_COMPRESSAO, CACHE_DOCUMENTOS_MAX_MB, RENDER_PROCESSOS)
+load_dotenv()
+
+from services.cache_redmine import cache_redmine
+from services.documento import data_geracao_atual
+from services.processos_render import gerar_documento, iniciar_pool_render, pids_pool
+from services.tarefas_geracao import FilaTarefas, FilaCheia, STATUS_CONCLUIDA, STATUS_ERRO
+from services.cache_documentos import cache_documentos
+from services.geracao import (
+    ErroRequisicaoGeracao, completar_payload, preparar_geracao, normalizar_item_lote, payload_das_linhas
+)
+from services.especulacao import especulacao
+from services.registro_modelos import registro_modelos
+from services.pacote_docx import iterar_zip
+from services.previa import FORMATOS_PREVIA, obter_esqueleto, previa_em_html, renderizar_previa
+from services.logs import com_correlacao, encerrar_correlacao, iniciar_correlacao, obter_logger
+from services.perfilamento import PERFILAMENTO_ATIVO, perfis, token_valido
+from services.memoria import SemMemoria, orcamento_memoria
+from services.metricas import (
+    METRICAS_ATIVAS, metricas, medir, medir_envio, iniciar_coleta, encerrar_coleta, server_timing
+)
 
 # Tenta importar redis para Vercel KV
 try:
@@ -19,15 +41,127 @@ try:
 except ImportError:
     REDIS_AVAILABLE = False
 
-# Carrega variáveis de ambiente do arquivo .env
-load_dotenv()
-
 # Inicializa a aplicação Flask
 app = Flask(__name__)
+# Nome fixo: rodando como script, __name__ é __main__
+log = obter_logger('app')
 
 # Habilita CORS para permitir requisições do frontend
 CORS(app)
 
+# Modelos descobertos e compilados (MODELOS_DIR) e pool de processos que gera os documentos
+# (RENDER_PROCESSOS), com os modelos já carregados
+# IMPORTANTE: iniciados na importação, antes do servidor abrir threads; a verificação de
+# modelos alterados só começa depois do pool criado (fork)
+registro_modelos.atualizar()
+iniciar_pool_render(registro_modelos.caminhos())
+registro_modelos.monitorar()
+# Esqueletos da prévia dos modelos já compilados (os alterados depois são montados na
+# primeira prévia de cada versão)
+for caminho_modelo in registro_modelos.caminhos():
+    obter_esqueleto(caminho_modelo)
+
+# Tarefas assíncronas: intervalo sugerido ao cliente quando a fila está cheia e intervalo
+# dos comentários de keep-alive no stream de progresso
+TAREFAS_RETRY_AFTER_SEGUNDOS = 5
+TAREFAS_SSE_PING_SEGUNDOS = 15
+
+# Geração em lote: máximo de documentos por requisição e gerações simultâneas
+# (cada uma ainda passa pelo pool de processos; as threads cobrem a espera pelo Redmine)
+LOTE_MAX_ITENS = int(os.getenv('LOTE_MAX_ITENS', '200'))
+LOTE_THREADS = int(os.getenv('LOTE_THREADS', '4'))
+
+
+@app.before_request
+def iniciar_correlacao_requisicao():
+    """
+    Id de correlação dos logs da requisição (o X-Request-ID recebido ou um novo) e sorteio
+    do rastro detalhado da renderização (LOG_AMOSTRA_RASTRO).
+    """
+    g.id_correlacao, g.tokens_correlacao = iniciar_correlacao(request.headers.get('X-Request-ID'))
+
+
+@app.before_request
+def iniciar_medicoes():
+    """
+    Abre as medições das etapas da requisição (services.metricas).
+    """
+    if METRICAS_ATIVAS:
+        g.inicio_requisicao = time.perf_counter()
+        g.medicoes, g.token_medicoes = iniciar_coleta()
+
+
+@app.after_request
+def registrar_medicoes_requisicao(resposta):
+    """
+    Registra as etapas e a duração da requisição nos histogramas e devolve as etapas no
+    cabeçalho Server-Timing.
+
+    IMPORTANTE: respostas transmitidas ainda não foram enviadas aqui; o envio é medido à
+    parte (medir_envio) e não entra no total
+    """
+    medicoes = g.pop('medicoes', None)
+    if medicoes is None:
+        return resposta
+    total = time.perf_counter() - g.inicio_requisicao
+    metricas.observar_etapas(medicoes)
+    metricas.observar_requisicao(request.endpoint, request.method, resposta.status_code, total)
+    resposta.headers['Server-Timing'] = server_timing(medicoes, total)
+    return resposta
+
+
+@app.before_request
+def iniciar_perfil():
+    """
+    Roda a requisição sob o profiler quando pedido (?perfil=1 ou X-Perfil: 1) com o
+    X-Admin-Token do perfilamento (PERFILAMENTO=1 e PERFILAMENTO_TOKEN); sem o token, o
+    pedido é ignorado.
+    """
+    if not PERFILAMENTO_ATIVO or '1' not in (request.args.get('perfil'), request.headers.get('X-Perfil')):
+        return
+    if token_valido(request.headers.get('X-Admin-Token')):
+        g.perfilamento = perfis.iniciar()
+
+
+@app.after_request
+def guardar_perfil(resposta):
+    """Guarda o perfil da requisição e devolve o id (X-Perfil-ID)."""
+    perfilamento = g.pop('perfilamento', None)
+    if perfilamento is None:
+        return resposta
+    corpo = request.get_json(silent=True) if request.is_json else None
+    id_perfil = perfis.encerrar(
+        perfilamento,
+        rota=request.endpoint,
+        metodo=request.method,
+        status=resposta.status_code,
+        demanda=(request.view_args or {}).get('demanda') or (corpo.get('demanda') if isinstance(corpo, dict) else None),
+        correlacao=g.get('id_correlacao'),
+    )
+    resposta.headers['X-Perfil-ID'] = id_perfil
+    return resposta
+
+
+@app.after_request
+def devolver_correlacao(resposta):
+    """Devolve o id de correlação, para achar nos logs as linhas da requisição."""
+    if 'id_correlacao' in g:
+        resposta.headers['X-Request-ID'] = g.id_correlacao
+    return resposta
+
+
+@app.teardown_request
+def encerrar_medicoes(_erro=None):
+    token = g.pop('token_medicoes', None)
+    if token is not None:
+        encerrar_coleta(token)
+    perfilamento = g.pop('perfilamento', None)
+    if perfilamento is not None:
+        perfis.descartar(perfilamento)
+    tokens = g.pop('tokens_correlacao', None)
+    if tokens is not None:
+        encerrar_correlacao(tokens)
+
 
 @app.route('/')
 def index():
@@ -87,17 +221,21 @@ def buscar_demanda_route(demanda):
         - 500: Erro no servidor
     """
     try:
-        # Busca os dados brutos da demanda no Redmine via API JSON
-        json_redmine = buscar_demanda(demanda)
+        # Busca a demanda no Redmine e formata no padrão esperado pelo frontend.
+        # IMPORTANTE: sempre consulta o Redmine e atualiza o cache, para a geração
+        # só com o ID usar exatamente os dados que o usuário está vendo
+        dados_formatados = cache_redmine.obter(demanda, atualizar=True)
 
-        if json_redmine is None:
+        if dados_formatados is None:
             return jsonify({
                 "error": "Demanda não encontrada",
                 "demanda": demanda
             }), 404
 
-        # Formata os dados no padrão esperado pelo frontend
-        dados_formatados = formatar_dados(json_redmine)
+        # O usuário provavelmente vai gerar o plano desta demanda: já prepara em segundo
+        # plano a parte do documento que não depende das horas e profissionais
+        if dados_formatados:
+            especular_geracao(demanda, dados_formatados)
 
         return jsonify(dados_formatados), 200
 
@@ -132,10 +270,66 @@ def health_check():
             "redmine_api_key_configured": bool(redmine_key),
             "redmine_base_url": redmine_url,
             "python_version": sys.version.split()[0]
-        }
+        },
+        "cache_documentos": cache_documentos.estatisticas(),
+        "cache_redmine": cache_redmine.estatisticas(),
+        "especulacao": especulacao.estatisticas(),
+        "tarefas_geracao": fila_tarefas.estatisticas(),
+        "memoria": orcamento_memoria.estatisticas(pids_pool())
     }), 200
 
 
+@app.route('/metrics', methods=['GET'])
+def exportar_metricas():
+    """
+    Histogramas das etapas e das requisições deste processo e o uso de memória das
+    gerações (orçamento, reservas, RSS), no formato texto do Prometheus.
+    """
+    if not METRICAS_ATIVAS:
+        return jsonify({"error": "Métricas desativadas (METRICAS=0)"}), 404
+    return Response(metricas.exportar() + orcamento_memoria.exportar(pids_pool()),
+                    mimetype='text/plain; version=0.0.4')
+
+
+def _verificar_acesso_perfis():
+    """Resposta de erro se os perfis não estão acessíveis (PERFILAMENTO e PERFILAMENTO_TOKEN), senão None."""
+    if not PERFILAMENTO_ATIVO:
+        return jsonify({"error": "Perfilamento desativado (PERFILAMENTO=0 ou sem PERFILAMENTO_TOKEN)"}), 404
+    if not token_valido(request.headers.get('X-Admin-Token')):
+        return jsonify({"error": "Token de administração inválido"}), 403
+    return None
+
+
+@app.route('/api/admin/perfis', methods=['GET'])
+def listar_perfis():
+    """
+    Perfis guardados (mais recentes primeiro), sem as listas de funções.
+    """
+    erro = _verificar_acesso_perfis()
+    if erro:
+        return erro
+    return jsonify({"perfis": perfis.listar()}), 200
+
+
+@app.route('/api/admin/perfis/<id_perfil>', methods=['GET'])
+def obter_perfil(id_perfil):
+    """
+    Um perfil completo em JSON, ou com ?formato=pstats o arquivo .prof (pstats, snakeviz).
+    """
+    erro = _verificar_acesso_perfis()
+    if erro:
+        return erro
+    encontrado = perfis.obter(id_perfil)
+    if encontrado is None:
+        return jsonify({"error": f"Perfil não encontrado: {id_perfil}"}), 404
+    perfil, bruto = encontrado
+    if request.args.get('formato') == 'pstats':
+        resposta = Response(bruto, mimetype='application/octet-stream')
+        resposta.headers.set('Content-Disposition', 'attachment', filename=f"perfil-{id_perfil}.prof")
+        return resposta
+    return jsonify(perfil), 200
+
+
 @app.route('/api/redmine/<demanda>/debug', methods=['GET'])
 def debug_demanda(demanda):
     """
@@ -161,6 +355,101 @@ def debug_demanda(demanda):
         }), 500
 
 
+def produzir_documento(pedido, ao_progredir=None):
+    """
+    Documento do pedido (preparar_geracao): do cache, se já foi gerado com as mesmas
+    entradas, ou gerado no pool de processos (ou na própria thread, se desativado),
+    direto da memória (sem arquivo temporário). Partes não alteradas (fontes,
+    imagens...) são copiadas do modelo sem recomprimir.
+    
+    Returns:
+        (iterável de bytes, 'HIT' ou 'MISS', estatísticas das fontes embutidas ou None)
+    """
+    chave = pedido['chave']
+    documento_cache = cache_documentos.obter(chave) if cache_documentos.ativo else None
+    if documento_cache is not None:
+        log.debug("Documento servido do cache (ETag %s...)", chave[:12])
+        return [documento_cache], 'HIT', None
+    
+    # Documento parcial preparado depois da busca da demanda (mesmo modelo, projeto e
+    # dados do Redmine): só falta preencher as horas e os profissionais
+    documento_parcial = especulacao.obter(pedido) if especulacao.ativo else None
+    
+    corpo, estatisticas_fontes = gerar_documento(
+        modelo_path=pedido['modelo_path'],
+        dados_demanda=pedido['dados_demanda'],
+        dados_sprints=pedido['dados_sprints'],
+        dados_profissionais=pedido['dados_profissionais'],
+        dados_projeto=pedido['dados_projeto'],
+        contexto=pedido['contexto'],
+        data_geracao=pedido['data_geracao'],
+        ao_progredir=ao_progredir,
+        documento_parcial=documento_parcial,
+        fontes=pedido['fontes']
+    )
+    if cache_documentos.ativo:
+        corpo = cache_documentos.guardar_ao_transmitir(chave, corpo)
+    return corpo, 'MISS', estatisticas_fontes
+
+
+def especular_geracao(demanda, linhas):
+    """
+    Agenda a preparação do documento parcial da demanda recém-buscada (sem horas
+    digitadas nem profissionais), consultada por produzir_documento na geração.
+    """
+    linhas = [dict(linha) for linha in linhas]
+    especulacao.agendar(lambda: preparar_geracao(payload_das_linhas(demanda, linhas), carregar_projetos()))
+
+
+def resposta_nao_modificado(pedido):
+    """Resposta 304 para um cliente que já tem o documento do pedido (If-None-Match)."""
+    log.debug("Documento não modificado (ETag %s...): 304", pedido['chave'][:12])
+    resposta = Response(status=304)
+    resposta.set_etag(pedido['chave'], weak=True)
+    return resposta
+
+
+def cabecalho_fontes(estatisticas_fontes):
+    """Estatísticas de reduzir_fontes no cabeçalho X-Fontes (ex.: modo=subconjunto; fontes=2; ...)."""
+    return '; '.join(f"{chave}={valor}" for chave, valor in estatisticas_fontes.items())
+
+
+def resposta_documento(pedido, corpo, origem, estatisticas_fontes=None):
+    """
+    Resposta com o .docx do pedido; X-Fontes traz o que o modo das fontes embutidas
+    economizou (só quando o documento foi gerado agora com fontes a reduzir).
+    
+    IMPORTANTE: se `corpo` é transmitido em pedaços, o status 200 já foi enviado quando
+    ele é consumido; erros durante a transmissão só interrompem o download (o arquivo
+    chega incompleto e o Word recusa abrir)
+    """
+    resposta = Response(
+        medir_envio(corpo),
+        status=200,
+        mimetype='application/vnd.openxmlformats-officedocument.wordprocessingml.document'
+    )
+    resposta.headers.set('Content-Disposition', 'attachment', filename=pedido['download_filename'])
+    resposta.headers['X-Cache'] = origem
+    if estatisticas_fontes:
+        resposta.headers['X-Fontes'] = cabecalho_fontes(estatisticas_fontes)
+    resposta.headers['Cache-Control'] = 'private, no-cache'
+    resposta.set_etag(pedido['chave'], weak=True)
+    return resposta
+
+
+def executar_tarefa_geracao(pedido, ao_progredir):
+    """Geração de uma tarefa assíncrona: o documento inteiro, em bytes."""
+    corpo, origem, estatisticas_fontes = produzir_documento(pedido, ao_progredir)
+    return b''.join(corpo), origem, estatisticas_fontes
+
+
+# Tarefas assíncronas de geração (fila limitada, progresso por Server-Sent Events)
+fila_tarefas = FilaTarefas(executar_tarefa_geracao)
+# A especulação só usa o pool quando não há gerações de verdade esperando (na fila de
+# tarefas ou por vaga no orçamento de memória) nem orçamento tomado
+especulacao.ocupado = lambda: fila_tarefas.na_fila > 0 or orcamento_memoria.saturado()
+
+
 @app.route('/api/gerar-plano-trabalho', methods=['POST'])
 def gerar_plano_trabalho():
     """
@@ -174,144 +463,332 @@ def gerar_plano_trabalho():
         "dados_profissionais": {...}
     }
     
-    Retorna o arquivo .docx gerado.
+    ou só o ID da demanda com os dados informados pelo usuário; a demanda e as sprints
+    são montadas no servidor a partir do Redmine (em cache desde /api/redmine/<demanda>):
+    {
+        "demanda": "128910",
+        "horas_sprint": {"129201": 120},
+        "dados_profissionais": {...}
+    }
+    
+    Retorna o arquivo .docx gerado, com ETag calculado a partir das entradas
+    (modelo, dados, projeto e data). Com If-None-Match igual ao ETag, retorna 304;
+    documentos já gerados com as mesmas entradas são servidos do cache (X-Cache: HIT).
+    Sem vaga no orçamento de memória a tempo, retorna 503 com Retry-After.
+    Para planos grandes, prefira /api/tarefas/plano-trabalho (assíncrona, com progresso).
     """
     try:
-        data = request.get_json()
-        
-        if not data:
-            return jsonify({
-                "error": "Dados não fornecidos"
-            }), 400
+        pedido = preparar_geracao(completar_payload(request.get_json()), carregar_projetos())
         
-        demanda_id = data.get('demanda')
-        dados_demanda = data.get('dados_demanda', {})
-        dados_sprints = data.get('dados_sprints', [])
-        dados_profissionais = data.get('dados_profissionais', {})
+        # O cliente já tem este documento: 304 sem gerar nada
+        if request.if_none_match.contains_weak(pedido['chave']):
+            return resposta_nao_modificado(pedido)
         
-        # Log para debug
-        print(f"[DEBUG] Dados recebidos:")
-        print(f"  Demanda ID: {demanda_id}")
-        print(f"  Dados Demanda: {dados_demanda}")
-        print(f"  Dados Sprints: {dados_sprints}")
-        print(f"  Dados Profissionais: {dados_profissionais}")
+        corpo, origem, estatisticas_fontes = produzir_documento(pedido)
+        return resposta_documento(pedido, corpo, origem, estatisticas_fontes)
         
-        if not demanda_id:
+    except SemMemoria as e:
+        resposta = jsonify({
+            "error": "Servidor sem memória para gerar agora, tente novamente em instantes",
+            "message": str(e)
+        })
+        resposta.status_code = 503
+        resposta.headers['Retry-After'] = str(e.retry_after)
+        return resposta
+    except ErroRequisicaoGeracao as e:
+        return jsonify({
+            "error": e.mensagem
+        }), e.status
+    except Exception as e:
+        return jsonify({
+            "error": "Erro ao gerar Plano de Trabalho",
+            "message": str(e)
+        }), 500
+
+
+@app.route('/api/gerar-plano-trabalho/previa', methods=['POST'])
+def previa_plano_trabalho():
+    """
+    Rota para a prévia do Plano de Trabalho (tabelas e parágrafos com tags já
+    preenchidos, em texto), sem gerar o .docx. Recebe os mesmos payloads de
+    /api/gerar-plano-trabalho (inclusive só o ID da demanda) e, opcionalmente:
+    {
+        "formato": "json" ou "html" (também em ?formato=),
+        "assinaturas": {"paragrafos": "...", "7": "...", "8": "..."}
+    }
+    
+    Com as assinaturas da prévia anterior, só as tabelas cujas entradas mudaram são
+    renderizadas (ex.: horas alteradas no modal refazem só as tabelas que as usam); as
+    demais voltam com "inalterada": true.
+    
+    Returns:
+        JSON (ou fragmento HTML) da prévia:
+        - 200: Prévia
+        - 400: Payload ou formato inválido
+        - 404: Demanda ou modelo não encontrado
+        - 500: Erro no servidor
+    """
+    try:
+        data = request.get_json()
+        opcoes = data if isinstance(data, dict) else {}
+        formato = str(request.args.get('formato') or opcoes.get('formato') or 'json').strip().lower()
+        if formato not in FORMATOS_PREVIA:
             return jsonify({
-                "error": "ID da demanda não fornecido"
+                "error": f"Formato de prévia inválido: {formato} (use {', '.join(FORMATOS_PREVIA)})"
             }), 400
-        
-        # Determina qual modelo usar baseado no tipo da sprint
-        # Se algum sprint for do tipo "Desenvolvimento", usa ModeloPT-LEO-CURSOR.docx
-        # Caso contrário, usa Modelo PT-CURSOR.docx
-        usar_modelo_leo = False
-        for sprint in dados_sprints:
-            tipo_sprint = str(sprint.get('tipo', '')).strip().lower()
-            if tipo_sprint == 'desenvolvimento':
-                usar_modelo_leo = True
-                break
-        
-        if usar_modelo_leo:
-            modelo_nome = 'ModeloPT-LEO-CURSOR.docx'
-            print(f"[DEBUG] Usando modelo LEO (Desenvolvimento): {modelo_nome}")
-        else:
-            modelo_nome = 'Modelo PT-CURSOR.docx'
-            print(f"[DEBUG] Usando modelo padrão: {modelo_nome}")
-        
-        # Caminho do modelo
-        modelo_path = os.path.join(os.path.dirname(__file__), modelo_nome)
-        
-        if not os.path.exists(modelo_path):
+        assinaturas = opcoes.get('assinaturas')
+        if assinaturas is not None and not isinstance(assinaturas, dict):
             return jsonify({
-                "error": f"Modelo de Plano de Trabalho não encontrado: {modelo_nome}"
-            }), 404
-        
-        # Carrega dados do projeto
-        # Regra:
-        # 1. Tenta achar um projeto cujo nomeProjeto case (case-insensitive) com o nome da demanda (project.name do Redmine)
-        # 2. Se não achar, usa o primeiro projeto como fallback
-        dados_projeto = {}
-        projetos = carregar_projetos()
-        if projetos and len(projetos) > 0:
-            nome_demanda = str(dados_demanda.get('nome', '')).strip().lower()
-            projeto_match = None
-
-            if nome_demanda:
-                for p in projetos:
-                    nome_proj = str(p.get('nomeProjeto', '')).strip().lower()
-                    # match exato ou contendo (para tolerar pequenas diferenças)
-                    if nome_proj == nome_demanda or nome_demanda in nome_proj or nome_proj in nome_demanda:
-                        projeto_match = p
-                        break
-
-            if projeto_match:
-                dados_projeto = projeto_match
-                print(f"[DEBUG] Usando projeto por nome: {dados_projeto.get('nomeProjeto', 'N/A')}")
-            else:
-                dados_projeto = projetos[0]
-                print(f"[DEBUG] [WARN] Projeto correspondente a '{nome_demanda}' não encontrado, usando primeiro projeto: {dados_projeto.get('nomeProjeto', 'N/A')}")
-        else:
-            print(f"[DEBUG] [WARN] Nenhum projeto encontrado no arquivo de configuração")
+                "error": "assinaturas deve ser um objeto {parte: assinatura}"
+            }), 400
         
-        # Gera o documento
-        doc = preencher_plano_trabalho(
-            modelo_path=modelo_path,
-            dados_demanda=dados_demanda,
-            dados_sprints=dados_sprints,
-            dados_profissionais=dados_profissionais,
-            dados_projeto=dados_projeto
+        pedido = preparar_geracao(completar_payload(data), carregar_projetos())
+        previa = renderizar_previa(
+            pedido['modelo_path'],
+            pedido['contexto'],
+            pedido['dados_projeto'],
+            pedido['data_geracao'],
+            assinaturas
         )
+        if formato == 'html':
+            resposta = Response(previa_em_html(previa), status=200, mimetype='text/html')
+        else:
+            resposta = jsonify(previa)
+        resposta.headers['Cache-Control'] = 'no-store'
+        return resposta
         
-        # Define o nome do arquivo de saída
-        # Regra:
-        # 1. Tenta usar o nome SVN do projeto (campo opcional cadastrado pelo usuário)
-        # 2. Se não houver, usa o nome do projeto cadastrado
-        # 3. Se ainda não houver, usa o nome vindo do Redmine
-        # 4. Fallback final: "Plano_Trabalho"
-        base_nome = ''
-        if dados_projeto:
-            base_nome = (
-                str(dados_projeto.get('nomeSVN') or '').strip()
-                or str(dados_projeto.get('nomeProjeto') or '').strip()
-            )
-        
-        if not base_nome:
-            base_nome = str(dados_demanda.get('nome') or '').strip()
-        
-        if not base_nome:
-            base_nome = 'Plano_Trabalho'
-        
-        # Sanitiza o nome para ser um nome de arquivo seguro
-        # Mantém apenas letras, números, underline, hífen e ponto; substitui o resto por underscore
-        base_nome_sanitizado = re.sub(r'[^A-Za-z0-9_.-]+', '_', base_nome)
-        if not base_nome_sanitizado:
-            base_nome_sanitizado = 'Plano_Trabalho'
-        
-        download_filename = f'{base_nome_sanitizado}_{demanda_id}.docx'
-        print(f"[DEBUG] Nome arquivo base='{base_nome}' sanitizado='{base_nome_sanitizado}', demanda='{demanda_id}', final='{download_filename}'")
-        
-        # Salva em arquivo temporário
-        temp_file = tempfile.NamedTemporaryFile(delete=False, suffix='.docx')
-        temp_path = temp_file.name
-        temp_file.close()
+    except ErroRequisicaoGeracao as e:
+        return jsonify({
+            "error": e.mensagem
+        }), e.status
+    except Exception as e:
+        return jsonify({
+            "error": "Erro ao gerar prévia do Plano de Trabalho",
+            "message": str(e)
+        }), 500
+
+
+def _gerar_item_lote(item, projetos):
+    """
+    Gera um documento do lote. O item é um payload completo ou só o ID da demanda
+    ("128910" ou {"demanda": "128910", "dados_profissionais": {...}}), buscada no Redmine.
+    
+    Returns:
+        (pedido, bytes do documento, 'HIT' ou 'MISS', estatísticas das fontes ou None)
+    """
+    pedido = preparar_geracao(normalizar_item_lote(item), projetos)
+    corpo, origem, estatisticas_fontes = produzir_documento(pedido)
+    return pedido, b''.join(corpo), origem, estatisticas_fontes
+
+
+def _nome_unico(nome, nomes_usados):
+    """Evita nomes repetidos no zip (ex.: a mesma demanda duas vezes no lote)."""
+    base, extensao = os.path.splitext(nome)
+    candidato, sufixo = nome, 2
+    while candidato in nomes_usados:
+        candidato = f"{base}_{sufixo}{extensao}"
+        sufixo += 1
+    nomes_usados.add(candidato)
+    return candidato
+
+
+@app.route('/api/gerar-plano-trabalho/lote', methods=['POST'])
+def gerar_planos_trabalho_lote():
+    """
+    Gera vários Planos de Trabalho em paralelo e retorna um .zip transmitido à medida
+    que cada documento fica pronto.
+    
+    Recebe:
+    {
+        "itens": [
+            {"demanda": "128910", "dados_demanda": {...}, "dados_sprints": [...], "dados_profissionais": {...}},
+            "128911",
+            {"demanda": "128912", "dados_profissionais": {...}}
+        ]
+    }
+    Itens só com o ID da demanda são buscados no Redmine (sem profissionais, se não
+    informados).
+    
+    O zip tem um {nomeSVN}_{demanda}.docx por documento gerado e, por último, o
+    manifesto.json com o resultado de cada item (arquivo ou erro).
+    """
+    data = request.get_json(silent=True)
+    itens = data.get('itens') if isinstance(data, dict) else data
+    if not isinstance(itens, list) or not itens:
+        return jsonify({
+            "error": "Informe a lista de itens do lote"
+        }), 400
+    if len(itens) > LOTE_MAX_ITENS:
+        return jsonify({
+            "error": f"Lote com {len(itens)} itens excede o máximo de {LOTE_MAX_ITENS}"
+        }), 400
+    
+    projetos = carregar_projetos()
+    log.debug("Lote: gerando %s documento(s) com %s thread(s)", len(itens), LOTE_THREADS)
+    
+    def arquivos():
+        manifesto = []
+        nomes_usados = set()
+        executor = ThreadPoolExecutor(max_workers=LOTE_THREADS)
+        gerar_item = com_correlacao(_gerar_item_lote)
+        futuros = {executor.submit(gerar_item, item, projetos): indice for indice, item in enumerate(itens)}
+        try:
+            for futuro in as_completed(futuros):
+                indice = futuros[futuro]
+                item = itens[indice]
+                demanda_item = item.get('demanda') if isinstance(item, dict) else item
+                try:
+                    pedido, documento, origem, estatisticas_fontes = futuro.result()
+                except Exception as e:
+                    mensagem = e.mensagem if isinstance(e, ErroRequisicaoGeracao) else str(e)
+                    log.error("Lote: item %s (demanda %s) falhou: %s", indice, demanda_item, mensagem)
+                    manifesto.append({"indice": indice, "demanda": demanda_item, "status": "erro", "message": mensagem})
+                    continue
+                
+                nome = _nome_unico(pedido['download_filename'], nomes_usados)
+                manifesto.append({
+                    "indice": indice,
+                    "demanda": pedido['demanda_id'],
+                    "status": "ok",
+                    "arquivo": nome,
+                    "tamanho_bytes": len(documento),
+                    "cache": origem,
+                })
+                if estatisticas_fontes:
+                    manifesto[-1]["fontes"] = estatisticas_fontes
+                yield nome, documento
+            
+            manifesto.sort(key=lambda registro: registro['indice'])
+            erros = sum(1 for registro in manifesto if registro['status'] == 'erro')
+            log.debug("Lote concluído: %s gerado(s), %s erro(s)", len(manifesto) - erros, erros)
+            yield 'manifesto.json', json.dumps({
+                "total": len(manifesto),
+                "gerados": len(manifesto) - erros,
+                "erros": erros,
+                "itens": manifesto,
+            }, ensure_ascii=False, indent=2).encode('utf-8')
+        finally:
+            # Cliente desconectou no meio do lote: não gera os itens restantes
+            executor.shutdown(wait=False, cancel_futures=True)
+    
+    resposta = Response(iterar_zip(arquivos()), status=200, mimetype='application/zip')
+    resposta.headers.set('Content-Disposition', 'attachment',
+                         filename=f"Planos_Trabalho_{data_geracao_atual().replace('/', '-')}.zip")
+    return resposta
+
+
+@app.route('/api/tarefas/plano-trabalho', methods=['POST'])
+def criar_tarefa_plano_trabalho():
+    """
+    Enfileira a geração do Plano de Trabalho (mesmo payload de /api/gerar-plano-trabalho).
+    
+    Retorna 202 com o id da tarefa e os links de progresso (Server-Sent Events) e do
+    arquivo; 304 se If-None-Match já corresponde ao documento; 503 (com Retry-After)
+    se a fila estiver cheia.
+    """
+    try:
+        pedido = preparar_geracao(completar_payload(request.get_json()), carregar_projetos())
         
-        doc.save(temp_path)
+        if request.if_none_match.contains_weak(pedido['chave']):
+            return resposta_nao_modificado(pedido)
         
-        # Retorna o arquivo
-        return send_file(
-            temp_path,
-            as_attachment=True,
-            download_name=download_filename,
-            mimetype='application/vnd.openxmlformats-officedocument.wordprocessingml.document'
-        ), 200
+        tarefa = fila_tarefas.submeter(pedido)
+        resposta = jsonify({
+            **tarefa.como_dict(),
+            "progresso": f"/api/tarefas/{tarefa.id}/progresso",
+            "arquivo": f"/api/tarefas/{tarefa.id}/arquivo"
+        })
+        resposta.status_code = 202
+        resposta.headers['Location'] = f"/api/tarefas/{tarefa.id}"
+        return resposta
         
+    except FilaCheia as e:
+        resposta = jsonify({
+            "error": "Muitas gerações em andamento, tente novamente em instantes",
+            "message": str(e)
+        })
+        resposta.status_code = 503
+        resposta.headers['Retry-After'] = str(TAREFAS_RETRY_AFTER_SEGUNDOS)
+        return resposta
+    except ErroRequisicaoGeracao as e:
+        return jsonify({
+            "error": e.mensagem
+        }), e.status
     except Exception as e:
         return jsonify({
-            "error": "Erro ao gerar Plano de Trabalho",
+            "error": "Erro ao criar tarefa de geração",
             "message": str(e)
         }), 500
 
 
+@app.route('/api/tarefas/<id_tarefa>', methods=['GET'])
+def consultar_tarefa(id_tarefa):
+    """Status atual de uma tarefa de geração."""
+    tarefa = fila_tarefas.obter(id_tarefa)
+    if tarefa is None:
+        return jsonify({"error": "Tarefa não encontrada"}), 404
+    return jsonify(tarefa.como_dict()), 200
+
+
+@app.route('/api/tarefas/<id_tarefa>/progresso', methods=['GET'])
+def progresso_tarefa(id_tarefa):
+    """
+    Progresso da tarefa por Server-Sent Events: 'inicio', um 'etapa' por etapa da geração
+    e, no fim, 'concluida' ou 'erro'. Cada evento tem id sequencial; reconexões com
+    Last-Event-ID continuam do evento seguinte.
+    """
+    tarefa = fila_tarefas.obter(id_tarefa)
+    if tarefa is None:
+        return jsonify({"error": "Tarefa não encontrada"}), 404
+    
+    try:
+        proximo = int(request.headers.get('Last-Event-ID', -1)) + 1
+    except ValueError:
+        proximo = 0
+    
+    def eventos():
+        nonlocal proximo
+        yield 'retry: 2000\n\n'
+        while True:
+            novos = tarefa.aguardar_eventos(proximo, timeout=TAREFAS_SSE_PING_SEGUNDOS)
+            if not novos:
+                # Comentário SSE: mantém a conexão aberta em proxies com timeout de inatividade
+                yield ': ping\n\n'
+                continue
+            for tipo, dados in novos:
+                yield f"id: {proximo}\nevent: {tipo}\ndata: {json.dumps(dados, ensure_ascii=False)}\n\n"
+                proximo += 1
+                if tipo in ('concluida', 'erro'):
+                    return
+    
+    resposta = Response(eventos(), mimetype='text/event-stream')
+    resposta.headers['Cache-Control'] = 'no-cache'
+    resposta.headers['X-Accel-Buffering'] = 'no'  # nginx: não acumula o stream
+    return resposta
+
+
+@app.route('/api/tarefas/<id_tarefa>/arquivo', methods=['GET'])
+def arquivo_tarefa(id_tarefa):
+    """Arquivo .docx de uma tarefa concluída (409 enquanto ainda está em andamento)."""
+    tarefa = fila_tarefas.obter(id_tarefa)
+    if tarefa is None:
+        return jsonify({"error": "Tarefa não encontrada"}), 404
+    if tarefa.status == STATUS_ERRO:
+        return jsonify({
+            "error": "Erro ao gerar Plano de Trabalho",
+            "message": tarefa.erro
+        }), 500
+    if tarefa.status != STATUS_CONCLUIDA:
+        return jsonify({
+            "error": "Tarefa ainda não concluída",
+            **tarefa.como_dict()
+        }), 409
+    
+    if request.if_none_match.contains_weak(tarefa.pedido['chave']):
+        return resposta_nao_modificado(tarefa.pedido)
+    return resposta_documento(tarefa.pedido, [tarefa.documento], tarefa.origem, tarefa.estatisticas_fontes)
+
+
 def get_redis_client():
     """Cria e retorna um cliente Redis para Vercel KV."""
     if not REDIS_AVAILABLE:
@@ -331,7 +808,7 @@ def get_redis_client():
                 'token': kv_token
             }
     except Exception as e:
-        print(f"[WARN] Erro ao configurar Redis: {e}")
+        log.warning("Erro ao configurar Redis: %s", e)
     
     return None
 
@@ -341,6 +818,7 @@ def get_projetos_file_path():
     return os.path.join(os.path.dirname(__file__), 'config', 'projetos.json')
 
 
+@medir('projetos')
 def carregar_projetos():
     """Carrega a lista de projetos do Vercel KV ou arquivo JSON (fallback)."""
     # Tenta carregar do Vercel KV primeiro
@@ -366,9 +844,7 @@ def carregar_projetos():
                 if result:
                     return json.loads(result)
         except Exception as e:
-            print(f"[WARN] Erro ao carregar do KV, usando fallback: {e}")
-            import traceback
-            traceback.print_exc()
+            log.warning("Erro ao carregar do KV, usando fallback: %s", e, exc_info=True)
     
     # Fallback: carrega do arquivo JSON (desenvolvimento local)
     try:
@@ -378,7 +854,7 @@ def carregar_projetos():
                 projetos = json.load(f)
                 return projetos
     except Exception as e:
-        print(f"[ERROR] Erro ao carregar projetos do arquivo: {e}")
+        log.error("Erro ao carregar projetos do arquivo: %s", e)
     
     return []
 
@@ -403,14 +879,12 @@ def salvar_projetos(projetos):
                 timeout=5
             )
             if response.status_code == 200:
-                print("[INFO] Projetos salvos no Vercel KV com sucesso")
+                log.info("Projetos salvos no Vercel KV com sucesso")
                 return True
             else:
-                print(f"[WARN] Resposta inesperada do KV: {response.status_code} - {response.text}")
+                log.warning("Resposta inesperada do KV: %s - %s", response.status_code, response.text)
         except Exception as e:
-            print(f"[WARN] Erro ao salvar no KV, usando fallback: {e}")
-            import traceback
-            traceback.print_exc()
+            log.warning("Erro ao salvar no KV, usando fallback: %s", e, exc_info=True)
     
     # Fallback: salva no arquivo JSON (desenvolvimento local)
     try:
@@ -421,15 +895,38 @@ def salvar_projetos(projetos):
         
         with open(projetos_path, 'w', encoding='utf-8') as f:
             json.dump(projetos, f, ensure_ascii=False, indent=2)
-        print("[INFO] Projetos salvos no arquivo local (fallback)")
+        log.info("Projetos salvos no arquivo local (fallback)")
         return True
     except Exception as e:
-        print(f"[ERROR] Erro ao salvar projetos no arquivo: {e}")
-        import traceback
-        traceback.print_exc()
+        log.error("Erro ao salvar projetos no arquivo: %s", e, exc_info=True)
         return False
 
 
+@app.route('/api/modelos', methods=['GET'])
+def listar_modelos():
+    """
+    Rota para listar os modelos de Plano de Trabalho registrados (versão, revisão,
+    compilação e quantidade de tags) e as regras de escolha.
+
+    Query:
+        atualizar=1: verifica o diretório antes de listar (sem esperar a próxima verificação)
+
+    Returns:
+        JSON com os modelos e as regras:
+        - 200: Listagem
+        - 500: Erro no servidor
+    """
+    try:
+        if request.args.get('atualizar') in ('1', 'true'):
+            registro_modelos.atualizar()
+        return jsonify(registro_modelos.listar()), 200
+    except Exception as e:
+        return jsonify({
+            "error": "Erro ao listar modelos",
+            "message": str(e)
+        }), 500
+
+
 @app.route('/api/projetos', methods=['GET'])
 def listar_projetos():
     """
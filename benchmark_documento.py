@@ -0,0 +1,587 @@
+"""
+Script para medir o desempenho do motor de documentos.
+
+Modos:
+  - duplicação: mede a duplicação em bloco das linhas de sprint para 1, 10, 100 e 500 sprints
+  - escalabilidade: roda preencher_plano_trabalho de 5 a 1000 sprints (a mais rápida de
+    REPETICOES_ESCALABILIDADE medições por tamanho) e verifica que o crescimento do tempo
+    é próximo de linear (sai com código 1 caso contrário)
+  - salvamento: compara doc.save com gravar_pacote (cópia das partes do modelo sem recompressão)
+  - memória: compara a memória (Python) retida por docx.Document e por abrir_documento
+    (zip do modelo carregado uma vez, partes não XML descompactadas sob demanda)
+  - concorrência: gera vários documentos ao mesmo tempo com threads (preso ao GIL) e com o
+    pool de processos (RENDER_PROCESSOS) e compara a vazão
+  - fontes: tamanho do .docx e tempo de gravação com as fontes embutidas mantidas, removidas
+    e reduzidas a subconjunto (o primeiro subconjunto, sem cache, é medido à parte)
+  - logs: tempo de preencher_plano_trabalho com o debug desligado (INFO), com DEBUG e com o
+    rastro completo (RASTRO), e as linhas de log escritas em cada nível
+  - suíte: cenários sintéticos (sprints, profissionais por sprint, introdução longa) em cada
+    modelo; tempo de cada etapa (services.metricas) e da gravação, alocações (tracemalloc) e
+    pico de RSS. Grava os resultados em JSON (--saida=arquivo.json) e, com
+    --comparar=base.json, aponta as regressões em relação à base (sai com código 1)
+
+Use: python benchmark_documento.py [--escalabilidade | --salvamento | --memoria | --concorrencia | --fontes | --logs | --suite [--saida=arquivo.json] [--comparar=base.json]] [caminho_do_modelo.docx ...]
+"""
+import contextlib
+import io
+import json
+import multiprocessing
+import os
+import platform
+import sys
+import time
+import tracemalloc
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from datetime import datetime
+from docx import Document
+from docx.oxml.ns import qn
+from services import fontes_docx, logs
+from services.documento import duplicar_linha_tabela, remover_linhas_tabela, preencher_plano_trabalho
+from services.memoria import PicoMemoria
+from services.metricas import coletar_medicoes, medir
+from services.pacote_docx import abrir_documento, gravar_pacote
+
+QUANTIDADES_SPRINTS = [1, 10, 100, 500]
+REPETICOES = 5
+
+# Escalabilidade: tamanhos do plano e fator máximo aceito entre o custo marginal por sprint
+# no trecho final (500 -> 1000) e no trecho inicial (5 -> 250). Crescimento quadrático
+# daria um fator próximo de 6.
+QUANTIDADES_ESCALABILIDADE = [5, 250, 500, 1000]
+PROFISSIONAIS_POR_SPRINT = 2
+FATOR_MAXIMO_CUSTO_MARGINAL = 2.5
+# Medições de cada tamanho (vale a mais rápida): uma só medição oscila com a carga da
+# máquina e o fator passa a falhar ao acaso
+REPETICOES_ESCALABILIDADE = 3
+
+# Concorrência: documentos gerados ao mesmo tempo e sprints de cada um
+DOCUMENTOS_CONCORRENCIA = 8
+SPRINTS_CONCORRENCIA = 50
+
+# Salvamento: sprints do documento medido e níveis de compressão comparados
+SPRINTS_SALVAMENTO = 10
+NIVEIS_COMPRESSAO_SALVAMENTO = [1, 6, 9]
+
+# Logs: sprints do documento medido e níveis comparados
+SPRINTS_LOGS = 50
+NIVEIS_LOGS = ['INFO', 'DEBUG', 'RASTRO']
+
+# Suíte: cenários (nome, sprints, profissionais por sprint, parágrafos da introdução do
+# projeto), repetições (vale a mais rápida) e arquivo de resultados
+CENARIOS_SUITE = [
+    ('pequeno', 5, 2, 1),
+    ('medio', 50, 4, 5),
+    ('grande', 100, 6, 20),
+    ('introducao_longa', 10, 2, 300),
+]
+REPETICOES_SUITE = 5
+ARQUIVO_SUITE = 'benchmark_resultados.json'
+VERSAO_FORMATO_SUITE = 1
+
+# Comparação com a base: (variação relativa, diferença absoluta) acima das quais uma medida
+# é regressão; a diferença absoluta evita apontar ruído em etapas de poucos milissegundos
+TOLERANCIAS_SUITE = {
+    'tempo_ms': (0.15, 2.0),
+    'alocacao_pico_kb': (0.10, 256.0),
+    'rss_pico_mb': (0.10, 2.0),
+}
+
+
+def localizar_linhas_template_sprint(doc):
+    """Retorna (tabela, índices) da primeira tabela com linhas template de sprint ({SPRINT_ID})."""
+    for table in doc.tables:
+        indices = []
+        for idx, tr in enumerate(table._tbl.tr_lst):
+            texto = ''.join(t.text or '' for t in tr.iter(qn('w:t')))
+            if '{SPRINT_ID}' in texto:
+                indices.append(idx)
+        if indices:
+            return table, indices
+    return None, []
+
+
+def medir_duplicacao(modelo_path, num_sprints):
+    """Mede o tempo (em ms) para ajustar a tabela de sprints a num_sprints linhas."""
+    tempos = []
+    for _ in range(REPETICOES):
+        doc = Document(modelo_path)
+        table, linhas_template = localizar_linhas_template_sprint(doc)
+        if table is None:
+            raise ValueError(f"Nenhuma tabela de sprints encontrada em {modelo_path}")
+
+        inicio = time.perf_counter()
+        if num_sprints > len(linhas_template):
+            duplicar_linha_tabela(table, linhas_template[-1], num_sprints - len(linhas_template))
+        elif num_sprints < len(linhas_template):
+            trs = table._tbl.tr_lst
+            remover_linhas_tabela(table, [trs[idx] for idx in linhas_template[num_sprints:]])
+        tempos.append((time.perf_counter() - inicio) * 1000)
+
+        linhas_sprint = len(localizar_linhas_template_sprint(doc)[1])
+        if linhas_sprint != num_sprints:
+            raise AssertionError(f"Esperadas {num_sprints} linhas de sprint, encontradas {linhas_sprint}")
+    return min(tempos)
+
+
+def executar_benchmark(modelo_path):
+    print("=" * 80)
+    print(f"BENCHMARK - DUPLICAÇÃO DE LINHAS DE SPRINT - {modelo_path}")
+    print("=" * 80)
+    print(f"{'Sprints':>10} {'Tempo (ms)':>14} {'ms/sprint':>12}")
+    for num_sprints in QUANTIDADES_SPRINTS:
+        tempo_ms = medir_duplicacao(modelo_path, num_sprints)
+        print(f"{num_sprints:>10} {tempo_ms:>14.3f} {tempo_ms / num_sprints:>12.4f}")
+    print("=" * 80)
+
+
+def gerar_payload_sintetico(num_sprints, profissionais_por_sprint, paragrafos_introducao=1):
+    """Gera (dados_demanda, dados_sprints, dados_profissionais, dados_projeto) sintéticos."""
+    dados_demanda = {
+        'demanda': '128910',
+        'pt': '129199',
+        'nome': 'Projeto Benchmark',
+        'valor_demanda': 'R$ 78.294,40',
+    }
+    dados_sprints = []
+    dados_profissionais = {}
+    for i in range(num_sprints):
+        sprint_id = str(200000 + i)
+        dados_sprints.append({
+            'demanda': '128910',
+            'pt': '129199',
+            'os': str(300000 + i),
+            'sprint': sprint_id,
+            'tipo': 'Desenvolvimento' if i % 2 else 'Manutenção',
+            'nome': 'Projeto Benchmark',
+            'hst': '160',
+            'horas_sprint': '80',
+            'valor_h_sprint': 'R$ 244,67',
+            'valor_total': 'R$ 39.147,20',
+            'valor_demanda': 'R$ 78.294,40',
+        })
+        dados_profissionais[sprint_id] = [
+            {'tipo': f'Perfil {j + 1}', 'quantidade': 1, 'horas': str(10 * (j + 1))}
+            for j in range(profissionais_por_sprint)
+        ]
+    dados_projeto = {
+        'nomeProjeto': 'Projeto Benchmark',
+        'gestorNome': 'Gestor Benchmark',
+        'gestorEmail': 'gestor@exemplo.com',
+        'gestorCelular': '(61) 90000-0000',
+        'gerenteNome': 'Gerente Benchmark',
+        'gerenteEmail': 'gerente@exemplo.com',
+        'gerenteTelefone': '(61) 3000-0000',
+        'introducaoProjeto': '\n'.join(
+            f'Parágrafo {i + 1} da introdução do projeto de benchmark, com o contexto, os objetivos '
+            f'e o escopo das entregas previstas para as sprints da demanda.'
+            for i in range(paragrafos_introducao)
+        ) if paragrafos_introducao > 1 else 'Introdução do projeto de benchmark.',
+    }
+    return dados_demanda, dados_sprints, dados_profissionais, dados_projeto
+
+
+def medir_preenchimento(modelo_path, num_sprints, repeticoes=1):
+    """
+    Mede o tempo (em s, o mais rápido de `repeticoes`) de preencher_plano_trabalho para
+    num_sprints sprints (sem o log de debug).
+    """
+    dados_demanda, dados_sprints, dados_profissionais, dados_projeto = gerar_payload_sintetico(
+        num_sprints, PROFISSIONAIS_POR_SPRINT
+    )
+    tempos = []
+    for _ in range(repeticoes):
+        inicio = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):
+            preencher_plano_trabalho(modelo_path, dados_demanda, dados_sprints, dados_profissionais, dados_projeto)
+        tempos.append(time.perf_counter() - inicio)
+    return min(tempos)
+
+
+def executar_escalabilidade(modelo_path):
+    """Verifica que o tempo de preenchimento cresce de forma aproximadamente linear. Retorna True se passou."""
+    print("=" * 80)
+    print(f"ESCALABILIDADE - preencher_plano_trabalho - {modelo_path}")
+    print("=" * 80)
+    print(f"{'Sprints':>10} {'Tempo (s)':>12} {'ms/sprint':>12}")
+    tempos = []
+    for num_sprints in QUANTIDADES_ESCALABILIDADE:
+        tempo = medir_preenchimento(modelo_path, num_sprints, REPETICOES_ESCALABILIDADE)
+        tempos.append(tempo)
+        print(f"{num_sprints:>10} {tempo:>12.3f} {tempo * 1000 / num_sprints:>12.3f}")
+
+    n = QUANTIDADES_ESCALABILIDADE
+    custo_inicial = (tempos[1] - tempos[0]) / (n[1] - n[0])
+    custo_final = (tempos[-1] - tempos[-2]) / (n[-1] - n[-2])
+    fator = custo_final / custo_inicial if custo_inicial > 0 else float('inf')
+    passou = fator <= FATOR_MAXIMO_CUSTO_MARGINAL
+    print(f"Custo marginal por sprint: {custo_inicial * 1000:.3f} ms ({n[0]}->{n[1]}) / "
+          f"{custo_final * 1000:.3f} ms ({n[-2]}->{n[-1]}) - fator {fator:.2f} "
+          f"(máximo {FATOR_MAXIMO_CUSTO_MARGINAL}) - {'OK' if passou else 'FALHOU'}")
+    print("=" * 80)
+    return passou
+
+
+def medir_salvamento(salvar):
+    """Mede o tempo (em ms, melhor de REPETICOES) e o tamanho (em bytes) de uma função de salvamento."""
+    tempos = []
+    for _ in range(REPETICOES):
+        buffer = io.BytesIO()
+        inicio_cpu = time.process_time()
+        inicio = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):
+            salvar(buffer)
+        tempos.append(((time.perf_counter() - inicio) * 1000, (time.process_time() - inicio_cpu) * 1000))
+    tempo, cpu = min(tempos)
+    return tempo, cpu, len(buffer.getvalue())
+
+
+def executar_salvamento(modelo_path):
+    """Compara doc.save (recomprime tudo) com gravar_pacote (copia as partes não alteradas)."""
+    print("=" * 80)
+    print(f"SALVAMENTO - {SPRINTS_SALVAMENTO} sprints - {modelo_path}")
+    print("=" * 80)
+    payload = gerar_payload_sintetico(SPRINTS_SALVAMENTO, PROFISSIONAIS_POR_SPRINT)
+    with contextlib.redirect_stdout(io.StringIO()):
+        doc = preencher_plano_trabalho(modelo_path, *payload)
+
+    print(f"{'Método':<32} {'Tempo (ms)':>12} {'CPU (ms)':>10} {'Tamanho (KB)':>14}")
+    tempo, cpu, tamanho = medir_salvamento(doc.save)
+    print(f"{'doc.save':<32} {tempo:>12.1f} {cpu:>10.1f} {tamanho / 1024:>14.1f}")
+    for nivel in NIVEIS_COMPRESSAO_SALVAMENTO:
+        tempo, cpu, tamanho = medir_salvamento(
+            lambda saida: gravar_pacote(doc, saida, modelo_path, nivel_compressao=nivel)
+        )
+        print(f"{f'gravar_pacote (nível {nivel})':<32} {tempo:>12.1f} {cpu:>10.1f} {tamanho / 1024:>14.1f}")
+    print("=" * 80)
+
+
+def executar_fontes(modelo_path):
+    """Compara tamanho e tempo de gravação (reduzir_fontes + gravar_pacote) em cada modo de fontes."""
+    print("=" * 80)
+    print(f"FONTES - {SPRINTS_SALVAMENTO} sprints - {modelo_path}")
+    print("=" * 80)
+    payload = gerar_payload_sintetico(SPRINTS_SALVAMENTO, PROFISSIONAIS_POR_SPRINT)
+    if not fontes_docx.FONTTOOLS_DISPONIVEL:
+        print("fontTools não instalado: o modo subconjunto remove as fontes")
+
+    def gravar(modo, saida):
+        with contextlib.redirect_stdout(io.StringIO()):
+            doc = preencher_plano_trabalho(modelo_path, *payload)
+        inicio = time.perf_counter()
+        fontes_docx.reduzir_fontes(doc, modo)
+        gravar_pacote(doc, saida, modelo_path)
+        return (time.perf_counter() - inicio) * 1000
+
+    print(f"{'Modo':<28} {'Tempo (ms)':>12} {'Tamanho (KB)':>14} {'Redução':>10}")
+    tamanho_original = None
+    for modo, repeticoes in [('manter', REPETICOES), ('remover', REPETICOES),
+                             ('subconjunto (sem cache)', 1), ('subconjunto', REPETICOES)]:
+        if modo.endswith('(sem cache)'):
+            fontes_docx._cache_subconjuntos.clear()
+        resultados = []
+        for _ in range(repeticoes):
+            saida = io.BytesIO()
+            with contextlib.redirect_stdout(io.StringIO()):
+                tempo = gravar(modo.split()[0], saida)
+            resultados.append((tempo, len(saida.getvalue())))
+        tempo, tamanho = min(resultados)
+        tamanho_original = tamanho_original or tamanho
+        print(f"{modo:<28} {tempo:>12.1f} {tamanho / 1024:>14.1f} {1 - tamanho / tamanho_original:>10.1%}")
+    print("=" * 80)
+
+
+def executar_logs(modelo_path):
+    """Compara o custo do log da geração por nível (as linhas vão para a memória, não para o terminal)."""
+    print("=" * 80)
+    print(f"LOGS - preencher_plano_trabalho - {SPRINTS_LOGS} sprints - {modelo_path}")
+    print("=" * 80)
+    payload = gerar_payload_sintetico(SPRINTS_LOGS, PROFISSIONAIS_POR_SPRINT)
+    with contextlib.redirect_stdout(io.StringIO()):
+        preencher_plano_trabalho(modelo_path, *payload)  # compila o modelo fora da medição
+
+    print(f"{'Nível':<12} {'Tempo (ms)':>12} {'Linhas':>10} {'Log (KB)':>10}")
+    try:
+        for nivel in NIVEIS_LOGS:
+            resultados = []
+            for _ in range(REPETICOES):
+                saida = io.StringIO()
+                logs.configurar_logs(nivel, saida=saida)
+                inicio = time.perf_counter()
+                preencher_plano_trabalho(modelo_path, *payload)
+                resultados.append(((time.perf_counter() - inicio) * 1000, saida.getvalue()))
+            tempo, texto = min(resultados)
+            print(f"{nivel:<12} {tempo:>12.1f} {texto.count(chr(10)):>10} {len(texto.encode('utf-8')) / 1024:>10.1f}")
+    finally:
+        logs.configurar_logs()
+    print("=" * 80)
+
+
+def executar_memoria(modelo_path):
+    """Compara a memória retida (tracemalloc, sem as árvores lxml) e o tempo de abertura do modelo."""
+    print("=" * 80)
+    print(f"MEMÓRIA - abertura do modelo - {modelo_path}")
+    print("=" * 80)
+    with contextlib.redirect_stdout(io.StringIO()):
+        abrir_documento(modelo_path)  # carrega o zip do modelo fora da medição
+
+    print(f"{'Método':<20} {'Tempo (ms)':>12} {'Retida (KB)':>14} {'Pico (KB)':>12}")
+    for nome, abrir in [('docx.Document', Document), ('abrir_documento', abrir_documento)]:
+        tracemalloc.start()
+        inicio = time.perf_counter()
+        doc = abrir(modelo_path)
+        tempo = (time.perf_counter() - inicio) * 1000
+        retida, pico = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        del doc
+        print(f"{nome:<20} {tempo:>12.1f} {retida / 1024:>14.1f} {pico / 1024:>12.1f}")
+    print("=" * 80)
+
+
+def executar_concorrencia(modelo_path):
+    """Compara a vazão (documentos/s) gerando em threads e no pool de processos."""
+    from services import processos_render
+
+    print("=" * 80)
+    print(f"CONCORRÊNCIA - {DOCUMENTOS_CONCORRENCIA} documentos de {SPRINTS_CONCORRENCIA} sprints - {modelo_path}")
+    print("=" * 80)
+    dados_demanda, dados_sprints, dados_profissionais, dados_projeto = gerar_payload_sintetico(
+        SPRINTS_CONCORRENCIA, PROFISSIONAIS_POR_SPRINT
+    )
+    processos = max(processos_render.PROCESSOS_RENDER, 1)
+
+    def gerar_em_thread(_):
+        doc = preencher_plano_trabalho(modelo_path, dados_demanda, dados_sprints, dados_profissionais, dados_projeto)
+        gravar_pacote(doc, io.BytesIO(), modelo_path)
+
+    def gerar_no_pool(_):
+        corpo, _ = processos_render.gerar_documento(
+            modelo_path, dados_demanda, dados_sprints, dados_profissionais, dados_projeto
+        )
+        b''.join(corpo)
+
+    print(f"{'Método':<32} {'Tempo (s)':>12} {'Documentos/s':>14}")
+    with contextlib.redirect_stdout(io.StringIO()):
+        pool = processos_render.iniciar_pool_render([modelo_path])
+    for nome, gerar in [(f'threads ({processos})', gerar_em_thread), (f'processos ({processos})', gerar_no_pool)]:
+        if gerar is gerar_no_pool and pool is None:
+            print(f"{nome:<32} {'pool indisponível (RENDER_PROCESSOS=0?)':>28}")
+            continue
+        inicio = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()), ThreadPoolExecutor(processos) as executor:
+            list(executor.map(gerar, range(DOCUMENTOS_CONCORRENCIA)))
+        tempo = time.perf_counter() - inicio
+        print(f"{nome:<32} {tempo:>12.2f} {DOCUMENTOS_CONCORRENCIA / tempo:>14.2f}")
+    print("=" * 80)
+
+
+def _gerar_e_gravar(modelo_path, payload):
+    """Preenche o modelo e grava o .docx em memória; retorna o tamanho em bytes."""
+    doc = preencher_plano_trabalho(modelo_path, *payload)
+    with medir('salvamento'):
+        saida = io.BytesIO()
+        gravar_pacote(doc, saida, modelo_path)
+    return len(saida.getvalue())
+
+
+def _medir_rss_cenario(modelo_path, payload):
+    """
+    Executado em um processo novo: pico de RSS (MB, ver services.memoria) de uma geração,
+    acima do RSS com o modelo já aberto. None sem /proc.
+    """
+    with contextlib.redirect_stdout(io.StringIO()):
+        abrir_documento(modelo_path)
+        with PicoMemoria() as pico:
+            _gerar_e_gravar(modelo_path, payload)
+    return pico.pico_mb
+
+
+def medir_cenario(modelo_path, payload):
+    """
+    Mede um cenário da suíte: tempo de cada etapa (a repetição mais rápida de cada uma),
+    alocações do Python (tracemalloc) e pico de RSS.
+
+    IMPORTANTE: o RSS é medido em um processo iniciado com spawn; um processo criado com
+    fork herdaria a memória que as gerações anteriores deixaram alocada e reutilizaria
+    essa memória sem aumentar o RSS.
+    """
+    tempos = {}
+    tamanho = 0
+    for _ in range(REPETICOES_SUITE):
+        inicio = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()), coletar_medicoes() as medicoes:
+            tamanho = _gerar_e_gravar(modelo_path, payload)
+        repeticao = {'total': time.perf_counter() - inicio}
+        for etapa, segundos in medicoes:
+            repeticao[etapa] = repeticao.get(etapa, 0.0) + segundos
+        for etapa, segundos in repeticao.items():
+            tempos[etapa] = min(tempos.get(etapa, segundos), segundos)
+
+    tracemalloc.start()
+    try:
+        with contextlib.redirect_stdout(io.StringIO()):
+            doc = preencher_plano_trabalho(modelo_path, *payload)
+            gravar_pacote(doc, io.BytesIO(), modelo_path)
+        retida, pico = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    del doc
+
+    with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context('spawn')) as executor:
+        rss_pico = executor.submit(_medir_rss_cenario, modelo_path, payload).result()
+
+    return {
+        'tempo_ms': {etapa: round(segundos * 1000, 3) for etapa, segundos in tempos.items()},
+        'alocacao_pico_kb': round(pico / 1024, 1),
+        'alocacao_retida_kb': round(retida / 1024, 1),
+        'rss_pico_mb': rss_pico,
+        'tamanho_kb': round(tamanho / 1024, 1),
+    }
+
+
+def executar_suite(modelos, saida=ARQUIVO_SUITE):
+    """Roda os cenários da suíte em cada modelo e grava os resultados em JSON; retorna os resultados."""
+    resultados = {}
+    print("=" * 100)
+    print(f"SUÍTE - {len(CENARIOS_SUITE)} cenários x {len(modelos)} modelo(s) - melhor de {REPETICOES_SUITE}")
+    print("=" * 100)
+    print(f"{'Modelo / cenário':<48} {'Total (ms)':>11} {'Gravação (ms)':>14} {'Alocação (KB)':>14} {'RSS (MB)':>9}")
+    for modelo_path in modelos:
+        with contextlib.redirect_stdout(io.StringIO()):
+            preencher_plano_trabalho(modelo_path, *gerar_payload_sintetico(1, 1))  # compila o modelo fora da medição
+        for nome, num_sprints, profissionais, paragrafos in CENARIOS_SUITE:
+            payload = gerar_payload_sintetico(num_sprints, profissionais, paragrafos)
+            chave = f"{os.path.basename(modelo_path)}/{nome}"
+            resultado = {
+                'sprints': num_sprints,
+                'profissionais_por_sprint': profissionais,
+                'paragrafos_introducao': paragrafos,
+                **medir_cenario(modelo_path, payload),
+            }
+            resultados[chave] = resultado
+            rss = resultado['rss_pico_mb']
+            print(f"{chave:<48} {resultado['tempo_ms']['total']:>11.1f} "
+                  f"{resultado['tempo_ms'].get('salvamento', 0.0):>14.1f} "
+                  f"{resultado['alocacao_pico_kb']:>14.1f} {'-' if rss is None else f'{rss:.1f}':>9}")
+    print("=" * 100)
+
+    documento = {
+        'versao_formato': VERSAO_FORMATO_SUITE,
+        'gerado_em': datetime.now().isoformat(timespec='seconds'),
+        'ambiente': {
+            'python': platform.python_version(),
+            'plataforma': platform.platform(),
+            'cpus': os.cpu_count(),
+        },
+        'repeticoes': REPETICOES_SUITE,
+        'resultados': resultados,
+    }
+    with open(saida, 'w', encoding='utf-8') as f:
+        json.dump(documento, f, ensure_ascii=False, indent=2)
+    print(f"Resultados gravados em {saida}")
+    return documento
+
+
+def _comparar_medida(base, atual, tolerancia):
+    """(variação relativa, regressão?) de uma medida em relação à base."""
+    relativa, absoluta = tolerancia
+    variacao = (atual - base) / base if base else 0.0
+    return variacao, atual - base > absoluta and variacao > relativa
+
+
+def comparar_suite(base, atual):
+    """
+    Compara os resultados da suíte com a base (mesmo formato de executar_suite) e lista as
+    regressões (TOLERANCIAS_SUITE). Cenários que só existem em um dos lados são avisados,
+    não comparados. Retorna True se não houve regressão.
+    """
+    print("=" * 100)
+    print(f"COMPARAÇÃO COM A BASE ({base.get('gerado_em', '?')}, Python {base.get('ambiente', {}).get('python', '?')})")
+    print("=" * 100)
+    if base.get('versao_formato') != VERSAO_FORMATO_SUITE:
+        print(f"Formato da base ({base.get('versao_formato')}) diferente do atual ({VERSAO_FORMATO_SUITE}): sem comparação")
+        return False
+
+    regressoes = 0
+    print(f"{'Modelo / cenário':<40} {'Medida':<22} {'Base':>10} {'Atual':>10} {'Variação':>10}")
+    for chave, resultado in atual['resultados'].items():
+        anterior = base['resultados'].get(chave)
+        if anterior is None:
+            print(f"{chave:<40} sem base")
+            continue
+        medidas = [(f'tempo_ms.{etapa}', 'tempo_ms', anterior['tempo_ms'].get(etapa), valor)
+                   for etapa, valor in resultado['tempo_ms'].items()]
+        medidas += [(medida, medida, anterior.get(medida), resultado.get(medida))
+                    for medida in ('alocacao_pico_kb', 'rss_pico_mb')]
+        for nome, tipo, valor_base, valor_atual in medidas:
+            if valor_base is None or valor_atual is None:
+                continue
+            variacao, regrediu = _comparar_medida(valor_base, valor_atual, TOLERANCIAS_SUITE[tipo])
+            if regrediu:
+                regressoes += 1
+            print(f"{chave:<40} {nome:<22} {valor_base:>10.1f} {valor_atual:>10.1f} {variacao:>+10.1%}"
+                  f"{'  REGRESSÃO' if regrediu else ''}")
+    for chave in sorted(set(base['resultados']) - set(atual['resultados'])):
+        print(f"{chave:<40} só na base")
+    print("=" * 100)
+    print(f"{regressoes} regressão(ões)" if regressoes else "Nenhuma regressão")
+    return regressoes == 0
+
+
+if __name__ == '__main__':
+    argumentos = sys.argv[1:]
+    modo_escalabilidade = '--escalabilidade' in argumentos
+    modo_salvamento = '--salvamento' in argumentos
+    modo_memoria = '--memoria' in argumentos
+    modo_concorrencia = '--concorrencia' in argumentos
+    modo_fontes = '--fontes' in argumentos
+    modo_logs = '--logs' in argumentos
+    modo_suite = '--suite' in argumentos
+    opcoes = dict(arg[2:].split('=', 1) for arg in argumentos if arg.startswith('--') and '=' in arg)
+    modelos = [arg for arg in argumentos if not arg.startswith('--')]
+    if not modelos:
+        raiz = os.path.dirname(os.path.abspath(__file__))
+        modelos = [
+            os.path.join(raiz, 'Modelo PT-CURSOR.docx'),
+            os.path.join(raiz, 'ModeloPT-LEO-CURSOR.docx'),
+        ]
+
+    if modo_escalabilidade:
+        resultados = [executar_escalabilidade(modelo) for modelo in modelos]
+        sys.exit(0 if all(resultados) else 1)
+
+    if modo_salvamento:
+        for modelo in modelos:
+            executar_salvamento(modelo)
+        sys.exit(0)
+
+    if modo_memoria:
+        for modelo in modelos:
+            executar_memoria(modelo)
+        sys.exit(0)
+
+    if modo_concorrencia:
+        for modelo in modelos:
+            executar_concorrencia(modelo)
+        sys.exit(0)
+
+    if modo_fontes:
+        for modelo in modelos:
+            executar_fontes(modelo)
+        sys.exit(0)
+
+    if modo_logs:
+        for modelo in modelos:
+            executar_logs(modelo)
+        sys.exit(0)
+
+    if modo_suite:
+        base = None
+        if 'comparar' in opcoes:
+            # Lida antes de rodar: a base pode ser o próprio arquivo de saída
+            with open(opcoes['comparar'], 'r', encoding='utf-8') as f:
+                base = json.load(f)
+        atual = executar_suite(modelos, opcoes.get('saida', ARQUIVO_SUITE))
+        sys.exit(0 if base is None or comparar_suite(base, atual) else 1)
+
+    for modelo in modelos:
+        executar_benchmark(modelo)
@@ -0,0 +1,273 @@
+"""
+Gerador de Planos de Trabalho em lote, por linha de comando (sem passar pela API HTTP).
+
+Lê os itens de um arquivo e gera um .docx por item em um pool de processos:
+  - .jsonl: um item por linha - payload de geração completo (como o enviado para
+    /api/gerar-plano-trabalho), {"demanda": "128910", "dados_profissionais": {...}} ou só
+    o ID da demanda ("128910"); itens só com o ID são buscados no Redmine
+  - .csv: uma demanda por linha (coluna "demanda"; coluna opcional "dados_profissionais"
+    com o JSON dos profissionais)
+
+O resultado de cada item é registrado em <saida>/manifesto.jsonl. Rodar de novo com a
+mesma saída retoma o lote: itens já gerados (com o arquivo presente) são pulados e só
+os que falharam ou não foram processados são gerados.
+
+Use: python gerar_lote.py ENTRADA [--saida DIR] [--processos N] [--projetos ARQUIVO.json]
+                          [--fontes manter|remover|subconjunto] [--refazer] [--verbose]
+"""
+import argparse
+import contextlib
+import csv
+import hashlib
+import io
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from services.documento import carregar_config_sprints, preencher_plano_trabalho
+from services.fontes_docx import MODOS_FONTES, reduzir_fontes
+from services.geracao import ErroRequisicaoGeracao, normalizar_item_lote, preparar_geracao
+from services.logs import configurar_logs
+from services.pacote_docx import gravar_pacote
+from services.registro_modelos import registro_modelos
+
+DIRETORIO_RAIZ = os.path.dirname(os.path.abspath(__file__))
+NOME_MANIFESTO = 'manifesto.jsonl'
+DIRETORIO_PARCIAL = '.parcial'
+
+_verbose = False
+
+
+def ler_itens(caminho):
+    """Lê os itens do lote (.jsonl ou .csv)."""
+    itens = []
+    if caminho.lower().endswith('.csv'):
+        with open(caminho, 'r', encoding='utf-8-sig', newline='') as f:
+            for linha in csv.DictReader(f):
+                demanda = (linha.get('demanda') or '').strip()
+                if not demanda:
+                    continue
+                item = {'demanda': demanda}
+                if (linha.get('dados_profissionais') or '').strip():
+                    item['dados_profissionais'] = json.loads(linha['dados_profissionais'])
+                itens.append(item)
+    else:
+        with open(caminho, 'r', encoding='utf-8') as f:
+            for numero, linha in enumerate(f, start=1):
+                if not linha.strip():
+                    continue
+                try:
+                    itens.append(json.loads(linha))
+                except json.JSONDecodeError as e:
+                    raise ValueError(f"{caminho}:{numero}: JSON inválido ({e})")
+    return itens
+
+
+def chave_item(item):
+    """Identifica o item entre execuções (retomada), independente da posição no arquivo."""
+    return hashlib.sha256(json.dumps(item, sort_keys=True, ensure_ascii=False).encode('utf-8')).hexdigest()[:16]
+
+
+def carregar_manifesto(diretorio_saida):
+    """Último registro de cada item no manifesto de uma execução anterior."""
+    registros = {}
+    caminho = os.path.join(diretorio_saida, NOME_MANIFESTO)
+    if os.path.exists(caminho):
+        with open(caminho, 'r', encoding='utf-8') as f:
+            for linha in f:
+                if linha.strip():
+                    registro = json.loads(linha)
+                    registros[registro['chave']] = registro
+    return registros
+
+
+def carregar_projetos(caminho):
+    """Projetos cadastrados (mesmo formato de config/projetos.json)."""
+    if not caminho or not os.path.exists(caminho):
+        print(f"[WARN] Arquivo de projetos não encontrado ({caminho}); documentos sem dados de projeto")
+        return []
+    with open(caminho, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def _inicializar_processo(verbose):
+    """Pré-carrega os modelos e a configuração de sprints em cada processo do pool."""
+    global _verbose
+    _verbose = verbose
+    if verbose:
+        # Sem --verbose, o que passar do LOG_NIVEL é descartado por _silenciar
+        configurar_logs('DEBUG')
+    with _silenciar():
+        # Descobre e compila os modelos do diretório (registro_modelos)
+        registro_modelos.atualizar()
+        carregar_config_sprints()
+
+
+def _silenciar():
+    """Descarta o log de debug do gerador, exceto com --verbose."""
+    return contextlib.nullcontext() if _verbose else contextlib.redirect_stdout(io.StringIO())
+
+
+def gerar_item(chave, item, projetos, diretorio_parcial, fontes=None):
+    """
+    Executado no processo filho: gera o documento do item em um arquivo parcial.
+    `fontes` é o modo das fontes embutidas dos itens que não informam o próprio.
+
+    Returns:
+        Dicionário com status, demanda, nome do arquivo sugerido, caminho parcial,
+        tamanho, tempo e as estatísticas das fontes embutidas (ou a mensagem de erro)
+    """
+    inicio = time.perf_counter()
+    demanda = item.get('demanda') if isinstance(item, dict) else item
+    try:
+        with _silenciar():
+            payload = normalizar_item_lote(item)
+            if fontes and 'fontes' not in payload:
+                payload = {**payload, 'fontes': fontes}
+            pedido = preparar_geracao(payload, projetos)
+            doc = preencher_plano_trabalho(
+                modelo_path=pedido['modelo_path'],
+                dados_demanda=pedido['dados_demanda'],
+                dados_sprints=pedido['dados_sprints'],
+                dados_profissionais=pedido['dados_profissionais'],
+                dados_projeto=pedido['dados_projeto'],
+                contexto=pedido['contexto'],
+                data_geracao=pedido['data_geracao']
+            )
+            estatisticas_fontes = reduzir_fontes(doc, pedido['fontes'])
+            caminho_parcial = os.path.join(diretorio_parcial, f'{chave}.docx')
+            with open(caminho_parcial, 'wb') as arquivo:
+                gravar_pacote(doc, arquivo, pedido['modelo_path'])
+    except Exception as e:
+        mensagem = e.mensagem if isinstance(e, ErroRequisicaoGeracao) else f"{type(e).__name__}: {e}"
+        return {'status': 'erro', 'demanda': demanda, 'message': mensagem,
+                'segundos': time.perf_counter() - inicio}
+    return {
+        'status': 'ok',
+        'demanda': pedido['demanda_id'],
+        'nome_arquivo': pedido['download_filename'],
+        'caminho_parcial': caminho_parcial,
+        'tamanho_bytes': os.path.getsize(caminho_parcial),
+        'segundos': time.perf_counter() - inicio,
+        'fontes': estatisticas_fontes,
+    }
+
+
+def _nome_unico(nome, nomes_usados):
+    """Evita sobrescrever outro documento do lote com o mesmo nome."""
+    base, extensao = os.path.splitext(nome)
+    candidato, sufixo = nome, 2
+    while candidato in nomes_usados:
+        candidato = f"{base}_{sufixo}{extensao}"
+        sufixo += 1
+    nomes_usados.add(candidato)
+    return candidato
+
+
+def _percentil(valores, percentual):
+    ordenados = sorted(valores)
+    return ordenados[min(len(ordenados) - 1, int(len(ordenados) * percentual / 100))]
+
+
+def executar_lote(caminho_entrada, diretorio_saida, processos, projetos, refazer=False, verbose=False,
+                  fontes=None):
+    """Gera o lote e imprime o progresso e as estatísticas. Retorna o número de erros."""
+    itens = ler_itens(caminho_entrada)
+    diretorio_parcial = os.path.join(diretorio_saida, DIRETORIO_PARCIAL)
+    os.makedirs(diretorio_parcial, exist_ok=True)
+
+    anteriores = {} if refazer else carregar_manifesto(diretorio_saida)
+    pendentes = []
+    nomes_usados = set()
+    pulados = 0
+    for indice, item in enumerate(itens):
+        chave = chave_item(item)
+        registro = anteriores.get(chave)
+        if (registro and registro['status'] == 'ok'
+                and os.path.exists(os.path.join(diretorio_saida, registro['arquivo']))):
+            nomes_usados.add(registro['arquivo'])
+            pulados += 1
+            continue
+        pendentes.append((indice, chave, item))
+
+    print("=" * 80)
+    print(f"GERAÇÃO EM LOTE - {caminho_entrada} -> {diretorio_saida}")
+    print(f"{len(itens)} item(ns), {pulados} já gerado(s) (retomada), {len(pendentes)} a gerar, "
+          f"{processos} processo(s)")
+    print("=" * 80)
+
+    tempos = []
+    erros = 0
+    bytes_gerados = 0
+    inicio = time.perf_counter()
+    with open(os.path.join(diretorio_saida, NOME_MANIFESTO), 'a', encoding='utf-8') as manifesto, \
+            ProcessPoolExecutor(max_workers=processos, initializer=_inicializar_processo,
+                                initargs=(verbose,)) as executor:
+        futuros = {
+            executor.submit(gerar_item, chave, item, projetos, diretorio_parcial, fontes): (indice, chave)
+            for indice, chave, item in pendentes
+        }
+        for concluidos, futuro in enumerate(as_completed(futuros), start=1):
+            indice, chave = futuros[futuro]
+            resultado = futuro.result()
+            registro = {'chave': chave, 'indice': indice, 'demanda': resultado['demanda'],
+                        'status': resultado['status'], 'segundos': round(resultado['segundos'], 3)}
+            if resultado['status'] == 'ok':
+                registro['arquivo'] = _nome_unico(resultado['nome_arquivo'], nomes_usados)
+                registro['tamanho_bytes'] = resultado['tamanho_bytes']
+                if resultado['fontes']:
+                    registro['fontes'] = resultado['fontes']
+                # Só aparece com o nome final quando está completo (retomada segura)
+                os.replace(resultado['caminho_parcial'], os.path.join(diretorio_saida, registro['arquivo']))
+                tempos.append(resultado['segundos'])
+                bytes_gerados += resultado['tamanho_bytes']
+                descricao = f"{registro['arquivo']} ({resultado['segundos']:.2f}s)"
+            else:
+                registro['message'] = resultado['message']
+                erros += 1
+                descricao = f"ERRO: {resultado['message']}"
+            manifesto.write(json.dumps(registro, ensure_ascii=False) + '\n')
+            manifesto.flush()
+            print(f"[{concluidos}/{len(pendentes)}] demanda {registro['demanda']}: {descricao}")
+
+    decorrido = time.perf_counter() - inicio
+    with contextlib.suppress(OSError):
+        os.rmdir(diretorio_parcial)  # só remove se vazio
+    print("=" * 80)
+    print(f"Gerados: {len(tempos)}  Erros: {erros}  Pulados: {pulados}  Tempo total: {decorrido:.2f}s")
+    if tempos:
+        print(f"Vazão: {len(tempos) / decorrido:.2f} documentos/s  ({bytes_gerados / 1024 / 1024 / decorrido:.2f} MB/s)")
+        print(f"Tempo por documento: média {sum(tempos) / len(tempos):.2f}s  "
+              f"p50 {_percentil(tempos, 50):.2f}s  p95 {_percentil(tempos, 95):.2f}s  máx {max(tempos):.2f}s")
+    if erros:
+        print(f"Rode de novo com a mesma saída para tentar novamente só os {erros} item(ns) com erro.")
+    print("=" * 80)
+    return erros
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Gera Planos de Trabalho em lote a partir de um arquivo .jsonl ou .csv")
+    parser.add_argument('entrada', help="Arquivo .jsonl (payloads ou IDs de demanda) ou .csv (coluna demanda)")
+    parser.add_argument('--saida', default='planos_gerados', help="Diretório dos documentos gerados (padrão: planos_gerados)")
+    parser.add_argument('--processos', type=int, default=os.cpu_count() or 1,
+                        help="Processos geradores (padrão: número de CPUs)")
+    parser.add_argument('--projetos', default=os.path.join(DIRETORIO_RAIZ, 'config', 'projetos.json'),
+                        help="JSON com os projetos cadastrados (padrão: config/projetos.json)")
+    parser.add_argument('--fontes', choices=MODOS_FONTES,
+                        help="Fontes embutidas nos documentos (padrão: DOCX_FONTES ou manter)")
+    parser.add_argument('--refazer', action='store_true', help="Ignora o manifesto e gera todos os itens de novo")
+    parser.add_argument('--verbose', action='store_true', help="Mostra o log de debug do gerador")
+    argumentos = parser.parse_args()
+
+    erros = executar_lote(
+        argumentos.entrada,
+        argumentos.saida,
+        max(argumentos.processos, 1),
+        carregar_projetos(argumentos.projetos),
+        refazer=argumentos.refazer,
+        verbose=argumentos.verbose,
+        fontes=argumentos.fontes
+    )
+    sys.exit(1 if erros else 0)
@@ -0,0 +1,113 @@
+"""
+Cache em memória dos documentos .docx gerados, endereçado pelo conteúdo das entradas.
+
+A chave é o SHA-256 de tudo que determina o documento: conteúdo do modelo, contexto de
+renderização (montar_contexto_render: dados da demanda, sprints e profissionais já
+normalizados, incluindo atividades/entregáveis da configuração de sprints), projeto
+usado e data de {DATA}. A mesma chave é usada como ETag das respostas.
+"""
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+
+from services.pacote_docx import obter_modelo
+
+# Tamanho máximo (soma dos .docx guardados) em MB; 0 desativa o cache
+LIMITE_CACHE_DOCUMENTOS_MB = float(os.getenv('CACHE_DOCUMENTOS_MAX_MB', '64'))
+
+
+def calcular_chave_documento(modelo_path, contexto, dados_projeto, data_geracao, fontes='manter'):
+    """
+    Chave (SHA-256 hex) do documento gerado a partir dessas entradas.
+    """
+    entradas = {
+        'modelo': obter_modelo(modelo_path).hash_conteudo,
+        'contexto': contexto,
+        'projeto': dados_projeto or {},
+        'data': data_geracao,
+    }
+    # Só entra na chave fora do padrão, para não mudar as chaves (ETags) já emitidas
+    if fontes != 'manter':
+        entradas['fontes'] = fontes
+    serializado = json.dumps(entradas, sort_keys=True, ensure_ascii=False, separators=(',', ':'), default=str)
+    return hashlib.sha256(serializado.encode('utf-8')).hexdigest()
+
+
+class CacheDocumentos:
+    """
+    Cache LRU de documentos (bytes), limitado pela soma dos tamanhos.
+    """
+
+    def __init__(self, limite_bytes):
+        self.limite_bytes = int(limite_bytes)
+        self._itens = OrderedDict()
+        self._tamanho = 0
+        self._acertos = 0
+        self._falhas = 0
+        self._lock = threading.Lock()
+
+    @property
+    def ativo(self):
+        return self.limite_bytes > 0
+
+    def obter(self, chave):
+        """Retorna os bytes guardados para a chave (ou None), contando acerto/falha."""
+        with self._lock:
+            dados = self._itens.get(chave)
+            if dados is None:
+                self._falhas += 1
+                return None
+            self._itens.move_to_end(chave)
+            self._acertos += 1
+            return dados
+
+    def guardar(self, chave, dados):
+        """Guarda o documento, descartando os menos usados até caber no limite."""
+        if len(dados) > self.limite_bytes:
+            return False
+        with self._lock:
+            anterior = self._itens.pop(chave, None)
+            if anterior is not None:
+                self._tamanho -= len(anterior)
+            self._itens[chave] = dados
+            self._tamanho += len(dados)
+            while self._tamanho > self.limite_bytes:
+                _, descartado = self._itens.popitem(last=False)
+                self._tamanho -= len(descartado)
+        return True
+
+    def guardar_ao_transmitir(self, chave, pedacos):
+        """
+        Repassa os pedaços de um documento sendo transmitido e, se a transmissão terminar
+        por completo, guarda o documento inteiro no cache.
+        """
+        acumulados = []
+        tamanho = 0
+        for pedaco in pedacos:
+            if acumulados is not None:
+                tamanho += len(pedaco)
+                # Documento maior que o cache inteiro: para de acumular
+                acumulados = acumulados if tamanho <= self.limite_bytes else None
+                if acumulados is not None:
+                    acumulados.append(pedaco)
+            yield pedaco
+        if acumulados is not None:
+            self.guardar(chave, b''.join(acumulados))
+
+    def estatisticas(self):
+        with self._lock:
+            consultas = self._acertos + self._falhas
+            return {
+                'ativo': self.ativo,
+                'documentos': len(self._itens),
+                'tamanho_bytes': self._tamanho,
+                'limite_bytes': self.limite_bytes,
+                'acertos': self._acertos,
+                'falhas': self._falhas,
+                'taxa_acerto': round(self._acertos / consultas, 4) if consultas else 0.0,
+            }
+
+
+cache_documentos = CacheDocumentos(LIMITE_CACHE_DOCUMENTOS_MB * 1024 * 1024)
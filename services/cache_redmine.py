@@ -0,0 +1,134 @@
+"""
+Cache em memória das demandas do Redmine já formatadas (formatar_dados), para gerar o
+Plano de Trabalho só com o ID da demanda sem o navegador reenviar as sprints.
+
+Montar uma demanda custa uma consulta ao Redmine pela demanda e mais uma por sprint
+(_buscar_sprint_detalhes). A busca da tela (/api/redmine/<demanda>) sempre consulta o
+Redmine e atualiza o cache; a geração logo em seguida usa as mesmas sprints que o usuário
+viu, sem consultar de novo. Entradas expiram após REDMINE_CACHE_TTL_SEGUNDOS.
+"""
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from services.redmine import buscar_demanda, formatar_dados
+
+# Validade das demandas em cache (segundos); 0 desativa o cache
+REDMINE_CACHE_TTL_SEGUNDOS = float(os.getenv('REDMINE_CACHE_TTL_SEGUNDOS', '300'))
+# Quantidade máxima de demandas em cache (as menos usadas são descartadas)
+REDMINE_CACHE_MAX_DEMANDAS = int(os.getenv('REDMINE_CACHE_MAX_DEMANDAS', '256'))
+
+
+def buscar_linhas_demanda(demanda):
+    """
+    Linhas formatadas da demanda (uma por sprint), direto do Redmine.
+
+    Returns:
+        Lista de linhas (formatar_dados) ou None se a demanda não existe
+    """
+    json_redmine = buscar_demanda(demanda)
+    if json_redmine is None:
+        return None
+    return formatar_dados(json_redmine)
+
+
+class CacheRedmine:
+    """
+    Cache LRU com validade das linhas formatadas de cada demanda.
+
+    IMPORTANTE: consultas simultâneas à mesma demanda fazem uma única busca no Redmine
+    (as demais aguardam o resultado). Demandas não encontradas não são guardadas.
+    """
+
+    def __init__(self, ttl_segundos, max_demandas, buscar=buscar_linhas_demanda):
+        self.ttl_segundos = ttl_segundos
+        self.max_demandas = max_demandas
+        self._buscar = buscar
+        self._itens = OrderedDict()
+        self._buscas = {}
+        self._acertos = 0
+        self._falhas = 0
+        self._lock = threading.Lock()
+
+    @property
+    def ativo(self):
+        return self.ttl_segundos > 0 and self.max_demandas > 0
+
+    def obter(self, demanda, atualizar=False):
+        """
+        Linhas da demanda: do cache, se ainda válidas, ou buscadas no Redmine.
+        Com atualizar=True, sempre busca no Redmine (e atualiza o cache).
+
+        Returns:
+            Cópia das linhas (o chamador pode alterá-las) ou None se a demanda não existe
+
+        Raises:
+            Exception: Erros de configuração ou de acesso ao Redmine (buscar_demanda)
+        """
+        demanda = str(demanda).strip()
+        if not self.ativo:
+            return self._buscar(demanda)
+
+        with self._lock:
+            if not atualizar:
+                linhas = self._obter_valido(demanda)
+                if linhas is not None:
+                    self._acertos += 1
+                    return _copiar(linhas)
+            lock_busca = self._buscas.setdefault(demanda, threading.Lock())
+
+        with lock_busca:
+            with self._lock:
+                # Outra requisição pode ter acabado de buscar a mesma demanda
+                linhas = None if atualizar else self._obter_valido(demanda)
+                if linhas is not None:
+                    self._acertos += 1
+                    return _copiar(linhas)
+                self._falhas += 1
+            try:
+                linhas = self._buscar(demanda)
+            finally:
+                with self._lock:
+                    self._buscas.pop(demanda, None)
+            if linhas is not None:
+                self._guardar(demanda, linhas)
+            return _copiar(linhas)
+
+    def _obter_valido(self, demanda):
+        """Linhas guardadas e ainda válidas (chamado com o lock)."""
+        item = self._itens.get(demanda)
+        if item is None:
+            return None
+        expira_em, linhas = item
+        if time.monotonic() >= expira_em:
+            del self._itens[demanda]
+            return None
+        self._itens.move_to_end(demanda)
+        return linhas
+
+    def _guardar(self, demanda, linhas):
+        with self._lock:
+            self._itens.pop(demanda, None)
+            self._itens[demanda] = (time.monotonic() + self.ttl_segundos, _copiar(linhas))
+            while len(self._itens) > self.max_demandas:
+                self._itens.popitem(last=False)
+
+    def estatisticas(self):
+        with self._lock:
+            consultas = self._acertos + self._falhas
+            return {
+                'ativo': self.ativo,
+                'demandas': len(self._itens),
+                'ttl_segundos': self.ttl_segundos,
+                'acertos': self._acertos,
+                'falhas': self._falhas,
+                'taxa_acerto': round(self._acertos / consultas, 4) if consultas else 0.0,
+            }
+
+
+def _copiar(linhas):
+    return None if linhas is None else [dict(linha) for linha in linhas]
+
+
+cache_redmine = CacheRedmine(REDMINE_CACHE_TTL_SEGUNDOS, REDMINE_CACHE_MAX_DEMANDAS)
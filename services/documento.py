@@ -1,32 +1,33 @@
 """
 Serviço para gerar documentos Word a partir de modelos.
 """
+import io
 import os
 import json
+import logging
+import threading
+import time
+import unicodedata
 from docx import Document
 from typing import Dict, Any, List
 import re
+from services.logs import obter_logger, rastro, rastro_ativo
+from services.metricas import Cronometro
+from services.pacote_docx import (
+    abrir_documento, gravar_pacote, iterar_pacote, obter_modelo, serializar_partes_alteradas
+)
 
+log = obter_logger(__name__)
 
-def substituir_texto_em_paragrafo(paragraph, tag, valor):
+
+def _reescrever_paragrafo(paragraph, novo_texto):
     """
-    Substitui uma tag por um valor em um parágrafo, preservando formatação completa.
+    Reescreve o texto de um parágrafo, mantendo o primeiro run (e sua formatação)
+    e removendo os demais.
     """
-    if not paragraph:
-        return False
-    
-    # Junta todo o texto do parágrafo de todos os runs
-    texto_completo = ''.join([run.text for run in paragraph.runs])
-    
-    if tag not in texto_completo:
-        return False
-    
-    # Substitui a tag pelo valor no texto completo
-    novo_texto = texto_completo.replace(tag, str(valor))
-    
-    # Preserva a formatação: mantém o primeiro run e remove os outros
-    if paragraph.runs:
-        primeiro_run = paragraph.runs[0]
+    runs = paragraph.runs
+    if runs:
+        primeiro_run = runs[0]
         
         # Preserva propriedades da fonte do primeiro run
         fonte_original = primeiro_run.font.name
@@ -35,12 +36,10 @@ def substituir_texto_em_paragrafo(paragraph, tag, valor):
         italico_original = primeiro_run.italic
         sublinhado_original = primeiro_run.underline
         
-        # Remove runs extras (do último para o primeiro, exceto o primeiro)
-        runs_para_remover = list(paragraph.runs[1:])
-        for run in runs_para_remover:
-            p_element = paragraph._element
-            run_element = run._element
-            p_element.remove(run_element)
+        # Remove runs extras (exceto o primeiro)
+        p_element = paragraph._element
+        for run in runs[1:]:
+            p_element.remove(run._element)
         
         # Atualiza o texto do primeiro run
         primeiro_run.text = novo_texto
@@ -56,359 +55,788 @@ def substituir_texto_em_paragrafo(paragraph, tag, valor):
     else:
         # Se não houver runs, cria um novo
         paragraph.add_run(novo_texto)
+
+
+def compilar_padrao_tags(tags):
+    """
+    Compila uma expressão regular que encontra qualquer uma das tags informadas.
+    As tags mais longas vêm primeiro, para que '{GESTOR_CELULAR}}' tenha prioridade sobre '{GESTOR_CELULAR}'.
+    """
+    return re.compile('|'.join(re.escape(tag) for tag in sorted(tags, key=len, reverse=True)))
+
+
+def substituir_tags_em_paragrafo(paragraph, padrao, valores):
+    """
+    Substitui, em uma única passada sobre o texto, todas as tags de `valores` presentes no parágrafo.
+    `padrao` deve ser gerado por compilar_padrao_tags(valores).
     
-    return True
+    Returns:
+        Conjunto com as tags substituídas (vazio se nenhuma)
+    """
+    texto_completo = ''.join([run.text for run in paragraph.runs])
+    if not texto_completo or padrao.search(texto_completo) is None:
+        return set()
+    
+    encontradas = set()
+    
+    def _valor(match):
+        tag = match.group(0)
+        encontradas.add(tag)
+        return str(valores[tag])
+    
+    _reescrever_paragrafo(paragraph, padrao.sub(_valor, texto_completo))
+    return encontradas
 
 
-def substituir_texto_em_documento(doc, tag, valor):
+def iterar_paragrafos_tabela(table):
     """
-    Substitui uma tag em todo o documento (parágrafos, tabelas, headers, footers).
+    Percorre os parágrafos de todas as células de uma tabela, visitando cada célula uma única vez.
+    Usa os elementos w:tc diretamente: table.rows/row.cells recalculam a grade inteira a cada acesso.
     """
-    substituido = False
+    from docx.table import _Cell
     
-    # Substitui em parágrafos principais
-    for paragraph in doc.paragraphs:
-        if substituir_texto_em_paragrafo(paragraph, tag, valor):
-            substituido = True
+    for tc in table._tbl.iter_tcs():
+        yield from _Cell(tc, table).paragraphs
+
+
+def iterar_paragrafos_documento(doc):
+    """
+    Percorre todos os parágrafos do documento (corpo, tabelas, headers e footers) uma única vez.
+    """
+    yield from doc.paragraphs
     
-    # Substitui em tabelas
     for table in doc.tables:
-        for row in table.rows:
-            for cell in row.cells:
-                for paragraph in cell.paragraphs:
-                    if substituir_texto_em_paragrafo(paragraph, tag, valor):
-                        substituido = True
+        yield from iterar_paragrafos_tabela(table)
     
-    # Substitui em headers
     for section in doc.sections:
-        header = section.header
-        for paragraph in header.paragraphs:
-            if substituir_texto_em_paragrafo(paragraph, tag, valor):
-                substituido = True
-        
-        # Substitui em tabelas dos headers
-        for table in header.tables:
-            for row in table.rows:
-                for cell in row.cells:
-                    for paragraph in cell.paragraphs:
-                        if substituir_texto_em_paragrafo(paragraph, tag, valor):
-                            substituido = True
-        
-        # Substitui em footers
-        footer = section.footer
-        for paragraph in footer.paragraphs:
-            if substituir_texto_em_paragrafo(paragraph, tag, valor):
-                substituido = True
-        
-        # Substitui em tabelas dos footers
-        for table in footer.tables:
-            for row in table.rows:
-                for cell in row.cells:
-                    for paragraph in cell.paragraphs:
-                        if substituir_texto_em_paragrafo(paragraph, tag, valor):
-                            substituido = True
-    
-    return substituido
+        for parte in (section.header, section.footer):
+            yield from parte.paragraphs
+            for table in parte.tables:
+                yield from iterar_paragrafos_tabela(table)
 
 
-def linha_contem_tag_sprint(row):
-    """Verifica se uma linha contém tags de sprint."""
-    tags_sprint = ['{SPRINT_OS}', '{OS_ID}', '{SPRINT_ID}', '{SPRINT_TIPO}', '{SPRINT_HST}', 
-                   '{SPRINT_VALOR_H}', '{SPRINT_VALOR_TOTAL}', '{SPRINTS_HORAS}', '{SPRINTS_ HORAS}', '{ATIVIDADES}', '{ENTREGAVEIS}']
-    texto_linha = ''
-    for cell in row.cells:
-        texto_linha += cell.text + ' '
+def substituir_tags_em_documento(doc, valores):
+    """
+    Substitui várias tags em todo o documento (parágrafos, tabelas, headers, footers).
     
-    # CRITÉRIO 1: Se não tem chaves {}, não pode ser uma linha de template
-    tem_chaves = '{' in texto_linha and '}' in texto_linha
-    if not tem_chaves:
-        return False
+    Cada parágrafo é lido uma única vez e todas as tags são resolvidas por uma expressão
+    regular pré-compilada, então o custo é O(tamanho do documento + tags), e não
+    O(tamanho do documento x tags).
     
-    # CRITÉRIO 2: Verifica se há tags explícitas com chaves {}
-    # Não aceita apenas palavras soltas como "Horas" - precisa ter a tag completa como "{SPRINTS_HORAS}"
-    tem_tag = False
-    for tag in tags_sprint:
-        if tag in texto_linha:
-            tem_tag = True
-            break
+    Returns:
+        Conjunto com as tags que foram encontradas e substituídas
+    """
+    if not valores:
+        return set()
     
-    # Se não tem tag explícita, não é uma linha de template
-    if not tem_tag:
+    padrao = compilar_padrao_tags(valores)
+    substituidas = set()
+    for paragraph in iterar_paragrafos_documento(doc):
+        substituidas |= substituir_tags_em_paragrafo(paragraph, padrao, valores)
+    return substituidas
+
+
+def substituir_texto_em_documento(doc, tag, valor):
+    """
+    Substitui uma tag em todo o documento (parágrafos, tabelas, headers, footers).
+    """
+    return bool(substituir_tags_em_documento(doc, {tag: valor}))
+
+
+class LinhaTabela:
+    """
+    Linha de tabela com as células já resolvidas.
+    
+    Expõe `cells` e `_element` como a linha do python-docx, mas sem recalcular a grade
+    da tabela a cada acesso (row.cells e table.rows[i] são O(linhas x colunas) por chamada).
+    """
+    __slots__ = ('_element', 'cells')
+    
+    def __init__(self, tr, cells):
+        self._element = tr
+        self.cells = cells
+
+
+def obter_linhas_tabela(table):
+    """
+    Retorna as linhas da tabela (LinhaTabela) calculando a grade de células uma única vez.
+
+    A grade é montada linha a linha: células com gridSpan se repetem nas colunas que ocupam
+    e células com mesclagem vertical ("continue") apontam para a célula de origem na mesma
+    coluna da linha anterior. Diferente de table._cells, uma linha com menos colunas que a
+    grade (ex.: um título) não desloca as células de todas as linhas seguintes.
+    Deve ser chamada novamente após inserir ou remover linhas.
+    """
+    from docx.oxml.ns import qn
+    from docx.table import _Cell
+
+    linhas = []
+    celula_por_coluna = {}  # última célula vista em cada coluna da grade
+    for tr in table._tbl.tr_lst:
+        coluna = 0
+        grid_before = tr.find(f"{qn('w:trPr')}/{qn('w:gridBefore')}")
+        if grid_before is not None:
+            coluna = int(grid_before.get(qn('w:val'), 0))
+
+        celulas = []
+        for tc in tr.tc_lst:
+            span = tc.grid_span
+            if tc.vMerge == 'continue' and coluna in celula_por_coluna:
+                celula = celula_por_coluna[coluna]
+            else:
+                celula = _Cell(tc, table)
+            for c in range(coluna, coluna + span):
+                celula_por_coluna[c] = celula
+            celulas.extend([celula] * span)
+            coluna += span
+        linhas.append(LinhaTabela(tr, tuple(celulas)))
+    return linhas
+
+
+# Tags que marcam uma linha template da tabela de sprints
+TAGS_SPRINT_LINHA = ['{SPRINT_OS}', '{OS_ID}', '{SPRINT_ID}', '{SPRINT_TIPO}', '{SPRINT_HST}',
+                     '{SPRINT_VALOR_H}', '{SPRINT_VALOR_TOTAL}', '{SPRINTS_HORAS}', '{SPRINTS_ HORAS}',
+                     '{ATIVIDADES}', '{ENTREGAVEIS}']
+# Tags genéricas de profissional
+TAGS_PROFISSIONAL_LINHA = ['{PROF_TIPO}', '{PROF_QUANTIDADE}', '{PROF_HORAS}', '{PROF_QTD}', '{PORCENTAGEM}']
+# Palavras que aparecem em cabeçalhos de tabelas
+PALAVRAS_CABECALHO = ['Fase', 'Sprint', 'Horas', 'OS*', 'Atividades', 'Entregáveis', 'Observação',
+                      'Perfil', 'Qtde', 'HSTs', 'Alocação', 'timebox', 'sprint (%)']
+# Palavras que identificam uma linha sem tags como cabeçalho da tabela de sprints
+PALAVRAS_CABECALHO_SPRINT = PALAVRAS_CABECALHO[:7]
+
+PADRAO_TAGS_SPRINT_LINHA = compilar_padrao_tags(TAGS_SPRINT_LINHA)
+PADRAO_TAGS_PROFISSIONAL_LINHA = compilar_padrao_tags(TAGS_PROFISSIONAL_LINHA)
+PADRAO_SPRINT_ID_NUMERADA = re.compile(r'\{SPRINT_ID_(\d+)\}')
+PADRAO_SPRINT_TIPO_NUMERADA = re.compile(r'\{SPRINT_TIPO_(\d+)\}')
+PADRAO_PROF_TIPO_NUMERADA = re.compile(r'\{PROF_TIPO_(\d+)_(\d+)\}')
+# Qualquer tag entre chaves (inclui variações como {SPRINTS_ HORAS} e {{data}})
+PADRAO_QUALQUER_TAG = re.compile(r'\{+[A-Za-z0-9_ ]+\}+')
+
+
+def _texto_linha(row):
+    """Texto da linha: textos das células separados por espaço."""
+    return ' '.join(cell.text for cell in row.cells)
+
+
+def texto_eh_template_sprint(texto_linha):
+    """
+    Verifica se o texto de uma linha é de uma linha template de sprint: precisa ter uma tag
+    de sprint explícita com chaves e não pode ser apenas um cabeçalho.
+    """
+    # CRITÉRIO 1 e 2: Precisa ter a tag completa com chaves (ex: "{SPRINTS_HORAS}", não apenas "Horas")
+    if not PADRAO_TAGS_SPRINT_LINHA.search(texto_linha):
         return False
     
-    # CRITÉRIO 3: Verifica se é uma linha de cabeçalho (contém palavras de cabeçalho mas não tem tags reais)
-    # Lista completa de palavras que aparecem em cabeçalhos de tabelas
-    palavras_cabecalho = ['Fase', 'Sprint', 'Horas', 'OS*', 'Atividades', 'Entregáveis', 'Observação', 
-                          'Perfil', 'Qtde', 'HSTs', 'Alocação', 'timebox', 'sprint (%)']
-    # Verifica se a linha contém palavras de cabeçalho SEM tags correspondentes
+    # CRITÉRIO 3: Se tem múltiplas palavras de cabeçalho sem as tags correspondentes, é um cabeçalho
     # Exemplo: "Horas" sozinho não é tag, mas "{SPRINTS_HORAS}" é tag
-    palavras_encontradas = sum(1 for palavra in palavras_cabecalho if palavra in texto_linha)
-    # Se tem palavras de cabeçalho mas não tem tags correspondentes, é um cabeçalho
-    # Verifica se tem palavras como "Horas" mas não tem "{SPRINTS_HORAS}" ou "{SPRINTS_ HORAS}"
+    palavras_encontradas = sum(1 for palavra in PALAVRAS_CABECALHO if palavra in texto_linha)
+    if palavras_encontradas < 2:
+        return True
     tem_palavra_horas = 'Horas' in texto_linha and '{SPRINTS_HORAS}' not in texto_linha and '{SPRINTS_ HORAS}' not in texto_linha
     tem_palavra_sprint = 'Sprint' in texto_linha and '{SPRINT_ID}' not in texto_linha and '{SPRINT_OS}' not in texto_linha and '{OS_ID}' not in texto_linha
     tem_palavra_fase = 'Fase' in texto_linha and '{SPRINT_ID}' not in texto_linha
-    
-    # Se tem múltiplas palavras de cabeçalho mas não tem tags correspondentes, é um cabeçalho
-    if palavras_encontradas >= 2 and (tem_palavra_horas or tem_palavra_sprint or tem_palavra_fase):
-        return False
-    
-    # CRITÉRIO FINAL: Só retorna True se tem tag E tem chaves E não é apenas cabeçalho
-    return True
+    return not (tem_palavra_horas or tem_palavra_sprint or tem_palavra_fase)
+
+
+def texto_tem_tag_profissional(texto_linha):
+    """Verifica se o texto de uma linha contém tags genéricas de profissional."""
+    return bool(PADRAO_TAGS_PROFISSIONAL_LINHA.search(texto_linha))
+
+
+def identificar_sprint_num_no_texto(texto_linha):
+    """Número da sprint das tags numeradas ({SPRINT_ID_N}, senão {SPRINT_TIPO_N}) ou None."""
+    match = PADRAO_SPRINT_ID_NUMERADA.search(texto_linha) or PADRAO_SPRINT_TIPO_NUMERADA.search(texto_linha)
+    return int(match.group(1)) if match else None
+
+
+def identificar_prof_num_no_texto(texto_linha, sprint_num):
+    """Número do profissional da tag {PROF_TIPO_<sprint_num>_M} ou None."""
+    for match in PADRAO_PROF_TIPO_NUMERADA.finditer(texto_linha):
+        if int(match.group(1)) == sprint_num:
+            return int(match.group(2))
+    return None
+
+
+def linha_contem_tag_sprint(row):
+    """Verifica se uma linha contém tags de sprint."""
+    return texto_eh_template_sprint(_texto_linha(row))
 
 
 def linha_contem_tag_profissional(row):
     """Verifica se uma linha contém tags de profissional."""
-    tags_prof = ['{PROF_TIPO}', '{PROF_QUANTIDADE}', '{PROF_HORAS}', '{PROF_QTD}', '{PORCENTAGEM}']
-    texto_linha = ''
-    for cell in row.cells:
-        texto_linha += cell.text + ' '
-    return any(tag in texto_linha for tag in tags_prof)
+    return texto_tem_tag_profissional(_texto_linha(row))
 
 
 def linha_contem_tag_numerada(row, sprint_num):
     """Verifica se uma linha contém tags numeradas de uma sprint específica."""
-    import re
-    texto_linha = ''
-    for cell in row.cells:
-        texto_linha += cell.text + ' '
     # Procura por tags numeradas como {SPRINT_ID_1}, {PROF_TIPO_1_1}, etc.
     pattern = r'\{[A-Z_]+_' + str(sprint_num) + r'(_\d+)?\}'
-    return bool(re.search(pattern, texto_linha))
+    return bool(re.search(pattern, _texto_linha(row)))
 
 
 def identificar_sprint_num_na_linha(row):
     """Identifica o número da sprint na linha baseado nas tags numeradas."""
-    import re
-    texto_linha = ''
-    for cell in row.cells:
-        texto_linha += cell.text + ' '
-    # Procura por padrão {SPRINT_ID_N} ou {SPRINT_TIPO_N}
-    match = re.search(r'\{SPRINT_ID_(\d+)\}', texto_linha)
-    if match:
-        return int(match.group(1))
-    match = re.search(r'\{SPRINT_TIPO_(\d+)\}', texto_linha)
-    if match:
-        return int(match.group(1))
-    return None
+    return identificar_sprint_num_no_texto(_texto_linha(row))
 
 
 def identificar_prof_num_na_linha(row, sprint_num):
     """Identifica o número do profissional na linha baseado nas tags numeradas."""
-    import re
-    texto_linha = ''
-    for cell in row.cells:
-        texto_linha += cell.text + ' '
-    # Procura por padrão {PROF_TIPO_N_M}
-    pattern = r'\{PROF_TIPO_' + str(sprint_num) + r'_(\d+)\}'
-    match = re.search(pattern, texto_linha)
-    if match:
-        return int(match.group(1))
-    return None
+    return identificar_prof_num_no_texto(_texto_linha(row), sprint_num)
+
 
+# Variações de "N/A" aceitas na última coluna (Observação) das linhas template
+VARIACOES_NA = ['N/A', 'N / A', 'N/ A', 'N /A']
 
-def duplicar_linha_tabela(table, linha_template_index):
-    """Duplica uma linha de tabela mantendo formatação completa."""
+
+def _normalizar_celula_na(tc):
+    """
+    Normaliza uma célula (elemento w:tc) que contém apenas "N/A" para um único
+    parágrafo com um único run "N/A", preservando pPr e rPr de referência.
+    Retorna True se a célula foi normalizada.
+    """
     from docx.oxml.ns import qn
-    from docx.enum.text import WD_ALIGN_PARAGRAPH
+
+    paragrafos = tc.findall(qn('w:p'))
+    texto = ''.join(t.text or '' for t in tc.iter(qn('w:t'))).strip()
+    if not paragrafos or texto.upper() not in VARIACOES_NA:
+        return False
+
+    primeiro_p = paragrafos[0]
+    runs = primeiro_p.findall(qn('w:r'))
+    if not runs:
+        return False
+
+    # Mantém apenas o primeiro parágrafo (com seu pPr)
+    for p in paragrafos[1:]:
+        tc.remove(p)
+
+    # Mantém apenas o primeiro run (com seu rPr) e deixa um único w:t com "N/A"
+    run_ref = runs[0]
+    for r in runs[1:]:
+        primeiro_p.remove(r)
+    for filho in list(run_ref):
+        if filho.tag != qn('w:rPr'):
+            run_ref.remove(filho)
+    t = run_ref.makeelement(qn('w:t'), {})
+    t.text = 'N/A'
+    run_ref.append(t)
+    return True
+
+
+def duplicar_linha_tabela(table, linha_template_index, quantidade=1):
+    """
+    Duplica uma linha de tabela mantendo formatação completa.
+
+    O elemento w:tr da linha template é copiado uma única vez para um protótipo
+    (já com a última coluna "N/A" normalizada) e as N cópias são inseridas em bloco
+    logo após a linha template.
+
+    Returns:
+        Lista com os índices das novas linhas na tabela
+    """
     from copy import deepcopy
+
+    if quantidade <= 0:
+        return []
+
+    tbl = table._tbl
+    tr_template = tbl.tr_lst[linha_template_index]
+
+    # Protótipo: cópia única do template, normalizada
+    prototipo = deepcopy(tr_template)
+    tcs = prototipo.tc_lst
+    if tcs:
+        _normalizar_celula_na(tcs[-1])
+
+    novas_linhas = [prototipo] + [deepcopy(prototipo) for _ in range(quantidade - 1)]
+
+    # Inserção em bloco logo após a linha template
+    posicao = tbl.index(tr_template) + 1
+    tbl[posicao:posicao] = novas_linhas
+
+    return list(range(linha_template_index + 1, linha_template_index + 1 + quantidade))
+
+
+def remover_linhas_tabela(table, linhas):
+    """
+    Remove de uma vez um conjunto de linhas da tabela.
+    Aceita objetos de linha (row) ou elementos w:tr; linhas já removidas são ignoradas.
+
+    Returns:
+        Quantidade de linhas removidas
+    """
+    tbl = table._tbl
+    removidas = 0
+    for linha in linhas:
+        tr = getattr(linha, '_element', linha)
+        if tr.getparent() is tbl:
+            tbl.remove(tr)
+            removidas += 1
+    return removidas
+
+
+# Tags numeradas do Item 7: {SPRINT_ID_1}, {SPRINT_TIPO_1}, {PROF_TIPO_1_2}, {PORCENTAGEM_1_2}...
+# Aceita também as variações encontradas nos modelos ({PROF_HORAS1_2}, {PROF_TIPO_1410})
+PADRAO_TAG_NUMERADA_ITEM7 = re.compile(
+    r'\{(SPRINT_ID|SPRINT_TIPO|PROF_TIPO|PROF_QTD|PROF_QUANTIDADE|PROF_HORAS|PORCENTAGEM)_?(\d+)(?:_(\d+))?\}'
+)
+TAGS_NUMERADAS_SPRINT = ('SPRINT_ID', 'SPRINT_TIPO')
+
+# Tags genéricas do Item 7 (sem numeração)
+TAGS_GENERICAS_ITEM7 = ['{SPRINT_ID}', '{SPRINT_TIPO}', '{PROF_TIPO}', '{PROF_QTD}',
+                        '{PROF_QUANTIDADE}', '{PROF_HORAS}', '{PORCENTAGEM}']
+
+
+def _renumerar_tags_linha(tabela, linha, sprint_num, prof_num):
+    """
+    Renumera as tags numeradas do Item 7 de uma linha para {TAG_<sprint_num>} /
+    {TAG_<sprint_num>_<prof_num>}.
+
+    O texto de cada célula com tags é reescrito em um único trecho (reescrever_celula),
+    o que junta tags quebradas em vários runs ou parágrafos. Corrige também tags
+    digitadas fora do padrão.
+    """
+    def nova_tag(match):
+        nome = match.group(1)
+        if nome in TAGS_NUMERADAS_SPRINT:
+            return f'{{{nome}_{sprint_num}}}'
+        return f'{{{nome}_{sprint_num}_{prof_num}}}'
+
+    for celula in tabela.celulas_linha(linha):
+        texto = tabela.texto_bruto(celula)
+        if '{' not in texto:
+            continue
+        tabela.reescrever_celula(celula, PADRAO_TAG_NUMERADA_ITEM7.sub(nova_tag, texto))
+
+
+def _mesclar_celulas_sprint(tabela, primeira, novas):
+    """
+    Transforma as colunas de sprint ({SPRINT_ID_N}, {SPRINT_TIPO_N}) da primeira linha
+    do grupo em mesclagem vertical e esvazia as mesmas colunas das novas linhas,
+    marcando-as como continuação.
+    """
+    for coluna, celula in enumerate(tabela.celulas_linha(primeira)):
+        match = PADRAO_TAG_NUMERADA_ITEM7.search(tabela.texto_bruto(celula))
+        if not match or match.group(1) not in TAGS_NUMERADAS_SPRINT:
+            continue
+        continuacoes = []
+        for linha in novas:
+            celulas = tabela.celulas_linha(linha)
+            if coluna < len(celulas):
+                continuacoes.append(celulas[coluna])
+        tabela.mesclar_verticalmente(celula, continuacoes)
+
+
+def expandir_grupos_item7(tabela, grupos_sprint, sprints_ctx):
+    """
+    Garante no Item 7 um grupo de linhas para cada sprint e uma linha para cada profissional.
+
+    - Sprints além do último grupo numerado do modelo: o grupo inteiro (com as células
+      mescladas verticalmente) é clonado;
+    - Profissionais além das linhas do grupo: a última linha do grupo é clonada (apenas
+      quando ela tem tags numeradas de profissional).
+
+    Todas as tags dos grupos são renumeradas pela posição ({PROF_TIPO_<sprint>_<linha>}),
+    o que também corrige tags digitadas com o número errado no modelo.
+    As cópias são inseridas em uma única passada (tabela.inserir_apos), sem recalcular
+    índices da tabela.
+
+    Args:
+        tabela: Tabela do documento (TabelaDocx) ou da prévia (previa.TabelaEsqueleto)
+        sprints_ctx: Sprints do contexto de renderização (montar_contexto_render)
+
+    Returns:
+        True se alguma linha foi inserida (a grade da tabela deve ser recalculada)
+    """
+    if not grupos_sprint:
+        return False
+
+    # Linhas (w:tr) de cada grupo, na ordem do documento
+    trs_grupos = {
+        sprint_num: [row._element for _, row, _ in linhas_grupo]
+        for sprint_num, linhas_grupo in grupos_sprint.items()
+    }
+    ultimo_grupo = max(trs_grupos)
+    prototipo_grupo = trs_grupos[ultimo_grupo]
+
+    inserir_apos = {}  # {id(linha existente): (linha existente, [novas linhas, na ordem])}
+
+    # Clona o último grupo numerado para as sprints que não existem no modelo
+    grupos_novos = []
+    for sprint_num in range(ultimo_grupo + 1, len(sprints_ctx) + 1):
+        trs_grupos[sprint_num] = [tabela.copiar_linha(tr) for tr in prototipo_grupo]
+        grupos_novos.append(sprint_num)
+
+    # Clona a última linha do grupo para os profissionais excedentes
+    for sprint_ctx in sprints_ctx:
+        sprint_num = sprint_ctx['num']
+        trs = trs_grupos.get(sprint_num)
+        if not trs:
+            continue
+        excedentes = len(sprint_ctx['profissionais']) - len(trs)
+        if excedentes <= 0:
+            continue
+        texto_linha = ''.join(tabela.texto_bruto(celula) for celula in tabela.celulas_linha(trs[-1]))
+        tags_linha = PADRAO_TAG_NUMERADA_ITEM7.findall(texto_linha)
+        if not any(nome not in TAGS_NUMERADAS_SPRINT for nome, _, _ in tags_linha):
+            continue
+        trs_extras = [tabela.copiar_linha(trs[-1]) for _ in range(excedentes)]
+        if len(trs) == 1:
+            _mesclar_celulas_sprint(tabela, trs[0], trs_extras)
+        if sprint_num in grupos_novos:
+            trs.extend(trs_extras)
+        else:
+            inserir_apos[id(trs[-1])] = (trs[-1], trs_extras)
+            trs_grupos[sprint_num] = trs + trs_extras
+
+    # Grupos novos entram logo após o último grupo do modelo (e das linhas extras dele)
+    if grupos_novos:
+        ancora = prototipo_grupo[-1]
+        inserir_apos.setdefault(id(ancora), (ancora, []))[1].extend(
+            tr for sprint_num in grupos_novos for tr in trs_grupos[sprint_num]
+        )
+
+    # Renumera as tags de todos os grupos pela posição
+    for sprint_num, trs in trs_grupos.items():
+        for prof_num, tr in enumerate(trs, start=1):
+            _renumerar_tags_linha(tabela, tr, sprint_num, prof_num)
+
+    if not inserir_apos:
+        return False
+    for ancora, trs_novos in inserir_apos.values():
+        tabela.inserir_apos(ancora, trs_novos)
+    return True
+
+
+# -----------------------------
+# PLANO DAS TABELAS
+# -----------------------------
+# Cada linha de tabela é classificada uma única vez em um destes tipos
+TIPO_CABECALHO = 'cabecalho'            # linha 0 ou cabeçalho de colunas sem tags
+TIPO_SPRINT = 'sprint'                  # linha template da tabela de sprints ({SPRINT_ID}, {ATIVIDADES}...)
+TIPO_ITEM7_NUMERADA = 'item7_numerada'  # linha do Item 7 com tags numeradas ({SPRINT_ID_1}, {PROF_TIPO_1_1}...)
+TIPO_ITEM7_GENERICA = 'item7_generica'  # linha do Item 7 com tags genéricas ({PROF_TIPO}, {PORCENTAGEM}...)
+TIPO_VAZIA = 'vazia'                    # linha sem conteúdo (nenhuma célula com mais de 2 caracteres)
+TIPO_ESTATICA = 'estatica'              # qualquer outra linha (não é alterada)
+
+
+class ClassificacaoLinha:
+    """
+    Classificação de uma linha de tabela feita pelo plano.
+    """
+    __slots__ = ('indice', 'tipo', 'sprint_num', 'prof_num', 'tags', 'texto')
+    
+    def __init__(self, indice, tipo, sprint_num, prof_num, tags, texto):
+        self.indice = indice
+        self.tipo = tipo
+        self.sprint_num = sprint_num
+        self.prof_num = prof_num
+        self.tags = tags
+        self.texto = texto
+    
+    def como_dict(self):
+        return {
+            'linha': self.indice,
+            'tipo': self.tipo,
+            'sprint_num': self.sprint_num,
+            'prof_num': self.prof_num,
+            'tags': list(self.tags),
+            'texto': self.texto[:80],
+        }
+
+
+def classificar_linha(indice, textos_celulas):
+    """
+    Classifica uma linha a partir dos textos das suas células (ver TIPO_*).
+    A linha 0 é sempre cabeçalho; tags numeradas do Item 7 têm prioridade sobre as genéricas.
+    """
+    texto = ' '.join(textos_celulas)
+    tags = tuple(dict.fromkeys(PADRAO_QUALQUER_TAG.findall(texto)))
+    sprint_num = identificar_sprint_num_no_texto(texto) if tags else None
+    prof_num = None
     
-    linha_template = table.rows[linha_template_index]
-    
-    # IMPORTANTE: add_row() cria uma linha baseada na última linha da tabela
-    # Para garantir que temos o número correto de células, vamos usar a linha template como referência
-    # Primeiro, adiciona uma linha baseada na linha template (não na última linha)
-    nova_linha = table.add_row()
-    
-    # Valida que o número de células corresponde
-    num_celulas_template = len(linha_template.cells)
-    num_celulas_nova = len(nova_linha.cells)
-    
-    # Se o número de células não corresponde, ajusta removendo células extras
-    if num_celulas_nova != num_celulas_template:
-        print(f"[DEBUG] Aviso: Número de células diferente! Template: {num_celulas_template}, Nova: {num_celulas_nova}")
-        # Se a nova linha tem mais células, remove as extras (da direita para esquerda)
-        if num_celulas_nova > num_celulas_template:
-            # Remove células extras do final - precisa fazer em ordem reversa para não quebrar índices
-            celulas_para_remover = num_celulas_nova - num_celulas_template
-            # Pega a lista de células antes de remover
-            celulas_para_remover_lista = list(nova_linha.cells)[num_celulas_template:]
-            # Remove cada célula extra
-            for cell_extra in celulas_para_remover_lista:
-                try:
-                    nova_linha._element.remove(cell_extra._element)
-                    print(f"[DEBUG] Removida célula extra")
-                except Exception as e:
-                    print(f"[DEBUG] Erro ao remover célula extra: {e}")
-        # Se a nova linha tem menos células, isso não deveria acontecer com add_row()
-        elif num_celulas_nova < num_celulas_template:
-            print(f"[DEBUG] Erro: Nova linha tem menos células que o template! Isso não deveria acontecer.")
-    
-    # Agora valida novamente após remoção
-    num_celulas_nova_final = len(nova_linha.cells)
-    if num_celulas_nova_final != num_celulas_template:
-        print(f"[DEBUG] Erro crítico: Após ajuste, ainda há diferença! Template: {num_celulas_template}, Nova: {num_celulas_nova_final}")
-        # Se ainda não corresponde, processa apenas até o mínimo
-        num_celulas_processar = min(num_celulas_template, num_celulas_nova_final)
+    if indice == 0:
+        tipo = TIPO_CABECALHO
+    elif sprint_num is not None:
+        tipo = TIPO_ITEM7_NUMERADA
+        prof_num = identificar_prof_num_no_texto(texto, sprint_num) or 1  # Default se não encontrar
+    elif tags and texto_eh_template_sprint(texto) and not texto_tem_tag_profissional(texto):
+        tipo = TIPO_SPRINT
+    elif tags and any(tag in texto for tag in TAGS_GENERICAS_ITEM7):
+        tipo = TIPO_ITEM7_GENERICA
+    elif '{' in texto and '}' in texto:
+        tipo = TIPO_ESTATICA
+    elif any(palavra in texto for palavra in PALAVRAS_CABECALHO_SPRINT):
+        tipo = TIPO_CABECALHO
+    elif all(len(t.strip()) <= 2 for t in textos_celulas):
+        tipo = TIPO_VAZIA
     else:
-        num_celulas_processar = num_celulas_template
+        tipo = TIPO_ESTATICA
+    return ClassificacaoLinha(indice, tipo, sprint_num, prof_num, tags, texto)
+
+
+class PlanoTabela:
+    """
+    Plano de uma tabela: a grade resolvida (obter_linhas_tabela) e a classificação de
+    cada linha, calculadas uma única vez e usadas pelas etapas de sprints e do Item 7.
+    Deve ser refeito (planejar_tabela) depois que a tabela for alterada.
+    """
     
-    # Copia conteúdo e formatação de cada célula
-    for i in range(num_celulas_processar):
-        cell_template = linha_template.cells[i]
-        nova_cell = nova_linha.cells[i]
-        is_ultima_coluna = (i == num_celulas_processar - 1)
-        
-        # Copia propriedades da célula (cor de fundo, etc.)
-        # Copia shading (cor de fundo) - método mais robusto
-        if cell_template._element.tcPr is not None:
-            shd_element = cell_template._element.tcPr.find(qn('w:shd'))
-            if shd_element is not None:
-                if nova_cell._element.tcPr is None:
-                    nova_cell._element.add_tcPr()
-                # Remove shading existente se houver
-                shd_existente = nova_cell._element.tcPr.find(qn('w:shd'))
-                if shd_existente is not None:
-                    nova_cell._element.tcPr.remove(shd_existente)
-                # Copia o shading
-                nova_cell._element.tcPr.append(deepcopy(shd_element))
-        
-        # Limpa a nova célula completamente (remove todos os parágrafos exceto o primeiro)
-        # Remove parágrafos extras
-        while len(nova_cell.paragraphs) > 1:
-            nova_cell._element.remove(nova_cell.paragraphs[-1]._element)
-        
-        # Limpa o primeiro parágrafo mas mantém sua estrutura
-        primeiro_para_novo = nova_cell.paragraphs[0]
-        for run in primeiro_para_novo.runs:
-            primeiro_para_novo._element.remove(run._element)
-        primeiro_para_novo.text = ''
-        
-        # Para a última coluna (Observação), trata especialmente para evitar duplicação de "N/A"
-        if is_ultima_coluna:
-            # Para a última coluna, junta todo o texto primeiro para verificar se é "N/A"
-            texto_completo_template = cell_template.text.strip()
-            
-            # Se o template tem "N/A", copia apenas uma vez preservando formatação
-            if texto_completo_template.upper() in ['N/A', 'N / A', 'N/ A', 'N /A']:
-                # Usa apenas o primeiro parágrafo e primeiro run como referência de formatação
-                if cell_template.paragraphs and cell_template.paragraphs[0].runs:
-                    run_referencia = cell_template.paragraphs[0].runs[0]
-                    para_referencia = cell_template.paragraphs[0]
-                    
-                    # Limpa completamente
-                    primeiro_para_novo.text = ''
-                    for run in list(primeiro_para_novo.runs):
-                        primeiro_para_novo._element.remove(run._element)
-                    
-                    # Adiciona apenas um run com "N/A"
-                    novo_run = primeiro_para_novo.add_run('N/A')
-                    
-                    # Copia formatação do run de referência
-                    if run_referencia._element.rPr is not None:
-                        rPr_copy = deepcopy(run_referencia._element.rPr)
-                        if novo_run._element.rPr is None:
-                            novo_run._element.insert(0, rPr_copy)
-                        else:
-                            novo_run._element.remove(novo_run._element.rPr)
-                            novo_run._element.insert(0, rPr_copy)
-                    else:
-                        novo_run.bold = run_referencia.bold
-                        novo_run.italic = run_referencia.italic
-                        novo_run.underline = run_referencia.underline
-                        if run_referencia.font.name:
-                            novo_run.font.name = run_referencia.font.name
-                        if run_referencia.font.size:
-                            novo_run.font.size = run_referencia.font.size
-                    
-                    # Copia alinhamento do parágrafo de referência
-                    if para_referencia._element.pPr is not None:
-                        pPr_copy = deepcopy(para_referencia._element.pPr)
-                        if primeiro_para_novo._element.pPr is None:
-                            primeiro_para_novo._element.insert(0, pPr_copy)
-                        else:
-                            primeiro_para_novo._element.remove(primeiro_para_novo._element.pPr)
-                            primeiro_para_novo._element.insert(0, pPr_copy)
-                    elif para_referencia.alignment is not None:
-                        primeiro_para_novo.alignment = para_referencia.alignment
-                    
-                    # Pula o resto do processamento para esta célula
-                    continue
-        
-        # Para outras células, copia normalmente
-        # Copia parágrafos preservando formatação completa
-        for para_idx, para_template in enumerate(cell_template.paragraphs):
-            if para_idx == 0:
-                novo_para = nova_cell.paragraphs[0]
-            else:
-                novo_para = nova_cell.add_paragraph()
-            
-            # Copia propriedades do parágrafo (alinhamento) usando deepcopy do elemento pPr
-            if para_template._element.pPr is not None:
-                # Copia o elemento pPr completo para preservar todas as propriedades
-                pPr_copy = deepcopy(para_template._element.pPr)
-                if novo_para._element.pPr is None:
-                    # Se não existe pPr, adiciona antes do elemento r
-                    novo_para._element.insert(0, pPr_copy)
-                else:
-                    # Substitui o pPr existente
-                    novo_para._element.remove(novo_para._element.pPr)
-                    novo_para._element.insert(0, pPr_copy)
-            elif para_template.alignment is not None:
-                # Fallback: se não tem pPr mas tem alinhamento, define apenas o alinhamento
-                novo_para.alignment = para_template.alignment
-            
-            # Limpa runs existentes do novo parágrafo (se houver)
-            for run in list(novo_para.runs):
-                novo_para._element.remove(run._element)
-            
-            # Copia runs preservando formatação completa
-            for run_template in para_template.runs:
-                texto_run = run_template.text
-                novo_run = novo_para.add_run(texto_run)
-                
-                # Copia formatação completa do run usando deepcopy do elemento rPr
-                if run_template._element.rPr is not None:
-                    rPr_copy = deepcopy(run_template._element.rPr)
-                    if novo_run._element.rPr is None:
-                        novo_run._element.insert(0, rPr_copy)
-                    else:
-                        novo_run._element.remove(novo_run._element.rPr)
-                        novo_run._element.insert(0, rPr_copy)
-                else:
-                    # Fallback: copia propriedades básicas manualmente
-                    novo_run.bold = run_template.bold
-                    novo_run.italic = run_template.italic
-                    novo_run.underline = run_template.underline
-                    if run_template.font.name:
-                        novo_run.font.name = run_template.font.name
-                    if run_template.font.size:
-                        novo_run.font.size = run_template.font.size
-    
-    # Retorna o índice da nova linha (última linha da tabela)
-    return len(table.rows) - 1
+    def __init__(self, indice, table, linhas, classificacoes):
+        self.indice = indice
+        self.table = table
+        self.linhas = linhas
+        self.classificacoes = classificacoes
+    
+    def indices(self, tipo):
+        """Índices das linhas de um tipo, na ordem da tabela."""
+        return [c.indice for c in self.classificacoes if c.tipo == tipo]
+    
+    @property
+    def usa_tags_numeradas(self):
+        return any(c.sprint_num is not None for c in self.classificacoes)
+    
+    def grupos_sprint(self):
+        """
+        Linhas do Item 7 agrupadas pelo número da sprint das tags numeradas.
+
+        Returns:
+            Dicionário {sprint_num: [(row_idx, row, prof_num), ...]}
+        """
+        grupos = {}
+        for c in self.classificacoes:
+            if c.tipo == TIPO_ITEM7_NUMERADA:
+                grupos.setdefault(c.sprint_num, []).append((c.indice, self.linhas[c.indice], c.prof_num))
+        return grupos
+    
+    def como_dict(self):
+        return {
+            'tabela': self.indice,
+            'linhas': [c.como_dict() for c in self.classificacoes],
+        }
+    
+    def resumo(self):
+        """Quantidade de linhas por tipo (para o log de debug)."""
+        contagem = {}
+        for c in self.classificacoes:
+            contagem[c.tipo] = contagem.get(c.tipo, 0) + 1
+        return contagem
+
+
+def planejar_tabela(table, indice=None):
+    """
+    Monta o plano de uma tabela: resolve a grade e classifica cada linha uma única vez.
+    O texto de cada célula é lido uma só vez, mesmo quando ela se repete em várias linhas
+    (gridSpan ou mesclagem vertical).
+    """
+    linhas = obter_linhas_tabela(table)
+    textos_por_celula = {}
+    classificacoes = []
+    for row_idx, row in enumerate(linhas):
+        textos_celulas = []
+        for cell in row.cells:
+            texto = textos_por_celula.get(cell._tc)
+            if texto is None:
+                texto = textos_por_celula[cell._tc] = cell.text
+            textos_celulas.append(texto)
+        classificacoes.append(classificar_linha(row_idx, textos_celulas))
+    return PlanoTabela(indice, table, linhas, classificacoes)
+
+
+def planejar_documento(doc):
+    """Monta o plano de todas as tabelas do documento (na ordem de doc.tables)."""
+    return [planejar_tabela(table, table_idx) for table_idx, table in enumerate(doc.tables)]
+
+
+def descrever_planos(planos):
+    """Serializa os planos em JSON para depurar modelos (ex: python testar_tags.py modelo.docx --plano)."""
+    return json.dumps([plano.como_dict() for plano in planos], ensure_ascii=False, indent=2)
+
+
+class TabelaDocx:
+    """
+    Tabela do documento vista pelas etapas de tabela (preencher_tabela_sprints,
+    preencher_tabela_item7, marcar_tipo_demanda). A prévia (previa.TabelaEsqueleto)
+    implementa a mesma interface sobre o texto do modelo: as duas seguem as mesmas regras.
+
+    Linhas são elementos w:tr e células, _Cell; as etapas só os repassam a estes métodos.
+    """
+
+    def __init__(self, table, indice=None):
+        self.table = table
+        self.indice = indice
+
+    def linhas(self):
+        """Grade da tabela (obter_linhas_tabela)."""
+        return obter_linhas_tabela(self.table)
+
+    def planejar(self):
+        return planejar_tabela(self.table, self.indice)
+
+    def celulas_linha(self, tr):
+        """Células de uma linha, uma por w:tc (sem repetir as de gridSpan)."""
+        from docx.table import _Cell
+        return [_Cell(tc, self.table) for tc in tr.tc_lst]
+
+    def copiar_linha(self, tr):
+        from copy import deepcopy
+        return deepcopy(tr)
+
+    def inserir_apos(self, ancora, trs):
+        for tr in reversed(trs):
+            ancora.addnext(tr)
+
+    def duplicar_linha(self, indice, quantidade):
+        return duplicar_linha_tabela(self.table, indice, quantidade)
+
+    def remover_linhas(self, linhas):
+        return remover_linhas_tabela(self.table, linhas)
+
+    def texto(self, celula):
+        return celula.text
+
+    def texto_bruto(self, celula):
+        """Texto de todos os w:t da célula, sem separar os parágrafos."""
+        from docx.oxml.ns import qn
+        return ''.join(t.text or '' for t in celula._tc.iter(qn('w:t')))
+
+    def substituir_tags(self, celula, padrao, valores):
+        """Tags de `valores` (padrao: compilar_padrao_tags) em cada parágrafo da célula."""
+        for paragraph in celula.paragraphs:
+            substituir_tags_em_paragrafo(paragraph, padrao, valores)
+
+    def escrever(self, celula, valor, referencia=None):
+        escrever_valor_em_celula(celula, valor, referencia)
+
+    def acrescentar(self, celula, texto, limpar=False):
+        """Acrescenta um run com `texto` ao primeiro parágrafo (antes esvaziado, com limpar)."""
+        paragrafo = celula.paragraphs[0]
+        if limpar:
+            paragrafo.clear()
+        paragrafo.add_run(texto)
+
+    def reescrever_celula(self, celula, texto):
+        """
+        Deixa a célula só com `texto`: escrito no primeiro w:t (com a formatação dele),
+        os demais esvaziados e os parágrafos que ficarem vazios removidos.
+        """
+        from docx.oxml.ns import qn
+
+        tc = celula._tc
+        textos = list(tc.iter(qn('w:t')))
+        if len(textos) == 1 and (textos[0].text or '') == texto:
+            return
+        textos[0].text = texto
+        textos[0].set('{http://www.w3.org/XML/1998/namespace}space', 'preserve')
+        for t in textos[1:]:
+            t.text = ''
+        for p in tc.findall(qn('w:p'))[1:]:
+            if not ''.join(t.text or '' for t in p.iter(qn('w:t'))):
+                tc.remove(p)
+
+    def mesclar_verticalmente(self, celula, continuacoes):
+        """
+        Faz de `celula` o início de uma mesclagem vertical (restart) e das `continuacoes`
+        (mesma coluna, linhas seguintes) a continuação, já sem conteúdo.
+        """
+        from docx.oxml.ns import qn
+
+        tc = celula._tc
+        if tc.vMerge is None:
+            tc.vMerge = 'restart'
+        for continuacao in continuacoes:
+            tc_novo = continuacao._tc
+            tc_novo.vMerge = 'continue'
+            paragrafos = tc_novo.findall(qn('w:p'))
+            for p in paragrafos[1:]:
+                tc_novo.remove(p)
+            for filho in list(paragrafos[0]) if paragrafos else []:
+                if filho.tag != qn('w:pPr'):
+                    paragrafos[0].remove(filho)
+
+
+# Caminho do arquivo de configuração de sprints
+CONFIG_SPRINTS_PATH = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'config', 'sprints_config.json')
+# Intervalo mínimo (segundos) entre verificações da data de modificação do arquivo
+INTERVALO_VERIFICACAO_CONFIG = 1.0
+
+# Cache da configuração: só é relido quando a data de modificação (mtime) do arquivo muda
+_cache_config_sprints = {
+    'mtime': None,           # st_mtime_ns do arquivo carregado (None = não carregado / inexistente)
+    'verificado_em': None,   # time.monotonic() da última verificação do mtime
+    'config': {},            # conteúdo do JSON
+    'indice': {},            # {tipo normalizado: {'atividades': ..., 'entregaveis': ...}}
+}
+_lock_config_sprints = threading.Lock()
+
+
+def normalizar_tipo_sprint(tipo_sprint) -> str:
+    """
+    Normaliza o tipo de sprint para busca: sem acentos, minúsculas e espaços simples.
+    Ex.: " Manutenção " e "MANUTENCAO" -> "manutencao".
+    """
+    texto = unicodedata.normalize('NFKD', str(tipo_sprint))
+    texto = ''.join(c for c in texto if not unicodedata.combining(c))
+    return ' '.join(texto.casefold().split())
+
+
+def _montar_indice_config(config):
+    """Monta o índice {tipo normalizado: dados} (o primeiro tipo de cada chave normalizada vence)."""
+    indice = {}
+    for tipo_config, dados in config.get('tipos_sprint', {}).items():
+        indice.setdefault(normalizar_tipo_sprint(tipo_config), dados or {})
+    return indice
+
+
+def _atualizar_cache_config_sprints():
+    """
+    Recarrega a configuração se o arquivo mudou (mtime) desde a última leitura.
+    O mtime é verificado no máximo uma vez a cada INTERVALO_VERIFICACAO_CONFIG segundos.
+    Retorna o estado do cache.
+    """
+    cache = _cache_config_sprints
+    agora = time.monotonic()
+    if cache['verificado_em'] is not None and agora - cache['verificado_em'] < INTERVALO_VERIFICACAO_CONFIG:
+        return cache
+
+    with _lock_config_sprints:
+        if cache['verificado_em'] is not None and agora - cache['verificado_em'] < INTERVALO_VERIFICACAO_CONFIG:
+            return cache
+        try:
+            mtime = os.stat(CONFIG_SPRINTS_PATH).st_mtime_ns
+        except OSError:
+            if cache['mtime'] is not None or cache['verificado_em'] is None:
+                log.warning("Arquivo de configuração não encontrado: %s", CONFIG_SPRINTS_PATH)
+            cache.update(mtime=None, config={}, indice={}, verificado_em=agora)
+            return cache
+
+        if mtime != cache['mtime']:
+            try:
+                with open(CONFIG_SPRINTS_PATH, 'r', encoding='utf-8') as f:
+                    config = json.load(f)
+                cache.update(mtime=mtime, config=config, indice=_montar_indice_config(config))
+                log.debug("Configuração de sprints carregada com sucesso (%s tipo(s))", len(cache['indice']))
+            except Exception as e:
+                # Mantém a última configuração válida; tenta de novo na próxima verificação
+                log.error("Erro ao carregar configuração de sprints: %s", e)
+        cache['verificado_em'] = agora
+    return cache
 
 
 def carregar_config_sprints():
     """
     Carrega o arquivo de configuração de sprints.
     Retorna um dicionário com as configurações ou um dicionário vazio se houver erro.
+    
+    O conteúdo fica em cache e só é relido quando o arquivo é modificado.
     """
-    try:
-        # Caminho do arquivo de configuração
-        config_path = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'config', 'sprints_config.json')
-        
-        if not os.path.exists(config_path):
-            print(f"[DEBUG] [WARN] Arquivo de configuração não encontrado: {config_path}")
-            return {}
-        
-        with open(config_path, 'r', encoding='utf-8') as f:
-            config = json.load(f)
-            print(f"[DEBUG] Configuração de sprints carregada com sucesso")
-            return config
-    except Exception as e:
-        print(f"[DEBUG] [ERROR] Erro ao carregar configuração de sprints: {e}")
-        return {}
+    return _atualizar_cache_config_sprints()['config']
+
+
+def _obter_dados_tipo_sprint(tipo_sprint):
+    """Dados do tipo de sprint na configuração (busca O(1), sem acentos/maiúsculas) ou None."""
+    return _atualizar_cache_config_sprints()['indice'].get(normalizar_tipo_sprint(tipo_sprint))
 
 
 def obter_atividades_por_tipo(tipo_sprint: str) -> str:
@@ -416,20 +844,13 @@ def obter_atividades_por_tipo(tipo_sprint: str) -> str:
     Obtém as atividades para um tipo de sprint específico.
     Retorna uma string vazia se o tipo não for encontrado.
     """
-    config = carregar_config_sprints()
-    tipos_sprint = config.get('tipos_sprint', {})
+    dados = _obter_dados_tipo_sprint(tipo_sprint)
+    if dados is not None:
+        atividades = dados.get('atividades', '')
+        rastro(log, "Atividades encontradas para tipo '%s': %s", tipo_sprint, atividades)
+        return atividades
     
-    # Normaliza o tipo (case-insensitive)
-    tipo_normalizado = str(tipo_sprint).strip().lower()
-    
-    # Busca o tipo correspondente (case-insensitive)
-    for tipo_config, dados in tipos_sprint.items():
-        if tipo_config.lower() == tipo_normalizado:
-            atividades = dados.get('atividades', '')
-            print(f"[DEBUG] Atividades encontradas para tipo '{tipo_sprint}': {atividades}")
-            return atividades
-    
-    print(f"[DEBUG] [WARN] Tipo de sprint '{tipo_sprint}' não encontrado no arquivo de configuração")
+    log.warning("Tipo de sprint '%s' não encontrado no arquivo de configuração", tipo_sprint)
     return ''
 
 
@@ -438,25 +859,181 @@ def obter_entregaveis_por_tipo(tipo_sprint: str) -> str:
     Obtém os entregáveis para um tipo de sprint específico.
     Retorna uma string vazia se o tipo não for encontrado.
     """
-    config = carregar_config_sprints()
-    tipos_sprint = config.get('tipos_sprint', {})
+    dados = _obter_dados_tipo_sprint(tipo_sprint)
+    if dados is not None:
+        entregaveis = dados.get('entregaveis', '')
+        rastro(log, "Entregáveis encontrados para tipo '%s': %s", tipo_sprint, entregaveis)
+        return entregaveis
+    
+    log.warning("Tipo de sprint '%s' não encontrado no arquivo de configuração", tipo_sprint)
+    return ''
+
+
+# -----------------------------
+# CONTEXTO DE RENDERIZAÇÃO
+# -----------------------------
+# Tags de sprint -> campo do contexto da sprint (montar_contexto_render)
+TAGS_SPRINT = {
+    '{SPRINT_OS}': 'os',
+    '{OS_ID}': 'os',  # Tag alternativa para OS
+    '{SPRINT_ID}': 'sprint',
+    '{SPRINT_TIPO}': 'tipo',
+    '{SPRINT_HST}': 'hst',  # HST original do Redmine
+    '{SPRINT_VALOR_H}': 'valor_h_sprint',
+    '{SPRINT_VALOR_TOTAL}': 'valor_total',
+    '{SPRINTS_HORAS}': 'horas_sprint',  # Horas digitadas pelo usuário
+    '{SPRINTS_ HORAS}': 'horas_sprint',
+    '{ATIVIDADES}': 'atividades',  # Preenchida do arquivo de configuração
+    '{ENTREGAVEIS}': 'entregaveis',  # Preenchida do arquivo de configuração
+}
+PADRAO_TAGS_SPRINT = compilar_padrao_tags(TAGS_SPRINT)
+
+# Tags genéricas de profissional -> campo do contexto do profissional
+TAGS_PROFISSIONAL = {
+    '{PROF_TIPO}': 'tipo',
+    '{PROF_QTD}': 'quantidade',
+    '{PROF_QUANTIDADE}': 'quantidade',
+    '{PROF_HORAS}': 'horas',
+    '{PORCENTAGEM}': 'porcentagem',
+}
+
+PADRAO_NUMERO_SIMPLES = re.compile(r'^-?\d+(\.\d+)?$')
+
+
+def _texto(valor) -> str:
+    """Converte um valor do payload para texto (None vira string vazia)."""
+    return '' if valor is None else str(valor)
+
+
+def formatar_moeda(valor) -> str:
+    """
+    Formata um valor numérico como moeda brasileira (ex: 39147.2 -> "R$ 39.147,20").
+    Valores já formatados (ex: "R$ 244,67") ou não numéricos são mantidos como estão.
+    """
+    texto = _texto(valor).strip()
+    if isinstance(valor, bool) or not PADRAO_NUMERO_SIMPLES.match(texto):
+        return _texto(valor)
+    return f"R$ {float(texto):,.2f}".replace(",", "X").replace(".", ",").replace("X", ".")
+
+
+def formatar_numero(valor: float) -> str:
+    """Formata um número sem casas decimais quando for inteiro (ex: 160.0 -> "160")."""
+    return str(int(valor)) if valor == int(valor) else str(valor)
+
+
+def calcular_porcentagem(horas_prof, horas_sprint, percentual_informado='') -> str:
+    """
+    Calcula a alocação do profissional na sprint: (horas_prof / horas_sprint) * 100.
+    Formata como inteiro se for número inteiro, senão com 1 decimal (ex: "25%", "12.5%").
+    Retorna '' se as horas da sprint forem zero e o percentual informado se as horas forem inválidas.
+    """
+    sprint_horas_str = str(horas_sprint).strip()
+    prof_horas_str = str(horas_prof).strip()
+    try:
+        if sprint_horas_str and prof_horas_str:
+            sprint_horas = float(sprint_horas_str)
+            prof_horas = float(prof_horas_str)
+            if sprint_horas > 0:
+                porcentagem_valor = (prof_horas / sprint_horas) * 100
+                if porcentagem_valor == int(porcentagem_valor):
+                    return f"{int(porcentagem_valor)}%"
+                return f"{porcentagem_valor:.1f}%"
+    except (ValueError, TypeError, ZeroDivisionError) as e:
+        log.warning("Erro ao calcular porcentagem: %s", e)
+        return _texto(percentual_informado)
+    return ''
+
+
+def montar_contexto_render(dados_demanda, dados_sprints, dados_profissionais):
+    """
+    Normaliza o payload recebido uma única vez para a renderização.
     
-    # Normaliza o tipo (case-insensitive)
-    tipo_normalizado = str(tipo_sprint).strip().lower()
+    Converte os números, calcula as porcentagens de alocação e o total de HSTs, formata
+    as moedas e resolve atividades/entregáveis pelo tipo da sprint. As funções de
+    preenchimento só leem os textos prontos do contexto.
     
-    # Busca o tipo correspondente (case-insensitive)
-    for tipo_config, dados in tipos_sprint.items():
-        if tipo_config.lower() == tipo_normalizado:
-            entregaveis = dados.get('entregaveis', '')
-            print(f"[DEBUG] Entregáveis encontrados para tipo '{tipo_sprint}': {entregaveis}")
-            return entregaveis
+    O contexto contém apenas dicionários, listas e strings (pode ser serializado com
+    json.dumps para cache ou comparação entre gerações).
     
-    print(f"[DEBUG] [WARN] Tipo de sprint '{tipo_sprint}' não encontrado no arquivo de configuração")
-    return ''
+    Returns:
+        {
+            'demanda': {'demanda', 'pt', 'nome', 'valor_demanda'},
+            'total_hst': '320',
+            'sprints': [{'num', 'sprint', 'os', 'tipo', 'nome', 'hst', 'horas_sprint',
+                         'valor_h_sprint', 'valor_total', 'atividades', 'entregaveis',
+                         'profissionais': [{'num', 'tipo', 'quantidade', 'horas', 'porcentagem'}]}],
+        }
+    """
+    dados_demanda = dados_demanda or {}
+    dados_profissionais = dados_profissionais or {}
+    
+    sprints = []
+    total_hst = 0
+    for sprint_idx, sprint in enumerate(dados_sprints or []):
+        sprint_id = _texto(sprint.get('sprint', ''))
+        tipo = _texto(sprint.get('tipo', ''))
+        
+        # IMPORTANTE: HST original do Redmine (hst_redmine se existir, senão hst) para o Item 10
+        # e horas digitadas pelo usuário (horas_sprint, senão hst) para as tabelas 6 e 7
+        hst = _texto(sprint.get('hst_redmine') or sprint.get('hst', ''))
+        horas_sprint = _texto(sprint.get('horas_sprint') or sprint.get('hst', ''))
+        horas_sprint_calculo = str(sprint.get('horas_sprint') or sprint.get('hst', '0'))
+        
+        hst_str = hst.strip()
+        if hst_str:
+            try:
+                total_hst += float(hst_str)
+            except (ValueError, TypeError):
+                log.warning("HST inválido na sprint %s: '%s'", sprint.get('sprint', 'N/A'), hst_str)
+        
+        profissionais = []
+        for prof_idx, prof in enumerate(dados_profissionais.get(sprint_id, []) or []):
+            percentual_informado = prof.get('percentual') or prof.get('alocacao') or prof.get('porcentagem') or ''
+            profissionais.append({
+                'num': prof_idx + 1,
+                'tipo': _texto(prof.get('tipo', '')),
+                'quantidade': _texto(prof.get('quantidade', '')),
+                'horas': _texto(prof.get('horas', '')),
+                'porcentagem': calcular_porcentagem(prof.get('horas', '0'), horas_sprint_calculo, percentual_informado),
+            })
+        
+        sprints.append({
+            'num': sprint_idx + 1,
+            'sprint': sprint_id,
+            'os': _texto(sprint.get('os', '')),
+            'tipo': tipo,
+            'nome': _texto(sprint.get('nome', '')),
+            'hst': hst,
+            'horas_sprint': horas_sprint,
+            'valor_h_sprint': formatar_moeda(sprint.get('valor_h_sprint', '')),
+            'valor_total': formatar_moeda(sprint.get('valor_total', '')),
+            'atividades': obter_atividades_por_tipo(tipo),
+            'entregaveis': obter_entregaveis_por_tipo(tipo),
+            'profissionais': profissionais,
+        })
+    
+    contexto = {
+        'demanda': {
+            'demanda': _texto(dados_demanda.get('demanda', '')),
+            'pt': _texto(dados_demanda.get('pt', '')),
+            'nome': _texto(dados_demanda.get('nome', '')),
+            'valor_demanda': formatar_moeda(dados_demanda.get('valor_demanda', '')),
+        },
+        'total_hst': formatar_numero(total_hst),
+        'sprints': sprints,
+    }
+    if log.isEnabledFor(logging.DEBUG):
+        log.debug("Contexto de renderização: %s sprint(s), %s profissional(is), total de HSTs %s",
+                  len(sprints), sum(len(s['profissionais']) for s in sprints), contexto['total_hst'])
+    return contexto
 
 
-def escrever_valor_em_celula(cell, valor):
-    """Escreve um valor em uma célula preservando ao máximo a formatação original."""
+def escrever_valor_em_celula(cell, valor, referencia=None):
+    """
+    Escreve um valor em uma célula preservando ao máximo a formatação original.
+    Se o primeiro run da célula não tiver formatação (rPr), usa a do primeiro run de
+    `referencia` (outra célula da mesma linha), se houver.
+    """
     valor = '' if valor is None else str(valor)
     
     if not cell.paragraphs:
@@ -482,6 +1059,19 @@ def escrever_valor_em_celula(cell, valor):
             from copy import deepcopy
             rPr_ref = deepcopy(primeiro_run._element.rPr)
     
+    # Sem formatação na célula: usa a da célula de referência
+    if rPr_ref is None and referencia is not None and referencia.paragraphs:
+        ref_para = referencia.paragraphs[0]
+        if ref_para.runs:
+            ref_run = ref_para.runs[0]
+            fonte_ref = fonte_ref or ref_run.font.name
+            tamanho_ref = tamanho_ref or ref_run.font.size
+            negrito_ref = negrito_ref or ref_run.bold
+            italico_ref = italico_ref or ref_run.italic
+            if ref_run._element.rPr is not None:
+                from copy import deepcopy
+                rPr_ref = deepcopy(ref_run._element.rPr)
+    
     # Remove todos os runs existentes
     for run in list(paragrafo.runs):
         paragrafo._element.remove(run._element)
@@ -506,68 +1096,27 @@ def escrever_valor_em_celula(cell, valor):
         novo_run.italic = italico_ref
 
 
-def preencher_linha_com_dados_sprint(row, sprint_data, tags_sprint):
-    """Preenche uma linha com dados de uma sprint preservando formatação."""
-    # Primeiro, substitui todas as tags preservando formatação
-    for cell_idx, cell in enumerate(row.cells):
-        for paragraph in cell.paragraphs:
-            # IMPORTANTE: Obtém o texto original UMA VEZ antes do loop
-            texto_original = paragraph.text
-            
-            # IMPORTANTE: Processa apenas as tags que estão PRESENTES nesta célula específica
-            # Isso evita processar tags que não pertencem a esta célula
-            tags_na_celula = []
-            for tag in tags_sprint.keys():
-                if tag in texto_original:
-                    tags_na_celula.append(tag)
-            
-            # Se não há tags nesta célula, pula para a próxima
-            if not tags_na_celula:
-                continue
-            
-            # Processa apenas as tags encontradas nesta célula
-            for tag in tags_na_celula:
-                campo = tags_sprint[tag]
-                
-                # Lógica especial para diferenciar HST original de horas sprint do usuário
-                if tag == '{SPRINT_HST}':
-                    # Tabela 10: usa HST original do Redmine
-                    valor = str(sprint_data.get('hst_redmine') or sprint_data.get('hst', ''))
-                elif tag in ['{SPRINTS_HORAS}', '{SPRINTS_ HORAS}']:
-                    # Tabela 6: usa horas_sprint (valor digitado pelo usuário)
-                    valor = str(sprint_data.get('horas_sprint') or sprint_data.get('hst', ''))
-                elif tag == '{ATIVIDADES}':
-                    # Tabela 6: preenche atividades baseado no tipo da sprint (do arquivo de configuração)
-                    tipo_sprint = sprint_data.get('tipo', '')
-                    valor = obter_atividades_por_tipo(tipo_sprint)
-                    print(f"[DEBUG] Preenchendo {tag} para sprint tipo '{tipo_sprint}': {valor}")
-                elif tag == '{ENTREGAVEIS}':
-                    # Tabela 6: preenche entregáveis baseado no tipo da sprint (do arquivo de configuração)
-                    tipo_sprint = sprint_data.get('tipo', '')
-                    valor = obter_entregaveis_por_tipo(tipo_sprint)
-                    print(f"[DEBUG] Preenchendo {tag} para sprint tipo '{tipo_sprint}': {valor}")
-                else:
-                    valor = str(sprint_data.get(campo, ''))
-                
-                # IMPORTANTE: Atualiza o texto original após cada substituição bem-sucedida
-                # para que a próxima iteração use o texto atualizado
-                substituido = substituir_texto_em_paragrafo(paragraph, tag, valor)
-                if substituido:
-                    print(f"[DEBUG] Tag {tag} substituída na célula {cell_idx} com valor: {valor}")
-                    # Atualiza o texto original para a próxima iteração
-                    texto_original = paragraph.text
-                else:
-                    print(f"[DEBUG] [WARN] Tag {tag} encontrada mas não foi substituída na célula {cell_idx}")
-    
-    # IMPORTANTE: NÃO substitui valores diretos em células que não têm tags
-    # Só preenche onde há tags explícitas para evitar sobrescrever dados normais
-    # A substituição de tags já foi feita acima
+def preencher_linha_com_dados_sprint(tabela, row, sprint_ctx, tags_sprint=TAGS_SPRINT):
+    """
+    Preenche uma linha com dados de uma sprint preservando formatação.
+    sprint_ctx é a sprint do contexto de renderização (montar_contexto_render); tabela é a
+    TabelaDocx (ou previa.TabelaEsqueleto) da linha.
+    """
+    # Valores já prontos no contexto (HST original x horas do usuário, atividades e
+    # entregáveis do arquivo de configuração, moedas formatadas)
+    valores = {tag: sprint_ctx.get(campo, '') for tag, campo in tags_sprint.items()}
+    padrao = PADRAO_TAGS_SPRINT if tags_sprint is TAGS_SPRINT else compilar_padrao_tags(tags_sprint)
+    
+    # IMPORTANTE: só as tags presentes são substituídas; células sem tags (dados normais)
+    # não são alteradas
+    for cell in row.cells:
+        tabela.substituir_tags(cell, padrao, valores)
     
     # SEMPRE normaliza a última coluna (Observação) para ter apenas "N/A" uma vez
     # Isso previne duplicação mesmo que tenha sido copiado incorretamente
     if len(row.cells) > 0:
         obs_cell = row.cells[-1]  # Última célula
-        texto_obs = obs_cell.text.strip().upper()
+        texto_obs = tabela.texto(obs_cell).strip().upper()
         
         # Se a célula contém qualquer variação de "N/A", normaliza para apenas "N/A"
         if texto_obs and ('N' in texto_obs and '/' in texto_obs and 'A' in texto_obs):
@@ -577,223 +1126,43 @@ def preencher_linha_com_dados_sprint(row, sprint_data, tags_sprint):
             
             # Se tem mais de uma ocorrência, está mal formatado, ou tem mais de 3 caracteres, normaliza
             if ocorrencias_na > 1 or ocorrencias_na_espacado > 0 or len(texto_obs.replace(' ', '').replace('/', '')) > 2:
-                # Limpa completamente e adiciona apenas "N/A" preservando formatação
-                if obs_cell.paragraphs:
-                    primeiro_para = obs_cell.paragraphs[0]
-                    
-                    # Preserva alinhamento e formatação do parágrafo
-                    alinhamento_original = primeiro_para.alignment
-                    
-                    # Preserva formatação do primeiro run existente (se houver)
-                    fonte_ref = None
-                    tamanho_ref = None
-                    bold_ref = False
-                    italic_ref = False
-                    rPr_ref = None
-                    
-                    if primeiro_para.runs:
-                        primeiro_run_original = primeiro_para.runs[0]
-                        fonte_ref = primeiro_run_original.font.name
-                        tamanho_ref = primeiro_run_original.font.size
-                        bold_ref = primeiro_run_original.bold
-                        italic_ref = primeiro_run_original.italic
-                        if primeiro_run_original._element.rPr is not None:
-                            from copy import deepcopy
-                            rPr_ref = deepcopy(primeiro_run_original._element.rPr)
-                    
-                    # Se não tem run de referência, tenta usar outra célula da linha
-                    if not rPr_ref and len(row.cells) > 0 and row.cells[0].paragraphs:
-                        ref_para = row.cells[0].paragraphs[0]
-                        if ref_para.runs:
-                            ref_run = ref_para.runs[0]
-                            fonte_ref = fonte_ref or ref_run.font.name
-                            tamanho_ref = tamanho_ref or ref_run.font.size
-                            bold_ref = bold_ref or ref_run.bold
-                            italic_ref = italic_ref or ref_run.italic
-                            if ref_run._element.rPr is not None:
-                                from copy import deepcopy
-                                rPr_ref = deepcopy(ref_run._element.rPr)
-                    
-                    # Remove todos os runs
-                    for run in list(primeiro_para.runs):
-                        primeiro_para._element.remove(run._element)
-                    
-                    # Adiciona novo run com "N/A"
-                    novo_run = primeiro_para.add_run('N/A')
-                    
-                    # Aplica formatação preservada
-                    if rPr_ref:
-                        if novo_run._element.rPr is None:
-                            novo_run._element.insert(0, rPr_ref)
-                        else:
-                            novo_run._element.remove(novo_run._element.rPr)
-                            novo_run._element.insert(0, rPr_ref)
-                    else:
-                        # Fallback: copia propriedades básicas
-                        if fonte_ref:
-                            novo_run.font.name = fonte_ref
-                        if tamanho_ref:
-                            novo_run.font.size = tamanho_ref
-                        novo_run.bold = bold_ref
-                        novo_run.italic = italic_ref
-                    
-                    # Restaura alinhamento
-                    if alinhamento_original is not None:
-                        primeiro_para.alignment = alinhamento_original
-
-
-def preencher_linha_com_dados_profissional(row, prof_data, tags_prof):
-    """Preenche uma linha com dados de um profissional."""
-    for cell in row.cells:
-        for paragraph in cell.paragraphs:
-            for tag, campo in tags_prof.items():
-                valor = str(prof_data.get(campo, ''))
-                substituir_texto_em_paragrafo(paragraph, tag, valor)
-
-
-def celula_contem_tag(cell, tag):
-    """
-    Verifica se uma célula contém uma tag específica.
-    Retorna True se a tag estiver presente no texto da célula.
-    """
-    texto_completo = ''.join([
-        run.text for paragraph in cell.paragraphs 
-        for run in paragraph.runs
-    ])
-    return tag in texto_completo
+                # Sem formatação própria, a célula usa a da primeira célula da linha
+                tabela.escrever(obs_cell, 'N/A', referencia=row.cells[0])
 
 
-def preencher_linha_item7(row, sprint_data, prof_data, tags_sprint, tags_prof, mostrar_sprint=True):
-    """
-    Preenche uma linha da Tabela 7 com dados da sprint e do profissional.
-    IMPORTANTE: Preenche APENAS onde há tags. Células sem tags (ex: "N/A") são mantidas como estão.
-    """
-    for cell in row.cells:
-        for paragraph in cell.paragraphs:
-            # Substitui tags da sprint presentes na linha
-            for tag, campo in tags_sprint.items():
-                valor = str(sprint_data.get(campo, ''))
-                substituir_texto_em_paragrafo(paragraph, tag, valor)
-            
-            # Substitui tags do profissional (se houver profissional associado)
-            for tag, campo in tags_prof.items():
-                valor = ''
-                if prof_data:
-                    if campo == 'percentual':
-                        # Calcula a porcentagem automaticamente: (prof_horas / sprint_horas) * 100
-                        # IMPORTANTE: Usa horas_sprint (horas digitadas pelo usuário) para a tabela 7, não HST original
-                        try:
-                            # Usa horas_sprint (horas da sprint digitadas pelo usuário), fallback para hst se não houver
-                            sprint_horas_str = str(sprint_data.get('horas_sprint') or sprint_data.get('hst', '0')).strip()
-                            prof_horas_str = str(prof_data.get('horas', '0')).strip()
-                            
-                            if sprint_horas_str and prof_horas_str:
-                                sprint_horas = float(sprint_horas_str)
-                                prof_horas = float(prof_horas_str)
-                                
-                                if sprint_horas > 0:
-                                    porcentagem_valor = (prof_horas / sprint_horas) * 100
-                                    # Formata como inteiro se for número inteiro, senão mantém 1 decimal, e adiciona %
-                                    if porcentagem_valor == int(porcentagem_valor):
-                                        valor = f"{int(porcentagem_valor)}%"
-                                    else:
-                                        valor = f"{porcentagem_valor:.1f}%"
-                        except (ValueError, TypeError, ZeroDivisionError) as e:
-                            print(f"[DEBUG] [WARN] Erro ao calcular porcentagem: {e}")
-                            # Fallback: usa valor dos dados se disponível
-                            valor = (
-                                prof_data.get('percentual') or
-                                prof_data.get('alocacao') or
-                                prof_data.get('porcentagem') or
-                                ''
-                            )
-                    else:
-                        valor = prof_data.get(campo, '')
-                substituir_texto_em_paragrafo(paragraph, tag, str(valor))
-    
-    # Atualiza as colunas de sprint apenas uma vez por grupo E APENAS se houver tags
-    # IMPORTANTE: Preenche apenas onde há tags. Se a célula não tiver tag, mantém como está (ex: "N/A")
-    if len(row.cells) >= 2 and mostrar_sprint:
-        # Verifica se há tags de sprint nas células antes de preencher
-        # Verifica todas as possíveis tags de sprint ID/OS
-        tags_sprint_id_possiveis = ['{SPRINT_ID}', '{SPRINT_OS}', '{OS_ID}'] + [tag for tag in tags_sprint.keys() if 'SPRINT_ID' in tag or 'SPRINT_OS' in tag or 'OS_ID' in tag]
-        tags_sprint_tipo_possiveis = ['{SPRINT_TIPO}'] + [tag for tag in tags_sprint.keys() if 'SPRINT_TIPO' in tag]
-        
-        tem_tag_sprint_id = any(celula_contem_tag(row.cells[0], tag) for tag in tags_sprint_id_possiveis)
-        tem_tag_sprint_tipo = any(celula_contem_tag(row.cells[1], tag) for tag in tags_sprint_tipo_possiveis)
-        
-        if tem_tag_sprint_id:
-            escrever_valor_em_celula(row.cells[0], sprint_data.get('sprint', ''))
-        if tem_tag_sprint_tipo:
-            escrever_valor_em_celula(row.cells[1], sprint_data.get('tipo', ''))
-
-
-def preencher_tags_numeradas_item7(row, sprint_data, prof_data, sprint_num, prof_num, primeira_linha_grupo=False):
+def preencher_tags_numeradas_item7(tabela, row, sprint_ctx, prof_ctx, sprint_num, prof_num, primeira_linha_grupo=False):
     """
     Preenche uma linha da Tabela 7 usando tags numeradas.
     Exemplo: {SPRINT_ID_1}, {SPRINT_TIPO_1}, {PROF_TIPO_1_1}, {PROF_QTD_1_1}, {PROF_HORAS_1_1}
     
     Args:
+        tabela: TabelaDocx (ou previa.TabelaEsqueleto) da linha
+        sprint_ctx / prof_ctx: Sprint e profissional do contexto de renderização (prof_ctx pode ser None)
         primeira_linha_grupo: Se True, esta é a primeira linha do grupo de sprint (células mescladas)
     """
-    import re
-    from docx.oxml.ns import qn
-    
     # Mapeamento de tags numeradas de sprint
     tags_sprint_numeradas = {
-        f'{{SPRINT_ID_{sprint_num}}}': sprint_data.get('sprint', ''),
-        f'{{SPRINT_TIPO_{sprint_num}}}': sprint_data.get('tipo', ''),
+        f'{{SPRINT_ID_{sprint_num}}}': sprint_ctx['sprint'],
+        f'{{SPRINT_TIPO_{sprint_num}}}': sprint_ctx['tipo'],
     }
     
     # Mapeamento de tags numeradas de profissional
     tags_prof_numeradas = {}
-    if prof_data:
+    if prof_ctx:
         # Trata variação {PROF_HORAS1_1} (sem underscore) e {PROF_HORAS_1_1} (com underscore)
-        tags_prof_numeradas[f'{{PROF_TIPO_{sprint_num}_{prof_num}}}'] = prof_data.get('tipo', '')
-        tags_prof_numeradas[f'{{PROF_QTD_{sprint_num}_{prof_num}}}'] = str(prof_data.get('quantidade', ''))
-        tags_prof_numeradas[f'{{PROF_HORAS_{sprint_num}_{prof_num}}}'] = str(prof_data.get('horas', ''))
-        tags_prof_numeradas[f'{{PROF_HORAS{sprint_num}_{prof_num}}}'] = str(prof_data.get('horas', ''))  # Variação sem underscore
+        tags_prof_numeradas[f'{{PROF_TIPO_{sprint_num}_{prof_num}}}'] = prof_ctx['tipo']
+        tags_prof_numeradas[f'{{PROF_QTD_{sprint_num}_{prof_num}}}'] = prof_ctx['quantidade']
+        tags_prof_numeradas[f'{{PROF_HORAS_{sprint_num}_{prof_num}}}'] = prof_ctx['horas']
+        tags_prof_numeradas[f'{{PROF_HORAS{sprint_num}_{prof_num}}}'] = prof_ctx['horas']  # Variação sem underscore
         
-        # Calcula a porcentagem automaticamente: (prof_horas / sprint_horas) * 100
+        # Porcentagem já calculada no contexto: (prof_horas / sprint_horas) * 100
         # IMPORTANTE: Usa horas_sprint (horas digitadas pelo usuário) para a tabela 7, não HST original
-        porcentagem_calculada = ''
-        try:
-            # Usa horas_sprint (horas da sprint digitadas pelo usuário), fallback para hst se não houver
-            sprint_horas_str = str(sprint_data.get('horas_sprint') or sprint_data.get('hst', '0')).strip()
-            prof_horas_str = str(prof_data.get('horas', '0')).strip()
-            
-            print(f"[DEBUG] Calculando porcentagem - Sprint {sprint_num}, Prof {prof_num}: sprint_horas={sprint_horas_str}, prof_horas={prof_horas_str}")
-            
-            if sprint_horas_str and prof_horas_str:
-                sprint_horas = float(sprint_horas_str)
-                prof_horas = float(prof_horas_str)
-                
-                if sprint_horas > 0:
-                    porcentagem_valor = (prof_horas / sprint_horas) * 100
-                    # Formata como inteiro se for número inteiro, senão mantém 1 decimal, e adiciona %
-                    if porcentagem_valor == int(porcentagem_valor):
-                        porcentagem_calculada = f"{int(porcentagem_valor)}%"
-                    else:
-                        porcentagem_calculada = f"{porcentagem_valor:.1f}%"
-                    print(f"[DEBUG] Porcentagem calculada: {porcentagem_calculada}")
-        except (ValueError, TypeError, ZeroDivisionError) as e:
-            print(f"[DEBUG] [WARN] Erro ao calcular porcentagem: {e}")
-            # Fallback: usa valor dos dados se disponível
-            porcentagem_calculada = (
-                prof_data.get('percentual') or
-                prof_data.get('alocacao') or
-                prof_data.get('porcentagem') or
-                ''
-            )
-        
         # Adiciona tanto a tag genérica quanto a tag numerada
-        tags_prof_numeradas['{PORCENTAGEM}'] = porcentagem_calculada
-        tag_porcentagem_numerada = f'{{PORCENTAGEM_{sprint_num}_{prof_num}}}'
-        tags_prof_numeradas[tag_porcentagem_numerada] = porcentagem_calculada
-        print(f"[DEBUG] Tag de porcentagem adicionada: {tag_porcentagem_numerada} = {porcentagem_calculada}")
+        tags_prof_numeradas['{PORCENTAGEM}'] = prof_ctx['porcentagem']
+        tags_prof_numeradas[f'{{PORCENTAGEM_{sprint_num}_{prof_num}}}'] = prof_ctx['porcentagem']
     else:
         # Se não há profissional, deixa tags vazias (serão ignoradas na substituição)
-        print(f"[DEBUG] Sem dados de profissional para sprint {sprint_num}, preenchendo apenas tags de sprint")
+        rastro(log, "Sem dados de profissional para sprint %s, preenchendo apenas tags de sprint", sprint_num)
     
     # Preenche células de sprint primeiro (apenas na primeira linha do grupo).
     # IMPORTANTE: Preenche APENAS onde há tags. Se a célula não tiver tag, mantém como está (ex: "N/A")
@@ -802,154 +1171,395 @@ def preencher_tags_numeradas_item7(row, sprint_data, prof_data, sprint_num, prof
     # para todas as linhas mescladas. Se limparmos nas linhas \"de baixo\",
     # apagamos também o conteúdo da primeira linha.
     if primeira_linha_grupo and len(row.cells) >= 2:
-        # Verifica se há tags de sprint nas células antes de preencher
-        # IMPORTANTE: Preenche APENAS onde há tags. Se não houver tag, mantém como está (ex: "N/A")
-        tag_sprint_id = f'{{SPRINT_ID_{sprint_num}}}'
-        tag_sprint_tipo = f'{{SPRINT_TIPO_{sprint_num}}}'
+        # Também aceita as tags genéricas de sprint
+        tags_sprint_id_possiveis = (f'{{SPRINT_ID_{sprint_num}}}', '{SPRINT_ID}', '{SPRINT_OS}', '{OS_ID}')
+        tags_sprint_tipo_possiveis = (f'{{SPRINT_TIPO_{sprint_num}}}', '{SPRINT_TIPO}')
         
-        # Também verifica tags genéricas caso existam
-        tags_sprint_id_possiveis = [
-            tag_sprint_id,
-            '{SPRINT_ID}',
-            '{SPRINT_OS}',
-            '{OS_ID}'
-        ]
-        tags_sprint_tipo_possiveis = [
-            tag_sprint_tipo,
-            '{SPRINT_TIPO}'
-        ]
-        
-        # Preenche apenas se a célula contém alguma tag correspondente
-        tem_tag_id = any(celula_contem_tag(row.cells[0], tag) for tag in tags_sprint_id_possiveis)
-        tem_tag_tipo = any(celula_contem_tag(row.cells[1], tag) for tag in tags_sprint_tipo_possiveis)
+        # As duas células são verificadas antes de qualquer uma ser escrita
+        texto_id, texto_tipo = tabela.texto_bruto(row.cells[0]), tabela.texto_bruto(row.cells[1])
+        tem_tag_id = any(tag in texto_id for tag in tags_sprint_id_possiveis)
+        tem_tag_tipo = any(tag in texto_tipo for tag in tags_sprint_tipo_possiveis)
         
         if tem_tag_id:
-            valor_sprint = str(sprint_data.get('sprint', ''))
-            escrever_valor_em_celula(row.cells[0], valor_sprint)
-            print(f"[DEBUG] Preenchida célula 0 com sprint {valor_sprint} (tag encontrada)")
-        else:
-            print(f"[DEBUG] Célula 0 não contém tag de sprint, mantendo conteúdo original (ex: 'N/A')")
-        
+            tabela.escrever(row.cells[0], sprint_ctx['sprint'])
+            rastro(log, "Preenchida célula 0 com sprint %s (tag encontrada)", sprint_ctx['sprint'])
         if tem_tag_tipo:
-            valor_tipo = str(sprint_data.get('tipo', ''))
-            escrever_valor_em_celula(row.cells[1], valor_tipo)
-            print(f"[DEBUG] Preenchida célula 1 com tipo {valor_tipo} (tag encontrada)")
-        else:
-            print(f"[DEBUG] Célula 1 não contém tag de tipo, mantendo conteúdo original (ex: 'N/A')")
+            tabela.escrever(row.cells[1], sprint_ctx['tipo'])
+            rastro(log, "Preenchida célula 1 com tipo %s (tag encontrada)", sprint_ctx['tipo'])
     
-    # Substitui todas as tags numeradas na linha
-    # IMPORTANTE: Tags de sprint nas células 0 e 1 já foram preenchidas diretamente acima
-    # Mas ainda precisa substituir tags de sprint em outras células (caso existam)
-    # IMPORTANTE: Também substitui tags nas células 0 e 1 caso não tenham sido preenchidas diretamente
+    # Substitui todas as tags numeradas na linha, em cada célula:
+    # - tags de sprint numeradas em TODAS as células (incluindo 0 e 1, caso não tenham sido
+    #   preenchidas acima);
+    # - tags genéricas de sprint: ID/OS na célula 0 e tipo na célula 1;
+    # - porcentagem em qualquer célula; demais tags de profissional a partir da célula 2
+    valores_porcentagem = {tag: valor for tag, valor in tags_prof_numeradas.items() if '{PORCENTAGEM' in tag}
+    valores_por_celula = (
+        {**tags_sprint_numeradas, **dict.fromkeys(('{SPRINT_ID}', '{SPRINT_OS}', '{OS_ID}'), sprint_ctx['sprint']),
+         **valores_porcentagem},
+        {**tags_sprint_numeradas, '{SPRINT_TIPO}': sprint_ctx['tipo'], **valores_porcentagem},
+        {**tags_sprint_numeradas, **tags_prof_numeradas},
+    )
+    padroes_por_celula = [compilar_padrao_tags(valores) for valores in valores_por_celula]
     for cell_idx, cell in enumerate(row.cells):
-        for paragraph in cell.paragraphs:
-            # Substitui tags de sprint numeradas em TODAS as células (incluindo 0 e 1)
-            # Isso garante que tags como {SPRINT_ID_1} sejam substituídas mesmo se não foram preenchidas diretamente
-            for tag, valor in tags_sprint_numeradas.items():
-                if substituir_texto_em_paragrafo(paragraph, tag, str(valor)):
-                    print(f"[DEBUG] Tag de sprint {tag} substituída na célula {cell_idx} com valor: {valor}")
-            
-            # IMPORTANTE: Também substitui tags genéricas de sprint caso existam
-            # Isso garante compatibilidade com templates que usam tags genéricas
-            if cell_idx == 0:
-                # Célula 0: substitui tags de sprint ID
-                for tag_gen in ['{SPRINT_ID}', '{SPRINT_OS}', '{OS_ID}']:
-                    if tag_gen in paragraph.text:
-                        valor_sprint = str(sprint_data.get('sprint', ''))
-                        if substituir_texto_em_paragrafo(paragraph, tag_gen, valor_sprint):
-                            print(f"[DEBUG] Tag genérica de sprint {tag_gen} substituída na célula 0 com valor: {valor_sprint}")
-            elif cell_idx == 1:
-                # Célula 1: substitui tags de tipo de sprint
-                if '{SPRINT_TIPO}' in paragraph.text:
-                    valor_tipo = str(sprint_data.get('tipo', ''))
-                    if substituir_texto_em_paragrafo(paragraph, '{SPRINT_TIPO}', valor_tipo):
-                        print(f"[DEBUG] Tag genérica de tipo {{SPRINT_TIPO}} substituída na célula 1 com valor: {valor_tipo}")
-            
-            # Substitui tags de profissional numeradas (apenas se houver profissional)
-            if tags_prof_numeradas:
-                # IMPORTANTE: Porcentagem pode estar em qualquer célula, então processa todas as células
-                for tag, valor in tags_prof_numeradas.items():
-                    # Se for tag de porcentagem, substitui em qualquer célula
-                    if '{PORCENTAGEM' in tag:
-                        if substituir_texto_em_paragrafo(paragraph, tag, str(valor)):
-                            print(f"[DEBUG] Tag {tag} substituída na célula {cell_idx} com valor: {valor}")
-                    # Para outras tags de profissional, só substitui nas células >= 2 (exceto sprint)
-                    elif cell_idx >= 2:
-                        if substituir_texto_em_paragrafo(paragraph, tag, str(valor)):
-                            print(f"[DEBUG] Tag de profissional {tag} substituída na célula {cell_idx} com valor: {valor}")
+        posicao = min(cell_idx, 2)
+        tabela.substituir_tags(cell, padroes_por_celula[posicao], valores_por_celula[posicao])
 
 
-def preencher_plano_trabalho(
-    modelo_path: str,
-    dados_demanda: Dict[str, Any],
-    dados_sprints: List[Dict[str, Any]],
-    dados_profissionais: Dict[str, List[Dict[str, Any]]],
-    dados_projeto: Dict[str, Any] = None
-) -> Document:
+# -----------------------------
+# ETAPAS DAS TABELAS
+# -----------------------------
+# Usadas pela geração (TabelaDocx) e pela prévia (previa.TabelaEsqueleto), com o plano da
+# tabela (PlanoTabela) já montado
+def preencher_tabela_sprints(tabela, plano, sprints_ctx):
     """
-    Preenche o modelo de Plano de Trabalho com os dados fornecidos.
-    
-    Args:
-        modelo_path: Caminho para o arquivo modelo .docx
-        dados_demanda: Dicionário com dados da demanda (demanda, pt, nome, valor_demanda)
-        dados_sprints: Lista de dicionários com dados das sprints
-        dados_profissionais: Dicionário onde a chave é o ID da sprint e o valor é lista de profissionais
-        dados_projeto: Dicionário com dados do projeto (gestor, gerente, introdução, etc.)
-        
+    Tabela de sprints: uma linha template (TIPO_SPRINT) por sprint, clonando a última
+    quando faltam e removendo as que sobram. Sem linhas template, a primeira linha
+    completamente vazia recebe as tags de sprint.
+
     Returns:
-        Documento Word preenchido
+        O plano da tabela, refeito se ela foi alterada
     """
-    if dados_projeto is None:
-        dados_projeto = {}
-    # Abre o documento modelo
-    doc = Document(modelo_path)
+    table_idx, linhas = plano.indice, plano.linhas
+    # Linhas template de sprint já classificadas pelo plano (o cabeçalho, linha 0, nunca entra)
+    linhas_template_sprint = plano.indices(TIPO_SPRINT)
+    for row_idx in linhas_template_sprint:
+        rastro(log, "Tabela %s: Linha %s contém tags de sprint: %s", table_idx, row_idx, plano.classificacoes[row_idx].texto[:50])
     
-    # Log para debug
-    print(f"[DEBUG] Processando documento...")
-    print(f"[DEBUG] Dados demanda: {dados_demanda}")
-    print(f"[DEBUG] Dados sprints: {dados_sprints}")
-    print(f"[DEBUG] Dados profissionais: {dados_profissionais}")
-    
-    # Função auxiliar para listar todas as tags encontradas no documento
-    def listar_tags_no_documento(doc):
-        """Lista todas as tags encontradas no documento para debug."""
-        tags_encontradas = set()
-        texto_completo = ''
-        
-        # Parágrafos principais
-        for p in doc.paragraphs:
-            texto_completo += p.text + ' '
+    # Se não encontrou linhas com tags, usa a primeira linha COMPLETAMENTE VAZIA
+    # (útil quando o template tem linhas vazias sem tags, mas NÃO preenche linhas com dados normais)
+    linhas_vazias = plano.indices(TIPO_VAZIA)
+    if not linhas_template_sprint and linhas_vazias:
+        row_idx = linhas_vazias[0]
+        row = linhas[row_idx]
+        rastro(log, "Tabela %s: Linha %s está completamente vazia, adicionando tags", table_idx, row_idx)
+        linhas_template_sprint.append(row_idx)
+        # Adiciona tags temporárias para que o preenchimento funcione
+        if len(row.cells) > 0:
+            # Adiciona tag de sprint ID na primeira célula se estiver vazia
+            if not tabela.texto(row.cells[0]).strip():
+                tabela.acrescentar(row.cells[0], '{SPRINT_ID}')
+            if len(row.cells) > 1 and not tabela.texto(row.cells[1]).strip():
+                tabela.acrescentar(row.cells[1], '{SPRINT_TIPO}')
+            for posicao, tag in ((2, '{SPRINTS_HORAS}'), (3, '{OS_ID}'), (4, '{ATIVIDADES}'), (5, '{ENTREGAVEIS}')):
+                if len(row.cells) > posicao:
+                    tabela.acrescentar(row.cells[posicao], tag)
+    
+    if not linhas_template_sprint:
+        log.debug("Tabela %s: Nenhuma linha com tags de sprint encontrada", table_idx)
+        return plano
+    
+    log.debug("Tabela %s: Encontradas %s linha(s) de template de sprint", table_idx, len(linhas_template_sprint))
+    
+    # Usa apenas as linhas necessárias (uma por sprint)
+    num_sprints = len(sprints_ctx)
+    num_linhas_template = len(linhas_template_sprint)
+    
+    # Se há mais sprints que linhas template, cria linhas adicionais
+    if num_sprints > num_linhas_template:
+        log.debug("Tabela %s: Criando %s linha(s) adicional(is)", table_idx, num_sprints - num_linhas_template)
+        # Usa a última linha template como modelo e cria todas as novas linhas em bloco,
+        # logo após ela (as linhas template anteriores não mudam de índice)
+        ultima_linha_template_idx = linhas_template_sprint[-1]
+        novas_linhas_idx = tabela.duplicar_linha(ultima_linha_template_idx, num_sprints - num_linhas_template)
+        linhas_template_sprint.extend(novas_linhas_idx)
+        log.debug("Tabela %s: Criadas %s nova(s) linha(s) após a linha %s", table_idx, len(novas_linhas_idx), ultima_linha_template_idx)
+        # Recalcula a grade uma única vez, já com as novas linhas
+        linhas = tabela.linhas()
+    
+    # Preenche as linhas necessárias
+    for sprint_ctx, linha_idx in zip(sprints_ctx, linhas_template_sprint):
+        preencher_linha_com_dados_sprint(tabela, linhas[linha_idx], sprint_ctx)
+        rastro(log, "Preenchida linha %s com dados da sprint %s", linha_idx, sprint_ctx['sprint'])
+    
+    # Remove linhas extras que não são necessárias
+    # IMPORTANTE: Só remove linhas que NÃO foram preenchidas (linhas extras além das necessárias)
+    if len(linhas_template_sprint) > num_sprints:
+        log.debug("Removendo %s linha(s) extra(s) da tabela %s", len(linhas_template_sprint) - num_sprints, table_idx)
+        # Remove todas as linhas extras em bloco
+        linhas_extras = [linhas[idx] for idx in linhas_template_sprint[num_sprints:] if idx < len(linhas)]
+        log.debug("Total de linhas removidas: %s", tabela.remover_linhas(linhas_extras))
+    
+    # A tabela mudou: refaz o plano dela para a etapa do Item 7
+    return tabela.planejar()
+
+
+def preencher_tabela_item7(tabela, plano, sprints_ctx):
+    """
+    Item 7 com tags numeradas: um grupo de linhas por sprint e uma linha por profissional
+    (expandir_grupos_item7), preenchidos e sem as linhas e grupos que sobram. Tabelas só
+    com tags genéricas não são alteradas.
+    """
+    table_idx, linhas = plano.indice, plano.linhas
+    
+    # Verifica se a tabela usa tags numeradas (ex: {SPRINT_ID_1}, {PROF_TIPO_1_1})
+    if not plano.usa_tags_numeradas:
+        # Tags genéricas (modelos antigos): preenchidas depois, no documento todo, com o
+        # primeiro profissional
+        if plano.indices(TIPO_ITEM7_GENERICA):
+            log.debug("Tabela %s: Processando com tags genéricas", table_idx)
+        return
+    
+    # Processa usando tags numeradas
+    log.debug("Tabela %s: Processando com tags numeradas", table_idx)
+    
+    # Linhas agrupadas por sprint usando tags numeradas
+    grupos_sprint = plano.grupos_sprint()  # {sprint_num: [(row_idx, row, prof_num), ...]}
+    
+    # IMPORTANTE: Linhas com tags genéricas do Item 7 ({PROF_TIPO}...) em uma tabela numerada
+    # não são preenchidas aqui; sem removê-las, a compatibilidade as preencheria
+    # com o primeiro profissional
+    linhas_genericas = [linhas[idx] for idx in plano.indices(TIPO_ITEM7_GENERICA)]
+    if linhas_genericas:
+        tabela.remover_linhas(linhas_genericas)
+        log.debug("Tabela %s: Removidas %s linha(s) com tags genéricas", table_idx, len(linhas_genericas))
+    
+    # Clona grupos de sprint e linhas de profissional que faltam no modelo
+    if expandir_grupos_item7(tabela, grupos_sprint, sprints_ctx) or linhas_genericas:
+        plano = tabela.planejar()
+        linhas = plano.linhas
+        grupos_sprint = plano.grupos_sprint()
+    
+    for sprint_num, linhas_grupo in grupos_sprint.items():
+        rastro(log, "Tabela %s: Sprint %s - %s linha(s) com tags numeradas", table_idx, sprint_num, len(linhas_grupo))
+    
+    # Se não encontrou linhas com tags numeradas, tenta identificar linhas COMPLETAMENTE VAZIAS
+    # (útil quando o template tem linhas vazias sem tags, mas NÃO preenche linhas com dados normais)
+    if not grupos_sprint and len(linhas) > 1:
+        log.debug("Tabela %s: Nenhuma tag numerada encontrada, procurando linhas completamente vazias", table_idx)
+        # Pula o cabeçalho (primeira linha) e procura linhas COMPLETAMENTE VAZIAS
+        linha_atual = 1
+        for sprint_ctx in sprints_ctx:
+            sprint_num = sprint_ctx['num']
+            if linha_atual >= len(linhas):
+                break
+            row = linhas[linha_atual]
+            # Só usa linhas COMPLETAMENTE VAZIAS (classificadas pelo plano)
+            if plano.classificacoes[linha_atual].tipo == TIPO_VAZIA:
+                rastro(log, "Tabela %s: Linha %s está completamente vazia, adicionando tags numeradas", table_idx, linha_atual)
+                # Troca o conteúdo das primeiras células por tags temporárias para que o preenchimento funcione
+                tags = (f'{{SPRINT_ID_{sprint_num}}}', f'{{SPRINT_TIPO_{sprint_num}}}', f'{{PROF_TIPO_{sprint_num}_1}}',
+                        f'{{PROF_QTD_{sprint_num}_1}}', f'{{PROF_HORAS_{sprint_num}_1}}')
+                for cell, tag in zip(row.cells, tags):
+                    tabela.acrescentar(cell, tag, limpar=True)
+                grupos_sprint.setdefault(sprint_num, []).append((linha_atual, row, 1))
+            linha_atual += 1
+    
+    log.debug("Tabela %s: Encontrados %s grupo(s) de sprint", table_idx, len(grupos_sprint))
+    
+    # Processa cada sprint
+    linhas_para_remover = []
+    for sprint_ctx in sprints_ctx:
+        sprint_num = sprint_ctx['num']  # Tags numeradas começam em 1
+        profissionais = sprint_ctx['profissionais']
         
-        # Tabelas
-        for table in doc.tables:
-            for row in table.rows:
-                for cell in row.cells:
-                    texto_completo += cell.text + ' '
+        if sprint_num not in grupos_sprint:
+            rastro(log, "Tabela %s: Sprint %s não encontrada no template", table_idx, sprint_num)
+            continue
         
-        # Headers e footers
-        for section in doc.sections:
-            for p in section.header.paragraphs:
-                texto_completo += p.text + ' '
-            for p in section.footer.paragraphs:
-                texto_completo += p.text + ' '
+        linhas_grupo = grupos_sprint[sprint_num]
+        log.debug("Tabela %s: Sprint %s (%s): %s profissional(is), %s linha(s) template",
+                  table_idx, sprint_num, sprint_ctx['sprint'], len(profissionais), len(linhas_grupo))
         
-        # Procura por padrão de tags {TAG}
-        import re
-        padrao = r'\{[A-Z_0-9]+\}'
-        tags_encontradas = set(re.findall(padrao, texto_completo))
+        # IMPORTANTE: Se não houver profissionais, ainda preenche as tags de sprint na
+        # primeira linha (sem dados de profissional) e mantém só ela
+        if profissionais:
+            for idx, ((row_idx, row, _), prof_ctx) in enumerate(zip(linhas_grupo, profissionais)):
+                # Profissionais numerados começam em 1; a primeira linha do grupo leva a sprint
+                preencher_tags_numeradas_item7(tabela, row, sprint_ctx, prof_ctx, sprint_num, prof_ctx['num'], idx == 0)
+                rastro(log, "Tabela %s: Preenchida linha %s - Sprint %s, Profissional %s (%s)",
+                       table_idx, row_idx, sprint_num, prof_ctx['num'], prof_ctx['tipo'])
+            linhas_remover_grupo = linhas_grupo[len(profissionais):]
+        else:
+            row_idx, row, _ = linhas_grupo[0]
+            preencher_tags_numeradas_item7(tabela, row, sprint_ctx, None, sprint_num, 1, True)
+            rastro(log, "Tabela %s: Preenchida linha %s - Sprint %s (sem profissionais, apenas tags de sprint)",
+                   table_idx, row_idx, sprint_num)
+            linhas_remover_grupo = linhas_grupo[1:]
         
-        print(f"[DEBUG] Tags encontradas no documento: {sorted(tags_encontradas)}")
-        return tags_encontradas
+        # Remove linhas extras deste grupo
+        if linhas_remover_grupo:
+            linhas_para_remover.extend(row for _, row, _ in linhas_remover_grupo)
+            rastro(log, "Tabela %s: Marcadas %s linha(s) para remoção do grupo da sprint %s",
+                   table_idx, len(linhas_remover_grupo), sprint_num)
+    
+    # Remove grupos de sprint que não existem nos dados
+    for sprint_num, linhas_grupo in grupos_sprint.items():
+        if sprint_num > len(sprints_ctx):
+            linhas_para_remover.extend(row for _, row, _ in linhas_grupo)
+            log.debug("Tabela %s: Marcado grupo da sprint %s inexistente para remoção", table_idx, sprint_num)
+    
+    # Remove todas as linhas marcadas em bloco (linhas marcadas mais de uma vez são ignoradas)
+    log.debug("Tabela %s: Removidas %s linha(s)", table_idx, tabela.remover_linhas(linhas_para_remover))
+
+
+# -----------------------------
+# TIPO DA DEMANDA - CHECKBOX
+# -----------------------------
+# Alguns modelos possuem, no item "Tipo da Demanda", caixinhas (☐, U+2610) para: Descoberta,
+# Construção, Design, Manutenção, Arquitetura, Monitoramento. A tabela é fixa, então são
+# usadas as posições conhecidas das células de check.
+TITULO_TABELA_TIPO_DEMANDA = 'Tipo da Demanda'
+# Pela inspeção do modelo:
+# linha 1: [0]=☐ Descoberta, [2]=☐ Design, [4]=☐ Arquitetura
+# linha 2: [0]=☐ Construção, [2]=☐ Manutenção, [4]=☐ Monitoramento
+CELULAS_TIPO_DEMANDA = [
+    # (linha, coluna, categoria)
+    (1, 0, 'descoberta'),
+    (2, 0, 'construcao'),
+    (1, 2, 'design'),
+    (2, 2, 'manutencao'),
+    (1, 4, 'arquitetura'),
+    (2, 4, 'monitoramento'),
+]
+# Trocas (símbolo, novo símbolo) para desmarcar e marcar uma caixinha; o segundo par é o
+# fallback para as caixinhas da fonte Wingdings (caracteres de uso privado)
+TROCAS_DESMARCAR_CAIXA = (('☒', '☐'), ('\uf078', '☐'))
+TROCAS_MARCAR_CAIXA = (('☐', '☒'), ('\uf06f', '☒'))
+PADRAO_DESMARCAR_CAIXA = compilar_padrao_tags(dict(TROCAS_DESMARCAR_CAIXA))
+PADRAO_MARCAR_CAIXA = compilar_padrao_tags(dict(TROCAS_MARCAR_CAIXA))
+
+# Map de categorias que podem aparecer nas sprints -> chave usada no template
+# (aqui usamos apenas palavras-chave para bater com o texto vindo do Redmine)
+MAPA_CATEGORIA_TIPO_DEMANDA = {
+    'descoberta': 'descoberta',
+    'construcao': 'construcao',
+    'construcao.': 'construcao',
+    'design': 'design',
+    'manutencao': 'manutencao',
+    'arquitetura': 'arquitetura',
+    'monitoramento': 'monitoramento',
+}
+
+
+def categorias_tipo_demanda(sprints_ctx):
+    """
+    Categorias do "Tipo da Demanda" (MAPA_CATEGORIA_TIPO_DEMANDA) que aparecem nos tipos
+    das sprints do contexto de renderização.
+    """
+    # Coleta todos os tipos distintos das sprints
+    tipos_sprints = set()
+    for s in sprints_ctx:
+        tipo_val = s['tipo'].strip()
+        if tipo_val:
+            tipos_sprints.add(tipo_val)
+    if not tipos_sprints:
+        return set()
+    log.debug("Marcando tipo(s) da demanda com base nas sprints: %s", tipos_sprints)
+
+    tipos_selecionados = set()
+    for t in tipos_sprints:
+        t_norm = normalizar_tipo_sprint(t)
+        for chave, categoria in MAPA_CATEGORIA_TIPO_DEMANDA.items():
+            if chave in t_norm:
+                tipos_selecionados.add(categoria)
+
+    log.debug("Categorias de tipo selecionadas: %s", tipos_selecionados)
+    return tipos_selecionados
+
+
+def marcar_tipo_demanda(tabela, tipos_selecionados):
+    """
+    Desmarca todas as caixinhas da tabela do "Tipo da Demanda" (TabelaDocx ou
+    previa.TabelaEsqueleto) e marca as das categorias selecionadas (CELULAS_TIPO_DEMANDA).
+    """
+    rows = tabela.linhas()
+    # Cabeçalho está na linha 0; as opções estão nas linhas 1 e 2
+    if len(rows) < 3 or len(rows[1].cells) < 6 or len(rows[2].cells) < 6:
+        return
+    desmarcar, marcar = dict(TROCAS_DESMARCAR_CAIXA), dict(TROCAS_MARCAR_CAIXA)
+    # Primeiro, reseta todos os checkboxes para "não marcado" (☐)
+    for r, c, _ in CELULAS_TIPO_DEMANDA:
+        tabela.substituir_tags(rows[r].cells[c], PADRAO_DESMARCAR_CAIXA, desmarcar)
+    # Depois, marca apenas os tipos que aparecem nas sprints
+    for r, c, categoria in CELULAS_TIPO_DEMANDA:
+        if categoria in tipos_selecionados:
+            tabela.substituir_tags(rows[r].cells[c], PADRAO_MARCAR_CAIXA, marcar)
+
+
+# Etapas da geração, na ordem em que acontecem, com a descrição usada no progresso
+ETAPAS_GERACAO = {
+    'modelo': 'Carregando modelo',
+    'tags_simples': 'Preenchendo tags simples',
+    'tabela_sprints': 'Preenchendo tabela de sprints',
+    'item7': 'Preenchendo Item 7 (profissionais)',
+    'salvamento': 'Salvando documento',
+}
+
+
+def notificar_etapa(ao_progredir, etapa):
+    """
+    Avisa o início de uma etapa (chave de ETAPAS_GERACAO) a quem acompanha a geração.
+    """
+    if ao_progredir is not None:
+        ao_progredir(etapa)
+
+
+def data_geracao_atual() -> str:
+    """
+    Data de geração do documento (tags {DATA}, {{data}}), no formato dd/mm/aaaa.
+    """
+    from datetime import datetime
+    return datetime.today().strftime('%d/%m/%Y')
+
+
+# Tags {TAG} de um modelo (para o log e a listagem de modelos)
+PADRAO_TAG_MODELO = re.compile(r'\{[A-Z_0-9]+\}')
+
+
+def listar_tags_documento(doc):
+    """Tags {TAG} encontradas em todos os parágrafos do documento (uma única passada)."""
+    tags_encontradas = set()
+    for p in iterar_paragrafos_documento(doc):
+        tags_encontradas.update(PADRAO_TAG_MODELO.findall(p.text))
+    return tags_encontradas
+
+
+def tags_do_modelo(doc):
+    """
+    Tags do modelo de onde o documento (ainda não alterado) foi aberto, listadas uma
+    única vez por versão do modelo e guardadas no ZipModelo.
+    """
+    modelo = getattr(doc.part.package, 'zip_modelo', None)
+    if modelo is None:
+        return listar_tags_documento(doc)
+    if modelo.tags is None:
+        modelo.tags = frozenset(listar_tags_documento(doc))
+    return modelo.tags
+
+
+def compilar_modelo(modelo_path):
+    """
+    Pré-carrega um modelo: lê o zip para a memória (obter_modelo), calcula o hash do
+    conteúdo, abre o documento (valida o XML) e lista as tags e as tabelas.
     
-    # Lista tags encontradas
-    tags_encontradas = listar_tags_no_documento(doc)
+    Returns:
+        {'versao': hash SHA-256, 'tags': [tags], 'tabelas': quantidade, 'tamanho_bytes': tamanho}
     
+    Raises:
+        Exception: Modelo inválido (zip corrompido, não é um .docx...)
+    """
+    modelo = obter_modelo(modelo_path)
+    doc = abrir_documento(modelo_path)
+    return {
+        'versao': modelo.hash_conteudo,
+        'tags': sorted(tags_do_modelo(doc)),
+        'tabelas': len(doc.tables),
+        'tamanho_bytes': os.path.getsize(modelo_path),
+    }
+
+
+def montar_tags_simples(contexto, dados_projeto, data_geracao=None):
+    """
+    Valores das tags simples (demanda, projeto, data e total de HSTs), substituídas em
+    todo o documento. Usado pela geração (_preencher_base) e pela prévia (services.previa).
+    """
     # Mapeamento de tags simples para valores
+    demanda_ctx = contexto['demanda']
     tags_simples = {
-        '{DEMANDA}': str(dados_demanda.get('demanda', '')),
-        '{PT}': str(dados_demanda.get('pt', '')),
-        '{NOME_PROJETO}': str(dados_demanda.get('nome', '')),
-        '{VALOR_DEMANDA}': str(dados_demanda.get('valor_demanda', '')),
+        '{DEMANDA}': demanda_ctx['demanda'],
+        '{PT}': demanda_ctx['pt'],
+        '{NOME_PROJETO}': demanda_ctx['nome'],
+        '{VALOR_DEMANDA}': demanda_ctx['valor_demanda'],
     }
 
     # Tags do projeto (Gestor e Gerente)
@@ -973,562 +1583,315 @@ def preencher_plano_trabalho(
             '{GERENTE_CELULAR}}': gerente_telefone,  # Trata erro de dupla chave no template
             '{DESCRICAO_PROJETO}': descricao_projeto,
         })
-        print(f"[DEBUG] Tags do projeto adicionadas:")
-        print(f"  GESTOR: {gestor_nome}")
-        print(f"  GERENTE: {gerente_nome}")
-        print(f"  DESCRICAO_PROJETO: {len(descricao_projeto)} caracteres")
+        log.debug("Tags do projeto adicionadas: GESTOR=%s, GERENTE=%s, DESCRICAO_PROJETO=%s caracteres",
+                  gestor_nome, gerente_nome, len(descricao_projeto))
     else:
-        print(f"[DEBUG] [WARN] Dados do projeto não fornecidos - tags de projeto não serão preenchidas")
+        log.warning("Dados do projeto não fornecidos - tags de projeto não serão preenchidas")
 
     # Tags especiais independentes dos dados da demanda
     # Ex.: {{data}} e {DATA} no histórico de revisões (data de geração do documento)
-    from datetime import datetime
-    data_hoje = datetime.today().strftime('%d/%m/%Y')
+    data_hoje = data_geracao or data_geracao_atual()
     tags_simples.update({
         '{{data}}': data_hoje,
         '{DATA}': data_hoje,  # Tag alternativa em maiúsculas
         '{data}': data_hoje,  # Tag alternativa em minúsculas
     })
-    print(f"[DEBUG] Data de hoje definida: {data_hoje}")
+    log.debug("Data de hoje definida: %s", data_hoje)
     
-    # Calcula o total de HSTs de todas as sprints (para Item 10)
+    # Total de HSTs de todas as sprints (para Item 10), calculado no contexto
     # IMPORTANTE: Usa o HST original do Redmine (hst_redmine se existir, senão hst)
-    total_hst = 0
-    if dados_sprints:
-        for sprint in dados_sprints:
-            # Prioriza hst_redmine (original do Redmine) sobre hst
-            hst_str = str(sprint.get('hst_redmine') or sprint.get('hst', '0')).strip()
-            if hst_str:
-                try:
-                    # Tenta converter para float (pode ser "160" ou "160.0")
-                    hst_valor = float(hst_str)
-                    total_hst += hst_valor
-                except (ValueError, TypeError):
-                    print(f"[DEBUG] [WARN] HST inválido na sprint {sprint.get('sprint', 'N/A')}: '{hst_str}'")
-    tags_simples.update({
-        '{TOTAL_HST}': str(int(total_hst)) if total_hst == int(total_hst) else str(total_hst),
-    })
-    print(f"[DEBUG] Total de HSTs calculado: {total_hst}")
-    
-    # Log das tags que serão substituídas
-    print(f"[DEBUG] Tags simples a substituir:")
-    for tag, valor in tags_simples.items():
-        print(f"  {tag} -> '{valor}'")
-    
-    # Substitui tags simples em todo o documento
-    for tag, valor in tags_simples.items():
-        substituido = substituir_texto_em_documento(doc, tag, valor)
-        if substituido:
-            print(f"[DEBUG] [OK] Tag {tag} substituída com sucesso")
-        else:
-            print(f"[DEBUG] [WARN] Tag {tag} não encontrada no documento")
+    tags_simples['{TOTAL_HST}'] = contexto['total_hst']
+    log.debug("Total de HSTs calculado: %s", contexto['total_hst'])
+    return tags_simples
+
+
+def _preencher_base(doc, contexto, dados_projeto, data_geracao, ao_progredir=None):
+    """
+    Etapas que só dependem dos dados do Redmine e do projeto: tags simples e tabela de
+    sprints (horas da sprint como estiverem no contexto; ver renderizar_documento_parcial).
+    
+    Returns:
+        Planos das tabelas (planejar_documento), já refeitos para as tabelas alteradas
+    """
+    sprints_ctx = contexto['sprints']
+    cronometro = Cronometro()
+    
+    # Lista tags encontradas (do modelo compilado: o documento ainda não foi alterado)
+    tags_encontradas = tags_do_modelo(doc)
+    if rastro_ativo(log):
+        rastro(log, "Tags encontradas no documento: %s", sorted(tags_encontradas))
+    
+    notificar_etapa(ao_progredir, 'tags_simples')
+    cronometro.etapa('tags_simples')
+    
+    tags_simples = montar_tags_simples(contexto, dados_projeto, data_geracao)
+    
+    # Substitui tags simples em todo o documento (uma única passada para todas as tags)
+    tags_substituidas = substituir_tags_em_documento(doc, tags_simples)
+    if rastro_ativo(log):
+        for tag, valor in tags_simples.items():
+            rastro(log, "Tag %s -> '%s': %s", tag, valor,
+                   'substituída' if tag in tags_substituidas else 'não encontrada no documento')
+    
+    notificar_etapa(ao_progredir, 'tabela_sprints')
+    cronometro.etapa('tabela_sprints')
+    
+    # Plano das tabelas: cada linha é classificada uma única vez (cabeçalho, template de sprint,
+    # Item 7...) e o plano é usado pelas etapas de sprints e do Item 7. Só as tabelas alteradas
+    # são planejadas de novo.
+    planos = planejar_documento(doc)
+    if rastro_ativo(log):
+        for plano in planos:
+            rastro(log, "Tabela %s: plano %s", plano.indice, plano.resumo())
     
     # -----------------------------
     # 1) TAGS SIMPLES E SPRINTS
     # -----------------------------
-    # Processa sprints - mapeamento de tags
-    tags_sprint = {
-        '{SPRINT_OS}': 'os',
-        '{OS_ID}': 'os',  # Tag alternativa para OS
-        '{SPRINT_ID}': 'sprint',
-        '{SPRINT_TIPO}': 'tipo',
-        '{SPRINT_HST}': 'hst',
-        '{SPRINT_VALOR_H}': 'valor_h_sprint',
-        '{SPRINT_VALOR_TOTAL}': 'valor_total',
-        '{SPRINTS_HORAS}': 'hst',  # Tag alternativa para horas
-        '{SPRINTS_ HORAS}': 'hst',
-        '{ATIVIDADES}': 'atividades',  # Tag para atividades (preenchida do arquivo de configuração)
-        '{ENTREGAVEIS}': 'entregaveis',  # Tag para entregáveis (preenchida do arquivo de configuração)
+    # Processa sprints em tabelas (tags de sprint em TAGS_SPRINT)
+    if sprints_ctx:
+        log.debug("Processando %s sprint(s)...", len(sprints_ctx))
+        for plano in planos:
+            planos[plano.indice] = preencher_tabela_sprints(TabelaDocx(plano.table, plano.indice), plano, sprints_ctx)
+    
+    cronometro.encerrar()
+    return planos
+
+
+PREFIXO_MARCADOR_HORAS = '{HORAS_PARCIAL_'
+
+
+def marcador_horas_parcial(sprint_num):
+    """Marcador das horas da sprint no documento parcial (substituído em _completar_documento_parcial)."""
+    return f'{PREFIXO_MARCADOR_HORAS}{sprint_num}}}'
+
+
+def contexto_documento_parcial(contexto):
+    """
+    Contexto do documento parcial: só o que vem do Redmine e da configuração. As horas
+    de cada sprint (digitadas pelo usuário) viram um marcador e os profissionais ficam
+    de fora; gerações que diferem só nesses campos têm o mesmo contexto parcial.
+    """
+    return {
+        **contexto,
+        'sprints': [
+            {**sprint, 'horas_sprint': marcador_horas_parcial(sprint['num']), 'profissionais': []}
+            for sprint in contexto['sprints']
+        ],
     }
+
+
+def renderizar_documento_parcial(modelo_path, contexto_parcial, dados_projeto=None, data_geracao=None):
+    """
+    Preenche as etapas que não dependem do usuário (modelo, tags simples e tabela de
+    sprints com as horas marcadas) e devolve o resultado serializado, para ser retomado
+    depois por preencher_plano_trabalho(documento_parcial=...), inclusive em outro processo.
     
-    # Processa sprints em tabelas
-    if dados_sprints:
-        print(f"[DEBUG] Processando {len(dados_sprints)} sprint(s)...")
-        
-        # Para cada tabela no documento
-        for table_idx, table in enumerate(doc.tables):
-            # Encontra linhas que contêm tags de sprint
-            # IMPORTANTE: Pula o cabeçalho (linha 0) e procura tags nas linhas seguintes
-            linhas_template_sprint = []
-            for row_idx, row in enumerate(table.rows):
-                # Pula o cabeçalho (linha 0)
-                if row_idx == 0:
-                    continue
-                
-                # IMPORTANTE: Verifica se é uma linha de cabeçalho (contém múltiplas palavras de cabeçalho sem tags)
-                texto_linha_completo = ' '.join([cell.text.strip() for cell in row.cells])
-                tem_chaves = '{' in texto_linha_completo and '}' in texto_linha_completo
-                
-                # CRITÉRIO 1: Se não tem chaves {}, não pode ser uma linha de template
-                if not tem_chaves:
-                    # Verifica se é um cabeçalho de colunas (contém palavras como "Fase", "Sprint", "Horas", etc.)
-                    palavras_cabecalho = ['Fase', 'Sprint', 'Horas', 'OS*', 'Atividades', 'Entregáveis', 'Observação']
-                    palavras_encontradas = sum(1 for palavra in palavras_cabecalho if palavra in texto_linha_completo)
-                    
-                    # Se tem pelo menos uma palavra de cabeçalho, é um cabeçalho - PULA
-                    if palavras_encontradas > 0:
-                        print(f"[DEBUG] Tabela {table_idx}: Linha {row_idx} é cabeçalho sem tags (ignorada): {texto_linha_completo[:60]}")
-                        continue
-                    else:
-                        # Linha sem tags e sem palavras de cabeçalho - pode ser linha vazia ou título
-                        print(f"[DEBUG] Tabela {table_idx}: Linha {row_idx} não tem tags nem é cabeçalho (ignorada): {texto_linha_completo[:50]}")
-                        continue
-                
-                # CRITÉRIO 2: Verifica se tem tags explícitas de sprint
-                # IMPORTANTE: Só adiciona se a linha CONTÉM tags de sprint com chaves {}
-                # IMPORTANTE: A função linha_contem_tag_sprint já verifica se tem chaves e tags, então se retornar True, é válida
-                if linha_contem_tag_sprint(row) and not linha_contem_tag_profissional(row):
-                    linhas_template_sprint.append(row_idx)
-                    print(f"[DEBUG] Tabela {table_idx}: Linha {row_idx} contém tags de sprint: {row.cells[0].text[:50] if row.cells else 'N/A'}")
-                else:
-                    # Se não passou na verificação de tags, ignora
-                    print(f"[DEBUG] Tabela {table_idx}: Linha {row_idx} não passou na verificação de tags (ignorada): {texto_linha_completo[:50]}")
-            
-            # Se não encontrou linhas com tags, tenta identificar linhas COMPLETAMENTE VAZIAS
-            # (útil quando o template tem linhas vazias sem tags, mas NÃO preenche linhas com dados normais)
-            if not linhas_template_sprint and len(table.rows) > 1:
-                print(f"[DEBUG] Tabela {table_idx}: Nenhuma tag encontrada, procurando linhas completamente vazias")
-                # Pula o cabeçalho (primeira linha) e verifica se há linhas COMPLETAMENTE VAZIAS
-                for row_idx in range(1, len(table.rows)):
-                    row = table.rows[row_idx]
-                    # Verifica se TODAS as células estão vazias (linha template)
-                    todas_vazias = True
-                    for cell in row.cells:
-                        texto_cell = cell.text.strip()
-                        # Se a célula tem conteúdo significativo (mais de 2 caracteres), não é template
-                        if len(texto_cell) > 2:
-                            todas_vazias = False
-                            break
-                    
-                    if todas_vazias:
-                        print(f"[DEBUG] Tabela {table_idx}: Linha {row_idx} está completamente vazia, adicionando tags")
-                        linhas_template_sprint.append(row_idx)
-                        # Adiciona tags temporárias para que o preenchimento funcione
-                        if len(row.cells) > 0:
-                            # Adiciona tag de sprint ID na primeira célula se estiver vazia
-                            if not row.cells[0].text.strip():
-                                row.cells[0].paragraphs[0].add_run('{SPRINT_ID}')
-                            if len(row.cells) > 1 and not row.cells[1].text.strip():
-                                row.cells[1].paragraphs[0].add_run('{SPRINT_TIPO}')
-                            if len(row.cells) > 2:
-                                row.cells[2].paragraphs[0].add_run('{SPRINTS_HORAS}')
-                            if len(row.cells) > 3:
-                                row.cells[3].paragraphs[0].add_run('{OS_ID}')
-                            if len(row.cells) > 4:
-                                row.cells[4].paragraphs[0].add_run('{ATIVIDADES}')
-                            if len(row.cells) > 5:
-                                row.cells[5].paragraphs[0].add_run('{ENTREGAVEIS}')
-                        # Para após encontrar a primeira linha template vazia
-                        break
-            
-            # Se encontrou linhas de template de sprint
-            if linhas_template_sprint:
-                print(f"[DEBUG] Tabela {table_idx}: Encontradas {len(linhas_template_sprint)} linha(s) de template de sprint")
-                
-                # Usa apenas as linhas necessárias (uma por sprint)
-                num_sprints = len(dados_sprints)
-                num_linhas_template = len(linhas_template_sprint)
-                
-                # Se há mais sprints que linhas template, cria linhas adicionais
-                if num_sprints > num_linhas_template:
-                    print(f"[DEBUG] Tabela {table_idx}: Criando {num_sprints - num_linhas_template} linha(s) adicional(is)")
-                    # Usa a última linha template como modelo para criar novas linhas
-                    ultima_linha_template_idx = linhas_template_sprint[-1]
-                    ultima_linha_template = table.rows[ultima_linha_template_idx]
-                    
-                    for i in range(num_linhas_template, num_sprints):
-                        # Duplica a última linha template
-                        nova_linha_idx = duplicar_linha_tabela(table, ultima_linha_template_idx)
-                        linhas_template_sprint.append(nova_linha_idx)
-                        print(f"[DEBUG] Tabela {table_idx}: Criada nova linha {nova_linha_idx}")
-                
-                # Preenche as linhas necessárias
-                for sprint_idx in range(num_sprints):
-                    sprint_data = dados_sprints[sprint_idx]
-                    if sprint_idx < len(linhas_template_sprint):
-                        linha_idx = linhas_template_sprint[sprint_idx]
-                        linha = table.rows[linha_idx]
-                        preencher_linha_com_dados_sprint(linha, sprint_data, tags_sprint)
-                        print(f"[DEBUG] Preenchida linha {linha_idx} com dados da sprint {sprint_data.get('sprint', 'N/A')}")
-                    else:
-                        print(f"[DEBUG] ERRO: Não há linha template suficiente para sprint {sprint_idx}")
-                
-                # Remove linhas extras que não são necessárias (da última para a primeira)
-                # IMPORTANTE: Só remove linhas que NÃO foram preenchidas (linhas extras além das necessárias)
-                if len(linhas_template_sprint) > num_sprints:
-                    linhas_para_remover = len(linhas_template_sprint) - num_sprints
-                    print(f"[DEBUG] Removendo {linhas_para_remover} linha(s) extra(s) da tabela {table_idx}")
-                    # Remove da última linha template para a primeira extra
-                    # IMPORTANTE: Remove em ordem reversa para não afetar os índices
-                    linhas_removidas = []
-                    for idx in range(len(linhas_template_sprint) - 1, num_sprints - 1, -1):
-                        linha_idx_remover = linhas_template_sprint[idx]
-                        try:
-                            # Verifica se a linha ainda existe antes de remover
-                            if linha_idx_remover < len(table.rows):
-                                table._element.remove(table.rows[linha_idx_remover]._element)
-                                linhas_removidas.append(linha_idx_remover)
-                                print(f"[DEBUG] Removida linha {linha_idx_remover} da tabela {table_idx}")
-                        except Exception as e:
-                            print(f"[DEBUG] Erro ao remover linha {linha_idx_remover}: {e}")
-                    print(f"[DEBUG] Total de linhas removidas: {len(linhas_removidas)}")
-            else:
-                print(f"[DEBUG] Tabela {table_idx}: Nenhuma linha com tags de sprint encontrada")
+    Args:
+        contexto_parcial: contexto_documento_parcial(contexto)
+    
+    Returns:
+        {'partes': {nome no zip: bytes}, 'tabelas_horas': [índices das tabelas com marcadores]}
+    """
+    doc = abrir_documento(modelo_path)
+    planos = _preencher_base(doc, contexto_parcial, dados_projeto or {}, data_geracao)
+    tabelas_horas = [
+        plano.indice for plano in planos
+        if any(PREFIXO_MARCADOR_HORAS in c.texto for c in plano.classificacoes)
+    ]
+    return {'partes': serializar_partes_alteradas(doc), 'tabelas_horas': tabelas_horas}
+
+
+def _completar_documento_parcial(doc, documento_parcial, sprints_ctx):
+    """
+    Troca os marcadores de horas do documento parcial pelas horas das sprints (só nas
+    tabelas que os têm) e monta o plano das tabelas para a etapa do Item 7.
+    """
+    valores = {marcador_horas_parcial(sprint['num']): sprint['horas_sprint'] for sprint in sprints_ctx}
+    if valores:
+        padrao = compilar_padrao_tags(valores)
+        tabelas = doc.tables
+        for table_idx in documento_parcial['tabelas_horas']:
+            for paragraph in iterar_paragrafos_tabela(tabelas[table_idx]):
+                substituir_tags_em_paragrafo(paragraph, padrao, valores)
+    return planejar_documento(doc)
+
+
+def preencher_plano_trabalho(
+    modelo_path: str,
+    dados_demanda: Dict[str, Any],
+    dados_sprints: List[Dict[str, Any]],
+    dados_profissionais: Dict[str, List[Dict[str, Any]]],
+    dados_projeto: Dict[str, Any] = None,
+    contexto: Dict[str, Any] = None,
+    data_geracao: str = None,
+    ao_progredir=None,
+    documento_parcial: Dict[str, Any] = None
+) -> Document:
+    """
+    Preenche o modelo de Plano de Trabalho com os dados fornecidos.
+    
+    Args:
+        modelo_path: Caminho para o arquivo modelo .docx
+        dados_demanda: Dicionário com dados da demanda (demanda, pt, nome, valor_demanda)
+        dados_sprints: Lista de dicionários com dados das sprints
+        dados_profissionais: Dicionário onde a chave é o ID da sprint e o valor é lista de profissionais
+        dados_projeto: Dicionário com dados do projeto (gestor, gerente, introdução, etc.)
+        contexto: Contexto de renderização já montado (montar_contexto_render); se não for
+            informado, é montado a partir de dados_demanda, dados_sprints e dados_profissionais
+        data_geracao: Data usada em {DATA} (dd/mm/aaaa); padrão: data_geracao_atual()
+        ao_progredir: Função chamada com a chave (ETAPAS_GERACAO) de cada etapa iniciada;
+            'salvamento' fica a cargo de quem grava o documento
+        documento_parcial: Documento parcial (renderizar_documento_parcial) com as tags simples
+            e a tabela de sprints já preenchidas para este mesmo modelo, projeto, data e dados
+            do Redmine; só as horas das sprints, o Item 7 e o tipo da demanda são preenchidos
         
+    Returns:
+        Documento Word preenchido
+    
+    Complexidade: O(linhas + tags). Nenhuma etapa usa table.rows[i] ou row.cells dentro de
+    laços (cada acesso recalcula a grade da tabela): a grade é resolvida uma vez por tabela
+    em cada etapa (obter_linhas_tabela), as tags simples são substituídas em uma única
+    passada pelos parágrafos (substituir_tags_em_documento) e as linhas são inseridas e
+    removidas em bloco (duplicar_linha_tabela / remover_linhas_tabela).
+    O benchmark_documento.py --escalabilidade verifica o crescimento linear.
+    """
+    if dados_projeto is None:
+        dados_projeto = {}
+    # Abre o documento modelo (zip já carregado em memória; fontes e demais partes não XML
+    # são carregadas sob demanda)
+    # Tempo de cada etapa (services.metricas): _preencher_base mede as tags simples e a tabela de sprints
+    cronometro = Cronometro()
+    notificar_etapa(ao_progredir, 'modelo')
+    cronometro.etapa('modelo')
+    doc = abrir_documento(modelo_path, documento_parcial['partes'] if documento_parcial else None)
+    cronometro.encerrar()
+    
+    # Log para debug
+    log.debug("Processando documento%s...", ' (a partir do documento parcial)' if documento_parcial else '')
+    rastro(log, "Dados demanda: %s", dados_demanda)
+    rastro(log, "Dados sprints: %s", dados_sprints)
+    rastro(log, "Dados profissionais: %s", dados_profissionais)
+    
+    # Contexto de renderização: números, porcentagens, totais, moedas e atividades/entregáveis
+    # calculados uma única vez; as etapas abaixo só leem os textos prontos
+    if contexto is None:
+        contexto = montar_contexto_render(dados_demanda, dados_sprints, dados_profissionais)
+    sprints_ctx = contexto['sprints']
+    
+    if documento_parcial is None:
+        planos = _preencher_base(doc, contexto, dados_projeto, data_geracao, ao_progredir)
+    else:
+        # Tags simples e tabela de sprints já preenchidas na especulação: só faltam as horas
+        notificar_etapa(ao_progredir, 'tags_simples')
+        notificar_etapa(ao_progredir, 'tabela_sprints')
+        cronometro.etapa('tabela_sprints')
+        planos = _completar_documento_parcial(doc, documento_parcial, sprints_ctx)
     
     # -----------------------------
     # 2) PROFISSIONAIS / ITEM 7
     # -----------------------------
-    # Processa profissionais em tabelas usando tags numeradas
-    tags_prof = {
-        '{PROF_TIPO}': 'tipo',
-        '{PROF_QTD}': 'quantidade',
-        '{PROF_QUANTIDADE}': 'quantidade',
-        '{PROF_HORAS}': 'horas',
-        '{PORCENTAGEM}': 'percentual',
-    }
-    
-    if dados_sprints:
-        print(f"[DEBUG] Processando profissionais...")
-        
-        for table_idx, table in enumerate(doc.tables):
-            # Verifica se a tabela usa tags numeradas (ex: {SPRINT_ID_1}, {PROF_TIPO_1_1})
-            usa_tags_numeradas = False
-            for row in table.rows:
-                sprint_num = identificar_sprint_num_na_linha(row)
-                if sprint_num is not None:
-                    usa_tags_numeradas = True
-                    break
-            
-            if not usa_tags_numeradas:
-                # Processa com tags genéricas (compatibilidade com modelos antigos)
-                linhas_template_prof = []
-                for row_idx, row in enumerate(table.rows):
-                    if linha_contem_tag_profissional(row):
-                        linhas_template_prof.append((row_idx, row))
-                
-                if not linhas_template_prof:
-                    continue
-                
-                print(f"[DEBUG] Tabela {table_idx}: Processando com tags genéricas")
-                # ... (código antigo para compatibilidade)
-                continue
-            
-            # Processa usando tags numeradas
-            print(f"[DEBUG] Tabela {table_idx}: Processando com tags numeradas")
-            
-            # Agrupa linhas por sprint usando tags numeradas
-            grupos_sprint = {}  # {sprint_num: [(row_idx, row, prof_num), ...]}
-            
-            for row_idx, row in enumerate(table.rows):
-                # Pula o cabeçalho (linha 0)
-                if row_idx == 0:
-                    continue
-                # Verifica tags numeradas primeiro
-                sprint_num = identificar_sprint_num_na_linha(row)
-                if sprint_num is not None:
-                    prof_num = identificar_prof_num_na_linha(row, sprint_num)
-                    if prof_num is None:
-                        prof_num = 1  # Default se não encontrar
-                    
-                    if sprint_num not in grupos_sprint:
-                        grupos_sprint[sprint_num] = []
-                    grupos_sprint[sprint_num].append((row_idx, row, prof_num))
-                    print(f"[DEBUG] Tabela {table_idx}: Linha {row_idx} tem tags numeradas - Sprint {sprint_num}, Prof {prof_num}")
-            
-            # Se não encontrou linhas com tags numeradas, tenta identificar linhas COMPLETAMENTE VAZIAS
-            # (útil quando o template tem linhas vazias sem tags, mas NÃO preenche linhas com dados normais)
-            if not grupos_sprint and len(table.rows) > 1 and dados_sprints:
-                print(f"[DEBUG] Tabela {table_idx}: Nenhuma tag numerada encontrada, procurando linhas completamente vazias")
-                # Pula o cabeçalho (primeira linha) e procura linhas COMPLETAMENTE VAZIAS
-                linha_atual = 1
-                for sprint_idx, sprint_data in enumerate(dados_sprints):
-                    sprint_num = sprint_idx + 1
-                    if linha_atual < len(table.rows):
-                        row = table.rows[linha_atual]
-                        # Verifica se TODAS as células estão vazias (linha template)
-                        todas_vazias = True
-                        for cell in row.cells:
-                            texto_cell = cell.text.strip()
-                            # Se a célula tem conteúdo significativo (mais de 2 caracteres), não é template
-                            if len(texto_cell) > 2:
-                                todas_vazias = False
-                                break
-                        
-                        if todas_vazias:
-                            print(f"[DEBUG] Tabela {table_idx}: Linha {linha_atual} está completamente vazia, adicionando tags numeradas")
-                            # Adiciona tags temporárias para que o preenchimento funcione
-                            if len(row.cells) > 0:
-                                # Limpa e adiciona tag na primeira célula
-                                row.cells[0].paragraphs[0].clear()
-                                row.cells[0].paragraphs[0].add_run(f'{{SPRINT_ID_{sprint_num}}}')
-                            if len(row.cells) > 1:
-                                row.cells[1].paragraphs[0].clear()
-                                row.cells[1].paragraphs[0].add_run(f'{{SPRINT_TIPO_{sprint_num}}}')
-                            if len(row.cells) > 2:
-                                row.cells[2].paragraphs[0].clear()
-                                row.cells[2].paragraphs[0].add_run(f'{{PROF_TIPO_{sprint_num}_1}}')
-                            if len(row.cells) > 3:
-                                row.cells[3].paragraphs[0].clear()
-                                row.cells[3].paragraphs[0].add_run(f'{{PROF_QTD_{sprint_num}_1}}')
-                            if len(row.cells) > 4:
-                                row.cells[4].paragraphs[0].clear()
-                                row.cells[4].paragraphs[0].add_run(f'{{PROF_HORAS_{sprint_num}_1}}')
-                            
-                            if sprint_num not in grupos_sprint:
-                                grupos_sprint[sprint_num] = []
-                            grupos_sprint[sprint_num].append((linha_atual, row, 1))
-                            linha_atual += 1
-                        else:
-                            # Linha tem dados, pula para próxima
-                            linha_atual += 1
-                    else:
-                        break
-            
-            print(f"[DEBUG] Tabela {table_idx}: Encontrados {len(grupos_sprint)} grupo(s) de sprint")
-            
-            # Processa cada sprint
-            linhas_para_remover = []
-            for sprint_idx, sprint_data in enumerate(dados_sprints):
-                sprint_num = sprint_idx + 1  # Tags numeradas começam em 1
-                sprint_id = str(sprint_data.get('sprint', ''))
-                profissionais = dados_profissionais.get(sprint_id, [])
-                
-                if sprint_num not in grupos_sprint:
-                    print(f"[DEBUG] Tabela {table_idx}: Sprint {sprint_num} não encontrada no template")
-                    continue
-                
-                linhas_grupo = grupos_sprint[sprint_num]
-                num_profissionais = len(profissionais) if profissionais else 0
-                num_linhas_template = len(linhas_grupo)
-                
-                print(f"[DEBUG] Tabela {table_idx}: Sprint {sprint_num} ({sprint_id}): {num_profissionais} profissional(is), {num_linhas_template} linha(s) template")
-                
-                # IMPORTANTE: NÃO força preenchimento em células sem tags
-                # Só preenche onde há tags explícitas para evitar sobrescrever dados normais
-                # O preenchimento já é feito pela função preencher_tags_numeradas_item7
-                
-                # Preenche linhas existentes
-                # IMPORTANTE: Se não houver profissionais, ainda preenche as tags de sprint
-                if num_profissionais > 0:
-                    # Tem profissionais: preenche normalmente
-                    for idx in range(min(num_profissionais, num_linhas_template)):
-                        row_idx, row, prof_num_template = linhas_grupo[idx]
-                        prof_data = profissionais[idx]
-                        prof_num_real = idx + 1  # Profissionais numerados começam em 1
-                        primeira_linha_grupo = (idx == 0)  # Primeira linha do grupo de sprint
-                        
-                        preencher_tags_numeradas_item7(row, sprint_data, prof_data, sprint_num, prof_num_real, primeira_linha_grupo)
-                        print(f"[DEBUG] Tabela {table_idx}: Preenchida linha {row_idx} - Sprint {sprint_num}, Profissional {prof_num_real} ({prof_data.get('tipo', 'N/A')})")
-                    
-                    # Remove linhas extras deste grupo (da última para a primeira)
-                    if num_linhas_template > num_profissionais:
-                        linhas_remover_grupo = linhas_grupo[num_profissionais:]
-                        for row_idx_remover, row_remover, _ in linhas_remover_grupo:
-                            linhas_para_remover.append((row_idx_remover, row_remover))
-                        print(f"[DEBUG] Tabela {table_idx}: Marcadas {len(linhas_remover_grupo)} linha(s) para remoção do grupo da sprint {sprint_num}")
-                else:
-                    # Não tem profissionais: preenche apenas tags de sprint na primeira linha
-                    if linhas_grupo:
-                        row_idx, row, _ = linhas_grupo[0]
-                        primeira_linha_grupo = True
-                        # Preenche apenas tags de sprint, sem dados de profissional
-                        preencher_tags_numeradas_item7(row, sprint_data, None, sprint_num, 1, primeira_linha_grupo)
-                        print(f"[DEBUG] Tabela {table_idx}: Preenchida linha {row_idx} - Sprint {sprint_num} (sem profissionais, apenas tags de sprint)")
-                        
-                        # Remove linhas extras deste grupo (mantém apenas a primeira)
-                        if num_linhas_template > 1:
-                            linhas_remover_grupo = linhas_grupo[1:]
-                            for row_idx_remover, row_remover, _ in linhas_remover_grupo:
-                                linhas_para_remover.append((row_idx_remover, row_remover))
-                            print(f"[DEBUG] Tabela {table_idx}: Marcadas {len(linhas_remover_grupo)} linha(s) para remoção do grupo da sprint {sprint_num} (sem profissionais)")
-                
-                # Remove linhas extras deste grupo (da última para a primeira)
-                if num_linhas_template > num_profissionais:
-                    linhas_remover_grupo = linhas_grupo[num_profissionais:]
-                    for row_idx, row, _ in linhas_remover_grupo:
-                        linhas_para_remover.append((row_idx, row))
-                    print(f"[DEBUG] Tabela {table_idx}: Marcadas {len(linhas_remover_grupo)} linha(s) para remoção do grupo da sprint {sprint_num}")
-            
-            # Remove linhas extras (da última para a primeira para evitar problemas de índice)
-            linhas_para_remover.sort(key=lambda x: x[0], reverse=True)
-            for row_idx, row in linhas_para_remover:
-                try:
-                    table._element.remove(row._element)
-                    print(f"[DEBUG] Tabela {table_idx}: Removida linha {row_idx}")
-                except Exception as e:
-                    print(f"[DEBUG] Erro ao remover linha {row_idx}: {e}")
-            
-            # Remove grupos de sprint que não existem nos dados
-            for sprint_num in grupos_sprint.keys():
-                if sprint_num > len(dados_sprints):
-                    linhas_grupo = grupos_sprint[sprint_num]
-                    for row_idx, row, _ in linhas_grupo:
-                        try:
-                            table._element.remove(row._element)
-                            print(f"[DEBUG] Tabela {table_idx}: Removida linha {row_idx} de sprint {sprint_num} inexistente")
-                        except Exception as e:
-                            print(f"[DEBUG] Erro ao remover linha {row_idx}: {e}")
+    cronometro.encerrar()
+    notificar_etapa(ao_progredir, 'item7')
+    cronometro.etapa('item7')
+    # Processa profissionais em tabelas usando tags numeradas (tags genéricas em TAGS_PROFISSIONAL)
+    if sprints_ctx:
+        log.debug("Processando profissionais...")
+        for plano in planos:
+            preencher_tabela_item7(TabelaDocx(plano.table, plano.indice), plano, sprints_ctx)
 
         # Compatibilidade: substitui tags fora de tabelas com o primeiro profissional encontrado
-        primeiro_prof = None
-        for sprint_data in dados_sprints:
-            sprint_id = str(sprint_data.get('sprint', ''))
-            profissionais = dados_profissionais.get(sprint_id, [])
-            if profissionais:
-                primeiro_prof = profissionais[0]
-                break
+        primeiro_prof = next((s['profissionais'][0] for s in sprints_ctx if s['profissionais']), None)
         
         if primeiro_prof:
-            for tag, campo in tags_prof.items():
-                if campo == 'percentual':
-                    valor = (
-                        primeiro_prof.get('percentual') or
-                        primeiro_prof.get('alocacao') or
-                        primeiro_prof.get('porcentagem') or
-                        ''
-                    )
-                else:
-                    valor = primeiro_prof.get(campo, '')
-                substituir_texto_em_documento(doc, tag, str(valor))
+            valores_prof = {tag: primeiro_prof[campo] for tag, campo in TAGS_PROFISSIONAL.items()}
+            substituir_tags_em_documento(doc, valores_prof)
         
         # Substitui tags de sprint restantes apenas em parágrafos (fora das tabelas)
-        primeira_sprint = dados_sprints[0]
-        for tag, campo in tags_sprint.items():
-            valor = str(primeira_sprint.get(campo, ''))
-            for paragraph in doc.paragraphs:
-                substituir_texto_em_paragrafo(paragraph, tag, valor)
-            for section in doc.sections:
-                for paragraph in section.header.paragraphs:
-                    substituir_texto_em_paragrafo(paragraph, tag, valor)
-                for paragraph in section.footer.paragraphs:
-                    substituir_texto_em_paragrafo(paragraph, tag, valor)
+        primeira_sprint = sprints_ctx[0]
+        valores_sprint = {tag: primeira_sprint[campo] for tag, campo in TAGS_SPRINT.items()}
+        padrao_sprint = compilar_padrao_tags(valores_sprint)
+        paragrafos_fora_tabelas = list(doc.paragraphs)
+        for section in doc.sections:
+            paragrafos_fora_tabelas.extend(section.header.paragraphs)
+            paragrafos_fora_tabelas.extend(section.footer.paragraphs)
+        for paragraph in paragrafos_fora_tabelas:
+            substituir_tags_em_paragrafo(paragraph, padrao_sprint, valores_sprint)
 
         # -----------------------------
         # 3) TIPO DA DEMANDA - CHECKBOX
         # -----------------------------
-        # Alguns modelos possuem, no item "Tipo da Demanda", caixinhas (☐, U+2610)
-        # para: Descoberta, Construção, Design, Manutenção, Arquitetura, Monitoramento.
-        # A tabela é fixa, então usamos as posições conhecidas das células de check.
+        cronometro.etapa('tipo_demanda')
+        # Caixinhas do item "Tipo da Demanda" nas posições conhecidas (CELULAS_TIPO_DEMANDA)
         try:
-            # Coleta todos os tipos distintos das sprints
-            tipos_sprints = set()
-            for s in dados_sprints:
-                tipo_val = str(s.get('tipo', '') or '').strip()
-                if tipo_val:
-                    tipos_sprints.add(tipo_val)
-
-            if tipos_sprints:
-                print(f"[DEBUG] Marcando tipo(s) da demanda com base nas sprints: {tipos_sprints}")
-
-                # Normaliza acentuação para comparação
-                def normalizar(t: str) -> str:
-                    return (
-                        t.replace('ã', 'a')
-                         .replace('á', 'a')
-                         .replace('â', 'a')
-                         .replace('é', 'e')
-                         .replace('ê', 'e')
-                         .replace('í', 'i')
-                         .replace('ó', 'o')
-                         .replace('ô', 'o')
-                         .replace('ú', 'u')
-                         .replace('ç', 'c')
-                    ).lower()
-
-                # Map de categorias que podem aparecer nas sprints -> chave usada no template
-                # (aqui usamos apenas palavras-chave para bater com o texto vindo do Redmine)
-                mapa_categoria = {
-                    'descoberta': 'descoberta',
-                    'construcao': 'construcao',
-                    'construcao.': 'construcao',
-                    'design': 'design',
-                    'manutencao': 'manutencao',
-                    'arquitetura': 'arquitetura',
-                    'monitoramento': 'monitoramento',
-                }
-
-                tipos_selecionados = set()
-                for t in tipos_sprints:
-                    t_norm = normalizar(t)
-                    for chave, categoria in mapa_categoria.items():
-                        if chave in t_norm:
-                            tipos_selecionados.add(categoria)
-
-                print(f"[DEBUG] Categorias de tipo selecionadas: {tipos_selecionados}")
-
-                if tipos_selecionados:
-                    # Localiza a tabela que contém "Tipo da Demanda"
-                    tabela_tipo = None
-                    for table in doc.tables:
-                        encontrou = False
-                        for row in table.rows:
-                            for cell in row.cells:
-                                if 'Tipo da Demanda' in (cell.text or ''):
-                                    tabela_tipo = table
-                                    encontrou = True
-                                    break
-                            if encontrou:
-                                break
-                        if tabela_tipo:
-                            break
-
-                    if tabela_tipo:
-                        # Pela inspeção do modelo:
-                        # linha 1: [0]=☐ Descoberta, [2]=☐ Design, [4]=☐ Arquitetura
-                        # linha 2: [0]=☐ Construção, [2]=☐ Manutenção, [4]=☐ Monitoramento
-                        checks = []
-                        rows = list(tabela_tipo.rows)
-                        if len(rows) >= 3:
-                            # Cabeçalho está na linha 0; as opções estão nas linhas 1 e 2
-                            if len(rows[1].cells) >= 6 and len(rows[2].cells) >= 6:
-                                checks = [
-                                    # (linha, coluna, categoria)
-                                    (1, 0, 'descoberta'),
-                                    (2, 0, 'construcao'),
-                                    (1, 2, 'design'),
-                                    (2, 2, 'manutencao'),
-                                    (1, 4, 'arquitetura'),
-                                    (2, 4, 'monitoramento'),
-                                ]
-
-                        # Primeiro, reseta todos os checkboxes para "não marcado" (☐)
-                        for (r, c, _cat) in checks:
-                            try:
-                                cell = rows[r].cells[c]
-                                for p in cell.paragraphs:
-                                    substituir_texto_em_paragrafo(p, '☒', '☐')
-                                    substituir_texto_em_paragrafo(p, '', '☐')  # fallback
-                            except Exception:
-                                continue
-
-                        # Depois, marca apenas os tipos que aparecem nas sprints
-                        for (r, c, categoria) in checks:
-                            if categoria in tipos_selecionados:
-                                try:
-                                    cell = rows[r].cells[c]
-                                    for p in cell.paragraphs:
-                                        substituir_texto_em_paragrafo(p, '☐', '☒')
-                                        substituir_texto_em_paragrafo(p, '', '☒')  # fallback
-                                except Exception:
-                                    continue
+            tipos_selecionados = categorias_tipo_demanda(sprints_ctx)
+            if tipos_selecionados:
+                # Localiza a tabela que contém "Tipo da Demanda"
+                tabela_tipo = None
+                for table in doc.tables:
+                    if any(TITULO_TABELA_TIPO_DEMANDA in (p.text or '') for p in iterar_paragrafos_tabela(table)):
+                        tabela_tipo = table
+                        break
+
+                if tabela_tipo:
+                    marcar_tipo_demanda(TabelaDocx(tabela_tipo), tipos_selecionados)
         except Exception as e:
-            print(f"[DEBUG] [WARN] Erro ao marcar tipo da demanda: {e}")
+            log.warning("Erro ao marcar tipo da demanda: %s", e)
 
+    cronometro.encerrar()
     return doc
 
 
-def salvar_documento(doc: Document, caminho_saida: str) -> str:
+def salvar_documento(doc: Document, caminho_saida: str, modelo_path: str = None, nivel_compressao: int = None) -> str:
     """
     Salva o documento gerado.
     
     Args:
         doc: Documento Word
         caminho_saida: Caminho onde salvar o arquivo
+        modelo_path: Modelo de onde o documento foi aberto. Se informado, as partes não
+            alteradas (fontes, imagens, estilos...) são copiadas do modelo sem recomprimir
+        nivel_compressao: Nível de compressão (0-9) das partes serializadas
+            (padrão: variável de ambiente DOCX_NIVEL_COMPRESSAO ou 6)
         
     Returns:
         Caminho do arquivo salvo
     """
-    doc.save(caminho_saida)
+    if not modelo_path:
+        doc.save(caminho_saida)
+        return caminho_saida
+    
+    with open(caminho_saida, 'wb') as arquivo:
+        estatisticas = gravar_pacote(doc, arquivo, modelo_path, nivel_compressao)
+    log.debug("Documento salvo: %s parte(s) copiada(s) do modelo, %s serializada(s)",
+              estatisticas['copiadas'], estatisticas['serializadas'])
     return caminho_saida
 
+
+def transmitir_documento(doc: Document, modelo_path: str = None, nivel_compressao: int = None):
+    """
+    Gera o .docx em pedaços de bytes, para enviar direto na resposta HTTP sem arquivo
+    temporário.
+    
+    Args:
+        doc: Documento Word
+        modelo_path: Modelo de onde o documento foi aberto. Se informado, as partes são
+            geradas uma a uma (os primeiros bytes saem antes das últimas partes serem
+            gravadas) e as não alteradas são copiadas do modelo sem recomprimir
+        nivel_compressao: Nível de compressão (0-9) das partes serializadas
+        
+    Returns:
+        Iterador de bytes
+    """
+    if not modelo_path:
+        buffer = io.BytesIO()
+        doc.save(buffer)
+        yield buffer.getvalue()
+        return
+    
+    estatisticas = {}
+    total = 0
+    for pedaco in iterar_pacote(doc, modelo_path, nivel_compressao, estatisticas=estatisticas):
+        total += len(pedaco)
+        yield pedaco
+    log.debug("Documento enviado: %s bytes, %s parte(s) copiada(s) do modelo, %s serializada(s)",
+              total, estatisticas['copiadas'], estatisticas['serializadas'])
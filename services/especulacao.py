@@ -0,0 +1,241 @@
+"""
+Pré-renderização especulativa dos Planos de Trabalho.
+
+Quando a tela busca uma demanda (/api/redmine/<demanda>), o servidor já sabe qual modelo
+será usado (regras do registro_modelos), qual projeto casa com a demanda e
+todas as tags que vêm do Redmine. Nesse momento um documento parcial é preparado em
+segundo plano (renderizar_documento_parcial: modelo, tags simples e tabela de sprints com
+as horas marcadas). Ao gerar, se o contexto parcial do pedido é o mesmo, só as horas
+digitadas, o Item 7 e o tipo da demanda são preenchidos.
+
+Cada documento parcial é usado uma única vez e expira após ESPECULACAO_TTL_SEGUNDOS. A
+especulação é abandonada se não terminar em ESPECULACAO_TIMEOUT_SEGUNDOS (contados desde
+o agendamento) e não é feita com gerações de verdade esperando, sem vaga livre no
+orçamento de memória (services.memoria; a especulação nunca espera por vaga) ou com pouca
+memória livre no container (ESPECULACAO_MEMORIA_MIN_MB); com pouca memória, os documentos parciais
+guardados também são descartados.
+"""
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as TempoEsgotado
+
+from services.cache_documentos import calcular_chave_documento
+from services.documento import contexto_documento_parcial
+from services.logs import com_correlacao, obter_logger
+from services.memoria import SemMemoria, memoria_livre_mb
+from services.processos_render import renderizar_parcial
+
+log = obter_logger(__name__)
+
+ESPECULACAO_ATIVA = os.getenv('ESPECULACAO', '1').strip().lower() not in ('0', 'false', 'nao', 'não')
+# Soma máxima dos documentos parciais guardados (MB)
+ESPECULACAO_MAX_MB = float(os.getenv('ESPECULACAO_MAX_MB', '32'))
+# Tempo que um documento parcial fica disponível para a geração
+ESPECULACAO_TTL_SEGUNDOS = float(os.getenv('ESPECULACAO_TTL_SEGUNDOS', '300'))
+# Tempo máximo entre o agendamento e o documento parcial pronto
+ESPECULACAO_TIMEOUT_SEGUNDOS = float(os.getenv('ESPECULACAO_TIMEOUT_SEGUNDOS', '10'))
+# Memória livre mínima para especular (até o limite do container ou, sem limite,
+# MemAvailable); 0 não verifica
+ESPECULACAO_MEMORIA_MIN_MB = float(os.getenv('ESPECULACAO_MEMORIA_MIN_MB', '256'))
+
+
+def chave_parcial(pedido):
+    """
+    Chave do documento parcial de um pedido (preparar_geracao): a mesma para pedidos
+    que diferem só nas horas das sprints e nos profissionais.
+    """
+    return calcular_chave_documento(
+        pedido['modelo_path'],
+        contexto_documento_parcial(pedido['contexto']),
+        pedido['dados_projeto'],
+        pedido['data_geracao']
+    )
+
+
+def _tamanho_parcial(documento_parcial):
+    return sum(len(dados) for dados in documento_parcial['partes'].values())
+
+
+class Especulacao:
+    """
+    Documentos parciais preparados em segundo plano (uma especulação por vez), guardados
+    por chave_parcial em um LRU limitado pela soma dos tamanhos.
+    """
+
+    def __init__(self, limite_bytes, ttl_segundos, timeout_segundos, memoria_min_mb,
+                 renderizar=renderizar_parcial, ocupado=None):
+        self.limite_bytes = int(limite_bytes)
+        self.ttl_segundos = ttl_segundos
+        self.timeout_segundos = timeout_segundos
+        self.memoria_min_mb = memoria_min_mb
+        self._renderizar = renderizar
+        self.ocupado = ocupado  # função: True se há gerações de verdade esperando vaga
+        self._itens = OrderedDict()  # chave -> (expira_em, documento parcial, tamanho)
+        self._tamanho = 0
+        self._em_andamento = set()
+        self._executor = None
+        self._contagem = {'agendadas': 0, 'prontas': 0, 'aproveitadas': 0, 'perdidas': 0,
+                          'canceladas_timeout': 0, 'canceladas_pressao': 0, 'erros': 0}
+        self._lock = threading.Lock()
+
+    @property
+    def ativo(self):
+        return ESPECULACAO_ATIVA and self.limite_bytes > 0 and self.ttl_segundos > 0
+
+    def _memoria_baixa(self):
+        if self.memoria_min_mb <= 0:
+            return False
+        livre = memoria_livre_mb()
+        return livre is not None and livre < self.memoria_min_mb
+
+    def _sob_pressao(self):
+        """
+        Pouca memória (libera também o que está guardado) ou gerações de verdade
+        esperando (o pool fica para elas): não especula.
+        """
+        if self._memoria_baixa():
+            self.descartar()
+            return True
+        return self.ocupado is not None and self.ocupado()
+
+    def agendar(self, preparar):
+        """
+        Agenda a preparação de um documento parcial em segundo plano.
+
+        Args:
+            preparar: Função sem argumentos que devolve o pedido (preparar_geracao) a
+                especular; é chamada na thread da especulação (pode consultar o KV)
+
+        Returns:
+            True se foi agendada
+        """
+        if not self.ativo:
+            return False
+        if self._sob_pressao():
+            with self._lock:
+                self._contagem['canceladas_pressao'] += 1
+            return False
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='especulacao')
+            self._contagem['agendadas'] += 1
+        self._executor.submit(com_correlacao(self._executar), preparar, time.monotonic())
+        return True
+
+    def _executar(self, preparar, agendada_em):
+        try:
+            pedido = preparar()
+            chave = chave_parcial(pedido)
+            with self._lock:
+                if chave in self._itens or chave in self._em_andamento:
+                    return
+                self._em_andamento.add(chave)
+            try:
+                restante = self.timeout_segundos - (time.monotonic() - agendada_em)
+                if restante <= 0:
+                    raise TempoEsgotado()
+                if self._sob_pressao():
+                    with self._lock:
+                        self._contagem['canceladas_pressao'] += 1
+                    return
+                try:
+                    documento_parcial = self._renderizar(
+                        pedido['modelo_path'],
+                        contexto_documento_parcial(pedido['contexto']),
+                        pedido['dados_projeto'],
+                        pedido['data_geracao'],
+                        timeout=restante
+                    )
+                except SemMemoria:
+                    # Orçamento de memória cheio: a vaga fica para as gerações de verdade
+                    with self._lock:
+                        self._contagem['canceladas_pressao'] += 1
+                    return
+                # Sem pool, a renderização na thread não é interrompida: confere o prazo no fim
+                if time.monotonic() - agendada_em > self.timeout_segundos:
+                    raise TempoEsgotado()
+                self._guardar(chave, documento_parcial)
+                log.debug("Documento parcial pronto (demanda %s, %.2fs)",
+                          pedido['demanda_id'], time.monotonic() - agendada_em)
+            finally:
+                with self._lock:
+                    self._em_andamento.discard(chave)
+        except TempoEsgotado:
+            with self._lock:
+                self._contagem['canceladas_timeout'] += 1
+            log.warning("Especulação cancelada: não terminou em %ss", self.timeout_segundos)
+        except Exception as e:
+            with self._lock:
+                self._contagem['erros'] += 1
+            log.warning("Erro na especulação: %s: %s", type(e).__name__, e)
+
+    def _guardar(self, chave, documento_parcial):
+        tamanho = _tamanho_parcial(documento_parcial)
+        if tamanho > self.limite_bytes:
+            return
+        agora = time.monotonic()
+        with self._lock:
+            for chave_guardada in [c for c, item in self._itens.items() if agora >= item[0]]:
+                self._remover(chave_guardada)
+                self._contagem['perdidas'] += 1
+            self._remover(chave)
+            self._itens[chave] = (agora + self.ttl_segundos, documento_parcial, tamanho)
+            self._tamanho += tamanho
+            self._contagem['prontas'] += 1
+            while self._tamanho > self.limite_bytes:
+                self._remover(next(iter(self._itens)))
+                self._contagem['perdidas'] += 1
+
+    def _remover(self, chave):
+        """Remove uma entrada (chamado com o lock)."""
+        item = self._itens.pop(chave, None)
+        if item is not None:
+            self._tamanho -= item[2]
+
+    def obter(self, pedido):
+        """
+        Retira o documento parcial do pedido, se houver um pronto e dentro da validade
+        (cada documento parcial é usado uma única vez).
+        """
+        if not self.ativo:
+            return None
+        chave = chave_parcial(pedido)
+        with self._lock:
+            item = self._itens.get(chave)
+            if item is None:
+                return None
+            self._remover(chave)
+            if time.monotonic() >= item[0]:
+                self._contagem['perdidas'] += 1
+                return None
+            self._contagem['aproveitadas'] += 1
+        log.debug("Usando documento parcial da especulação (demanda %s)", pedido['demanda_id'])
+        return item[1]
+
+    def descartar(self):
+        """Descarta todos os documentos parciais guardados."""
+        with self._lock:
+            self._contagem['perdidas'] += len(self._itens)
+            self._itens.clear()
+            self._tamanho = 0
+
+    def estatisticas(self):
+        with self._lock:
+            return {
+                'ativo': self.ativo,
+                'documentos': len(self._itens),
+                'em_andamento': len(self._em_andamento),
+                'tamanho_bytes': self._tamanho,
+                'limite_bytes': self.limite_bytes,
+                **self._contagem,
+            }
+
+
+especulacao = Especulacao(
+    ESPECULACAO_MAX_MB * 1024 * 1024,
+    ESPECULACAO_TTL_SEGUNDOS,
+    ESPECULACAO_TIMEOUT_SEGUNDOS,
+    ESPECULACAO_MEMORIA_MIN_MB
+)
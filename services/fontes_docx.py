@@ -0,0 +1,244 @@
+"""
+Fontes embutidas nos documentos gerados (modo enxuto).
+
+O ModeloPT-LEO-CURSOR.docx embute ~3,8 MB de fontes (word/fonts/font1..4.odttf) e o
+Modelo PT-CURSOR.docx ~460 KB (Roboto), copiadas para cada Plano de Trabalho. Modos:
+
+- manter: o documento sai com as fontes do modelo (padrão, como antes)
+- remover: as fontes embutidas são retiradas (relacionamentos e <w:embed*> da fontTable);
+  o Word usa as fontes instaladas ou substitutas
+- subconjunto: cada fonte é reduzida aos glifos dos textos do documento (w:subsetted="1").
+  Requer o pacote opcional fontTools; sem ele, as fontes são removidas. Fontes cuja
+  licença proíbe subconjunto (OS/2 fsType) são mantidas inteiras
+
+As fontes .odttf são ofuscadas (ECMA-376, parte 2): os 32 primeiros bytes são combinados
+(XOR) com a chave w:fontKey da fontTable; a ofuscação é desfeita antes de reduzir a fonte
+e refeita depois. Os subconjuntos são guardados por (fonte, caracteres usados): documentos
+do mesmo modelo costumam usar os mesmos caracteres.
+"""
+import io
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from docx.opc.constants import CONTENT_TYPE as CT, RELATIONSHIP_TYPE as RT
+from docx.opc.oxml import serialize_part_xml
+from docx.opc.part import XmlPart
+from docx.oxml.ns import qn
+from docx.oxml.parser import parse_xml
+
+from services.logs import obter_logger
+
+log = obter_logger(__name__)
+
+# Tenta importar fontTools (opcional) para o modo subconjunto
+try:
+    from fontTools import subset as subconjunto_fonte
+    from fontTools.ttLib import TTFont
+    FONTTOOLS_DISPONIVEL = True
+    # Avisos do fontTools sobre tabelas que ele descarta (ex.: 'meta') não interessam aqui
+    logging.getLogger('fontTools').setLevel(logging.ERROR)
+except ImportError:
+    FONTTOOLS_DISPONIVEL = False
+
+MODOS_FONTES = ('manter', 'remover', 'subconjunto')
+# Modo das fontes embutidas quando o pedido não informa ('manter', 'remover' ou 'subconjunto')
+MODO_FONTES_PADRAO = os.getenv('DOCX_FONTES', 'manter').strip().lower()
+# Quantidade de subconjuntos de fontes guardados em memória (por processo)
+MAX_SUBCONJUNTOS_CACHE = 32
+
+_ELEMENTOS_EMBED = tuple(qn(f'w:{nome}') for nome in ('embedRegular', 'embedBold', 'embedItalic', 'embedBoldItalic'))
+_PARTES_TEXTO_SEM_CLASSE = (CT.WML_FOOTNOTES, CT.WML_ENDNOTES, CT.WML_COMMENTS)
+# Sempre no subconjunto: ASCII imprimível (números de página e de listas, campos), Latin-1
+# (acentos do português) e a pontuação tipográfica comum. Assim documentos do mesmo modelo
+# quase sempre caem no mesmo conjunto de caracteres e reaproveitam o subconjunto em cache
+_CARACTERES_BASE = frozenset(
+    [chr(codigo) for codigo in range(0x20, 0x7F)]
+    + [chr(codigo) for codigo in range(0xA0, 0x100)]
+    + list('\u2013\u2014\u2018\u2019\u201c\u201d\u2022\u2026\u20ac')
+)
+# OS/2 fsType: bit 8 = a licença não permite subconjunto
+_FSTYPE_SEM_SUBCONJUNTO = 0x0100
+
+_cache_subconjuntos = OrderedDict()
+_lock_subconjuntos = threading.Lock()
+
+
+def normalizar_modo_fontes(modo):
+    """
+    Modo das fontes de um pedido (None: MODO_FONTES_PADRAO).
+
+    Raises:
+        ValueError: Modo desconhecido
+    """
+    modo = MODO_FONTES_PADRAO if modo in (None, '') else str(modo).strip().lower()
+    if modo not in MODOS_FONTES:
+        raise ValueError(f"Modo de fontes inválido: {modo} (use {', '.join(MODOS_FONTES)})")
+    return modo
+
+
+def _parte_tabela_fontes(doc):
+    for rel in doc.part.rels.values():
+        if not rel.is_external and rel.reltype == RT.FONT_TABLE:
+            return rel.target_part
+    return None
+
+
+def _tamanho_parte(parte):
+    """Tamanho do conteúdo sem carregá-lo, se a parte ainda está só no modelo (ParteModelo)."""
+    info = getattr(parte, 'info', None)
+    if info is not None and getattr(parte, 'intacta', False):
+        return info.file_size
+    return len(parte.blob)
+
+
+def _desofuscar(dados, chave_fonte):
+    """
+    Desfaz (ou refaz: a operação é a mesma) a ofuscação da fonte com a chave w:fontKey
+    ("{GUID}"). Sem chave, a fonte não é ofuscada (.ttf).
+    """
+    if not chave_fonte:
+        return dados
+    chave = bytes.fromhex(chave_fonte.strip('{}').replace('-', ''))[::-1]
+    dados = bytearray(dados)
+    for indice in range(min(32, len(dados))):
+        dados[indice] ^= chave[indice % 16]
+    return bytes(dados)
+
+
+def caracteres_documento(doc):
+    """Caracteres que o documento pode exibir: textos, marcadores de listas e símbolos."""
+    caracteres = set(_CARACTERES_BASE)
+    for parte in doc.part.package.iter_parts():
+        if isinstance(parte, XmlPart):
+            elemento = parte._element
+        elif parte.content_type in _PARTES_TEXTO_SEM_CLASSE:
+            elemento = parse_xml(parte.blob)
+        else:
+            continue
+        for no in elemento.iter(qn('w:t'), qn('w:lvlText'), qn('w:sym')):
+            if no.tag == qn('w:t'):
+                caracteres.update(no.text or '')
+            elif no.tag == qn('w:lvlText'):
+                caracteres.update(no.get(qn('w:val')) or '')
+            else:
+                try:
+                    caracteres.add(chr(int(no.get(qn('w:char')) or '', 16)))
+                except ValueError:
+                    pass
+    return frozenset(caracteres)
+
+
+def _reduzir_fonte(dados, caracteres):
+    """
+    Subconjunto da fonte (TrueType/OpenType, não ofuscada) com os glifos dos caracteres.
+
+    Returns:
+        Bytes da fonte reduzida ou None se a licença não permite subconjunto
+    """
+    fonte = TTFont(io.BytesIO(dados))
+    if 'OS/2' in fonte and fonte['OS/2'].fsType & _FSTYPE_SEM_SUBCONJUNTO:
+        return None
+    opcoes = subconjunto_fonte.Options()
+    # Mantém os nomes (o Word associa a fonte embutida pelo nome) e o kerning antigo
+    opcoes.name_IDs = ['*']
+    opcoes.name_languages = ['*']
+    opcoes.name_legacy = True
+    opcoes.legacy_kern = True
+    opcoes.notdef_outline = True
+    opcoes.ignore_missing_glyphs = True
+    opcoes.ignore_missing_unicodes = True
+    subconjunto = subconjunto_fonte.Subsetter(opcoes)
+    subconjunto.populate(text=''.join(sorted(caracteres)))
+    subconjunto.subset(fonte)
+    saida = io.BytesIO()
+    fonte.save(saida)
+    return saida.getvalue()
+
+
+def _subconjunto_em_cache(chave, dados, chave_fonte, caracteres):
+    """Fonte reduzida e ofuscada de novo, reaproveitando subconjuntos já calculados."""
+    with _lock_subconjuntos:
+        if chave in _cache_subconjuntos:
+            _cache_subconjuntos.move_to_end(chave)
+            return _cache_subconjuntos[chave]
+    reduzida = _reduzir_fonte(_desofuscar(dados, chave_fonte), caracteres)
+    if reduzida is not None:
+        reduzida = _desofuscar(reduzida, chave_fonte)
+    with _lock_subconjuntos:
+        _cache_subconjuntos[chave] = reduzida
+        while len(_cache_subconjuntos) > MAX_SUBCONJUNTOS_CACHE:
+            _cache_subconjuntos.popitem(last=False)
+    return reduzida
+
+
+def reduzir_fontes(doc, modo):
+    """
+    Aplica o modo das fontes embutidas ao documento antes da gravação: altera a
+    fontTable (e os relacionamentos dela) e o conteúdo das fontes.
+
+    Returns:
+        {'modo', 'fontes', 'bytes_antes', 'bytes_depois', 'tempo_ms'} ou None se não há
+        nada a fazer (modo 'manter' ou documento sem fontes embutidas)
+    """
+    modo = normalizar_modo_fontes(modo)
+    if modo == 'manter':
+        return None
+    parte_fontes = _parte_tabela_fontes(doc)
+    if parte_fontes is None:
+        return None
+    if modo == 'subconjunto' and not FONTTOOLS_DISPONIVEL:
+        log.warning("fontTools não instalado: fontes embutidas removidas em vez de reduzidas")
+        modo = 'remover'
+
+    inicio = time.perf_counter()
+    tabela = parse_xml(parte_fontes.blob)
+    embutidas = [elemento for elemento in tabela.iter(*_ELEMENTOS_EMBED)]
+    if not embutidas:
+        return None
+
+    caracteres = caracteres_documento(doc) if modo == 'subconjunto' else None
+    versao_modelo = getattr(getattr(doc.part.package, 'zip_modelo', None), 'hash_conteudo', None)
+    bytes_antes = bytes_depois = 0
+    for elemento in embutidas:
+        id_rel = elemento.get(qn('r:id'))
+        rel = parte_fontes.rels.get(id_rel)
+        if rel is None or rel.is_external:
+            elemento.getparent().remove(elemento)
+            continue
+        parte = rel.target_part
+        tamanho = _tamanho_parte(parte)
+        bytes_antes += tamanho
+
+        if modo == 'remover':
+            elemento.getparent().remove(elemento)
+            parte_fontes.rels.pop(id_rel)
+            continue
+
+        chave_fonte = elemento.get(qn('w:fontKey'))
+        chave = (versao_modelo or id(parte), parte.partname, caracteres)
+        try:
+            reduzida = _subconjunto_em_cache(chave, parte.blob, chave_fonte, caracteres)
+        except Exception as e:
+            log.warning("Fonte %s mantida inteira (erro no subconjunto: %s: %s)", parte.partname, type(e).__name__, e)
+            reduzida = None
+        if reduzida is None or len(reduzida) >= tamanho:
+            bytes_depois += tamanho
+            continue
+        parte._blob = reduzida
+        elemento.set(qn('w:subsetted'), '1')
+        bytes_depois += len(reduzida)
+
+    parte_fontes._blob = serialize_part_xml(tabela)
+    estatisticas = {
+        'modo': modo,
+        'fontes': len(embutidas),
+        'bytes_antes': bytes_antes,
+        'bytes_depois': bytes_depois,
+        'tempo_ms': round((time.perf_counter() - inicio) * 1000, 1),
+    }
+    log.debug("Fontes embutidas (%s): %s fonte(s), %.0f KB -> %.0f KB em %s ms",
+              modo, len(embutidas), bytes_antes / 1024, bytes_depois / 1024, estatisticas['tempo_ms'])
+    return estatisticas
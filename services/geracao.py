@@ -0,0 +1,241 @@
+"""
+Preparação das gerações de Plano de Trabalho, compartilhada pela API (app.py) e pelo
+gerador em lote por linha de comando (gerar_lote.py): validação do payload, escolha do
+projeto e do modelo (registro_modelos), contexto de renderização, chave do documento e nome do arquivo.
+"""
+import re
+
+from services.cache_documentos import calcular_chave_documento
+from services.documento import montar_contexto_render, data_geracao_atual
+from services.cache_redmine import cache_redmine
+from services.fontes_docx import normalizar_modo_fontes
+from services.logs import obter_logger, rastro
+from services.registro_modelos import ModeloIndisponivel, registro_modelos
+
+log = obter_logger(__name__)
+
+
+class ErroRequisicaoGeracao(Exception):
+    """Payload de geração inválido (mensagem e status HTTP da resposta)."""
+
+    def __init__(self, mensagem, status=400):
+        super().__init__(mensagem)
+        self.mensagem = mensagem
+        self.status = status
+
+
+def preparar_geracao(data, projetos):
+    """
+    Valida o payload de geração e resolve tudo que determina o documento: modelo,
+    projeto, contexto de renderização, data de {DATA}, chave (cache/ETag) e nome do arquivo.
+    
+    Args:
+        data: Payload de geração (demanda, dados_demanda, dados_sprints, dados_profissionais
+            e, opcional, fontes: 'manter', 'remover' ou 'subconjunto' - ver fontes_docx)
+        projetos: Projetos cadastrados (lista de dicionários, pode ser vazia)
+    
+    Raises:
+        ErroRequisicaoGeracao: Payload inválido ou modelo inexistente
+    """
+    if not data:
+        raise ErroRequisicaoGeracao("Dados não fornecidos")
+    
+    demanda_id = data.get('demanda')
+    dados_demanda = data.get('dados_demanda', {})
+    dados_sprints = data.get('dados_sprints', [])
+    dados_profissionais = data.get('dados_profissionais', {})
+
+    # Payload inteiro só no rastro (requisições amostradas)
+    log.debug("Dados recebidos: demanda %s", demanda_id)
+    rastro(log, "Dados Demanda: %s", dados_demanda)
+    rastro(log, "Dados Sprints: %s", dados_sprints)
+    rastro(log, "Dados Profissionais: %s", dados_profissionais)
+
+    if not demanda_id:
+        raise ErroRequisicaoGeracao("ID da demanda não fornecido")
+
+    try:
+        fontes = normalizar_modo_fontes(data.get('fontes'))
+    except ValueError as e:
+        raise ErroRequisicaoGeracao(str(e))
+
+    # Carrega dados do projeto
+    # Regra:
+    # 1. Tenta achar um projeto cujo nomeProjeto case (case-insensitive) com o nome da demanda (project.name do Redmine)
+    # 2. Se não achar, usa o primeiro projeto como fallback
+    dados_projeto = {}
+    if projetos and len(projetos) > 0:
+        nome_demanda = str(dados_demanda.get('nome', '')).strip().lower()
+        projeto_match = None
+
+        if nome_demanda:
+            for p in projetos:
+                nome_proj = str(p.get('nomeProjeto', '')).strip().lower()
+                # match exato ou contendo (para tolerar pequenas diferenças)
+                if nome_proj == nome_demanda or nome_demanda in nome_proj or nome_proj in nome_demanda:
+                    projeto_match = p
+                    break
+
+        if projeto_match:
+            dados_projeto = projeto_match
+            log.debug("Usando projeto por nome: %s", dados_projeto.get('nomeProjeto', 'N/A'))
+        else:
+            dados_projeto = projetos[0]
+            log.warning("Projeto correspondente a '%s' não encontrado, usando primeiro projeto: %s", nome_demanda, dados_projeto.get('nomeProjeto', 'N/A'))
+    else:
+        log.warning("Nenhum projeto encontrado no arquivo de configuração")
+
+    # Modelo pelas regras do registro (config/modelos_config.json): tipo das sprints e projeto
+    try:
+        _, modelo_path = registro_modelos.escolher(dados_sprints, dados_projeto, dados_demanda)
+    except ModeloIndisponivel as e:
+        raise ErroRequisicaoGeracao(str(e), 404)
+
+    # Contexto de renderização e data de {DATA}: junto com o modelo e o projeto,
+    # determinam o documento (chave do cache e ETag)
+    contexto = montar_contexto_render(dados_demanda, dados_sprints, dados_profissionais)
+    data_geracao = data_geracao_atual()
+    chave_documento = calcular_chave_documento(modelo_path, contexto, dados_projeto, data_geracao, fontes)
+
+    # Define o nome do arquivo de saída
+    # Regra:
+    # 1. Tenta usar o nome SVN do projeto (campo opcional cadastrado pelo usuário)
+    # 2. Se não houver, usa o nome do projeto cadastrado
+    # 3. Se ainda não houver, usa o nome vindo do Redmine
+    # 4. Fallback final: "Plano_Trabalho"
+    base_nome = ''
+    if dados_projeto:
+        base_nome = (
+            str(dados_projeto.get('nomeSVN') or '').strip()
+            or str(dados_projeto.get('nomeProjeto') or '').strip()
+        )
+
+    if not base_nome:
+        base_nome = str(dados_demanda.get('nome') or '').strip()
+
+    if not base_nome:
+        base_nome = 'Plano_Trabalho'
+
+    # Sanitiza o nome para ser um nome de arquivo seguro
+    # Mantém apenas letras, números, underline, hífen e ponto; substitui o resto por underscore
+    base_nome_sanitizado = re.sub(r'[^A-Za-z0-9_.-]+', '_', base_nome)
+    if not base_nome_sanitizado:
+        base_nome_sanitizado = 'Plano_Trabalho'
+
+    download_filename = f'{base_nome_sanitizado}_{demanda_id}.docx'
+    log.debug("Nome arquivo base='%s' sanitizado='%s', demanda='%s', final='%s'", base_nome, base_nome_sanitizado, demanda_id, download_filename)
+    
+    return {
+        'demanda_id': demanda_id,
+        'modelo_path': modelo_path,
+        'dados_demanda': dados_demanda,
+        'dados_sprints': dados_sprints,
+        'dados_profissionais': dados_profissionais,
+        'dados_projeto': dados_projeto,
+        'contexto': contexto,
+        'data_geracao': data_geracao,
+        'fontes': fontes,
+        'chave': chave_documento,
+        'download_filename': download_filename,
+    }
+
+
+def montar_payload_demanda(demanda_id, dados_profissionais=None, horas_sprint=None):
+    """
+    Monta o payload de geração de uma demanda a partir do Redmine (via cache_redmine),
+    como o frontend faz com o resultado de /api/redmine/<demanda>.
+    
+    IMPORTANTE: as horas da sprint (tabela 6) e os profissionais são informados pelo
+    usuário no navegador e não existem no Redmine; sem `horas_sprint` vale o HST do
+    Redmine e sem `dados_profissionais` o documento sai sem profissionais.
+    
+    Args:
+        demanda_id: ID da demanda
+        dados_profissionais: {sprint_id: [profissionais]}
+        horas_sprint: {sprint_id: horas digitadas pelo usuário}
+    
+    Raises:
+        ErroRequisicaoGeracao: Demanda não encontrada ou sem sprints
+    """
+    demanda_id = str(demanda_id or '').strip()
+    if not demanda_id:
+        raise ErroRequisicaoGeracao("ID da demanda não fornecido")
+    
+    linhas = cache_redmine.obter(demanda_id)
+    if linhas is None:
+        raise ErroRequisicaoGeracao(f"Demanda não encontrada: {demanda_id}", 404)
+    return payload_das_linhas(demanda_id, linhas, dados_profissionais, horas_sprint)
+
+
+def payload_das_linhas(demanda_id, linhas, dados_profissionais=None, horas_sprint=None):
+    """
+    Payload de geração a partir das linhas formatadas da demanda (formatar_dados),
+    com as horas e os profissionais informados pelo usuário (ver montar_payload_demanda).
+    
+    Raises:
+        ErroRequisicaoGeracao: Demanda sem sprints
+    """
+    if not linhas:
+        raise ErroRequisicaoGeracao(f"Demanda {demanda_id} não tem sprints no Redmine", 422)
+    
+    # Preserva o HST original do Redmine (hst_redmine), como o frontend
+    for linha in linhas:
+        if not linha.get('hst_redmine') and linha.get('hst'):
+            linha['hst_redmine'] = linha['hst']
+    
+    horas_sprint = {str(sprint_id): horas for sprint_id, horas in (horas_sprint or {}).items()}
+    for linha in linhas:
+        horas = horas_sprint.pop(str(linha.get('sprint', '')), None)
+        if horas not in (None, ''):
+            linha['horas_sprint'] = horas
+    if horas_sprint:
+        log.warning("Horas informadas para sprints fora da demanda %s: %s", demanda_id, sorted(horas_sprint))
+    
+    primeira_linha = linhas[0]
+    return {
+        'demanda': primeira_linha.get('demanda') or demanda_id,
+        'dados_demanda': {
+            'demanda': primeira_linha.get('demanda', ''),
+            'pt': primeira_linha.get('pt', ''),
+            'nome': primeira_linha.get('nome', ''),
+            'valor_demanda': primeira_linha.get('valor_demanda', ''),
+        },
+        'dados_sprints': linhas,
+        'dados_profissionais': dados_profissionais or {},
+    }
+
+
+def completar_payload(data):
+    """
+    Payload de geração completo: se vier só o ID da demanda (sem dados_sprints), os dados
+    da demanda e das sprints são montados no servidor (montar_payload_demanda), com as
+    horas e os profissionais informados pelo usuário:
+    {"demanda": "128910", "horas_sprint": {...}, "dados_profissionais": {...}}
+    
+    Raises:
+        ErroRequisicaoGeracao: Demanda não encontrada ou sem sprints
+    """
+    if isinstance(data, dict) and data.get('demanda') and 'dados_sprints' not in data:
+        payload = montar_payload_demanda(data['demanda'], data.get('dados_profissionais'), data.get('horas_sprint'))
+        if 'fontes' in data:
+            payload['fontes'] = data['fontes']
+        return payload
+    return data
+
+
+def normalizar_item_lote(item):
+    """
+    Payload de geração de um item de lote: o próprio payload ou só o ID da demanda
+    ("128910", 128910 ou {"demanda": "128910", "dados_profissionais": {...}}), buscada
+    no Redmine (montar_payload_demanda).
+    
+    Raises:
+        ErroRequisicaoGeracao: Item inválido ou demanda não encontrada
+    """
+    if isinstance(item, (str, int)) and not isinstance(item, bool):
+        item = {'demanda': str(item)}
+    if not isinstance(item, dict):
+        raise ErroRequisicaoGeracao("Item inválido: informe o payload de geração ou o ID da demanda")
+    if 'dados_sprints' not in item and not item.get('demanda'):
+        raise ErroRequisicaoGeracao("ID da demanda não fornecido")
+    return completar_payload(item)
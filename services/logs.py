@@ -0,0 +1,194 @@
+"""
+Logs da aplicação: níveis, formatação preguiçosa e id de correlação por requisição.
+
+Os módulos usam obter_logger(__name__) e mensagens no estilo do logging
+(log.debug("Tabela %s: %s linha(s)", indice, total)): com o nível desligado a mensagem
+não é formatada nem escrita. O nível vem de LOG_NIVEL (padrão INFO; DEBUG mostra o que
+antes era impresso a cada geração).
+
+O rastro detalhado da renderização (cada tag, linha e célula, e os payloads inteiros)
+é do nível RASTRO e só sai nas requisições amostradas: uma fração LOG_AMOSTRA_RASTRO
+delas (ou todas com LOG_NIVEL=RASTRO). Fora delas, rastro() custa uma leitura de
+ContextVar.
+
+Cada linha leva o id de correlação da requisição (cabeçalho X-Request-ID recebido ou
+gerado em iniciar_correlacao). Threads e processos que trabalham para a requisição
+recebem o id com com_correlacao / usar_correlacao(correlacao_atual()).
+"""
+import json
+import logging
+import os
+import random
+import sys
+import uuid
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+# Nível abaixo de DEBUG: rastro detalhado da renderização
+RASTRO = 5
+logging.addLevelName(RASTRO, 'RASTRO')
+
+# Nível mínimo dos logs (RASTRO, DEBUG, INFO, WARNING, ERROR)
+LOG_NIVEL = os.getenv('LOG_NIVEL', 'INFO').strip().upper()
+# Formato das linhas: texto ou json (uma linha JSON por registro)
+LOG_FORMATO = os.getenv('LOG_FORMATO', 'texto').strip().lower()
+# Fração das requisições (0 a 1) com o rastro detalhado da renderização
+LOG_AMOSTRA_RASTRO = float(os.getenv('LOG_AMOSTRA_RASTRO', '0'))
+
+LOGGER_RAIZ = 'gendoc'
+SEM_CORRELACAO = '-'
+# Tamanho máximo de um X-Request-ID aceito do cliente
+TAMANHO_MAXIMO_CORRELACAO = 64
+
+_id_correlacao = ContextVar('id_correlacao', default=SEM_CORRELACAO)
+_rastro_amostrado = ContextVar('rastro_amostrado', default=False)
+
+
+class _SaidaPadrao(logging.StreamHandler):
+    """
+    Escreve no sys.stdout do momento da escrita (e não no da criação), para que
+    contextlib.redirect_stdout continue capturando os logs, como fazia com os prints.
+    """
+
+    def __init__(self):
+        super().__init__(sys.stdout)
+
+    @property
+    def stream(self):
+        return sys.stdout
+
+    @stream.setter
+    def stream(self, _valor):
+        pass
+
+
+class _FiltroCorrelacao(logging.Filter):
+    def filter(self, record):
+        record.correlacao = _id_correlacao.get()
+        return True
+
+
+class FormatoJson(logging.Formatter):
+    """
+    Um objeto JSON por linha: ts, nivel, logger, correlacao, mensagem (e excecao).
+    """
+
+    def format(self, record):
+        registro = {
+            'ts': round(record.created, 3),
+            'nivel': record.levelname,
+            'logger': record.name,
+            'correlacao': record.correlacao,
+            'mensagem': record.getMessage(),
+        }
+        if record.exc_info:
+            registro['excecao'] = self.formatException(record.exc_info)
+        return json.dumps(registro, ensure_ascii=False, default=str)
+
+
+def configurar_logs(nivel=None, formato=None, saida=None):
+    """
+    (Re)configura o logger raiz da aplicação. Chamado na importação com LOG_NIVEL e
+    LOG_FORMATO; o benchmark chama de novo para comparar os níveis.
+
+    Args:
+        nivel: Nome ou número do nível (padrão: LOG_NIVEL)
+        formato: 'texto' ou 'json' (padrão: LOG_FORMATO)
+        saida: Stream das linhas (padrão: o sys.stdout do momento)
+    """
+    nivel = nivel or LOG_NIVEL
+    if isinstance(nivel, str):
+        nivel = logging.getLevelName(nivel.upper())
+        if not isinstance(nivel, int):
+            nivel = logging.INFO
+    handler = _SaidaPadrao() if saida is None else logging.StreamHandler(saida)
+    if (formato or LOG_FORMATO) == 'json':
+        handler.setFormatter(FormatoJson())
+    else:
+        handler.setFormatter(logging.Formatter('%(asctime)s %(levelname)s [%(correlacao)s] %(name)s: %(message)s'))
+    handler.addFilter(_FiltroCorrelacao())
+
+    raiz = logging.getLogger(LOGGER_RAIZ)
+    for anterior in list(raiz.handlers):
+        raiz.removeHandler(anterior)
+    raiz.addHandler(handler)
+    raiz.setLevel(nivel)
+    # IMPORTANTE: não repassa ao logger raiz do Python (o Flask/werkzeug configuram o deles)
+    raiz.propagate = False
+    return raiz
+
+
+def obter_logger(nome):
+    """Logger de um módulo (ex.: obter_logger(__name__) -> gendoc.documento)."""
+    return logging.getLogger(f"{LOGGER_RAIZ}.{nome.rsplit('.', 1)[-1]}")
+
+
+def rastro_ativo(log):
+    """True se rastro() vai escrever (para evitar montar argumentos caros à toa)."""
+    return _rastro_amostrado.get() or log.isEnabledFor(RASTRO)
+
+
+def rastro(log, mensagem, *args):
+    """
+    Linha do rastro detalhado da renderização (nível RASTRO). Só é formatada e escrita
+    nas requisições amostradas (qualquer que seja o nível) ou com LOG_NIVEL=RASTRO.
+    """
+    if not _rastro_amostrado.get() and not log.isEnabledFor(RASTRO):
+        return
+    registro = log.makeRecord(log.name, RASTRO, '(rastro)', 0, mensagem, args, None)
+    log.handle(registro)
+
+
+def _amostrar():
+    return LOG_AMOSTRA_RASTRO > 0 and random.random() < LOG_AMOSTRA_RASTRO
+
+
+def iniciar_correlacao(id_recebido=None):
+    """
+    Define o id de correlação (o recebido, se válido, ou um novo) e sorteia se a
+    requisição terá o rastro detalhado.
+
+    Returns:
+        (id de correlação, tokens para encerrar_correlacao)
+    """
+    id_correlacao = (id_recebido or '').strip()
+    if not id_correlacao or len(id_correlacao) > TAMANHO_MAXIMO_CORRELACAO or not id_correlacao.isprintable():
+        id_correlacao = uuid.uuid4().hex[:16]
+    tokens = (_id_correlacao.set(id_correlacao), _rastro_amostrado.set(_amostrar()))
+    return id_correlacao, tokens
+
+
+def encerrar_correlacao(tokens):
+    _id_correlacao.reset(tokens[0])
+    _rastro_amostrado.reset(tokens[1])
+
+
+def correlacao_atual():
+    """(id de correlação, rastro amostrado) do contexto atual, para repassar a outra thread ou processo."""
+    return _id_correlacao.get(), _rastro_amostrado.get()
+
+
+@contextmanager
+def usar_correlacao(correlacao):
+    """Executa o bloco com a correlação de correlacao_atual() (None não muda nada)."""
+    if correlacao is None:
+        yield
+        return
+    tokens = (_id_correlacao.set(correlacao[0]), _rastro_amostrado.set(correlacao[1]))
+    try:
+        yield
+    finally:
+        encerrar_correlacao(tokens)
+
+
+def com_correlacao(funcao):
+    """Envolve a função para rodar (ex.: em um executor) com a correlação de quem a criou."""
+    correlacao = correlacao_atual()
+
+    def executar(*args, **kwargs):
+        with usar_correlacao(correlacao):
+            return funcao(*args, **kwargs)
+    return executar
+
+
+configurar_logs()
@@ -0,0 +1,284 @@
+"""
+Memória das gerações: pico de cada geração e orçamento global (controle de admissão).
+
+Cada geração reserva, antes de começar, a memória estimada para o modelo usado; se a
+soma das reservas passaria de MEMORIA_ORCAMENTO_MB, ou se já há GERACOES_MAX_SIMULTANEAS
+em andamento, ela espera até GERACOES_ESPERA_SEGUNDOS por uma vaga e depois é recusada
+(SemMemoria -> 503 com Retry-After). A estimativa de cada modelo começa em
+GERACAO_MEMORIA_INICIAL_MB e acompanha o pico medido nas gerações: sobe na hora e
+desce devagar.
+
+O pico é o do RSS do processo que gerou (VmHWM, zerado antes da geração em
+/proc/self/clear_refs; o lxml aloca fora do tracemalloc). Nos processos do pool cada
+processo gera um documento por vez; sem o pool, só as gerações que não rodaram junto com
+outra na própria thread são medidas. Sem /proc, a estimativa fica no valor inicial.
+"""
+import os
+import threading
+import time
+
+# Memória (MB) que as gerações simultâneas podem reservar; 0 não limita. Padrão: 70% do
+# limite do container (cgroup), se houver
+MEMORIA_ORCAMENTO_MB = os.getenv('MEMORIA_ORCAMENTO_MB')
+# Gerações em andamento ao mesmo tempo (0 não limita)
+GERACOES_MAX_SIMULTANEAS = int(os.getenv('GERACOES_MAX_SIMULTANEAS', '0'))
+# Tempo máximo de espera por uma vaga antes de recusar a geração
+GERACOES_ESPERA_SEGUNDOS = float(os.getenv('GERACOES_ESPERA_SEGUNDOS', '10'))
+# Estimativa de memória de uma geração de um modelo ainda não medido
+GERACAO_MEMORIA_INICIAL_MB = float(os.getenv('GERACAO_MEMORIA_INICIAL_MB', '150'))
+
+# Intervalo sugerido ao cliente (Retry-After) quando a geração é recusada
+RETRY_AFTER_SEGUNDOS = 5
+# Fração do limite do container usada como orçamento padrão
+FRACAO_LIMITE_CONTAINER = 0.7
+# Peso da medição nova quando o pico fica abaixo da estimativa (a estimativa desce devagar)
+PESO_QUEDA_ESTIMATIVA = 0.2
+# Limites de cgroup maiores que isso significam "sem limite"
+_SEM_LIMITE_CGROUP = 1 << 60
+
+
+class SemMemoria(Exception):
+    """A geração não coube no orçamento de memória/concorrência a tempo."""
+
+    def __init__(self, mensagem, retry_after=RETRY_AFTER_SEGUNDOS):
+        super().__init__(mensagem)
+        self.retry_after = retry_after
+
+
+def _ler_status(pid='self'):
+    """VmRSS e VmHWM (MB) de /proc/<pid>/status, ou {} se não der para ler."""
+    valores = {}
+    try:
+        with open(f'/proc/{pid}/status', 'r') as f:
+            for linha in f:
+                if linha.startswith(('VmRSS:', 'VmHWM:')):
+                    chave, valor = linha.split(':', 1)
+                    valores[chave] = int(valor.split()[0]) / 1024
+    except (OSError, ValueError, IndexError):
+        pass
+    return valores
+
+
+def rss_mb(pids=()):
+    """RSS (MB) deste processo somado ao dos `pids` (ex.: processos do pool), ou None."""
+    atual = _ler_status().get('VmRSS')
+    if atual is None:
+        return None
+    return atual + sum(_ler_status(pid).get('VmRSS', 0.0) for pid in pids)
+
+
+def _ler_cgroup(caminhos):
+    """Primeiro arquivo de cgroup que existir entre `caminhos` (v2 e v1), ou None."""
+    for caminho in caminhos:
+        try:
+            with open(caminho, 'r') as f:
+                return f.read()
+        except OSError:
+            continue
+    return None
+
+
+def limite_container_mb():
+    """Limite de memória do container (cgroup v2 ou v1) em MB, ou None se não houver."""
+    valor = (_ler_cgroup(('/sys/fs/cgroup/memory.max', '/sys/fs/cgroup/memory/memory.limit_in_bytes')) or '').strip()
+    if valor.isdigit() and int(valor) < _SEM_LIMITE_CGROUP:
+        return int(valor) / 1024 / 1024
+    return None
+
+
+def uso_container_mb():
+    """
+    Memória em uso pelo container (cgroup v2 memory.current ou v1 memory.usage_in_bytes)
+    em MB, sem o cache de arquivos inativo (que o kernel devolve antes de faltar memória),
+    ou None se não houver cgroup.
+    """
+    valor = (_ler_cgroup(('/sys/fs/cgroup/memory.current', '/sys/fs/cgroup/memory/memory.usage_in_bytes')) or '').strip()
+    if not valor.isdigit():
+        return None
+    uso = int(valor)
+    estatisticas = _ler_cgroup(('/sys/fs/cgroup/memory.stat', '/sys/fs/cgroup/memory/memory.stat')) or ''
+    for linha in estatisticas.splitlines():
+        chave, _, numero = linha.partition(' ')
+        if chave in ('inactive_file', 'total_inactive_file') and numero.strip().isdigit():
+            uso = max(uso - int(numero), 0)
+            break
+    return uso / 1024 / 1024
+
+
+def memoria_livre_mb():
+    """
+    Memória livre (MB): o que falta para o limite do container (cgroup) ou, sem limite,
+    o MemAvailable do sistema; None se não der para saber.
+    """
+    limite = limite_container_mb()
+    if limite is not None:
+        uso = uso_container_mb()
+        return max(limite - uso, 0.0) if uso is not None else None
+    try:
+        with open('/proc/meminfo', 'r') as f:
+            for linha in f:
+                if linha.startswith('MemAvailable:'):
+                    return int(linha.split()[1]) / 1024
+    except (OSError, ValueError, IndexError):
+        pass
+    return None
+
+
+class PicoMemoria:
+    """
+    Pico do RSS do processo durante um bloco (with), acima do RSS do início, em MB.
+    IMPORTANTE: zera o VmHWM do processo inteiro; só é exato com uma geração por processo.
+    """
+
+    def __init__(self):
+        self.pico_mb = None
+
+    def __enter__(self):
+        try:
+            with open('/proc/self/clear_refs', 'w') as f:
+                f.write('5')
+            self._inicio = _ler_status().get('VmRSS')
+        except OSError:
+            self._inicio = None
+        return self
+
+    def __exit__(self, *_):
+        pico = _ler_status().get('VmHWM')
+        if self._inicio is not None and pico is not None:
+            self.pico_mb = round(max(pico - self._inicio, 0.0), 1)
+        return False
+
+
+def _orcamento_padrao_mb():
+    if MEMORIA_ORCAMENTO_MB is not None:
+        return float(MEMORIA_ORCAMENTO_MB)
+    limite = limite_container_mb()
+    return round(limite * FRACAO_LIMITE_CONTAINER, 1) if limite else 0.0
+
+
+class OrcamentoMemoria:
+    """
+    Reservas de memória e vagas das gerações em andamento (uma Condition para esperar).
+    """
+
+    def __init__(self, orcamento_mb, max_simultaneas, espera_segundos, estimativa_inicial_mb):
+        self.orcamento_mb = orcamento_mb
+        self.max_simultaneas = max_simultaneas
+        self.espera_segundos = espera_segundos
+        self.estimativa_inicial_mb = estimativa_inicial_mb
+        self._estimativas = {}   # modelo -> MB
+        self._picos = {}         # modelo -> maior pico medido (MB)
+        self._reservado_mb = 0.0
+        self._ativas = 0
+        self._em_espera = 0
+        self._contagem = {'admitidas': 0, 'esperaram': 0, 'recusadas': 0}
+        self._condicao = threading.Condition()
+
+    def estimativa_mb(self, modelo):
+        return self._estimativas.get(os.path.basename(modelo), self.estimativa_inicial_mb)
+
+    def _cabe(self, reserva_mb):
+        if self.max_simultaneas > 0 and self._ativas >= self.max_simultaneas:
+            return False
+        # Sozinha, a geração sempre é admitida (mesmo com estimativa maior que o orçamento)
+        if self.orcamento_mb > 0 and self._ativas and self._reservado_mb + reserva_mb > self.orcamento_mb:
+            return False
+        return True
+
+    def reservar(self, modelo, espera_segundos=None):
+        """
+        Reserva a memória estimada para uma geração do modelo, esperando uma vaga.
+
+        Returns:
+            A reserva (MB), para liberar()
+
+        Raises:
+            SemMemoria: Se não houve vaga em `espera_segundos` (padrão: GERACOES_ESPERA_SEGUNDOS)
+        """
+        espera = self.espera_segundos if espera_segundos is None else espera_segundos
+        with self._condicao:
+            reserva_mb = self.estimativa_mb(modelo)
+            if not self._cabe(reserva_mb):
+                self._em_espera += 1
+                self._contagem['esperaram'] += 1
+                try:
+                    limite = time.monotonic() + espera
+                    while not self._cabe(reserva_mb):
+                        restante = limite - time.monotonic()
+                        if restante <= 0:
+                            self._contagem['recusadas'] += 1
+                            raise SemMemoria(
+                                f"Sem memória para gerar agora ({self._ativas} geração(ões) em andamento, "
+                                f"{self._reservado_mb:.0f} de {self.orcamento_mb:.0f} MB reservados)"
+                            )
+                        self._condicao.wait(restante)
+                finally:
+                    self._em_espera -= 1
+            self._ativas += 1
+            self._reservado_mb += reserva_mb
+            self._contagem['admitidas'] += 1
+            return reserva_mb
+
+    def saturado(self):
+        """True se há gerações esperando vaga ou se nem a menor estimativa cabe agora."""
+        with self._condicao:
+            menor_mb = min(self._estimativas.values(), default=self.estimativa_inicial_mb)
+            return self._em_espera > 0 or not self._cabe(menor_mb)
+
+    def liberar(self, modelo, reserva_mb, pico_mb=None):
+        """Devolve a reserva e, com o pico medido, atualiza a estimativa do modelo."""
+        nome = os.path.basename(modelo)
+        with self._condicao:
+            self._ativas -= 1
+            self._reservado_mb = max(self._reservado_mb - reserva_mb, 0.0)
+            if pico_mb is not None:
+                anterior = self._estimativas.get(nome, self.estimativa_inicial_mb)
+                self._estimativas[nome] = round(
+                    max(pico_mb, anterior + (pico_mb - anterior) * PESO_QUEDA_ESTIMATIVA), 1
+                )
+                self._picos[nome] = max(self._picos.get(nome, 0.0), pico_mb)
+            self._condicao.notify_all()
+
+    def estatisticas(self, pids=()):
+        """Uso atual (para /health e autoscaling); `pids` entram no RSS total."""
+        with self._condicao:
+            estatisticas = {
+                'orcamento_mb': self.orcamento_mb,
+                'reservado_mb': round(self._reservado_mb, 1),
+                'geracoes_ativas': self._ativas,
+                'max_simultaneas': self.max_simultaneas,
+                'em_espera': self._em_espera,
+                'estimativas_mb': dict(self._estimativas),
+                'picos_mb': dict(self._picos),
+                **self._contagem,
+            }
+        rss = rss_mb(pids)
+        estatisticas['rss_mb'] = round(rss, 1) if rss is not None else None
+        return estatisticas
+
+    def exportar(self, pids=()):
+        """Medidores no formato texto do Prometheus (complementa metricas.exportar)."""
+        estatisticas = self.estatisticas(pids)
+        linhas = []
+        for nome, tipo, descricao, valor in (
+            ('gendoc_memoria_reservada_bytes', 'gauge', 'Memória reservada pelas gerações em andamento',
+             estatisticas['reservado_mb'] * 1024 * 1024),
+            ('gendoc_memoria_orcamento_bytes', 'gauge', 'Orçamento de memória das gerações (0: sem limite)',
+             estatisticas['orcamento_mb'] * 1024 * 1024),
+            ('gendoc_memoria_rss_bytes', 'gauge', 'RSS do servidor e dos processos do pool',
+             (estatisticas['rss_mb'] or 0) * 1024 * 1024),
+            ('gendoc_geracoes_ativas', 'gauge', 'Gerações em andamento', estatisticas['geracoes_ativas']),
+            ('gendoc_geracoes_em_espera', 'gauge', 'Gerações esperando vaga', estatisticas['em_espera']),
+            ('gendoc_geracoes_recusadas_total', 'counter', 'Gerações recusadas por falta de vaga',
+             estatisticas['recusadas']),
+        ):
+            linhas += [f'# HELP {nome} {descricao}', f'# TYPE {nome} {tipo}', f'{nome} {valor:.0f}']
+        return '\n'.join(linhas) + '\n'
+
+
+orcamento_memoria = OrcamentoMemoria(
+    _orcamento_padrao_mb(),
+    GERACOES_MAX_SIMULTANEAS,
+    GERACOES_ESPERA_SEGUNDOS,
+    GERACAO_MEMORIA_INICIAL_MB
+)
@@ -0,0 +1,231 @@
+"""
+Tempo das etapas das requisições: histogramas no formato texto do Prometheus (/metrics)
+e o cabeçalho Server-Timing de cada resposta.
+
+As etapas são medidas onde acontecem (medir / Cronometro) e vão para as medições da
+requisição em andamento (coletar_medicoes, aberta pelo app em before_request); no fim da
+requisição elas entram nos histogramas e no Server-Timing. Etapas fora de uma requisição
+(tarefas assíncronas, lote, especulação) entram direto nos histogramas. Nos processos do
+pool de geração, as medições voltam junto com o documento (registrar_medicoes).
+
+O custo de uma medição é um perf_counter() no início e outro no fim; com METRICAS=0 nada
+é medido.
+"""
+import bisect
+import os
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+# Mede as etapas e expõe /metrics (0 desativa)
+METRICAS_ATIVAS = os.getenv('METRICAS', '1').strip().lower() not in ('0', 'false', 'nao', 'não')
+# Limites (segundos) dos buckets dos histogramas
+BUCKETS_SEGUNDOS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+# Etapas medidas (nome no histograma e no Server-Timing -> descrição)
+ETAPAS_MEDIDAS = {
+    'redmine_demanda': 'Busca da demanda no Redmine',
+    'redmine_sprint': 'Busca de sprint no Redmine',
+    'projetos': 'Carga dos projetos',
+    'modelo': 'Abertura do modelo',
+    'tags_simples': 'Tags simples',
+    'tabela_sprints': 'Tabela de sprints',
+    'item7': 'Item 7 (profissionais)',
+    'tipo_demanda': 'Tipo da demanda (checkbox)',
+    'salvamento': 'Gravação do documento',
+    'envio': 'Envio da resposta',
+}
+
+_medicoes_atuais = ContextVar('medicoes_atuais', default=None)
+
+
+class Histograma:
+    """
+    Histograma de durações (buckets fixos), no formato do Prometheus.
+    """
+
+    def __init__(self, buckets):
+        self.buckets = tuple(buckets)
+        self.contagens = [0] * (len(self.buckets) + 1)  # o último é o +Inf
+        self.soma = 0.0
+        self.total = 0
+
+    def observar(self, segundos):
+        self.contagens[bisect.bisect_left(self.buckets, segundos)] += 1
+        self.soma += segundos
+        self.total += 1
+
+    def linhas(self, nome, rotulos):
+        acumulado = 0
+        for limite, contagem in zip(self.buckets + (float('inf'),), self.contagens):
+            acumulado += contagem
+            le = '+Inf' if limite == float('inf') else repr(limite)
+            yield f'{nome}_bucket{{{rotulos},le="{le}"}} {acumulado}'
+        yield f'{nome}_sum{{{rotulos}}} {self.soma:.6f}'
+        yield f'{nome}_count{{{rotulos}}} {self.total}'
+
+
+class RegistroMetricas:
+    """
+    Histogramas das etapas e das requisições (por rota) deste processo.
+    """
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self._etapas = {}
+        self._requisicoes = {}
+        self._lock = threading.Lock()
+
+    def _observar(self, histogramas, chave, segundos):
+        with self._lock:
+            histograma = histogramas.get(chave)
+            if histograma is None:
+                histograma = histogramas[chave] = Histograma(self.buckets)
+            histograma.observar(segundos)
+
+    def observar_etapa(self, etapa, segundos):
+        self._observar(self._etapas, etapa, segundos)
+
+    def observar_etapas(self, medicoes):
+        for etapa, segundos in medicoes:
+            self._observar(self._etapas, etapa, segundos)
+
+    def observar_requisicao(self, rota, metodo, status, segundos):
+        self._observar(self._requisicoes, (rota or 'desconhecida', metodo, str(status)), segundos)
+
+    def exportar(self):
+        """Histogramas no formato texto do Prometheus (version=0.0.4)."""
+        with self._lock:
+            etapas = sorted(self._etapas.items())
+            requisicoes = sorted(self._requisicoes.items())
+            linhas = [
+                '# HELP gendoc_etapa_segundos Duração das etapas das requisições, em segundos',
+                '# TYPE gendoc_etapa_segundos histogram',
+            ]
+            for etapa, histograma in etapas:
+                linhas.extend(histograma.linhas('gendoc_etapa_segundos', f'etapa="{etapa}"'))
+            linhas += [
+                '# HELP gendoc_requisicao_segundos Duração das requisições por rota, em segundos',
+                '# TYPE gendoc_requisicao_segundos histogram',
+            ]
+            for (rota, metodo, status), histograma in requisicoes:
+                rotulos = f'rota="{rota}",metodo="{metodo}",status="{status}"'
+                linhas.extend(histograma.linhas('gendoc_requisicao_segundos', rotulos))
+        return '\n'.join(linhas) + '\n'
+
+
+metricas = RegistroMetricas(BUCKETS_SEGUNDOS)
+
+
+def registrar_etapa(etapa, segundos):
+    """Medição de uma etapa: nas medições em andamento ou direto no histograma."""
+    medicoes = _medicoes_atuais.get()
+    if medicoes is not None:
+        medicoes.append((etapa, segundos))
+    else:
+        metricas.observar_etapa(etapa, segundos)
+
+
+def registrar_medicoes(medicoes):
+    """Medições vindas de outro processo (ver coletar_medicoes)."""
+    for etapa, segundos in medicoes or ():
+        registrar_etapa(etapa, segundos)
+
+
+@contextmanager
+def medir(etapa):
+    """Mede o bloco como uma etapa (chave de ETAPAS_MEDIDAS)."""
+    if not METRICAS_ATIVAS:
+        yield
+        return
+    inicio = time.perf_counter()
+    try:
+        yield
+    finally:
+        registrar_etapa(etapa, time.perf_counter() - inicio)
+
+
+class Cronometro:
+    """
+    Mede etapas consecutivas de uma função longa sem reindentá-la: cada etapa()
+    encerra a anterior; encerrar() fecha a última.
+    """
+    __slots__ = ('_etapa', '_inicio')
+
+    def __init__(self):
+        self._etapa = None
+        self._inicio = 0.0
+
+    def etapa(self, etapa):
+        self.encerrar()
+        if METRICAS_ATIVAS:
+            self._etapa, self._inicio = etapa, time.perf_counter()
+
+    def encerrar(self):
+        if self._etapa is not None:
+            registrar_etapa(self._etapa, time.perf_counter() - self._inicio)
+            self._etapa = None
+
+
+def iniciar_coleta():
+    """
+    Passa a guardar as medições deste contexto (thread) em uma lista, em vez de
+    registrá-las nos histogramas.
+
+    Returns:
+        (lista de (etapa, segundos), token para encerrar_coleta)
+    """
+    medicoes = []
+    return medicoes, _medicoes_atuais.set(medicoes)
+
+
+def encerrar_coleta(token):
+    _medicoes_atuais.reset(token)
+
+
+@contextmanager
+def coletar_medicoes():
+    """Medições do bloco, em uma lista (ex.: para devolvê-las do processo filho)."""
+    medicoes, token = iniciar_coleta()
+    try:
+        yield medicoes
+    finally:
+        encerrar_coleta(token)
+
+
+def medir_envio(pedacos):
+    """
+    Repassa os pedaços da resposta medindo o envio (do primeiro ao último pedaço).
+    IMPORTANTE: o envio termina depois da requisição: vai direto para o histograma
+    e não aparece no Server-Timing.
+    """
+    if isinstance(pedacos, (bytes, bytearray)):
+        # Documento inteiro (ex.: arquivo de tarefa): um pedaço só, não um iterável de ints
+        pedacos = [pedacos]
+    if not METRICAS_ATIVAS:
+        yield from pedacos
+        return
+    inicio = time.perf_counter()
+    try:
+        yield from pedacos
+    finally:
+        metricas.observar_etapa('envio', time.perf_counter() - inicio)
+
+
+def server_timing(medicoes, total=None):
+    """
+    Valor do cabeçalho Server-Timing: uma entrada por etapa (durações somadas quando a
+    etapa se repete, ex.: uma busca por sprint) e o total da requisição.
+    """
+    duracoes = {}
+    for etapa, segundos in medicoes:
+        soma, vezes = duracoes.get(etapa, (0.0, 0))
+        duracoes[etapa] = (soma + segundos, vezes + 1)
+    entradas = []
+    for etapa, (soma, vezes) in duracoes.items():
+        descricao = ETAPAS_MEDIDAS.get(etapa, etapa) + (f' ({vezes}x)' if vezes > 1 else '')
+        entradas.append(f'{etapa};dur={soma * 1000:.1f};desc="{descricao}"')
+    if total is not None:
+        entradas.append(f'total;dur={total * 1000:.1f}')
+    return ', '.join(entradas)
@@ -0,0 +1,442 @@
+"""
+Abertura e gravação rápidas do pacote .docx (zip) dos modelos.
+
+O zip de cada modelo é lido para a memória uma única vez e compartilhado entre as
+gerações. Ao abrir o documento, só as partes XML que o python-docx interpreta
+(document.xml, cabeçalhos/rodapés, estilos, numeração...) são descompactadas; as demais
+(fontes embutidas, tema, fontTable...) ficam nos bytes do zip e só são descompactadas se
+alguém acessar o conteúdo.
+
+IMPORTANTE: o zip é copiado para a memória, e não mapeado (mmap): com o recarregamento
+dos modelos, um arquivo sobrescrito no lugar (cp, shutil.copyfile) com um mapeamento
+aberto derruba o processo (SIGBUS) ou, no mesmo tamanho, troca os bytes das partes
+copiadas sem verificação de CRC. Os modelos têm poucos MB; com fork, os processos do
+pool compartilham a cópia.
+
+Na gravação, as partes que não mudam em relação ao modelo são copiadas do zip do modelo
+como bytes já comprimidos, sem descompactar nem comprimir de novo. Só as partes alteradas
+(document.xml, cabeçalhos, rodapés, relacionamentos e [Content_Types].xml) são
+serializadas e comprimidas.
+"""
+import hashlib
+import io
+import os
+import struct
+import threading
+import time
+import zipfile
+import zlib
+
+from docx.opc.constants import RELATIONSHIP_TYPE as RT
+from docx.opc.package import Unmarshaller
+from docx.opc.packuri import CONTENT_TYPES_URI, PACKAGE_URI
+from docx.opc.part import Part, PartFactory, XmlPart
+from docx.opc.pkgreader import PackageReader, _ContentTypeMap
+from docx.opc.pkgwriter import _ContentTypesItem
+from docx.package import Package
+
+from services.logs import obter_logger
+
+log = obter_logger(__name__)
+
+# Nível de compressão (deflate) das partes serializadas: 0 (sem compressão) a 9 (máxima)
+NIVEL_COMPRESSAO_PADRAO = int(os.getenv('DOCX_NIVEL_COMPRESSAO', '6'))
+
+_ASSINATURA_LOCAL = b'PK\x03\x04'
+_ASSINATURA_CENTRAL = b'PK\x01\x02'
+_ASSINATURA_FIM = b'PK\x05\x06'
+_TAMANHO_CABECALHO_LOCAL = 30
+_FLAG_UTF8 = 0x800
+_LIMITE_ZIP32 = 0xFFFFFFFF
+# Tamanho máximo de cada pedaço entregue por iterar_pacote (partes copiadas do modelo são fatiadas)
+TAMANHO_PEDACO = 64 * 1024
+_CT_DOCUMENTO = 'application/vnd.openxmlformats-officedocument.wordprocessingml.document.main+xml'
+
+
+def _data_hora_dos(data_hora):
+    """Converte (ano, mês, dia, hora, min, seg) para o par (hora, data) do formato DOS."""
+    ano, mes, dia, hora, minuto, segundo = data_hora[:6]
+    ano = max(ano, 1980)
+    return (hora << 11) | (minuto << 5) | (segundo // 2), ((ano - 1980) << 9) | (mes << 5) | dia
+
+
+class EscritorZip:
+    """
+    Escritor de zip mínimo (sem ZIP64) que grava em qualquer objeto com write().
+
+    Diferente de zipfile.ZipFile, permite copiar uma entrada de outro zip com os bytes
+    já comprimidos (copiar_bruto) e não precisa de seek: cada entrada é comprimida em
+    memória antes do cabeçalho ser gravado.
+    """
+
+    def __init__(self, saida):
+        self._saida = saida
+        self._posicao = 0
+        self._entradas = []
+
+    def _gravar(self, dados):
+        self._saida.write(dados)
+        self._posicao += len(dados)
+
+    def _gravar_entrada(self, nome, metodo, crc, comprimido, tamanho, data_hora):
+        nome_bytes = nome.encode('utf-8')
+        flags = 0 if nome.isascii() else _FLAG_UTF8
+        hora_dos, data_dos = _data_hora_dos(data_hora)
+        if self._posicao + len(comprimido) > _LIMITE_ZIP32 or tamanho > _LIMITE_ZIP32:
+            raise ValueError("Pacote grande demais para zip sem ZIP64")
+
+        self._entradas.append((nome_bytes, flags, metodo, hora_dos, data_dos, crc,
+                               len(comprimido), tamanho, self._posicao))
+        self._gravar(struct.pack(
+            '<4s5H3L2H', _ASSINATURA_LOCAL, 20, flags, metodo, hora_dos, data_dos,
+            crc, len(comprimido), tamanho, len(nome_bytes), 0
+        ))
+        self._gravar(nome_bytes)
+        self._gravar(comprimido)
+
+    def adicionar(self, nome, dados, nivel_compressao=NIVEL_COMPRESSAO_PADRAO):
+        """Adiciona uma entrada comprimindo `dados` com o nível informado (0 = sem compressão)."""
+        crc = zlib.crc32(dados)
+        if nivel_compressao == 0:
+            metodo, comprimido = zipfile.ZIP_STORED, dados
+        else:
+            compressor = zlib.compressobj(nivel_compressao, zlib.DEFLATED, -15)
+            metodo, comprimido = zipfile.ZIP_DEFLATED, compressor.compress(dados) + compressor.flush()
+        self._gravar_entrada(nome, metodo, crc, comprimido, len(dados), time.localtime(time.time()))
+
+    def copiar_bruto(self, info, comprimido, nome=None):
+        """Adiciona uma entrada de outro zip (ZipInfo + bytes comprimidos) sem recomprimir."""
+        self._gravar_entrada(nome or info.filename, info.compress_type, info.CRC, comprimido,
+                             info.file_size, info.date_time)
+
+    def fechar(self):
+        """Grava o diretório central e o registro de fim do zip."""
+        inicio_diretorio = self._posicao
+        for nome_bytes, flags, metodo, hora_dos, data_dos, crc, comprimido, tamanho, posicao in self._entradas:
+            self._gravar(struct.pack(
+                '<4s6H3L5H2L', _ASSINATURA_CENTRAL, 20, 20, flags, metodo, hora_dos, data_dos,
+                crc, comprimido, tamanho, len(nome_bytes), 0, 0, 0, 0, 0, posicao
+            ))
+            self._gravar(nome_bytes)
+        tamanho_diretorio = self._posicao - inicio_diretorio
+        if len(self._entradas) > 0xFFFF or inicio_diretorio > _LIMITE_ZIP32:
+            raise ValueError("Pacote grande demais para zip sem ZIP64")
+        self._gravar(struct.pack(
+            '<4s4H2LH', _ASSINATURA_FIM, 0, 0, len(self._entradas), len(self._entradas),
+            tamanho_diretorio, inicio_diretorio, 0
+        ))
+
+
+class ZipModelo:
+    """
+    Zip do modelo em memória (somente leitura).
+
+    Os bytes são compartilhados entre threads: as leituras são fatias (memoryview),
+    sem seek nem posição de arquivo compartilhada.
+    """
+
+    def __init__(self, modelo_path, versao=None):
+        self.caminho = modelo_path
+        self.versao = versao
+        self._hash_conteudo = None
+        # Tags {TAG} do documento desta versão (services.documento.compilar_modelo)
+        self.tags = None
+        # Tabelas e parágrafos com tags desta versão, em texto (services.previa)
+        self.esqueleto_previa = None
+        with open(modelo_path, 'rb') as arquivo:
+            self._dados = arquivo.read()
+        self.infos = {info.filename: info for info in zipfile.ZipFile(io.BytesIO(self._dados)).infolist()}
+
+        # Início dos dados de cada entrada (logo após o cabeçalho local)
+        self._inicio_dados = {}
+        for nome, info in self.infos.items():
+            if self._dados[info.header_offset:info.header_offset + 4] != _ASSINATURA_LOCAL:
+                raise zipfile.BadZipFile(f"Cabeçalho local inválido: {nome}")
+            tamanho_nome, tamanho_extra = struct.unpack_from('<2H', self._dados, info.header_offset + 26)
+            self._inicio_dados[nome] = info.header_offset + _TAMANHO_CABECALHO_LOCAL + tamanho_nome + tamanho_extra
+
+    @property
+    def hash_conteudo(self):
+        """SHA-256 (hex) do arquivo do modelo, calculado uma vez por versão carregada."""
+        if self._hash_conteudo is None:
+            self._hash_conteudo = hashlib.sha256(self._dados).hexdigest()
+        return self._hash_conteudo
+
+    def ler_bruto(self, info):
+        """Bytes da entrada exatamente como estão no zip (comprimidos), sem cópia (memoryview)."""
+        inicio = self._inicio_dados[info.filename]
+        return memoryview(self._dados)[inicio:inicio + info.compress_size]
+
+    def ler(self, info):
+        """Conteúdo descompactado da entrada."""
+        if info.compress_type == zipfile.ZIP_STORED:
+            blob = bytes(self.ler_bruto(info))
+        elif info.compress_type == zipfile.ZIP_DEFLATED:
+            blob = zlib.decompress(self.ler_bruto(info), -15)
+        else:
+            with zipfile.ZipFile(self.caminho) as zip_modelo:
+                return zip_modelo.read(info.filename)
+        if zlib.crc32(blob) != info.CRC:
+            raise zipfile.BadZipFile(f"CRC inválido: {info.filename}")
+        return blob
+
+
+# Modelos carregados, por caminho absoluto. Recarregados quando o arquivo muda (inode/mtime/tamanho).
+_cache_modelos = {}
+_lock_modelos = threading.Lock()
+
+
+def obter_modelo(modelo_path):
+    """
+    Retorna o ZipModelo do modelo, reaproveitando os bytes carregados entre as gerações.
+    """
+    caminho = os.path.abspath(modelo_path)
+    estado = os.stat(caminho)
+    # inode: um arquivo trocado por rename mantém às vezes mtime e tamanho
+    versao = (estado.st_ino, estado.st_mtime_ns, estado.st_size)
+    with _lock_modelos:
+        modelo = _cache_modelos.get(caminho)
+        if modelo is None or modelo.versao != versao:
+            # IMPORTANTE: documentos ainda abertos com a versão anterior mantêm os bytes
+            # antigos vivos (por referência) até serem descartados
+            modelo = ZipModelo(caminho, versao)
+            _cache_modelos[caminho] = modelo
+            log.debug("Modelo carregado em memória: %s (%s entradas)", caminho, len(modelo.infos))
+    return modelo
+
+
+class ParteModelo(Part):
+    """
+    Parte (não XML) do modelo carregada sob demanda.
+
+    Enquanto `blob` não é acessado, o conteúdo fica só nos bytes do zip do modelo
+    (ZipModelo) e, na gravação, é copiado comprimido direto deles.
+    """
+
+    def __init__(self, partname, content_type, modelo, info, package):
+        super().__init__(partname, content_type, None, package)
+        self.modelo = modelo
+        self.info = info
+
+    @property
+    def blob(self):
+        if self._blob is None:
+            self._blob = self.modelo.ler(self.info)
+        return self._blob
+
+    @property
+    def intacta(self):
+        """True se o conteúdo nunca foi carregado (logo, é igual ao do modelo)."""
+        return self._blob is None
+
+
+class _LeitorModelo:
+    """
+    Leitor físico do pacote (mesma interface de docx.opc.phys_pkg) sobre um ZipModelo.
+
+    Para as partes que o python-docx não interpreta (classe padrão Part), blob_for
+    devolve o próprio ZipInfo no lugar dos bytes; _fabricar_parte cria a ParteModelo.
+    Partes em `partes_xml` ({nome no zip: bytes}) são lidas desses bytes, e não do modelo.
+    """
+
+    def __init__(self, modelo, partes_xml=None):
+        self._modelo = modelo
+        self._partes_xml = partes_xml or {}
+        self.content_types_xml = self._ler_membro(CONTENT_TYPES_URI.membername)
+        self._tipos = _ContentTypeMap.from_xml(self.content_types_xml)
+
+    def _ler_membro(self, nome):
+        info = self._modelo.infos.get(nome)
+        return None if info is None else self._modelo.ler(info)
+
+    def blob_for(self, pack_uri):
+        if pack_uri.membername in self._partes_xml:
+            return self._partes_xml[pack_uri.membername]
+        info = self._modelo.infos[pack_uri.membername]
+        if PartFactory._part_cls_for(self._tipos[pack_uri]) is Part:
+            return info
+        return self._modelo.ler(info)
+
+    def rels_xml_for(self, source_uri):
+        return self._ler_membro(source_uri.rels_uri.membername)
+
+    def close(self):
+        pass
+
+
+def _fabricar_parte(modelo):
+    def fabricar(partname, content_type, reltype, blob, package):
+        if isinstance(blob, zipfile.ZipInfo):
+            return ParteModelo(partname, content_type, modelo, blob, package)
+        return PartFactory(partname, content_type, reltype, blob, package)
+    return fabricar
+
+
+def abrir_documento(modelo_path, partes_xml=None):
+    """
+    Equivalente a docx.Document(modelo_path), mas sobre o zip do modelo já em memória e
+    sem carregar as partes que o python-docx não interpreta (fontes, tema...).
+
+    Args:
+        partes_xml: {nome no zip: bytes} de partes XML já preenchidas (serializar_partes_alteradas),
+            usadas no lugar das partes do modelo (ex.: documento parcial da especulação)
+    """
+    modelo = obter_modelo(modelo_path)
+    leitor = _LeitorModelo(modelo, partes_xml)
+    pkg_srels = PackageReader._srels_for(leitor, PACKAGE_URI)
+    sparts = PackageReader._load_serialized_parts(leitor, pkg_srels, leitor._tipos)
+    pkg_reader = PackageReader(leitor._tipos, pkg_srels, sparts)
+
+    pacote = Package()
+    Unmarshaller.unmarshal(pkg_reader, pacote, _fabricar_parte(modelo))
+    pacote.zip_modelo = modelo
+
+    document_part = pacote.main_document_part
+    if document_part.content_type != _CT_DOCUMENTO:
+        raise ValueError(f"{modelo_path} não é um documento Word (.docx)")
+    return document_part.document
+
+
+def partes_alteradas_documento(doc):
+    """
+    Partes XML que o preenchimento altera: document.xml e os cabeçalhos/rodapés.
+    As demais partes XML do modelo são copiadas sem serializar.
+    """
+    partes = {doc.part}
+    for rel in doc.part.rels.values():
+        if not rel.is_external and rel.reltype in (RT.HEADER, RT.FOOTER):
+            partes.add(rel.target_part)
+    return partes
+
+
+def serializar_partes_alteradas(doc):
+    """
+    Partes alteradas do documento (partes_alteradas_documento) serializadas, no formato
+    aceito por abrir_documento(partes_xml=...): {nome no zip: bytes}.
+    """
+    return {parte.partname.membername: parte.blob for parte in partes_alteradas_documento(doc)}
+
+
+class _BufferPedacos:
+    """Saída do EscritorZip que só acumula os pedaços gravados até serem retirados."""
+
+    def __init__(self):
+        self.pedacos = []
+
+    def write(self, dados):
+        self.pedacos.append(dados)
+
+    def retirar(self):
+        """Retorna os pedaços acumulados como bytes (no máximo TAMANHO_PEDACO cada)."""
+        pedacos, self.pedacos = self.pedacos, []
+        for pedaco in pedacos:
+            if isinstance(pedaco, memoryview):
+                for inicio in range(0, len(pedaco), TAMANHO_PEDACO):
+                    yield bytes(pedaco[inicio:inicio + TAMANHO_PEDACO])
+            else:
+                yield pedaco
+
+
+def iterar_pacote(doc, modelo_path, nivel_compressao=None, partes_alteradas=None, estatisticas=None):
+    """
+    Gera o documento como .docx em pedaços de bytes, reaproveitando o modelo.
+
+    Cada parte só é serializada quando o pedaço anterior já foi consumido, então os
+    primeiros bytes podem ser enviados ao cliente enquanto as partes seguintes ainda
+    estão sendo gravadas. Nada passa pelo sistema de arquivos.
+
+    - Partes XML alteradas (partes_alteradas_documento), relacionamentos e [Content_Types].xml
+      são serializados e comprimidos com `nivel_compressao`;
+    - Partes XML não alteradas existentes no modelo são copiadas comprimidas, sem serializar;
+    - Partes carregadas sob demanda (ParteModelo) que nunca foram lidas são copiadas
+      comprimidas direto do zip do modelo;
+    - Demais partes binárias (imagens) são copiadas comprimidas quando o conteúdo é igual
+      ao do modelo (mesmo tamanho e CRC32).
+
+    Args:
+        estatisticas: Dicionário opcional preenchido com a contagem de partes
+            copiadas e serializadas
+    """
+    if nivel_compressao is None:
+        nivel_compressao = NIVEL_COMPRESSAO_PADRAO
+    if partes_alteradas is None:
+        partes_alteradas = partes_alteradas_documento(doc)
+    if estatisticas is None:
+        estatisticas = {}
+    estatisticas.update({'copiadas': 0, 'serializadas': 0})
+
+    pacote = doc.part.package
+    partes = list(pacote.iter_parts())
+    # Documento aberto por abrir_documento: usa o mesmo zip em memória de onde foi lido
+    modelo = getattr(pacote, 'zip_modelo', None) or obter_modelo(modelo_path)
+    buffer = _BufferPedacos()
+    escritor = EscritorZip(buffer)
+
+    def adicionar(nome, blob):
+        escritor.adicionar(nome, blob, nivel_compressao)
+        estatisticas['serializadas'] += 1
+
+    adicionar(CONTENT_TYPES_URI.membername, _ContentTypesItem.from_parts(partes).blob)
+    adicionar(PACKAGE_URI.rels_uri.membername, pacote.rels.xml)
+    yield from buffer.retirar()
+
+    for parte in partes:
+        nome = parte.partname.membername
+        if isinstance(parte, ParteModelo) and parte.intacta:
+            escritor.copiar_bruto(parte.info, parte.modelo.ler_bruto(parte.info), nome)
+            estatisticas['copiadas'] += 1
+        else:
+            info = modelo.infos.get(nome)
+            copiar = False
+            if info is not None and parte not in partes_alteradas:
+                if isinstance(parte, XmlPart):
+                    copiar = True
+                else:
+                    blob = parte.blob
+                    copiar = len(blob) == info.file_size and zlib.crc32(blob) == info.CRC
+
+            if copiar:
+                escritor.copiar_bruto(info, modelo.ler_bruto(info))
+                estatisticas['copiadas'] += 1
+            else:
+                adicionar(nome, parte.blob)
+
+        if len(parte.rels):
+            adicionar(parte.partname.rels_uri.membername, parte.rels.xml)
+        yield from buffer.retirar()
+
+    escritor.fechar()
+    yield from buffer.retirar()
+
+
+def iterar_zip(arquivos, nivel_compressao=0):
+    """
+    Gera um zip em pedaços a partir de (nome, bytes) produzidos aos poucos: cada arquivo
+    vai para a saída assim que chega, sem esperar os seguintes.
+
+    Args:
+        arquivos: Iterável de (nome, bytes)
+        nivel_compressao: 0 (padrão) guarda sem comprimir, o ideal para arquivos já
+            comprimidos como .docx
+    """
+    buffer = _BufferPedacos()
+    escritor = EscritorZip(buffer)
+    for nome, dados in arquivos:
+        escritor.adicionar(nome, dados, nivel_compressao)
+        yield from buffer.retirar()
+    escritor.fechar()
+    yield from buffer.retirar()
+
+
+def gravar_pacote(doc, saida, modelo_path, nivel_compressao=None, partes_alteradas=None):
+    """
+    Grava o documento como .docx em `saida` (objeto com write()), reaproveitando o modelo.
+    Veja iterar_pacote.
+
+    Returns:
+        Dicionário com a contagem de partes copiadas e serializadas
+    """
+    estatisticas = {}
+    for pedaco in iterar_pacote(doc, modelo_path, nivel_compressao, partes_alteradas, estatisticas):
+        saida.write(pedaco)
+    return estatisticas
@@ -0,0 +1,167 @@
+"""
+Perfilamento sob demanda de requisições (geração, prévia, busca no Redmine).
+
+Só com PERFILAMENTO=1 e PERFILAMENTO_TOKEN definido (sem o token o perfilamento fica
+desligado). Uma requisição com ?perfil=1 (ou o cabeçalho X-Perfil: 1) e o cabeçalho
+X-Admin-Token igual ao token roda
+inteira sob o cProfile; o perfil fica em um buffer circular (os PERFILAMENTO_MAX_PERFIS
+mais recentes) e o id volta no cabeçalho X-Perfil-ID. Cada perfil traz as funções de
+services/documento.py que mais consumiram tempo, as mais caras no geral e o tempo
+bloqueado no Redmine (buscar_demanda e buscas de sprint).
+
+IMPORTANTE: o cProfile só vê a thread da requisição; por isso, a requisição perfilada
+gera o documento na própria thread, e não no pool de processos (perfilando()).
+"""
+import cProfile
+import hmac
+import io
+import marshal
+import os
+import pstats
+import threading
+import time
+import uuid
+from collections import deque
+from contextvars import ContextVar
+from datetime import datetime
+
+from services.logs import obter_logger
+
+log = obter_logger(__name__)
+
+# Perfis guardados (os mais antigos são descartados)
+PERFILAMENTO_MAX_PERFIS = int(os.getenv('PERFILAMENTO_MAX_PERFIS', '20'))
+# Token exigido (cabeçalho X-Admin-Token) para perfilar uma requisição e para ler os perfis
+PERFILAMENTO_TOKEN = os.getenv('PERFILAMENTO_TOKEN', '')
+# Aceita o pedido de perfil nas requisições (0 ignora ?perfil=1 e desativa os endpoints)
+# IMPORTANTE: os perfis trazem demandas e caminhos do código; sem token, fica desligado
+PERFILAMENTO_ATIVO = os.getenv('PERFILAMENTO', '0').strip().lower() in ('1', 'true', 'sim')
+if PERFILAMENTO_ATIVO and not PERFILAMENTO_TOKEN:
+    log.warning("PERFILAMENTO=1 sem PERFILAMENTO_TOKEN: perfilamento desativado")
+    PERFILAMENTO_ATIVO = False
+
+# Funções listadas em cada perfil
+TOP_FUNCOES = 25
+# Arquivo cujas funções são destacadas e funções cujo tempo conta como espera pelo Redmine
+ARQUIVO_DOCUMENTO = os.path.join('services', 'documento.py')
+ARQUIVO_REDMINE = os.path.join('services', 'redmine.py')
+FUNCOES_REDMINE = ('buscar_demanda', '_buscar_sprint_detalhes')
+
+_perfilando = ContextVar('perfilando', default=False)
+
+
+def token_valido(token):
+    """True se o perfilamento está ativo e `token` (X-Admin-Token) é o PERFILAMENTO_TOKEN."""
+    return PERFILAMENTO_ATIVO and hmac.compare_digest((token or '').encode(), PERFILAMENTO_TOKEN.encode())
+
+
+def perfilando():
+    """True se a requisição atual roda sob o profiler."""
+    return _perfilando.get()
+
+
+def _funcoes(estatisticas, ordem, filtro=None):
+    """As TOP_FUNCOES entradas (pstats) de maior `ordem` ('proprio_ms' ou 'acumulado_ms')."""
+    funcoes = []
+    for (arquivo, linha, nome), (_, chamadas, proprio, acumulado, _) in estatisticas.stats.items():
+        if filtro is not None and not filtro(arquivo):
+            continue
+        funcoes.append({
+            'funcao': nome,
+            'local': f"{os.path.relpath(arquivo) if os.path.isabs(arquivo) else arquivo}:{linha}",
+            'chamadas': chamadas,
+            'proprio_ms': round(proprio * 1000, 2),
+            'acumulado_ms': round(acumulado * 1000, 2),
+        })
+    funcoes.sort(key=lambda funcao: funcao[ordem], reverse=True)
+    return funcoes[:TOP_FUNCOES]
+
+
+def _tempo_redmine(estatisticas):
+    """(ms, chamadas) dentro das funções do Redmine (tempo de parede, inclui a espera da rede)."""
+    total = 0.0
+    chamadas = 0
+    for (arquivo, _, nome), (_, primitivas, _, acumulado, _) in estatisticas.stats.items():
+        if nome in FUNCOES_REDMINE and arquivo.endswith(ARQUIVO_REDMINE):
+            total += acumulado
+            chamadas += primitivas
+    return round(total * 1000, 2), chamadas
+
+
+class PerfisRequisicoes:
+    """
+    Buffer circular dos perfis das requisições.
+    """
+
+    def __init__(self, max_perfis):
+        self._perfis = deque(maxlen=max(int(max_perfis), 1))
+        self._lock = threading.Lock()
+
+    def iniciar(self):
+        """Liga o profiler nesta thread; o retorno vai para encerrar()."""
+        profiler = cProfile.Profile()
+        token = _perfilando.set(True)
+        profiler.enable()
+        return profiler, token, time.perf_counter()
+
+    def encerrar(self, perfilamento, **dados):
+        """
+        Desliga o profiler e guarda o perfil.
+
+        Args:
+            perfilamento: Retorno de iniciar()
+            **dados: Dados da requisição guardados com o perfil (rota, status, demanda...)
+
+        Returns:
+            Id do perfil
+        """
+        profiler, token, inicio = perfilamento
+        profiler.disable()
+        duracao = time.perf_counter() - inicio
+        _perfilando.reset(token)
+
+        estatisticas = pstats.Stats(profiler, stream=io.StringIO())
+        redmine_ms, redmine_chamadas = _tempo_redmine(estatisticas)
+        perfil = {
+            'id': uuid.uuid4().hex[:12],
+            'criado_em': datetime.now().isoformat(timespec='seconds'),
+            **dados,
+            'duracao_ms': round(duracao * 1000, 2),
+            'redmine_ms': redmine_ms,
+            'redmine_chamadas': redmine_chamadas,
+            'funcoes_documento': _funcoes(
+                estatisticas, 'acumulado_ms', lambda arquivo: arquivo.endswith(ARQUIVO_DOCUMENTO)
+            ),
+            'funcoes': _funcoes(estatisticas, 'proprio_ms'),
+        }
+        # Formato do pstats (Stats.dump_stats), para abrir com pstats/snakeviz
+        bruto = marshal.dumps(estatisticas.stats)
+        with self._lock:
+            self._perfis.append((perfil, bruto))
+        return perfil['id']
+
+    def descartar(self, perfilamento):
+        """Desliga o profiler sem guardar o perfil (requisição interrompida)."""
+        profiler, token, _ = perfilamento
+        profiler.disable()
+        _perfilando.reset(token)
+
+    def listar(self):
+        """Resumo dos perfis guardados, do mais recente ao mais antigo."""
+        with self._lock:
+            perfis = [perfil for perfil, _ in reversed(self._perfis)]
+        return [
+            {chave: valor for chave, valor in perfil.items() if chave not in ('funcoes_documento', 'funcoes')}
+            for perfil in perfis
+        ]
+
+    def obter(self, id_perfil):
+        """(perfil, bytes no formato do pstats) ou None."""
+        with self._lock:
+            for perfil, bruto in self._perfis:
+                if perfil['id'] == id_perfil:
+                    return perfil, bruto
+        return None
+
+
+perfis = PerfisRequisicoes(PERFILAMENTO_MAX_PERFIS)
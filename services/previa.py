@@ -0,0 +1,456 @@
+"""
+Prévia do Plano de Trabalho em JSON ou HTML, sem montar nem compactar o .docx.
+
+O modelo é lido uma vez por versão: o esqueleto (tabelas e parágrafos com tags, só o
+texto, as colunas mescladas e as mesclagens verticais) fica guardado no ZipModelo. Cada
+prévia roda sobre esse texto as etapas de tabela da própria geração (tabela de sprints,
+Item 7 e tipo da demanda, pela interface de TabelaEsqueleto), com o mesmo contexto de
+renderização; as tags simples e a compatibilidade fora das tabelas seguem
+preencher_plano_trabalho. A formatação (fontes, estilos, imagens) não é reproduzida.
+
+Prévia incremental: cada tabela tem uma assinatura calculada só com as entradas de que
+ela depende (tags simples presentes nela; sprints, com ou sem os profissionais; tipos
+das sprints). O cliente envia as assinaturas que já tem e só as tabelas cujas entradas
+mudaram são renderizadas; as demais voltam marcadas como inalteradas. Ex.: alterar as
+horas de um profissional no modal refaz só o Item 7.
+"""
+import hashlib
+import html
+import json
+import os
+import time
+
+from docx.oxml.ns import qn
+from docx.table import _Cell
+
+from services.documento import (
+    TAGS_PROFISSIONAL, TAGS_SPRINT, TIPO_ITEM7_GENERICA, TIPO_SPRINT, TIPO_VAZIA,
+    TITULO_TABELA_TIPO_DEMANDA, VARIACOES_NA, LinhaTabela, PlanoTabela, categorias_tipo_demanda,
+    classificar_linha, compilar_padrao_tags, iterar_paragrafos_tabela, marcar_tipo_demanda,
+    montar_tags_simples, preencher_tabela_item7, preencher_tabela_sprints,
+)
+from services.logs import obter_logger
+from services.pacote_docx import abrir_documento, obter_modelo
+
+log = obter_logger(__name__)
+
+FORMATOS_PREVIA = ('json', 'html')
+# Chave das assinaturas dos parágrafos (as das tabelas são os índices, como texto)
+CHAVE_PARAGRAFOS = 'paragrafos'
+
+
+# -----------------------------
+# ESQUELETO DO MODELO
+# -----------------------------
+def _texto_runs(paragraph):
+    """Texto do parágrafo como a substituição de tags o vê (runs diretos do parágrafo)."""
+    return ''.join(run.text for run in paragraph.runs)
+
+
+def _linhas_esqueleto(table):
+    """
+    Linhas da tabela em texto: [{'grid_before', 'celulas': [{'paragrafos', 'span', 'vmerge'}]}],
+    uma célula por w:tc (como em tr.tc_lst).
+    """
+    linhas = []
+    for tr in table._tbl.tr_lst:
+        grid_before = tr.find(f"{qn('w:trPr')}/{qn('w:gridBefore')}")
+        linhas.append({
+            'grid_before': int(grid_before.get(qn('w:val'), 0)) if grid_before is not None else 0,
+            'celulas': [
+                {
+                    'paragrafos': [_texto_runs(p) for p in _Cell(tc, table).paragraphs],
+                    'span': tc.grid_span,
+                    'vmerge': tc.vMerge,
+                }
+                for tc in tr.tc_lst
+            ],
+        })
+    return linhas
+
+
+def montar_esqueleto(doc, versao):
+    """
+    Esqueleto de um modelo (documento ainda não alterado): tabelas do corpo, com as
+    dependências de cada uma, e os parágrafos com tags do corpo, cabeçalhos e rodapés.
+    """
+    tabelas = []
+    indice_tipo_demanda = None
+    for table_idx, table in enumerate(doc.tables):
+        linhas = _linhas_esqueleto(table)
+        classificacoes = TabelaEsqueleto(linhas).planejar().classificacoes
+        tipos = {c.tipo for c in classificacoes}
+        texto = '\n'.join(p for linha in linhas for celula in linha['celulas'] for p in celula['paragrafos'])
+        depende_profissionais = (
+            any(c.sprint_num is not None for c in classificacoes)
+            or TIPO_ITEM7_GENERICA in tipos
+            or any(tag in texto for tag in TAGS_PROFISSIONAL)
+        )
+        if indice_tipo_demanda is None and any(
+            TITULO_TABELA_TIPO_DEMANDA in (p.text or '') for p in iterar_paragrafos_tabela(table)
+        ):
+            indice_tipo_demanda = table_idx
+        tabelas.append({
+            'linhas': linhas,
+            'texto': texto,
+            'depende_profissionais': depende_profissionais,
+            'depende_sprints': depende_profissionais or bool(tipos & {TIPO_SPRINT, TIPO_VAZIA}),
+            'tipo_demanda': indice_tipo_demanda == table_idx,
+        })
+
+    paragrafos = [
+        {'origem': 'corpo', 'indice': indice, 'texto': texto, 'em_tabela': False}
+        for indice, texto in enumerate(_texto_runs(p) for p in doc.paragraphs)
+        if '{' in texto
+    ]
+    partes_vistas = set()
+    for section in doc.sections:
+        for origem, parte in (('cabecalho', section.header), ('rodape', section.footer)):
+            # Seções ligadas à anterior compartilham o mesmo cabeçalho/rodapé
+            if id(parte.part) in partes_vistas:
+                continue
+            partes_vistas.add(id(parte.part))
+            textos = [(_texto_runs(p), False) for p in parte.paragraphs]
+            for table in parte.tables:
+                textos.extend((_texto_runs(p), True) for p in iterar_paragrafos_tabela(table))
+            paragrafos.extend(
+                {'origem': origem, 'indice': indice, 'texto': texto, 'em_tabela': em_tabela}
+                for indice, (texto, em_tabela) in enumerate(textos)
+                if '{' in texto
+            )
+    return {'versao': versao, 'tabelas': tabelas, 'paragrafos': paragrafos}
+
+
+def obter_esqueleto(modelo_path):
+    """
+    Esqueleto do modelo, montado uma única vez por versão e guardado no ZipModelo.
+    """
+    modelo = obter_modelo(modelo_path)
+    if modelo.esqueleto_previa is None:
+        inicio = time.perf_counter()
+        modelo.esqueleto_previa = montar_esqueleto(abrir_documento(modelo_path), modelo.hash_conteudo)
+        log.debug("Esqueleto da prévia montado: %s (%s tabela(s), %.1f ms)", os.path.basename(modelo_path),
+                  len(modelo.esqueleto_previa['tabelas']), (time.perf_counter() - inicio) * 1000)
+    return modelo.esqueleto_previa
+
+
+# -----------------------------
+# RENDERIZAÇÃO EM TEXTO
+# -----------------------------
+def _copiar_linha(linha):
+    return {
+        'grid_before': linha['grid_before'],
+        'celulas': [{**celula, 'paragrafos': list(celula['paragrafos'])} for celula in linha['celulas']],
+    }
+
+
+def _substituir_tags(paragrafos, padrao, valores):
+    for indice, texto in enumerate(paragrafos):
+        if texto and padrao.search(texto) is not None:
+            paragrafos[indice] = padrao.sub(lambda match: str(valores[match.group(0)]), texto)
+
+
+class TabelaEsqueleto:
+    """
+    Linhas do esqueleto de uma tabela com a interface de documento.TabelaDocx: as etapas
+    de tabela da geração (preencher_tabela_sprints, preencher_tabela_item7,
+    marcar_tipo_demanda) preenchem o texto com as mesmas regras do .docx.
+
+    Linhas (trs) são {'grid_before', 'celulas'} e células, {'paragrafos', 'span', 'vmerge'};
+    as etapas alteram as linhas no lugar.
+    """
+
+    def __init__(self, trs, indice=None):
+        self.trs = trs
+        self.indice = indice
+
+    def linhas(self):
+        """Células de cada linha por coluna da grade (ver documento.obter_linhas_tabela)."""
+        linhas = []
+        celula_por_coluna = {}
+        for linha in self.trs:
+            coluna = linha['grid_before']
+            celulas = []
+            for celula in linha['celulas']:
+                span = celula['span']
+                if celula['vmerge'] == 'continue' and coluna in celula_por_coluna:
+                    celula = celula_por_coluna[coluna]
+                for c in range(coluna, coluna + span):
+                    celula_por_coluna[c] = celula
+                celulas.extend([celula] * span)
+                coluna += span
+            linhas.append(LinhaTabela(linha, tuple(celulas)))
+        return linhas
+
+    def planejar(self):
+        """Grade e classificação das linhas (ver documento.planejar_tabela)."""
+        linhas = self.linhas()
+        textos_por_celula = {}
+        classificacoes = []
+        for row_idx, row in enumerate(linhas):
+            textos_celulas = []
+            for celula in row.cells:
+                texto = textos_por_celula.get(id(celula))
+                if texto is None:
+                    texto = textos_por_celula[id(celula)] = self.texto(celula)
+                textos_celulas.append(texto)
+            classificacoes.append(classificar_linha(row_idx, textos_celulas))
+        return PlanoTabela(self.indice, self, linhas, classificacoes)
+
+    def celulas_linha(self, linha):
+        return linha['celulas']
+
+    def copiar_linha(self, linha):
+        return _copiar_linha(linha)
+
+    def inserir_apos(self, ancora, linhas):
+        posicao = next(indice for indice, linha in enumerate(self.trs) if linha is ancora) + 1
+        self.trs[posicao:posicao] = linhas
+
+    def duplicar_linha(self, indice, quantidade):
+        """Como documento.duplicar_linha_tabela: cópias em bloco, com o "N/A" da última coluna normalizado."""
+        if quantidade <= 0:
+            return []
+        prototipo = _copiar_linha(self.trs[indice])
+        if prototipo['celulas']:
+            ultima = prototipo['celulas'][-1]
+            if ultima['paragrafos'] and ''.join(ultima['paragrafos']).strip().upper() in VARIACOES_NA:
+                ultima['paragrafos'] = ['N/A']
+        self.trs[indice + 1:indice + 1] = [prototipo] + [_copiar_linha(prototipo) for _ in range(quantidade - 1)]
+        return list(range(indice + 1, indice + 1 + quantidade))
+
+    def remover_linhas(self, linhas):
+        ids = {id(getattr(linha, '_element', linha)) for linha in linhas}
+        restantes = [linha for linha in self.trs if id(linha) not in ids]
+        removidas = len(self.trs) - len(restantes)
+        self.trs[:] = restantes
+        return removidas
+
+    def texto(self, celula):
+        return '\n'.join(celula['paragrafos'])
+
+    def texto_bruto(self, celula):
+        return ''.join(celula['paragrafos'])
+
+    def substituir_tags(self, celula, padrao, valores):
+        _substituir_tags(celula['paragrafos'], padrao, valores)
+
+    def escrever(self, celula, valor, referencia=None):
+        valor = '' if valor is None else str(valor)
+        if celula['paragrafos']:
+            celula['paragrafos'][0] = valor
+        else:
+            celula['paragrafos'] = [valor]
+
+    def acrescentar(self, celula, texto, limpar=False):
+        paragrafos = celula['paragrafos']
+        paragrafos[0] = texto if limpar else paragrafos[0] + texto
+
+    def reescrever_celula(self, celula, texto):
+        if celula['paragrafos'] != [texto]:
+            celula['paragrafos'] = [texto]
+
+    def mesclar_verticalmente(self, celula, continuacoes):
+        if celula['vmerge'] is None:
+            celula['vmerge'] = 'restart'
+        for continuacao in continuacoes:
+            continuacao['vmerge'] = 'continue'
+            continuacao['paragrafos'] = [''] if continuacao['paragrafos'] else []
+
+
+def _renderizar_tabela(tabela, valores, indice=None):
+    """Linhas da tabela preenchidas com as etapas de preencher_plano_trabalho."""
+    esqueleto = TabelaEsqueleto([_copiar_linha(linha) for linha in tabela['linhas']], indice)
+    for linha in esqueleto.trs:
+        for celula in linha['celulas']:
+            _substituir_tags(celula['paragrafos'], valores['padrao_simples'], valores['tags_simples'])
+
+    sprints_ctx = valores['sprints']
+    if not sprints_ctx:
+        return esqueleto.trs
+    plano = preencher_tabela_sprints(esqueleto, esqueleto.planejar(), sprints_ctx)
+    preencher_tabela_item7(esqueleto, plano, sprints_ctx)
+    if valores['valores_prof']:
+        for linha in esqueleto.trs:
+            for celula in linha['celulas']:
+                _substituir_tags(celula['paragrafos'], valores['padrao_prof'], valores['valores_prof'])
+    if tabela['tipo_demanda'] and valores['tipos_selecionados']:
+        marcar_tipo_demanda(esqueleto, valores['tipos_selecionados'])
+    return esqueleto.trs
+
+
+def _renderizar_paragrafos(paragrafos, valores):
+    itens = []
+    for paragrafo in paragrafos:
+        textos = [paragrafo['texto']]
+        _substituir_tags(textos, valores['padrao_simples'], valores['tags_simples'])
+        if valores['sprints']:
+            if valores['valores_prof']:
+                _substituir_tags(textos, valores['padrao_prof'], valores['valores_prof'])
+            if not paragrafo['em_tabela']:
+                _substituir_tags(textos, valores['padrao_sprint'], valores['valores_sprint'])
+        itens.append({'origem': paragrafo['origem'], 'indice': paragrafo['indice'], 'texto': textos[0]})
+    return itens
+
+
+# -----------------------------
+# SAÍDA
+# -----------------------------
+def _linhas_saida(linhas):
+    """
+    Linhas para exibição: listas de {'texto', 'colspan'?, 'rowspan'?}. Células que
+    continuam uma mesclagem vertical são omitidas (a de origem recebe o rowspan).
+    """
+    por_coluna = []  # {coluna inicial: célula} de cada linha
+    for linha in linhas:
+        coluna = linha['grid_before']
+        celulas = {}
+        for celula in linha['celulas']:
+            celulas[coluna] = celula
+            coluna += celula['span']
+        por_coluna.append(celulas)
+
+    saida = []
+    colunas_vistas = set()
+    for row_idx, linha in enumerate(linhas):
+        itens = []
+        if linha['grid_before']:
+            itens.append({'texto': '', 'colspan': linha['grid_before']})
+        for coluna, celula in por_coluna[row_idx].items():
+            continua = celula['vmerge'] == 'continue' and coluna in colunas_vistas
+            colunas_vistas.update(range(coluna, coluna + celula['span']))
+            if continua:
+                continue
+            item = {'texto': '\n'.join(celula['paragrafos'])}
+            if celula['span'] > 1:
+                item['colspan'] = celula['span']
+            rowspan = 1
+            while (row_idx + rowspan < len(linhas)
+                   and (por_coluna[row_idx + rowspan].get(coluna) or {}).get('vmerge') == 'continue'):
+                rowspan += 1
+            if rowspan > 1:
+                item['rowspan'] = rowspan
+            itens.append(item)
+        saida.append(itens)
+    return saida
+
+
+def _assinatura(*entradas):
+    serializado = json.dumps(entradas, sort_keys=True, ensure_ascii=False, separators=(',', ':'), default=str)
+    return hashlib.sha256(serializado.encode('utf-8')).hexdigest()[:16]
+
+
+def _entradas_tabela(tabela, valores):
+    """Só o que a tabela usa: tags simples presentes nela, sprints e tipos das sprints."""
+    entradas = {'simples': {tag: valor for tag, valor in valores['tags_simples'].items() if tag in tabela['texto']}}
+    if tabela['depende_profissionais']:
+        entradas['sprints'] = valores['sprints']
+    elif tabela['depende_sprints']:
+        entradas['sprints'] = [
+            {campo: valor for campo, valor in sprint.items() if campo != 'profissionais'}
+            for sprint in valores['sprints']
+        ]
+    if tabela['tipo_demanda']:
+        entradas['tipos'] = sorted(valores['tipos_selecionados'])
+    return entradas
+
+
+def _montar_valores(contexto, dados_projeto, data_geracao):
+    """Valores usados por todas as tabelas e parágrafos (como em preencher_plano_trabalho)."""
+    sprints_ctx = contexto['sprints']
+    tags_simples = montar_tags_simples(contexto, dados_projeto, data_geracao)
+    primeiro_prof = next((s['profissionais'][0] for s in sprints_ctx if s['profissionais']), None)
+    valores_prof = {tag: primeiro_prof[campo] for tag, campo in TAGS_PROFISSIONAL.items()} if primeiro_prof else None
+    valores_sprint = {tag: sprints_ctx[0][campo] for tag, campo in TAGS_SPRINT.items()} if sprints_ctx else None
+    return {
+        'tags_simples': tags_simples,
+        'padrao_simples': compilar_padrao_tags(tags_simples),
+        'sprints': sprints_ctx,
+        'valores_prof': valores_prof,
+        'padrao_prof': compilar_padrao_tags(valores_prof) if valores_prof else None,
+        'valores_sprint': valores_sprint,
+        'padrao_sprint': compilar_padrao_tags(valores_sprint) if valores_sprint else None,
+        'tipos_selecionados': categorias_tipo_demanda(sprints_ctx) if sprints_ctx else set(),
+    }
+
+
+def renderizar_previa(modelo_path, contexto, dados_projeto=None, data_geracao=None, assinaturas=None):
+    """
+    Prévia do documento: tabelas e parágrafos com tags já preenchidos, em texto.
+
+    Args:
+        contexto: Contexto de renderização (montar_contexto_render)
+        assinaturas: Assinaturas que o cliente já tem ({'paragrafos': ..., '<índice da tabela>': ...});
+            as partes com a mesma assinatura não são renderizadas de novo
+
+    Returns:
+        {'modelo', 'versao', 'paragrafos': {'assinatura', 'itens' | 'inalterada'},
+         'tabelas': [{'indice', 'assinatura', 'linhas' | 'inalterada'}], 'renderizadas', 'tempo_ms'}
+    """
+    inicio = time.perf_counter()
+    esqueleto = obter_esqueleto(modelo_path)
+    assinaturas = {str(chave): valor for chave, valor in (assinaturas or {}).items()}
+    valores = _montar_valores(contexto, dados_projeto, data_geracao)
+
+    renderizadas = 0
+    assinatura = _assinatura(
+        esqueleto['versao'], CHAVE_PARAGRAFOS, valores['tags_simples'], valores['valores_sprint'], valores['valores_prof']
+    )
+    if assinaturas.get(CHAVE_PARAGRAFOS) == assinatura:
+        paragrafos = {'assinatura': assinatura, 'inalterada': True}
+    else:
+        paragrafos = {'assinatura': assinatura, 'itens': _renderizar_paragrafos(esqueleto['paragrafos'], valores)}
+
+    tabelas = []
+    for indice, tabela in enumerate(esqueleto['tabelas']):
+        assinatura = _assinatura(esqueleto['versao'], indice, _entradas_tabela(tabela, valores))
+        if assinaturas.get(str(indice)) == assinatura:
+            tabelas.append({'indice': indice, 'assinatura': assinatura, 'inalterada': True})
+            continue
+        linhas = _renderizar_tabela(tabela, valores, indice)
+        tabelas.append({'indice': indice, 'assinatura': assinatura, 'linhas': _linhas_saida(linhas)})
+        renderizadas += 1
+
+    tempo_ms = round((time.perf_counter() - inicio) * 1000, 2)
+    log.debug("Prévia: %s de %s tabela(s) renderizada(s) em %s ms", renderizadas, len(tabelas), tempo_ms)
+    return {
+        'modelo': os.path.basename(modelo_path),
+        'versao': esqueleto['versao'],
+        'paragrafos': paragrafos,
+        'tabelas': tabelas,
+        'renderizadas': renderizadas,
+        'tempo_ms': tempo_ms,
+    }
+
+
+def previa_em_html(previa):
+    """
+    Fragmento HTML da prévia. Tabelas e parágrafos inalterados (prévia incremental) saem
+    vazios, com data-inalterada="1", para o cliente manter os que já tem.
+    """
+    def texto_html(texto):
+        return html.escape(texto).replace('\n', '<br>')
+
+    partes = [f'<div class="previa-plano" data-modelo="{html.escape(previa["modelo"])}" '
+              f'data-versao="{previa["versao"]}">']
+    paragrafos = previa['paragrafos']
+    inalterada = ' data-inalterada="1"' if paragrafos.get('inalterada') else ''
+    partes.append(f'<div class="previa-paragrafos" data-assinatura="{paragrafos["assinatura"]}"{inalterada}>')
+    for item in paragrafos.get('itens', []):
+        partes.append(f'<p data-origem="{item["origem"]}" data-indice="{item["indice"]}">{texto_html(item["texto"])}</p>')
+    partes.append('</div>')
+
+    for tabela in previa['tabelas']:
+        inalterada = ' data-inalterada="1"' if tabela.get('inalterada') else ''
+        partes.append(f'<table data-tabela="{tabela["indice"]}" data-assinatura="{tabela["assinatura"]}"{inalterada}>')
+        for linha in tabela.get('linhas', []):
+            partes.append('<tr>')
+            for celula in linha:
+                atributos = ''.join(
+                    f' {atributo}="{celula[atributo]}"' for atributo in ('colspan', 'rowspan') if atributo in celula
+                )
+                partes.append(f'<td{atributos}>{texto_html(celula["texto"])}</td>')
+            partes.append('</tr>')
+        partes.append('</table>')
+    partes.append('</div>')
+    return '\n'.join(partes)
@@ -0,0 +1,371 @@
+"""
+Geração dos documentos em um pool de processos.
+
+preencher_plano_trabalho é CPU puro em Python e segura o GIL: um plano grande gerado
+na thread da requisição trava as demais requisições do mesmo worker Flask (inclusive as
+consultas ao Redmine). Com o pool, a rota só entrega as entradas a um processo filho e
+devolve os bytes gerados; cada processo já começa com os modelos carregados em memória e
+a configuração de sprints carregada.
+
+RENDER_PROCESSOS define o número de processos (padrão: número de CPUs; 0 gera na própria
+thread da requisição, como antes). Se o pool não puder ser criado (ex.: ambiente
+serverless sem suporte a multiprocessing), a geração volta para a própria thread.
+
+Toda geração passa antes pelo orçamento de memória (services.memoria): sem vaga a tempo,
+gerar_documento levanta SemMemoria.
+"""
+import io
+import multiprocessing
+import os
+import threading
+import uuid
+import weakref
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from services.documento import (
+    preencher_plano_trabalho, transmitir_documento, carregar_config_sprints, notificar_etapa,
+    renderizar_documento_parcial, compilar_modelo
+)
+from services.fontes_docx import reduzir_fontes
+from services.logs import correlacao_atual, obter_logger, usar_correlacao
+from services.memoria import PicoMemoria, orcamento_memoria
+from services.metricas import coletar_medicoes, medir, registrar_medicoes
+from services.pacote_docx import gravar_pacote
+from services.perfilamento import perfilando
+
+log = obter_logger(__name__)
+
+# No Vercel (serverless) não há pool de processos: gera na própria thread
+PROCESSOS_RENDER = int(os.getenv('RENDER_PROCESSOS', '0' if os.getenv('VERCEL') else str(os.cpu_count() or 1)))
+# fork (Linux) herda os modelos já carregados; spawn é usado onde fork não existe
+METODO_INICIO_RENDER = os.getenv(
+    'RENDER_METODO_INICIO',
+    'fork' if 'fork' in multiprocessing.get_all_start_methods() else 'spawn'
+)
+# Método usado ao recriar o pool depois de um BrokenProcessPool: a recriação acontece
+# dentro de uma requisição (ou da especulação), com outras threads ativas, onde fork não é seguro
+METODO_RECRIACAO_RENDER = os.getenv('RENDER_METODO_RECRIACAO', 'spawn')
+
+_pool = None
+_pool_indisponivel = False
+_metodo_inicio = METODO_INICIO_RENDER
+_lock_pool = threading.Lock()
+
+# Progresso das gerações no pool: os processos filhos enviam (id, etapa) por esta fila e
+# uma thread do processo principal repassa para a função registrada para o id
+_fila_progresso = None
+_metodo_fila_progresso = None
+_ouvintes_progresso = {}  # id -> (ao_progredir, Event do fim do progresso)
+# Etapa enviada pelo processo filho depois da última etapa de uma geração
+_FIM_PROGRESSO = None
+# Espera máxima, depois do documento pronto, pelas últimas etapas ainda na fila de progresso
+ESPERA_FIM_PROGRESSO_SEGUNDOS = 5
+
+
+def _inicializar_processo(modelos, fila_progresso):
+    """Pré-carrega, em cada processo do pool, os modelos (já compilados) e a configuração de sprints."""
+    global _fila_progresso
+    _fila_progresso = fila_progresso
+    for modelo_path in modelos:
+        compilar_modelo(modelo_path)
+    carregar_config_sprints()
+
+
+def _renderizar(modelo_path, dados_demanda, dados_sprints, dados_profissionais,
+                dados_projeto, contexto, data_geracao, documento_parcial=None, fontes='manter',
+                id_progresso=None, correlacao=None):
+    """
+    Executado no processo filho: preenche o modelo e devolve o .docx em bytes, as
+    medições das etapas (services.metricas), registradas no processo principal, o
+    pico de memória da geração (MB, ou None), que atualiza o orçamento de memória, e
+    as estatísticas das fontes embutidas (reduzir_fontes, ou None).
+    correlacao (logs.correlacao_atual) leva aos logs do filho o id da requisição.
+    """
+    ao_progredir = None
+    if id_progresso is not None and _fila_progresso is not None:
+        ao_progredir = lambda etapa: _fila_progresso.put((id_progresso, etapa))
+
+    try:
+        with usar_correlacao(correlacao), coletar_medicoes() as medicoes, PicoMemoria() as pico:
+            doc = preencher_plano_trabalho(
+                modelo_path=modelo_path,
+                dados_demanda=dados_demanda,
+                dados_sprints=dados_sprints,
+                dados_profissionais=dados_profissionais,
+                dados_projeto=dados_projeto,
+                contexto=contexto,
+                data_geracao=data_geracao,
+                ao_progredir=ao_progredir,
+                documento_parcial=documento_parcial
+            )
+            notificar_etapa(ao_progredir, 'salvamento')
+            with medir('salvamento'):
+                estatisticas_fontes = reduzir_fontes(doc, fontes)
+                buffer = io.BytesIO()
+                gravar_pacote(doc, buffer, modelo_path)
+    finally:
+        # Na mesma fila, depois da última etapa: a thread de repasse remove o ouvinte
+        if ao_progredir is not None:
+            ao_progredir(_FIM_PROGRESSO)
+    return buffer.getvalue(), medicoes, pico.pico_mb, estatisticas_fontes
+
+
+def _repassar_progresso(fila):
+    """
+    Thread do processo principal: entrega o progresso vindo dos processos filhos e, no
+    fim do progresso de uma geração (_FIM_PROGRESSO), remove o ouvinte dela.
+    """
+    while True:
+        id_progresso, etapa = fila.get()
+        if etapa is _FIM_PROGRESSO:
+            ouvinte = _ouvintes_progresso.pop(id_progresso, None)
+            if ouvinte is not None:
+                ouvinte[1].set()
+            continue
+        ouvinte = _ouvintes_progresso.get(id_progresso)
+        if ouvinte is None:
+            continue
+        ao_progredir = ouvinte[0]
+        try:
+            ao_progredir(etapa)
+        except Exception as e:
+            log.warning("Erro ao repassar progresso (%s): %s", etapa, e)
+
+
+def iniciar_pool_render(modelos=()):
+    """
+    Cria o pool (se configurado) e aguarda os processos ficarem prontos.
+
+    IMPORTANTE: com fork, chamar na importação do app, antes do servidor abrir threads
+    (um fork com outras threads ativas pode herdar locks travados). Um pool descartado
+    (_descartar_pool) é recriado com METODO_RECRIACAO_RENDER, nunca com fork.
+
+    Returns:
+        O pool, ou None se a geração for na própria thread
+    """
+    global _pool, _pool_indisponivel, _fila_progresso, _metodo_fila_progresso
+    if multiprocessing.parent_process() is not None:
+        # Processo filho (spawn reimporta o módulo principal): não cria outro pool
+        return None
+    with _lock_pool:
+        if _pool is not None or _pool_indisponivel or PROCESSOS_RENDER <= 0:
+            return _pool
+        try:
+            contexto_mp = multiprocessing.get_context(_metodo_inicio)
+            # Um pool recriado com o mesmo método reaproveita a fila e a thread de progresso;
+            # a fila de um contexto fork não pode ser passada a processos spawn
+            nova_fila = _fila_progresso is None or _metodo_fila_progresso != _metodo_inicio
+            fila_progresso = contexto_mp.SimpleQueue() if nova_fila else _fila_progresso
+            pool = ProcessPoolExecutor(
+                max_workers=PROCESSOS_RENDER,
+                mp_context=contexto_mp,
+                initializer=_inicializar_processo,
+                initargs=(list(modelos), fila_progresso)
+            )
+            # Sobe os processos agora (e não na primeira requisição)
+            pool.submit(carregar_config_sprints).result()
+        except (OSError, NotImplementedError, ValueError, BrokenProcessPool) as e:
+            log.warning("Pool de processos indisponível (%s); documentos serão gerados na própria thread", e)
+            _pool_indisponivel = True
+            return None
+        _pool = pool
+        if nova_fila:
+            _fila_progresso, _metodo_fila_progresso = fila_progresso, _metodo_inicio
+            threading.Thread(target=_repassar_progresso, args=(fila_progresso,), daemon=True).start()
+        log.info("Pool de geração iniciado: %s processo(s) (%s)", PROCESSOS_RENDER, _metodo_inicio)
+        return _pool
+
+
+def _descartar_pool(pool):
+    """
+    Descarta um pool quebrado. O próximo é criado pela primeira geração que precisar
+    dele, já com o servidor atendendo: por isso com METODO_RECRIACAO_RENDER (spawn).
+    """
+    global _pool, _metodo_inicio
+    with _lock_pool:
+        if _pool is pool:
+            _pool = None
+            _metodo_inicio = METODO_RECRIACAO_RENDER
+    pool.shutdown(wait=False, cancel_futures=True)
+
+
+def pids_pool():
+    """Pids dos processos do pool (para somar o RSS deles ao do servidor)."""
+    pool = _pool
+    processos = getattr(pool, '_processes', None) or {}
+    return list(processos)
+
+
+def gerar_documento(modelo_path, dados_demanda, dados_sprints, dados_profissionais,
+                    dados_projeto=None, contexto=None, data_geracao=None, ao_progredir=None,
+                    documento_parcial=None, fontes='manter'):
+    """
+    Gera o Plano de Trabalho e retorna o .docx como iterável de bytes, com as
+    estatísticas das fontes embutidas (fontes_docx.reduzir_fontes, ou None).
+
+    Com o pool ativo, o preenchimento e a gravação rodam em um processo filho e o
+    iterável tem o documento inteiro. Sem o pool, o documento é preenchido aqui e
+    transmitido em pedaços (transmitir_documento). Erros de preenchimento são
+    levantados nesta chamada, antes de qualquer byte ser enviado.
+
+    ao_progredir recebe a chave (ETAPAS_GERACAO) de cada etapa iniciada; com o pool,
+    é chamada pela thread que repassa o progresso dos processos filhos.
+    documento_parcial (renderizar_documento_parcial) é retomado em vez de abrir o modelo.
+    fontes é o modo das fontes embutidas (fontes_docx.reduzir_fontes).
+
+    Returns:
+        (iterável de bytes, estatísticas das fontes ou None)
+
+    Raises:
+        SemMemoria: Sem vaga no orçamento de memória (services.memoria) a tempo
+    """
+    argumentos = (modelo_path, dados_demanda, dados_sprints, dados_profissionais,
+                  dados_projeto, contexto, data_geracao, documento_parcial, fontes)
+    # Espera uma vaga no orçamento de memória (SemMemoria se não houver a tempo)
+    reserva_mb = orcamento_memoria.reservar(modelo_path)
+    pico_mb = None
+    medicao = None
+    transmitindo = False
+    try:
+        # Requisição perfilada: gera aqui, onde o profiler enxerga o preenchimento
+        pool = None if perfilando() else (_pool or iniciar_pool_render([modelo_path]))
+        if pool is not None:
+            id_progresso = None
+            fim_progresso = None
+            if ao_progredir is not None:
+                id_progresso = uuid.uuid4().hex
+                fim_progresso = threading.Event()
+                _ouvintes_progresso[id_progresso] = (ao_progredir, fim_progresso)
+            try:
+                documento, medicoes, pico_mb, estatisticas_fontes = pool.submit(
+                    _renderizar, *argumentos, id_progresso, correlacao_atual()
+                ).result()
+                registrar_medicoes(medicoes)
+                # IMPORTANTE: a última etapa ('salvamento') pode chegar pela fila de progresso
+                # depois do resultado; espera o repasse dela antes de devolver o documento
+                if fim_progresso is not None and not fim_progresso.wait(ESPERA_FIM_PROGRESSO_SEGUNDOS):
+                    log.warning("Fim do progresso da geração não chegou em %ss", ESPERA_FIM_PROGRESSO_SEGUNDOS)
+                return [documento], estatisticas_fontes
+            except BrokenProcessPool as e:
+                # Um processo morreu (ex.: falta de memória): recria o pool na próxima requisição
+                log.warning("Pool de processos quebrado (%s); gerando na própria thread", e)
+                _descartar_pool(pool)
+            finally:
+                # Normalmente já removido pela thread de repasse (erro ou pool quebrado: aqui)
+                _ouvintes_progresso.pop(id_progresso, None)
+
+        medicao = _MedicaoNaThread()
+        doc = preencher_plano_trabalho(*argumentos[:5], contexto=contexto, data_geracao=data_geracao,
+                                       ao_progredir=ao_progredir, documento_parcial=documento_parcial)
+        notificar_etapa(ao_progredir, 'salvamento')
+        # Sem o pool, a gravação acontece durante a transmissão (medida como 'envio')
+        with medir('salvamento'):
+            estatisticas_fontes = reduzir_fontes(doc, fontes)
+        corpo = _TransmissaoReservada(transmitir_documento(doc, modelo_path=modelo_path),
+                                      modelo_path, reserva_mb, medicao)
+        transmitindo = True
+        return corpo, estatisticas_fontes
+    finally:
+        # Transmitindo, a reserva só é devolvida no fim da transmissão
+        if not transmitindo:
+            if medicao is not None:
+                medicao.encerrar()  # geração com erro: o pico não atualiza a estimativa
+            orcamento_memoria.liberar(modelo_path, reserva_mb, pico_mb)
+
+
+class _MedicaoNaThread:
+    """
+    Pico de memória (PicoMemoria) de uma renderização na própria thread, do início até
+    encerrar(). O VmHWM é do processo inteiro: o pico só vale se nenhuma outra
+    renderização na própria thread correu junto (as do pool são outros processos);
+    senão encerrar() devolve None e a estimativa do modelo não muda.
+    """
+    _lock = threading.Lock()
+    _ativas = []
+
+    def __init__(self, medir=True):
+        self._pico = None
+        self._valida = False
+        with self._lock:
+            for outra in self._ativas:
+                outra._valida = False
+            if medir and not self._ativas:
+                self._pico = PicoMemoria().__enter__()
+                self._valida = True
+            self._ativas.append(self)
+
+    def encerrar(self):
+        """Encerra a medição (uma vez só) e devolve o pico em MB, ou None."""
+        with self._lock:
+            if self not in self._ativas:
+                return None
+            self._ativas.remove(self)
+            if self._pico is None:
+                return None
+            self._pico.__exit__(None, None, None)
+            return self._pico.pico_mb if self._valida else None
+
+
+def _encerrar_transmissao(modelo_path, reserva_mb, medicao):
+    orcamento_memoria.liberar(modelo_path, reserva_mb, medicao.encerrar())
+
+
+class _TransmissaoReservada:
+    """
+    Documento transmitido na própria thread: devolve a reserva de memória, com o pico
+    medido do preenchimento até o fim da gravação (_MedicaoNaThread), ao terminar a
+    transmissão ou, se ela nem começar, quando o iterável for descartado.
+    """
+
+    def __init__(self, pedacos, modelo_path, reserva_mb, medicao):
+        self._pedacos = pedacos
+        self._liberar = weakref.finalize(self, _encerrar_transmissao, modelo_path, reserva_mb, medicao)
+
+    def __iter__(self):
+        try:
+            yield from self._pedacos
+        finally:
+            self._liberar()
+
+
+def renderizar_parcial(modelo_path, contexto_parcial, dados_projeto=None, data_geracao=None, timeout=None):
+    """
+    Documento parcial (renderizar_documento_parcial) no pool de processos, ou na própria
+    thread sem o pool. Com o pool, se não terminar em `timeout` segundos, levanta
+    TimeoutError; a renderização segue no processo filho até o fim.
+
+    Passa pelo orçamento de memória como as gerações, mas sem esperar: especulação não
+    disputa vaga com gerações de verdade.
+
+    Raises:
+        SemMemoria: Sem vaga livre no orçamento de memória agora
+    """
+    argumentos = (modelo_path, contexto_parcial, dados_projeto, data_geracao)
+    reserva_mb = orcamento_memoria.reservar(modelo_path, espera_segundos=0)
+    try:
+        pool = _pool or iniciar_pool_render([modelo_path])
+        futuro = pool.submit(renderizar_documento_parcial, *argumentos) if pool is not None else None
+    except BaseException:
+        orcamento_memoria.liberar(modelo_path, reserva_mb)
+        raise
+    if futuro is not None:
+        # IMPORTANTE: a reserva só é devolvida quando a renderização termina de fato; depois
+        # de um TimeoutError o processo filho continua renderizando e ocupando a memória
+        futuro.add_done_callback(lambda _: orcamento_memoria.liberar(modelo_path, reserva_mb))
+        try:
+            return futuro.result(timeout=timeout)
+        except BrokenProcessPool as e:
+            log.warning("Pool de processos quebrado (%s); documento parcial na própria thread", e)
+            _descartar_pool(pool)
+        # A reserva do pool já voltou com o futuro; a renderização na própria thread reserva de novo
+        reserva_mb = orcamento_memoria.reservar(modelo_path, espera_segundos=0)
+    try:
+        # Não é medida, mas invalida o pico de uma geração na própria thread em paralelo
+        medicao = _MedicaoNaThread(medir=False)
+        try:
+            return renderizar_documento_parcial(*argumentos)
+        finally:
+            medicao.encerrar()
+    finally:
+        orcamento_memoria.liberar(modelo_path, reserva_mb)
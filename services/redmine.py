@@ -5,6 +5,8 @@ import os
 import requests
 from typing import Dict, Optional, Any
 
+from services.metricas import medir
+
 
 def buscar_demanda(demanda: str) -> Optional[Dict[str, Any]]:
     """
@@ -36,7 +38,8 @@ def buscar_demanda(demanda: str) -> Optional[Dict[str, Any]]:
     }
     
     try:
-        response = requests.get(url, params=params, timeout=30)
+        with medir('redmine_demanda'):
+            response = requests.get(url, params=params, timeout=30)
 
         if response.status_code == 404:
             # Demanda não existe no Redmine
@@ -121,7 +124,8 @@ def _buscar_sprint_detalhes(sprint_id: str) -> Dict[str, str]:
     }
     
     try:
-        response = requests.get(url, params=params, timeout=30)
+        with medir('redmine_sprint'):
+            response = requests.get(url, params=params, timeout=30)
         if response.status_code == 404:
             return {}
         response.raise_for_status()
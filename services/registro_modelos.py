@@ -0,0 +1,287 @@
+"""
+Registro dos modelos de Plano de Trabalho (.docx).
+
+Os modelos são descobertos em MODELOS_DIR (padrão: raiz do projeto) e o modelo de cada
+geração é escolhido pelas regras de config/modelos_config.json, em ordem: a primeira
+regra que casa com o pedido vence; se nenhuma casar, vale o modelo_padrao.
+
+    {
+      "modelo_padrao": "Modelo PT-CURSOR.docx",
+      "regras": [
+        {"modelo": "ModeloPT-LEO-CURSOR.docx", "tipos_sprint": ["Desenvolvimento"]},
+        {"modelo": "Modelo Projeto X.docx", "projetos": ["Projeto X"]}
+      ]
+    }
+
+- tipos_sprint: alguma sprint da demanda é de um desses tipos (sem acentos/maiúsculas)
+- projetos: o projeto usado (nomeProjeto) ou o nome da demanda no Redmine é um desses
+Uma regra com as duas condições exige as duas; uma regra sem condições sempre casa.
+
+Na inicialização todos os modelos são compilados (compilar_modelo: zip carregado em memória,
+hash do conteúdo, validação do XML, tags e tabelas). Depois, uma thread verifica o
+diretório e o arquivo de regras a cada MODELOS_INTERVALO_VERIFICACAO segundos e
+recompila em segundo plano os modelos novos ou alterados. A versão de cada modelo é o
+hash do conteúdo; a revisão conta quantas versões diferentes já foram compiladas.
+"""
+import json
+import os
+import threading
+import time
+from datetime import datetime
+
+from services.documento import compilar_modelo, normalizar_tipo_sprint
+from services.logs import obter_logger
+
+log = obter_logger(__name__)
+
+_RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Diretório onde os modelos .docx são descobertos
+MODELOS_DIR = os.path.abspath(os.getenv('MODELOS_DIR', _RAIZ))
+# Regras de escolha do modelo
+MODELOS_CONFIG_PATH = os.path.join(_RAIZ, 'config', 'modelos_config.json')
+# Intervalo (segundos) entre verificações de modelos novos/alterados; 0 desativa
+MODELOS_INTERVALO_VERIFICACAO = float(os.getenv('MODELOS_INTERVALO_VERIFICACAO', '5'))
+
+# Regras usadas se o arquivo de configuração não existir (escolha original do gerador)
+CONFIG_MODELOS_PADRAO = {
+    'modelo_padrao': 'Modelo PT-CURSOR.docx',
+    'regras': [
+        {
+            'descricao': 'Alguma sprint do tipo Desenvolvimento',
+            'modelo': 'ModeloPT-LEO-CURSOR.docx',
+            'tipos_sprint': ['Desenvolvimento'],
+        },
+    ],
+}
+
+
+class ModeloIndisponivel(Exception):
+    """O modelo escolhido não existe no diretório ou não compilou."""
+
+    def __init__(self, nome):
+        super().__init__(f"Modelo de Plano de Trabalho não encontrado: {nome}")
+        self.nome = nome
+
+
+def _normalizar_nome(nome):
+    return ' '.join(str(nome or '').casefold().split())
+
+
+def _regra_casa(regra, tipos_sprint, nomes_projeto):
+    """Verdadeiro se o pedido atende todas as condições da regra."""
+    tipos_regra = regra.get('tipos_sprint')
+    if tipos_regra and not tipos_sprint & {normalizar_tipo_sprint(tipo) for tipo in tipos_regra}:
+        return False
+    projetos_regra = regra.get('projetos')
+    if projetos_regra and not nomes_projeto & {_normalizar_nome(projeto) for projeto in projetos_regra}:
+        return False
+    return True
+
+
+class RegistroModelos:
+    """
+    Modelos descobertos no diretório, compilados, e as regras de escolha.
+    """
+
+    def __init__(self, diretorio, config_path, intervalo_verificacao):
+        self.diretorio = diretorio
+        self.config_path = config_path
+        self.intervalo_verificacao = intervalo_verificacao
+        self._modelos = {}  # nome do arquivo -> registro (ver _compilar)
+        self._config = CONFIG_MODELOS_PADRAO
+        self._mtime_config = None
+        self._atualizado = False
+        self._thread = None
+        self._lock = threading.Lock()
+        self._lock_atualizacao = threading.Lock()
+
+    def _carregar_regras(self):
+        """Relê o arquivo de regras se a data de modificação mudou (mantém as últimas válidas se houver erro)."""
+        try:
+            mtime = os.stat(self.config_path).st_mtime_ns
+        except OSError:
+            if self._mtime_config is not None or not self._atualizado:
+                log.warning("Regras de modelos não encontradas (%s); usando as regras padrão", self.config_path)
+            self._mtime_config, self._config = None, CONFIG_MODELOS_PADRAO
+            return
+        if mtime == self._mtime_config:
+            return
+        try:
+            with open(self.config_path, 'r', encoding='utf-8') as f:
+                config = json.load(f)
+            self._config = config
+            log.info("Regras de modelos carregadas (%s regra(s))", len(config.get('regras', [])))
+        except Exception as e:
+            log.error("Erro ao carregar regras de modelos: %s", e)
+        self._mtime_config = mtime
+
+    def _descobrir(self):
+        """Arquivos .docx do diretório: {nome: (caminho, (inode, mtime_ns, tamanho))}."""
+        encontrados = {}
+        try:
+            nomes = sorted(os.listdir(self.diretorio))
+        except OSError as e:
+            log.error("Diretório de modelos inacessível (%s): %s", self.diretorio, e)
+            return encontrados
+        for nome in nomes:
+            # ~$arquivo.docx: arquivo de trava do Word com o modelo aberto
+            if not nome.lower().endswith('.docx') or nome.startswith('~$'):
+                continue
+            caminho = os.path.join(self.diretorio, nome)
+            try:
+                estado = os.stat(caminho)
+            except OSError:
+                continue
+            encontrados[nome] = (caminho, (estado.st_ino, estado.st_mtime_ns, estado.st_size))
+        return encontrados
+
+    def _compilar(self, nome, caminho, estado, anterior):
+        inicio = time.perf_counter()
+        registro = {
+            'nome': nome,
+            'caminho': caminho,
+            'versao': None,
+            'revisao': anterior['revisao'] if anterior else 0,
+            'compilado_em': datetime.now().isoformat(timespec='seconds'),
+            'tempo_compilacao_ms': None,
+            'tags': 0,
+            'tabelas': 0,
+            'tamanho_bytes': estado[2],
+            'erro': None,
+            '_estado': estado,
+        }
+        try:
+            compilado = compilar_modelo(caminho)
+        except Exception as e:
+            registro['erro'] = f"{type(e).__name__}: {e}"
+            log.error("Modelo %s não compilou: %s", nome, registro['erro'])
+            return registro
+        registro.update(
+            versao=compilado['versao'],
+            tags=len(compilado['tags']),
+            tabelas=compilado['tabelas'],
+            tamanho_bytes=compilado['tamanho_bytes'],
+            tempo_compilacao_ms=round((time.perf_counter() - inicio) * 1000, 1),
+        )
+        if anterior is None or anterior['versao'] != registro['versao']:
+            registro['revisao'] += 1
+        log.info("Modelo compilado: %s (versão %s, revisão %s, %s tag(s), %s ms)", nome, registro['versao'][:12],
+                 registro['revisao'], registro['tags'], registro['tempo_compilacao_ms'])
+        return registro
+
+    def atualizar(self):
+        """
+        Descobre os modelos do diretório, compila os novos ou alterados, remove os que
+        sumiram e relê as regras.
+
+        Returns:
+            Nomes dos modelos compilados nesta chamada
+        """
+        with self._lock_atualizacao:
+            self._carregar_regras()
+            encontrados = self._descobrir()
+            with self._lock:
+                for nome in set(self._modelos) - set(encontrados):
+                    del self._modelos[nome]
+                    log.info("Modelo removido do registro: %s", nome)
+                anteriores = dict(self._modelos)
+
+            compilados = []
+            for nome, (caminho, estado) in encontrados.items():
+                anterior = anteriores.get(nome)
+                if anterior is not None and anterior['_estado'] == estado:
+                    continue
+                registro = self._compilar(nome, caminho, estado, anterior)
+                with self._lock:
+                    self._modelos[nome] = registro
+                compilados.append(nome)
+            self._atualizado = True
+            return compilados
+
+    def _garantir_atualizado(self):
+        if not self._atualizado:
+            self.atualizar()
+
+    def monitorar(self):
+        """
+        Inicia a thread que recompila em segundo plano os modelos alterados.
+
+        IMPORTANTE: chamar depois de criar o pool de processos (iniciar_pool_render), que
+        usa fork e não deve herdar threads em andamento.
+        """
+        if self.intervalo_verificacao <= 0 or self._thread is not None:
+            return
+
+        def verificar():
+            while True:
+                time.sleep(self.intervalo_verificacao)
+                try:
+                    self.atualizar()
+                except Exception as e:
+                    log.warning("Erro ao verificar modelos: %s", e)
+
+        self._thread = threading.Thread(target=verificar, name='registro-modelos', daemon=True)
+        self._thread.start()
+
+    def caminhos(self):
+        """Caminhos dos modelos compilados com sucesso (para pré-carregar no pool)."""
+        self._garantir_atualizado()
+        with self._lock:
+            return [registro['caminho'] for registro in self._modelos.values() if registro['erro'] is None]
+
+    def escolher(self, dados_sprints, dados_projeto=None, dados_demanda=None):
+        """
+        Modelo do pedido pelas regras (a primeira que casa) ou o modelo padrão.
+
+        Returns:
+            (nome do modelo, caminho)
+
+        Raises:
+            ModeloIndisponivel: O modelo escolhido não existe ou não compilou
+        """
+        self._garantir_atualizado()
+        tipos_sprint = {normalizar_tipo_sprint(sprint.get('tipo', '')) for sprint in dados_sprints or []}
+        nomes_projeto = {
+            _normalizar_nome((dados_projeto or {}).get('nomeProjeto')),
+            _normalizar_nome((dados_demanda or {}).get('nome')),
+        } - {''}
+        with self._lock:
+            config, modelos = self._config, dict(self._modelos)
+
+        for regra in config.get('regras', []):
+            if not _regra_casa(regra, tipos_sprint, nomes_projeto):
+                continue
+            nome = regra.get('modelo')
+            registro = modelos.get(nome)
+            if registro is not None and registro['erro'] is None:
+                log.debug("Usando modelo %s (regra: %s)", nome, regra.get('descricao') or regra)
+                return nome, registro['caminho']
+            log.warning("Regra casou, mas o modelo %s não está disponível; seguindo para a próxima", nome)
+
+        nome = config.get('modelo_padrao')
+        registro = modelos.get(nome)
+        if registro is None or registro['erro'] is not None:
+            raise ModeloIndisponivel(nome)
+        log.debug("Usando modelo padrão: %s", nome)
+        return nome, registro['caminho']
+
+    def listar(self):
+        """Modelos registrados (versão, revisão, compilação, tags) e as regras em uso."""
+        self._garantir_atualizado()
+        with self._lock:
+            modelos = [
+                {chave: valor for chave, valor in registro.items() if not chave.startswith('_')}
+                for registro in self._modelos.values()
+            ]
+            config = self._config
+        return {
+            'diretorio': self.diretorio,
+            'modelo_padrao': config.get('modelo_padrao'),
+            'regras': config.get('regras', []),
+            'intervalo_verificacao_segundos': self.intervalo_verificacao,
+            'modelos': modelos,
+        }
+
+
+registro_modelos = RegistroModelos(MODELOS_DIR, MODELOS_CONFIG_PATH, MODELOS_INTERVALO_VERIFICACAO)
@@ -0,0 +1,233 @@
+"""
+Tarefas assíncronas de geração de documentos.
+
+A submissão só enfileira a geração e devolve o id da tarefa. O progresso (um evento por
+etapa de ETAPAS_GERACAO) é acompanhado por Server-Sent Events e o arquivo é baixado quando
+a tarefa termina. A fila é limitada (TAREFAS_FILA_MAX): cheia, a submissão é recusada.
+Tarefas finalizadas (e o documento gerado) ficam disponíveis por TAREFAS_TTL_SEGUNDOS,
+limitadas a TAREFAS_MAX_FINALIZADAS tarefas e TAREFAS_DOCUMENTOS_MAX_MB de documentos: acima
+disso, as finalizadas há mais tempo são descartadas (o arquivo delas passa a dar 404).
+"""
+import os
+import queue
+import threading
+import time
+import uuid
+
+from services.documento import ETAPAS_GERACAO
+from services.logs import correlacao_atual, obter_logger, usar_correlacao
+
+log = obter_logger(__name__)
+
+TAREFAS_FILA_MAX = int(os.getenv('TAREFAS_FILA_MAX', '32'))
+TAREFAS_THREADS = int(os.getenv('TAREFAS_THREADS', '2'))
+TAREFAS_TTL_SEGUNDOS = int(os.getenv('TAREFAS_TTL_SEGUNDOS', '600'))
+# Tarefas finalizadas guardadas e memória total dos documentos delas
+TAREFAS_MAX_FINALIZADAS = int(os.getenv('TAREFAS_MAX_FINALIZADAS', '256'))
+TAREFAS_DOCUMENTOS_MAX_MB = float(os.getenv('TAREFAS_DOCUMENTOS_MAX_MB', '64'))
+
+STATUS_NA_FILA = 'na_fila'
+STATUS_EXECUTANDO = 'executando'
+STATUS_CONCLUIDA = 'concluida'
+STATUS_ERRO = 'erro'
+
+_ORDEM_ETAPAS = list(ETAPAS_GERACAO)
+
+
+class FilaCheia(Exception):
+    """A fila de tarefas atingiu TAREFAS_FILA_MAX."""
+
+
+class Tarefa:
+    """
+    Uma geração assíncrona: status, eventos de progresso e o documento gerado.
+    """
+
+    def __init__(self, pedido):
+        self.id = uuid.uuid4().hex
+        self.pedido = pedido
+        # Logs da geração com o id de correlação da requisição que a submeteu
+        self.correlacao = correlacao_atual()
+        self.status = STATUS_NA_FILA
+        self.etapa = None
+        self.eventos = []  # [(tipo, dados)], na ordem em que aconteceram
+        self.documento = None
+        self.origem = None
+        self.estatisticas_fontes = None
+        self.erro = None
+        self.criada_em = time.time()
+        self.finalizada_em = None
+        self._condicao = threading.Condition()
+
+    @property
+    def finalizada(self):
+        return self.status in (STATUS_CONCLUIDA, STATUS_ERRO)
+
+    def _registrar(self, tipo, dados, status=None):
+        with self._condicao:
+            if status is not None:
+                self.status = status
+            self.eventos.append((tipo, dados))
+            self._condicao.notify_all()
+
+    def iniciar(self):
+        self._registrar('inicio', {'status': STATUS_EXECUTANDO}, STATUS_EXECUTANDO)
+
+    def progredir(self, etapa):
+        """Registra o início de uma etapa (chave de ETAPAS_GERACAO)."""
+        self.etapa = etapa
+        self._registrar('etapa', {
+            'etapa': etapa,
+            'descricao': ETAPAS_GERACAO.get(etapa, etapa),
+            'indice': _ORDEM_ETAPAS.index(etapa) + 1 if etapa in ETAPAS_GERACAO else None,
+            'total': len(_ORDEM_ETAPAS),
+        })
+
+    def concluir(self, documento, origem, estatisticas_fontes=None):
+        self.documento = documento
+        self.origem = origem
+        self.estatisticas_fontes = estatisticas_fontes
+        self.finalizada_em = time.time()
+        dados = {'status': STATUS_CONCLUIDA, 'tamanho_bytes': len(documento)}
+        if estatisticas_fontes:
+            dados['fontes'] = estatisticas_fontes
+        self._registrar('concluida', dados, STATUS_CONCLUIDA)
+
+    def falhar(self, mensagem):
+        self.erro = mensagem
+        self.finalizada_em = time.time()
+        self._registrar('erro', {'status': STATUS_ERRO, 'message': mensagem}, STATUS_ERRO)
+
+    def aguardar_eventos(self, desde, timeout):
+        """
+        Eventos a partir do índice `desde`, esperando até `timeout` segundos por um novo.
+        Lista vazia = nenhum evento novo no período.
+        """
+        with self._condicao:
+            self._condicao.wait_for(lambda: len(self.eventos) > desde, timeout)
+            return self.eventos[desde:]
+
+    def como_dict(self):
+        return {
+            'id': self.id,
+            'status': self.status,
+            'etapa': self.etapa,
+            'descricao_etapa': ETAPAS_GERACAO.get(self.etapa) if self.etapa else None,
+            'criada_em': self.criada_em,
+            'finalizada_em': self.finalizada_em,
+            'message': self.erro,
+        }
+
+
+class FilaTarefas:
+    """
+    Fila limitada de tarefas, consumida por TAREFAS_THREADS threads.
+
+    As threads só esperam pela geração (que roda no pool de processos, quando ativo),
+    então poucas bastam; o limite real de paralelismo é o do pool.
+    """
+
+    def __init__(self, executar, threads=TAREFAS_THREADS, tamanho_max=TAREFAS_FILA_MAX,
+                 ttl_segundos=TAREFAS_TTL_SEGUNDOS, max_finalizadas=TAREFAS_MAX_FINALIZADAS,
+                 documentos_max_mb=TAREFAS_DOCUMENTOS_MAX_MB):
+        """
+        Args:
+            executar: Função executar(pedido, ao_progredir) -> (bytes do documento, origem,
+                estatísticas das fontes embutidas ou None)
+        """
+        self._executar = executar
+        self._quantidade_threads = max(threads, 1)
+        self._ttl_segundos = ttl_segundos
+        self._max_finalizadas = max_finalizadas
+        self._documentos_max_bytes = int(documentos_max_mb * 1024 * 1024)
+        self._fila = queue.Queue(maxsize=tamanho_max)
+        self._tarefas = {}
+        self._lock = threading.Lock()
+        self._threads = []
+
+    def _iniciar_threads(self):
+        # Threads criadas só na primeira submissão (não na importação do app)
+        with self._lock:
+            if self._threads:
+                return
+            for i in range(self._quantidade_threads):
+                thread = threading.Thread(target=self._trabalhar, name=f'tarefas-geracao-{i}', daemon=True)
+                thread.start()
+                self._threads.append(thread)
+
+    def _descartar_expiradas(self):
+        """
+        Remove as tarefas finalizadas há mais de TTL e, acima dos limites de tarefas
+        finalizadas ou de bytes dos documentos, as finalizadas há mais tempo.
+        """
+        limite = time.time() - self._ttl_segundos
+        with self._lock:
+            finalizadas = sorted(
+                (tarefa for tarefa in self._tarefas.values() if tarefa.finalizada),
+                key=lambda tarefa: tarefa.finalizada_em
+            )
+            tamanho = sum(len(tarefa.documento or b'') for tarefa in finalizadas)
+            for indice, tarefa in enumerate(finalizadas):
+                restantes = len(finalizadas) - indice
+                if (tarefa.finalizada_em >= limite and restantes <= self._max_finalizadas
+                        and tamanho <= self._documentos_max_bytes):
+                    break
+                tamanho -= len(tarefa.documento or b'')
+                del self._tarefas[tarefa.id]
+
+    def submeter(self, pedido):
+        """
+        Enfileira a geração do pedido.
+
+        Raises:
+            FilaCheia: Se a fila atingiu o limite
+        """
+        self._iniciar_threads()
+        self._descartar_expiradas()
+        tarefa = Tarefa(pedido)
+        with self._lock:
+            try:
+                self._fila.put_nowait(tarefa)
+            except queue.Full:
+                raise FilaCheia(f"Fila de geração cheia ({self._fila.maxsize} tarefas)")
+            self._tarefas[tarefa.id] = tarefa
+        log.debug("Tarefa %s enfileirada (%s na fila)", tarefa.id, self._fila.qsize())
+        return tarefa
+
+    def obter(self, id_tarefa):
+        with self._lock:
+            return self._tarefas.get(id_tarefa)
+
+    def _trabalhar(self):
+        while True:
+            tarefa = self._fila.get()
+            tarefa.iniciar()
+            with usar_correlacao(tarefa.correlacao):
+                try:
+                    documento, origem, estatisticas_fontes = self._executar(tarefa.pedido, tarefa.progredir)
+                    tarefa.concluir(documento, origem, estatisticas_fontes)
+                    log.debug("Tarefa %s concluída (%s bytes)", tarefa.id, len(documento))
+                except Exception as e:
+                    tarefa.falhar(str(e))
+                    log.error("Tarefa %s falhou: %s", tarefa.id, e)
+                finally:
+                    self._fila.task_done()
+            # Limpeza também sem novas submissões (um documento a mais pode estourar o limite)
+            self._descartar_expiradas()
+
+    @property
+    def na_fila(self):
+        """Tarefas esperando uma thread livre."""
+        return self._fila.qsize()
+
+    def estatisticas(self):
+        with self._lock:
+            por_status = {}
+            for tarefa in self._tarefas.values():
+                por_status[tarefa.status] = por_status.get(tarefa.status, 0) + 1
+        return {
+            'na_fila': self.na_fila,
+            'limite_fila': self._fila.maxsize,
+            'threads': self._quantidade_threads,
+            'tarefas': por_status,
+        }
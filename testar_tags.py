@@ -1,6 +1,7 @@
 """
 Script para testar e investigar tags no documento Word.
 Verifica quais tags estão presentes na primeira linha de dados das tabelas.
+Com --plano, mostra o plano das tabelas (classificação de cada linha) usado pelo gerador, em JSON.
 """
 from docx import Document
 import re
@@ -43,17 +44,28 @@ def listar_tags_no_documento(doc_path):
     print("FIM DA INVESTIGAÇÃO")
     print("=" * 80)
 
+def mostrar_plano_tabelas(doc_path):
+    """Mostra em JSON o plano das tabelas (tipo de cada linha) usado por preencher_plano_trabalho."""
+    from services.documento import planejar_documento, descrever_planos
+    doc = Document(doc_path)
+    print(descrever_planos(planejar_documento(doc)))
+
 if __name__ == '__main__':
-    if len(sys.argv) < 2:
-        print("Uso: python testar_tags.py <caminho_do_documento.docx>")
+    argumentos = [arg for arg in sys.argv[1:] if not arg.startswith('--')]
+    if not argumentos:
+        print("Uso: python testar_tags.py <caminho_do_documento.docx> [--plano]")
         print("\nExemplo:")
         print("  python testar_tags.py \"Modelo PT-CURSOR.docx\"")
+        print("  python testar_tags.py \"Modelo PT-CURSOR.docx\" --plano")
         sys.exit(1)
     
-    doc_path = sys.argv[1]
+    doc_path = argumentos[0]
     
     try:
-        listar_tags_no_documento(doc_path)
+        if '--plano' in sys.argv:
+            mostrar_plano_tabelas(doc_path)
+        else:
+            listar_tags_no_documento(doc_path)
     except FileNotFoundError:
         print(f"ERRO: Arquivo não encontrado: {doc_path}")
         sys.exit(1)
@@ -0,0 +1,386 @@
+"""
+Teste de carga da API, de ponta a ponta, sem rede: sobe o app (python app.py) apontado para
+um Redmine e um KV (Vercel KV/Upstash, API REST) locais, simulados por este script, e
+roda usuários simultâneos repetindo o fluxo do frontend:
+  1. busca da demanda (GET /api/redmine/<demanda>)
+  2. lista de projetos (GET /api/projetos)
+  3. geração do plano só com o ID (POST /api/gerar-plano-trabalho, horas e profissionais
+     informados pelo "usuário", diferentes a cada iteração para não cair no cache)
+
+Ao final, imprime por endpoint a vazão, a taxa de erro e as latências p50/p95/p99 (e,
+com --saida, grava o relatório em JSON). As demandas simuladas têm --sprints sprints e o
+Redmine simulado responde cada consulta depois de --latencia-redmine ms. O app herda o
+ambiente (RENDER_PROCESSOS, MEMORIA_ORCAMENTO_MB, LOG_NIVEL...), para dimensionar cada
+configuração antes da implantação.
+
+Use: python teste_carga.py [--usuarios N] [--duracao SEGUNDOS] [--demandas N] [--sprints N]
+                           [--latencia-redmine MS] [--pausa MS] [--porta PORTA] [--saida ARQUIVO.json]
+"""
+import argparse
+import json
+import os
+import random
+import re
+import signal
+import socket
+import subprocess
+import sys
+import threading
+import time
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import requests
+
+DIRETORIO_RAIZ = os.path.dirname(os.path.abspath(__file__))
+
+# Credenciais aceitas pelos serviços simulados
+CHAVE_REDMINE = 'teste-carga'
+TOKEN_KV = 'teste-carga'
+# IDs das demandas simuladas (a demanda i é PRIMEIRA_DEMANDA + i * PASSO_DEMANDA; PT, OS e
+# sprints usam os IDs seguintes)
+PRIMEIRA_DEMANDA = 500000
+PASSO_DEMANDA = 1000
+TIPOS_SPRINT = ['Desenvolvimento', 'Manutenção']
+# Tempo máximo para o app ficar pronto (compila os modelos e sobe o pool)
+ESPERA_APP_SEGUNDOS = 120
+# Percentis do relatório
+PERCENTIS = (50, 95, 99)
+
+
+def _porta_livre():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+class RedmineSimulado:
+    """
+    Issues do Redmine (/issues/<id>.json) das demandas simuladas: demanda -> Plano de
+    Trabalho -> Proposta de OS -> sprints, com os campos personalizados lidos por
+    services/redmine.py.
+    """
+
+    def __init__(self, num_demandas, num_sprints, latencia_segundos):
+        self.latencia_segundos = latencia_segundos
+        self.demandas = []
+        self._issues = {}
+        for indice in range(num_demandas):
+            demanda_id = PRIMEIRA_DEMANDA + indice * PASSO_DEMANDA
+            pt_id, os_id = demanda_id + 1, demanda_id + 2
+            sprints = [
+                {'id': os_id + 1 + i, 'tracker': {'name': 'Sprint'}}
+                for i in range(num_sprints)
+            ]
+            self._issues[demanda_id] = {
+                'id': demanda_id,
+                'project': {'name': f'Projeto Carga {indice + 1}'},
+                'custom_fields': [{'name': 'Valor da Demanda', 'value': str(39147.2 * num_sprints)}],
+                'relations': [],
+                'children': [{
+                    'id': pt_id,
+                    'tracker': {'name': 'Plano de Trabalho'},
+                    'children': [{'id': os_id, 'tracker': {'name': 'Proposta de OS'}, 'children': sprints}],
+                }],
+            }
+            for i, sprint in enumerate(sprints):
+                self._issues[sprint['id']] = {
+                    'id': sprint['id'],
+                    'custom_fields': [
+                        {'name': 'Valor Unitário', 'value': '244.67'},
+                        {'name': 'Valor da Fase', 'value': '39147.20'},
+                        {'name': 'Tipo de Sprint', 'value': TIPOS_SPRINT[(indice + i) % len(TIPOS_SPRINT)]},
+                        {'name': 'Tempo Estimado (HST)', 'value': '160'},
+                    ],
+                }
+            self.demandas.append({'id': str(demanda_id), 'sprints': [str(sprint['id']) for sprint in sprints]})
+
+    def issue(self, issue_id):
+        time.sleep(self.latencia_segundos)
+        issue = self._issues.get(issue_id)
+        return None if issue is None else {'issue': issue}
+
+
+class KvSimulado:
+    """Comandos GET e SET da API REST do Vercel KV/Upstash, em memória."""
+
+    def __init__(self, valores):
+        self._valores = dict(valores)
+        self._lock = threading.Lock()
+
+    def executar(self, comando):
+        with self._lock:
+            if comando[0].upper() == 'GET':
+                return self._valores.get(comando[1])
+            if comando[0].upper() == 'SET':
+                self._valores[comando[1]] = comando[2]
+                return 'OK'
+        raise ValueError(f"Comando não suportado: {comando[0]}")
+
+
+def _servidor(tratar):
+    """Servidor HTTP local (thread daemon) que responde com tratar(manipulador) -> (status, corpo)."""
+
+    class Manipulador(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def _responder(self):
+            status, corpo = tratar(self)
+            dados = json.dumps(corpo).encode('utf-8')
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(dados)))
+            self.end_headers()
+            self.wfile.write(dados)
+
+        do_GET = do_POST = _responder
+
+        def log_message(self, *_):
+            pass
+
+    servidor = ThreadingHTTPServer(('127.0.0.1', _porta_livre()), Manipulador)
+    servidor.daemon_threads = True
+    threading.Thread(target=servidor.serve_forever, daemon=True).start()
+    return servidor
+
+
+def iniciar_redmine(redmine):
+    def tratar(manipulador):
+        encontrado = re.fullmatch(r'/issues/(\d+)\.json(\?.*)?', manipulador.path)
+        if encontrado is None or f'key={CHAVE_REDMINE}' not in (encontrado.group(2) or ''):
+            return 401 if encontrado else 404, {}
+        resposta = redmine.issue(int(encontrado.group(1)))
+        return (404, {}) if resposta is None else (200, resposta)
+    return _servidor(tratar)
+
+
+def iniciar_kv(kv):
+    def tratar(manipulador):
+        if manipulador.headers.get('Authorization') != f'Bearer {TOKEN_KV}':
+            return 401, {'error': 'Unauthorized'}
+        tamanho = int(manipulador.headers.get('Content-Length') or 0)
+        try:
+            return 200, {'result': kv.executar(json.loads(manipulador.rfile.read(tamanho)))}
+        except (ValueError, IndexError, TypeError) as e:
+            return 400, {'error': str(e)}
+    return _servidor(tratar)
+
+
+def projetos_simulados(redmine):
+    """Projetos cadastrados (KV) correspondentes às demandas simuladas."""
+    return [
+        {
+            'id': indice + 1,
+            'nomeProjeto': f'Projeto Carga {indice + 1}',
+            'nomeSVN': f'projeto-carga-{indice + 1}',
+            'gestorNome': 'Gestor Carga',
+            'gestorEmail': 'gestor@exemplo.com',
+            'gestorCelular': '(61) 90000-0000',
+            'gerenteNome': 'Gerente Carga',
+            'gerenteEmail': 'gerente@exemplo.com',
+            'gerenteTelefone': '(61) 3000-0000',
+            'introducaoProjeto': 'Projeto simulado para o teste de carga.',
+        }
+        for indice in range(len(redmine.demandas))
+    ]
+
+
+def iniciar_app(porta, url_redmine, url_kv):
+    """Sobe python app.py apontado para os serviços simulados e espera o /health responder."""
+    ambiente = {
+        **os.environ,
+        'PORT': str(porta),
+        'FLASK_ENV': 'production',
+        'REDMINE_API_KEY': CHAVE_REDMINE,
+        'REDMINE_BASE_URL': url_redmine,
+        'KV_REST_API_URL': url_kv,
+        'KV_REST_API_TOKEN': TOKEN_KV,
+        'NO_PROXY': '127.0.0.1,localhost',
+        'no_proxy': '127.0.0.1,localhost',
+    }
+    # Sessão própria: encerrar_app derruba o app junto com os processos do pool de geração
+    processo = subprocess.Popen(
+        [sys.executable, os.path.join(DIRETORIO_RAIZ, 'app.py')],
+        cwd=DIRETORIO_RAIZ, env=ambiente, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+        start_new_session=True
+    )
+    sessao = requests.Session()
+    sessao.trust_env = False
+    limite = time.monotonic() + ESPERA_APP_SEGUNDOS
+    while time.monotonic() < limite:
+        if processo.poll() is not None:
+            raise RuntimeError(f"O app encerrou ao iniciar (código {processo.returncode})")
+        try:
+            if sessao.get(f'http://127.0.0.1:{porta}/health', timeout=2).status_code == 200:
+                return processo
+        except requests.RequestException:
+            pass
+        time.sleep(0.5)
+    encerrar_app(processo)
+    raise RuntimeError(f"O app não respondeu em {ESPERA_APP_SEGUNDOS} s")
+
+
+def encerrar_app(processo):
+    """Encerra o app e os processos filhos (pool de geração)."""
+    try:
+        os.killpg(processo.pid, signal.SIGTERM)
+    except ProcessLookupError:
+        pass
+    try:
+        processo.wait(timeout=30)
+    except subprocess.TimeoutExpired:
+        os.killpg(processo.pid, signal.SIGKILL)
+        processo.wait()
+
+
+class Resultados:
+    """Latências e status de cada endpoint, registrados pelos usuários (threads)."""
+
+    def __init__(self):
+        self._por_endpoint = {}
+        self._lock = threading.Lock()
+
+    def registrar(self, endpoint, segundos, status, erro=None):
+        with self._lock:
+            registros = self._por_endpoint.setdefault(endpoint, {'latencias': [], 'status': {}, 'erros': 0})
+            registros['latencias'].append(segundos)
+            chave = str(status) if erro is None else type(erro).__name__
+            registros['status'][chave] = registros['status'].get(chave, 0) + 1
+            if erro is not None or status >= 400:
+                registros['erros'] += 1
+
+    def relatorio(self, duracao):
+        with self._lock:
+            por_endpoint = {endpoint: dict(registros) for endpoint, registros in self._por_endpoint.items()}
+        relatorio = {}
+        for endpoint, registros in por_endpoint.items():
+            latencias = sorted(registros['latencias'])
+            total = len(latencias)
+            relatorio[endpoint] = {
+                'requisicoes': total,
+                'erros': registros['erros'],
+                'taxa_erro': round(registros['erros'] / total, 4),
+                'vazao_rps': round(total / duracao, 2),
+                **{f'p{p}_ms': round(percentil(latencias, p) * 1000, 1) for p in PERCENTIS},
+                'max_ms': round(latencias[-1] * 1000, 1),
+                'status': registros['status'],
+            }
+        return relatorio
+
+
+def percentil(valores_ordenados, p):
+    """Percentil p (nearest-rank) de uma lista ordenada."""
+    indice = max(int(len(valores_ordenados) * p / 100 + 0.5) - 1, 0)
+    return valores_ordenados[min(indice, len(valores_ordenados) - 1)]
+
+
+def executar_usuario(numero, url_app, redmine, resultados, fim, pausa_segundos):
+    """Um usuário: repete o fluxo busca -> projetos -> geração até o fim do teste."""
+    sessao = requests.Session()
+    sessao.trust_env = False
+    aleatorio = random.Random(numero)
+    iteracao = 0
+
+    def chamar(endpoint, metodo, caminho, **kwargs):
+        inicio = time.perf_counter()
+        try:
+            resposta = sessao.request(metodo, url_app + caminho, timeout=120, **kwargs)
+            resposta.content  # lê o corpo inteiro (o .docx é transmitido)
+        except requests.RequestException as e:
+            resultados.registrar(endpoint, time.perf_counter() - inicio, 0, e)
+            return None
+        resultados.registrar(endpoint, time.perf_counter() - inicio, resposta.status_code)
+        return resposta
+
+    while time.monotonic() < fim:
+        demanda = aleatorio.choice(redmine.demandas)
+        iteracao += 1
+        chamar('GET /api/redmine/<demanda>', 'GET', f"/api/redmine/{demanda['id']}")
+        time.sleep(pausa_segundos)
+        chamar('GET /api/projetos', 'GET', '/api/projetos')
+        time.sleep(pausa_segundos)
+        # Horas e profissionais "digitados" pelo usuário, diferentes a cada iteração
+        horas = {sprint: 40 + (numero * 7 + iteracao) % 120 for sprint in demanda['sprints']}
+        profissionais = {
+            sprint: [{'tipo': 'Desenvolvedor', 'quantidade': 1 + iteracao % 3, 'horas': str(horas[sprint])}]
+            for sprint in demanda['sprints']
+        }
+        chamar('POST /api/gerar-plano-trabalho', 'POST', '/api/gerar-plano-trabalho', json={
+            'demanda': demanda['id'],
+            'horas_sprint': horas,
+            'dados_profissionais': profissionais,
+        })
+        time.sleep(pausa_segundos)
+
+
+def imprimir_relatorio(relatorio, duracao, usuarios):
+    print("=" * 110)
+    print(f"TESTE DE CARGA - {usuarios} usuário(s), {duracao:.1f} s")
+    print("=" * 110)
+    print(f"{'Endpoint':<34} {'Req.':>7} {'Req/s':>8} {'Erros':>8} "
+          + ' '.join(f"{f'p{p} (ms)':>10}" for p in PERCENTIS) + f" {'Máx (ms)':>10}")
+    for endpoint, dados in relatorio.items():
+        print(f"{endpoint:<34} {dados['requisicoes']:>7} {dados['vazao_rps']:>8.2f} {dados['taxa_erro']:>8.1%} "
+              + ' '.join(f"{dados[f'p{p}_ms']:>10.1f}" for p in PERCENTIS) + f" {dados['max_ms']:>10.1f}")
+        if dados['erros']:
+            print(f"{'':<34} status: {dados['status']}")
+    print("=" * 110)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Teste de carga da API com Redmine e KV simulados (sem rede)")
+    parser.add_argument('--usuarios', type=int, default=4, help="Usuários simultâneos (padrão: 4)")
+    parser.add_argument('--duracao', type=float, default=30, help="Duração do teste em segundos (padrão: 30)")
+    parser.add_argument('--demandas', type=int, default=10, help="Demandas simuladas no Redmine (padrão: 10)")
+    parser.add_argument('--sprints', type=int, default=5, help="Sprints de cada demanda (padrão: 5)")
+    parser.add_argument('--latencia-redmine', type=float, default=50,
+                        help="Tempo de resposta do Redmine simulado, em ms por consulta (padrão: 50)")
+    parser.add_argument('--pausa', type=float, default=0,
+                        help="Pausa do usuário entre as etapas do fluxo, em ms (padrão: 0)")
+    parser.add_argument('--porta', type=int, default=0, help="Porta do app (padrão: uma porta livre)")
+    parser.add_argument('--saida', help="Grava o relatório em JSON neste arquivo")
+    args = parser.parse_args()
+
+    redmine = RedmineSimulado(args.demandas, args.sprints, args.latencia_redmine / 1000)
+    kv = KvSimulado({'projetos': json.dumps(projetos_simulados(redmine), ensure_ascii=False)})
+    servidor_redmine = iniciar_redmine(redmine)
+    servidor_kv = iniciar_kv(kv)
+    porta = args.porta or _porta_livre()
+    print(f"Subindo o app na porta {porta} (Redmine simulado na {servidor_redmine.server_port}, "
+          f"KV na {servidor_kv.server_port})...")
+    processo_app = iniciar_app(
+        porta, f'http://127.0.0.1:{servidor_redmine.server_port}', f'http://127.0.0.1:{servidor_kv.server_port}'
+    )
+
+    resultados = Resultados()
+    try:
+        inicio = time.monotonic()
+        fim = inicio + args.duracao
+        usuarios = [
+            threading.Thread(
+                target=executar_usuario,
+                args=(numero, f'http://127.0.0.1:{porta}', redmine, resultados, fim, args.pausa / 1000),
+                daemon=True
+            )
+            for numero in range(args.usuarios)
+        ]
+        for usuario in usuarios:
+            usuario.start()
+        for usuario in usuarios:
+            usuario.join()
+        duracao = time.monotonic() - inicio
+    finally:
+        encerrar_app(processo_app)
+
+    relatorio = resultados.relatorio(duracao)
+    imprimir_relatorio(relatorio, duracao, args.usuarios)
+    if args.saida:
+        with open(args.saida, 'w', encoding='utf-8') as f:
+            json.dump({
+                'gerado_em': datetime.now().isoformat(timespec='seconds'),
+                'parametros': vars(args),
+                'duracao_segundos': round(duracao, 2),
+                'endpoints': relatorio,
+            }, f, ensure_ascii=False, indent=2)
+        print(f"Relatório gravado em {args.saida}")
+    sys.exit(1 if any(dados['erros'] for dados in relatorio.values()) else 0)